@@ -0,0 +1,28 @@
+# apps/analytics/kpis.py
+from datetime import timedelta
+
+from django.db.models import Count, Q, Sum
+
+from apps.analytics.models import AlertaInteligente, EventoAnalytics
+from apps.core.services import KPI, PlaneadorKPIService
+from apps.vendas.models import Venda
+
+
+@PlaneadorKPIService.registrar('analytics')
+def kpis_analytics(empresa, hoje):
+    """Eventos de hoje/ontem, vendas do mês e do mês anterior, alertas ativos"""
+    mes_atual = hoje.replace(day=1)
+    mes_anterior = (mes_atual - timedelta(days=1)).replace(day=1)
+    vendas_mes = Q(status='finalizada', data_venda__date__gte=mes_atual)
+    vendas_mes_anterior = Q(
+        status='finalizada', data_venda__date__gte=mes_anterior, data_venda__date__lt=mes_atual,
+    )
+    return [
+        KPI('eventos_hoje', EventoAnalytics, Count, 'id', Q(timestamp__date=hoje)),
+        KPI('eventos_ontem', EventoAnalytics, Count, 'id', Q(timestamp__date=hoje - timedelta(days=1))),
+        KPI('vendas_mes_total', Venda, Sum, 'total', vendas_mes, padrao=None),
+        KPI('vendas_mes_quantidade', Venda, Count, 'id', vendas_mes),
+        KPI('vendas_mes_anterior_total', Venda, Sum, 'total', vendas_mes_anterior, padrao=None),
+        KPI('vendas_mes_anterior_quantidade', Venda, Count, 'id', vendas_mes_anterior),
+        KPI('alertas_ativos', AlertaInteligente, Count, 'id', Q(status='ativo')),
+    ]
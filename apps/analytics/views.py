@@ -45,6 +45,7 @@ from .utils import (
 )
 from django.contrib.auth.mixins import AccessMixin
 from apps.core.mixins import BaseViewMixin
+from apps.core.services import PlaneadorKPIService
 from apps.vendas.models import Venda
 from apps.produtos.models import Produto
 from apps.clientes.models import Cliente
@@ -84,6 +85,10 @@ class PermissaoAcaoMixin(AccessMixin):
 
 class AnalyticsDashboardView(BaseViewMixin, TemplateView):
     template_name = 'analytics/dashboard.html'
+
+    def get_empresa(self):
+        """Retorna a empresa associada ao usuário logado."""
+        return getattr(self.request.user, "empresa", None)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -102,53 +107,24 @@ class AnalyticsDashboardView(BaseViewMixin, TemplateView):
         
         # Métricas principais
         hoje = timezone.now().date()
-        ontem = hoje - timedelta(days=1)
-        mes_atual = hoje.replace(day=1)
-        mes_anterior = (mes_atual - timedelta(days=1)).replace(day=1)
         
-        # Eventos hoje vs ontem
-        eventos_hoje = EventoAnalytics.objects.filter(
-            empresa=empresa,
-            timestamp__date=hoje
-        ).count()
-        
-        eventos_ontem = EventoAnalytics.objects.filter(
-            empresa=empresa,
-            timestamp__date=ontem
-        ).count()
+        # Contagens e totais numa consulta por tabela (apps/analytics/kpis.py)
+        kpis = PlaneadorKPIService(empresa).executar('analytics', hoje=hoje)
         
+        # Eventos hoje vs ontem
+        eventos_hoje = kpis['eventos_hoje']
+        eventos_ontem = kpis['eventos_ontem']
         variacao_eventos = self._calcular_variacao(eventos_hoje, eventos_ontem)
         
         # Vendas do período
-        vendas_mes = Venda.objects.filter(
-            empresa=empresa,
-            data_venda__gte=mes_atual,
-            status='finalizada'
-        ).aggregate(
-            total=Sum('total'),
-            quantidade=Count('id')
-        )
-        
-        vendas_mes_anterior = Venda.objects.filter(
-            empresa=empresa,
-            data_venda__gte=mes_anterior,
-            data_venda__lt=mes_atual,
-            status='finalizada'
-        ).aggregate(
-            total=Sum('total'),
-            quantidade=Count('id')
-        )
-        
+        vendas_mes = {'total': kpis['vendas_mes_total'], 'quantidade': kpis['vendas_mes_quantidade']}
         variacao_vendas = self._calcular_variacao(
-            vendas_mes['total'] or 0,
-            vendas_mes_anterior['total'] or 0
+            kpis['vendas_mes_total'] or 0,
+            kpis['vendas_mes_anterior_total'] or 0
         )
         
         # Alertas ativos
-        alertas_ativos = AlertaInteligente.objects.filter(
-            empresa=empresa,
-            status='ativo'
-        ).count()
+        alertas_ativos = kpis['alertas_ativos']
         
         # Top eventos por categoria
         eventos_por_categoria = EventoAnalytics.objects.filter(
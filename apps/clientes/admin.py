@@ -4,7 +4,7 @@ from .models import (
     Cliente, Ponto, CategoriaCliente, EnderecoCliente,
     ContatoCliente, HistoricoCliente,
     CartaoFidelidade, MovimentacaoFidelidade, PreferenciaCliente,
-    TelefoneCliente, GrupoCliente, ProgramaFidelidade
+    TelefoneCliente, GrupoCliente, ProgramaFidelidade, EstatisticaCliente
 )
 
 @admin.register(Cliente)
@@ -17,7 +17,18 @@ class ClienteAdmin(admin.ModelAdmin):
 @admin.register(Ponto)
 class PontoAdmin(admin.ModelAdmin):
     search_fields = ("cliente__nome_completo",)
-    list_display = ("cliente", "valor", "data")
+    list_display = ("cliente", "valor", "data", "venda")
+    raw_id_fields = ("venda",)
+
+
+@admin.register(EstatisticaCliente)
+class EstatisticaClienteAdmin(admin.ModelAdmin):
+    search_fields = ("cliente__nome_completo", "cliente__razao_social")
+    list_filter = ("empresa",)
+    list_display = ("cliente", "total_compras", "total_comprado", "ultima_compra", "total_pontos",
+                    "credito_em_aberto", "reconciliado_em")
+    list_select_related = ("cliente",)
+    readonly_fields = ("atualizado_em", "reconciliado_em")
    
 
 @admin.register(CategoriaCliente)
@@ -50,14 +61,17 @@ class HistoricoClienteAdmin(admin.ModelAdmin):
 @admin.register(CartaoFidelidade)
 class CartaoFidelidadeAdmin(admin.ModelAdmin):
     search_fields = ("numero_cartao", "cliente__nome_completo")
-    list_display = ("numero_cartao", "cliente", "pontos_atuais", "nivel_atual", "ativo")
+    list_display = ("numero_cartao", "cliente", "pontos_atuais", "pontos_totais_acumulados", "nivel_atual", "ativo")
+    readonly_fields = ("pontos_atuais", "pontos_totais_acumulados", "pontos_utilizados", "pontos_expirados")
    
 
 @admin.register(MovimentacaoFidelidade)
 class MovimentacaoFidelidadeAdmin(admin.ModelAdmin):
     search_fields = ("cartao__numero_cartao", "cartao__cliente__nome_completo")
     list_filter = ("tipo_movimentacao",)
-    list_display = ("cartao", "tipo_movimentacao", "pontos", "descricao", "data_movimentacao")
+    list_display = ("cartao", "tipo_movimentacao", "pontos", "saldo_apos", "pontos_restantes", "data_expiracao",
+                    "descricao", "data_movimentacao")
+    readonly_fields = ("saldo_apos", "pontos_restantes", "chave_idempotencia")
     
 
 @admin.register(PreferenciaCliente)
@@ -30,7 +30,16 @@ class ClienteSerializer(serializers.ModelSerializer):
     enderecos = EnderecoClienteSerializer(many=True, read_only=True)
     telefones = TelefoneClienteSerializer(many=True, read_only=True)
     idade = serializers.IntegerField(read_only=True)
-    total_compras = serializers.DecimalField(max_digits=15, decimal_places=2, read_only=True)
+    # Estatísticas desnormalizadas (EstatisticaCliente, lida por select_related)
+    total_compras = serializers.IntegerField(source='estatistica_compras.total_compras', read_only=True)
+    total_comprado = serializers.DecimalField(
+        source='estatistica_compras.total_comprado', max_digits=14, decimal_places=2, read_only=True
+    )
+    ultima_compra = serializers.DateField(source='estatistica_compras.ultima_compra', read_only=True)
+    total_pontos = serializers.DecimalField(
+        source='estatistica_compras.total_pontos', max_digits=14, decimal_places=2, read_only=True
+    )
+    credito_disponivel = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
     
     class Meta:
         model = Cliente
@@ -13,6 +13,17 @@ class ClienteViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['ativo', 'grupo', 'data_nascimento']
     
+    def get_queryset(self):
+        user = self.request.user
+        empresa = getattr(user, 'empresa', None)
+        if empresa is None and getattr(user, 'funcionario', None):
+            empresa = user.funcionario.empresa
+        return (
+            Cliente.objects.filter(empresa=empresa)
+            .select_related('estatistica')
+            .prefetch_related('enderecos', 'telefones')
+        )
+    
     @action(detail=True, methods=['get'])
     def historico_compras(self, request, pk=None):
         cliente = self.get_object()
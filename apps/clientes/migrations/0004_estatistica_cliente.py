@@ -0,0 +1,35 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0003_alter_cliente_nome_completo'),
+        ('core', '0003_numeracao_blocos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstatisticaCliente',
+            fields=[
+                ('cliente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='estatistica', serialize=False, to='clientes.cliente')),
+                ('total_compras', models.PositiveIntegerField(default=0)),
+                ('total_comprado', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('primeira_compra', models.DateField(blank=True, null=True)),
+                ('ultima_compra', models.DateField(blank=True, null=True)),
+                ('total_pontos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('credito_em_aberto', models.DecimalField(decimal_places=2, default=0, help_text='Soma de (total - valor pago) das vendas pendentes/finalizadas não liquidadas', max_digits=14)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('reconciliado_em', models.DateTimeField(blank=True, null=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estatisticas_clientes', to='core.empresa')),
+            ],
+            options={
+                'verbose_name': 'Estatística de Cliente',
+                'verbose_name_plural': 'Estatísticas de Clientes',
+                'indexes': [models.Index(fields=['empresa', '-total_comprado'], name='idx_estat_cliente_comprado'), models.Index(fields=['empresa', '-ultima_compra'], name='idx_estat_cliente_ultima')],
+            },
+        ),
+    ]
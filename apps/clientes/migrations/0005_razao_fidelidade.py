@@ -0,0 +1,50 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0004_estatistica_cliente'),
+        ('vendas', '0007_metas_realizado_execucao_comissao'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartaofidelidade',
+            name='pontos_expirados',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movimentacaofidelidade',
+            name='chave_idempotencia',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='movimentacaofidelidade',
+            name='data_expiracao',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movimentacaofidelidade',
+            name='pontos_restantes',
+            field=models.IntegerField(default=0, help_text='Pontos do lote ainda não utilizados/expirados'),
+        ),
+        migrations.AddField(
+            model_name='movimentacaofidelidade',
+            name='saldo_apos',
+            field=models.IntegerField(default=0, help_text='Saldo do cartão após a movimentação'),
+        ),
+        migrations.AlterField(
+            model_name='movimentacaofidelidade',
+            name='tipo_movimentacao',
+            field=models.CharField(choices=[('credito', 'Crédito'), ('debito', 'Débito'), ('expiracao', 'Expiração'), ('bonus', 'Bônus'), ('ajuste', 'Ajuste'), ('estorno', 'Estorno')], max_length=15),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaofidelidade',
+            index=models.Index(condition=models.Q(('pontos_restantes__gt', 0)), fields=['data_expiracao', 'cartao'], name='idx_fidelidade_lotes_abertos'),
+        ),
+    ]
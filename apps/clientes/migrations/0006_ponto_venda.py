@@ -0,0 +1,71 @@
+# Generated by Django 5.1.5 on 2026-10-19 15:02
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+CHAVE_VENDA = re.compile(r'^venda:\d+$')
+
+
+def ligar_pontos_vendas(apps, schema_editor):
+    """
+    Liga os Pontos existentes à venda pela movimentação de acumulação
+    (mesmo cliente, valor e dia) e remove os das vendas já canceladas,
+    descontando-os das estatísticas do cliente.
+    """
+    Ponto = apps.get_model('clientes', 'Ponto')
+    MovimentacaoFidelidade = apps.get_model('clientes', 'MovimentacaoFidelidade')
+    EstatisticaCliente = apps.get_model('clientes', 'EstatisticaCliente')
+
+    acumulacoes = (
+        MovimentacaoFidelidade.objects
+        .filter(chave_idempotencia__startswith='venda:', venda_relacionada__isnull=False)
+        .values_list('chave_idempotencia', 'cartao__cliente_id', 'pontos', 'data_movimentacao',
+                     'venda_relacionada_id', 'venda_relacionada__status')
+        .order_by('id')
+    )
+    for chave, cliente_id, pontos, data, venda_id, status in acumulacoes.iterator():
+        if not CHAVE_VENDA.match(chave):
+            continue
+        if timezone.is_aware(data):
+            data = timezone.localtime(data)
+        ponto = (
+            Ponto.objects
+            .filter(cliente_id=cliente_id, valor=pontos, data=data.date(), venda__isnull=True)
+            .order_by('id')
+            .first()
+        )
+        if ponto is None:
+            continue
+        if status == 'cancelada':
+            ponto.delete()
+            EstatisticaCliente.objects.filter(cliente_id=cliente_id).update(
+                total_pontos=F('total_pontos') - pontos
+            )
+        else:
+            ponto.venda_id = venda_id
+            ponto.save(update_fields=['venda'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0005_razao_fidelidade'),
+        ('vendas', '0009_itemdevolucao_item_venda_original'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ponto',
+            name='venda',
+            field=models.ForeignKey(
+                blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                related_name='pontos_cliente', to='vendas.venda',
+            ),
+        ),
+        migrations.RunPython(ligar_pontos_vendas, migrations.RunPython.noop),
+    ]
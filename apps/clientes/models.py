@@ -11,7 +11,6 @@ from django.db import models
 from django.utils import timezone 
 from datetime import date
 from django.core.exceptions import ValidationError
-from django.db.models import Sum
 from django.db import models, transaction
 from cloudinary.models import CloudinaryField
 
@@ -21,6 +20,13 @@ class Ponto(models.Model):
     cliente = models.ForeignKey('clientes.Cliente', on_delete=models.CASCADE)
     valor = models.DecimalField(max_digits=10, decimal_places=2)
     data = models.DateField(auto_now_add=True)
+    venda = models.ForeignKey(
+        'vendas.Venda',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='pontos_cliente'
+    )
 
 
 class CategoriaCliente(TimeStampedModel):
@@ -229,32 +235,40 @@ class Cliente(TimeStampedModel):
         ]
         return " - ".join(filter(None, endereco_parts))
     
+    @property
+    def estatistica_compras(self):
+        """
+        Estatísticas desnormalizadas (EstatisticaCliente). Em listagens use
+        ``select_related('estatistica')`` para as ler no mesmo JOIN.
+        """
+        try:
+            return self.estatistica
+        except EstatisticaCliente.DoesNotExist:
+            from .services import EstatisticaClienteService
+            EstatisticaClienteService(self.empresa).reconciliar(clientes=[self])
+            return EstatisticaCliente.objects.get(cliente_id=self.pk)
+    
     @property
     def total_compras(self):
         """Total de compras realizadas"""
-        return self.vendas.filter(status__in=['finalizada', 'entregue']).count()
+        return self.estatistica_compras.total_compras
     
     @property
     def total_comprado(self):
         """Valor total comprado pelo cliente"""
-        total = self.vendas.filter(
-            status__in=['finalizada', 'entregue']
-        ).aggregate(total=models.Sum('total'))['total']
-        return total or Decimal('0.00')
+        return self.estatistica_compras.total_comprado
     
     @property
     def ticket_medio(self):
         """Ticket médio do cliente"""
-        total_compras = self.total_compras
-        if total_compras > 0:
-            return self.total_comprado / total_compras
-        return Decimal('0.00')
+        return self.estatistica_compras.ticket_medio
     
     @property
     def dias_sem_compra(self):
         """Dias desde a última compra"""
-        if self.data_ultima_compra:
-            return (date.today() - self.data_ultima_compra).days
+        ultima_compra = self.estatistica_compras.ultima_compra or self.data_ultima_compra
+        if ultima_compra:
+            return (date.today() - ultima_compra).days
         return None
     
     @property
@@ -274,25 +288,54 @@ class Cliente(TimeStampedModel):
     
     @property
     def total_pontos(self):
-        return self.ponto_set.aggregate(Sum('valor'))['valor__sum'] or 0
+        return self.estatistica_compras.total_pontos
     
     @property
     def credito_disponivel(self):
         """Crédito disponível considerando limite e vendas em aberto"""
-        from django.db.models import Sum
-        from decimal import Decimal
+        return self.limite_credito - self.estatistica_compras.credito_em_aberto
 
-        vendas_em_aberto = self.vendas.filter(
-            status__in=['pendente', 'finalizada']
-        ).exclude(
-            valor_pago__gte=models.F('total')
-        )
 
-        total_em_aberto = vendas_em_aberto.aggregate(
-            total=Sum(models.F('total') - models.F('valor_pago'))
-        )['total'] or Decimal('0.00')
-
-        return self.limite_credito - total_em_aberto
+class EstatisticaCliente(models.Model):
+    """
+    Estatísticas de compras por cliente, mantidas por deltas nas gravações
+    de vendas e pontos (apps.vendas.signals / signals de Ponto) e
+    reconciliadas periodicamente (reconciliar_estatisticas_clientes_task).
+    """
+    cliente = models.OneToOneField(
+        Cliente, on_delete=models.CASCADE, primary_key=True, related_name='estatistica'
+    )
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='estatisticas_clientes')
+    
+    total_compras = models.PositiveIntegerField(default=0)
+    total_comprado = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    primeira_compra = models.DateField(null=True, blank=True)
+    ultima_compra = models.DateField(null=True, blank=True)
+    total_pontos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    credito_em_aberto = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0,
+        help_text="Soma de (total - valor pago) das vendas pendentes/finalizadas não liquidadas"
+    )
+    
+    atualizado_em = models.DateTimeField(auto_now=True)
+    reconciliado_em = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Estatística de Cliente"
+        verbose_name_plural = "Estatísticas de Clientes"
+        indexes = [
+            models.Index(fields=['empresa', '-total_comprado'], name='idx_estat_cliente_comprado'),
+            models.Index(fields=['empresa', '-ultima_compra'], name='idx_estat_cliente_ultima'),
+        ]
+    
+    def __str__(self):
+        return f"{self.cliente_id}: {self.total_compras} compras / {self.total_comprado}"
+    
+    @property
+    def ticket_medio(self):
+        if self.total_compras > 0:
+            return self.total_comprado / self.total_compras
+        return Decimal('0.00')
 
 
 class EnderecoCliente(TimeStampedModel):
@@ -454,8 +497,28 @@ class HistoricoCliente(TimeStampedModel):
     def __str__(self):
         return f"{self.cliente.nome_exibicao} - {self.get_tipo_interacao_display()} - {self.data_interacao.strftime('%d/%m/%Y')}"
 
+# Níveis do cartão por pontos acumulados (limite mínimo, nível), do maior para o menor
+NIVEIS_FIDELIDADE = [
+    (10000, 'Diamante'),
+    (5000, 'Ouro'),
+    (2000, 'Prata'),
+    (0, 'Bronze'),
+]
+
+
+def nivel_fidelidade(pontos_acumulados):
+    for minimo, nivel in NIVEIS_FIDELIDADE:
+        if pontos_acumulados >= minimo:
+            return nivel
+    return NIVEIS_FIDELIDADE[-1][1]
+
+
 class CartaoFidelidade(TimeStampedModel):
-    """Programa de fidelidade"""
+    """
+    Programa de fidelidade. Os saldos são mantidos pelo razão de
+    movimentações (FidelidadeService): pontos_atuais = acumulados -
+    utilizados - expirados, sempre atualizados com o cartão bloqueado.
+    """
     cliente = models.OneToOneField(Cliente, on_delete=models.CASCADE, related_name='cartao_fidelidade')
     
     # Identificação
@@ -466,6 +529,7 @@ class CartaoFidelidade(TimeStampedModel):
     pontos_atuais = models.IntegerField(default=0)
     pontos_totais_acumulados = models.IntegerField(default=0)
     pontos_utilizados = models.IntegerField(default=0)
+    pontos_expirados = models.IntegerField(default=0)
     
     # Configurações
     ativo = models.BooleanField(default=True)
@@ -483,64 +547,45 @@ class CartaoFidelidade(TimeStampedModel):
     def __str__(self):
         return f"Cartão {self.numero_cartao} - {self.cliente.nome_exibicao}"
     
-    def adicionar_pontos(self, pontos, descricao=""):
+    def _aplicar_movimentacao(self, tipo, pontos, descricao, **kwargs):
+        from .services import FidelidadeService
+        movimentacao = FidelidadeService.movimentar(self.pk, tipo, pontos, descricao, **kwargs)
+        self.refresh_from_db(fields=[
+            'pontos_atuais', 'pontos_totais_acumulados', 'pontos_utilizados', 'pontos_expirados',
+            'nivel_atual', 'data_ultima_movimentacao',
+        ])
+        return movimentacao
+    
+    def adicionar_pontos(self, pontos, descricao="", **kwargs):
         """Adiciona pontos ao cartão"""
-        self.pontos_atuais += pontos
-        self.pontos_totais_acumulados += pontos
-        self.data_ultima_movimentacao = date.today()
-        self.save()
-        
-        # Registrar movimentação
-        MovimentacaoFidelidade.objects.create(
-            cartao=self,
-            tipo_movimentacao='credito',
-            pontos=pontos,
-            descricao=descricao
-        )
-        
-        # Verificar mudança de nível
-        self.verificar_nivel()
-    
-    def utilizar_pontos(self, pontos, descricao=""):
+        return self._aplicar_movimentacao('credito', pontos, descricao, **kwargs)
+    
+    def utilizar_pontos(self, pontos, descricao="", **kwargs):
         """Utiliza pontos do cartão"""
-        if self.pontos_atuais < pontos:
-            raise ValidationError("Pontos insuficientes")
-        
-        self.pontos_atuais -= pontos
-        self.pontos_utilizados += pontos
-        self.data_ultima_movimentacao = date.today()
-        self.save()
-        
-        # Registrar movimentação
-        MovimentacaoFidelidade.objects.create(
-            cartao=self,
-            tipo_movimentacao='debito',
-            pontos=pontos,
-            descricao=descricao
-        )
+        return self._aplicar_movimentacao('debito', pontos, descricao, **kwargs)
     
     def verificar_nivel(self):
         """Verifica e atualiza o nível do cliente"""
-        if self.pontos_totais_acumulados >= 10000:
-            self.nivel_atual = 'Diamante'
-        elif self.pontos_totais_acumulados >= 5000:
-            self.nivel_atual = 'Ouro'
-        elif self.pontos_totais_acumulados >= 2000:
-            self.nivel_atual = 'Prata'
-        else:
-            self.nivel_atual = 'Bronze'
-        
-        self.save()
+        nivel = nivel_fidelidade(self.pontos_totais_acumulados)
+        if nivel != self.nivel_atual:
+            self.nivel_atual = nivel
+            self.save(update_fields=['nivel_atual'])
 
 class MovimentacaoFidelidade(TimeStampedModel):
-    """Movimentações do programa de fidelidade"""
+    """
+    Razão (append-only) do programa de fidelidade. ``pontos`` é sempre
+    positivo; o sinal vem do tipo. Créditos são lotes com validade e
+    ``pontos_restantes`` consumidos por ordem de antiguidade (FIFO).
+    """
     TIPO_CHOICES = [
         ('credito', 'Crédito'),
         ('debito', 'Débito'),
         ('expiracao', 'Expiração'),
         ('bonus', 'Bônus'),
         ('ajuste', 'Ajuste'),
+        ('estorno', 'Estorno'),
     ]
+    TIPOS_CREDITO = ('credito', 'bonus', 'ajuste')
     
     cartao = models.ForeignKey(CartaoFidelidade, on_delete=models.CASCADE, related_name='movimentacoes')
     
@@ -549,6 +594,12 @@ class MovimentacaoFidelidade(TimeStampedModel):
     descricao = models.CharField(max_length=255)
     data_movimentacao = models.DateTimeField(auto_now_add=True)
     
+    # Razão
+    saldo_apos = models.IntegerField(default=0, help_text="Saldo do cartão após a movimentação")
+    pontos_restantes = models.IntegerField(default=0, help_text="Pontos do lote ainda não utilizados/expirados")
+    data_expiracao = models.DateField(null=True, blank=True)
+    chave_idempotencia = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    
     # Relacionamentos
     venda_relacionada = models.ForeignKey(
         'vendas.Venda', 
@@ -567,9 +618,16 @@ class MovimentacaoFidelidade(TimeStampedModel):
         verbose_name = "Movimentação Fidelidade"
         verbose_name_plural = "Movimentações Fidelidade"
         ordering = ['-data_movimentacao']
+        indexes = [
+            models.Index(
+                fields=['data_expiracao', 'cartao'],
+                condition=models.Q(pontos_restantes__gt=0),
+                name='idx_fidelidade_lotes_abertos',
+            ),
+        ]
     
     def __str__(self):
-        sinal = '+' if self.tipo_movimentacao == 'credito' else '-'
+        sinal = '+' if self.tipo_movimentacao in self.TIPOS_CREDITO else '-'
         return f"{sinal}{self.pontos} pts - {self.cartao.cliente.nome_exibicao}"
 
 class PreferenciaCliente(TimeStampedModel):
@@ -0,0 +1,492 @@
+# apps/clientes/services.py
+"""
+Manutenção das estatísticas desnormalizadas por cliente (EstatisticaCliente).
+
+As gravações de vendas e pontos aplicam deltas atómicos (F()) ao registo do
+cliente; a reconciliação periódica recalcula tudo por agregação agrupada e
+corrige eventuais desvios (gravações via queryset.update, imports, etc.).
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, Count, DecimalField, F, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least, TruncDate
+from django.utils import timezone
+
+from .models import (
+    NIVEIS_FIDELIDADE, CartaoFidelidade, Cliente, EstatisticaCliente, MovimentacaoFidelidade, Ponto,
+    nivel_fidelidade,
+)
+
+ZERO = Decimal('0.00')
+
+# Estados de venda que contam como compra / que podem ter crédito em aberto
+STATUS_COMPRA = ('finalizada', 'entregue')
+STATUS_CREDITO = ('pendente', 'finalizada')
+
+
+def contribuicao_venda(status, total, valor_pago):
+    """
+    Contribuição de uma venda para as estatísticas do cliente:
+    (compras, valor comprado, crédito em aberto).
+    """
+    total = total or ZERO
+    valor_pago = valor_pago or ZERO
+    compra = status in STATUS_COMPRA
+    aberto = total - valor_pago if status in STATUS_CREDITO and valor_pago < total else ZERO
+    return (1 if compra else 0, total if compra else ZERO, aberto)
+
+
+class EstatisticaClienteService:
+    """Deltas e reconciliação das estatísticas de clientes de uma empresa"""
+
+    TAMANHO_BLOCO = 1000
+
+    def __init__(self, empresa=None):
+        self.empresa = empresa
+
+    # =====================================
+    # DELTAS (caminhos de escrita)
+    # =====================================
+
+    @classmethod
+    def aplicar_delta(cls, cliente_id, compras=0, comprado=ZERO, pontos=ZERO, credito=ZERO, data_compra=None,
+                      criar=True):
+        """
+        Aplica um delta ao registo do cliente com um único UPDATE atómico.
+        Se o registo ainda não existir é criado por reconciliação do cliente
+        (que já inclui o efeito da gravação corrente), exceto com
+        ``criar=False`` (remoções, que podem vir da eliminação do cliente).
+        """
+        if not cliente_id or not (compras or comprado or pontos or credito or data_compra):
+            return
+
+        campos = {}
+        if compras:
+            campos['total_compras'] = F('total_compras') + compras
+        if comprado:
+            campos['total_comprado'] = F('total_comprado') + comprado
+        if pontos:
+            campos['total_pontos'] = F('total_pontos') + pontos
+        if credito:
+            campos['credito_em_aberto'] = F('credito_em_aberto') + credito
+        if data_compra and compras > 0:
+            campos['ultima_compra'] = Greatest(Coalesce('ultima_compra', Value(data_compra)), Value(data_compra))
+            campos['primeira_compra'] = Least(Coalesce('primeira_compra', Value(data_compra)), Value(data_compra))
+        campos['atualizado_em'] = timezone.now()
+
+        if EstatisticaCliente.objects.filter(cliente_id=cliente_id).update(**campos) or not criar:
+            return
+
+        cliente = Cliente.objects.filter(pk=cliente_id).select_related('empresa').first()
+        if cliente is not None:
+            try:
+                with transaction.atomic():
+                    cls(cliente.empresa).reconciliar(clientes=[cliente])
+            except IntegrityError:
+                # Criado em paralelo: aplica o delta sobre o registo existente
+                EstatisticaCliente.objects.filter(cliente_id=cliente_id).update(**campos)
+
+    @classmethod
+    def registrar_venda(cls, anterior, atual, data_compra=None):
+        """
+        Atualiza as estatísticas a partir do estado anterior e atual de uma
+        venda; cada estado é (cliente_id, status, total, valor_pago) ou None.
+        """
+        if anterior == atual:
+            return
+        deltas = {}
+        if anterior and anterior[0]:
+            compras, comprado, credito = contribuicao_venda(*anterior[1:])
+            deltas[anterior[0]] = [-compras, -comprado, -credito]
+        if atual and atual[0]:
+            compras, comprado, credito = contribuicao_venda(*atual[1:])
+            delta = deltas.setdefault(atual[0], [0, ZERO, ZERO])
+            delta[0] += compras
+            delta[1] += comprado
+            delta[2] += credito
+        # Um único delta por cliente: se o registo não existir, a reconciliação
+        # já inclui o estado gravado e não pode ser aplicada duas vezes
+        for cliente_id, (compras, comprado, credito) in deltas.items():
+            cls.aplicar_delta(
+                cliente_id, compras=compras, comprado=comprado, credito=credito,
+                data_compra=data_compra if atual and cliente_id == atual[0] else None,
+                criar=atual is not None,
+            )
+
+    @classmethod
+    def registrar_pontos(cls, cliente_id, valor, criar=True):
+        cls.aplicar_delta(cliente_id, pontos=valor or ZERO, criar=criar)
+
+    # =====================================
+    # RECONCILIAÇÃO
+    # =====================================
+
+    def _clientes(self, clientes=None):
+        if clientes is not None:
+            return list(clientes)
+        queryset = Cliente.objects.all()
+        if self.empresa is not None:
+            queryset = queryset.filter(empresa=self.empresa)
+        return queryset.only('id', 'empresa_id')
+
+    def _calcular(self, ids):
+        """Agrega vendas e pontos de um bloco de clientes (duas queries)"""
+        from apps.vendas.models import Venda
+
+        decimal = DecimalField(max_digits=14, decimal_places=2)
+        vendas = Venda.objects.filter(cliente_id__in=ids).values('cliente_id').annotate(
+            compras=Count('id', filter=Q(status__in=STATUS_COMPRA)),
+            comprado=Sum('total', filter=Q(status__in=STATUS_COMPRA)),
+            primeira=Min(TruncDate('data_venda'), filter=Q(status__in=STATUS_COMPRA)),
+            ultima=Max(TruncDate('data_venda'), filter=Q(status__in=STATUS_COMPRA)),
+            credito=Sum(
+                Case(
+                    When(status__in=STATUS_CREDITO, valor_pago__lt=F('total'), then=F('total') - F('valor_pago')),
+                    default=Value(ZERO),
+                    output_field=decimal,
+                ),
+            ),
+        )
+        pontos = dict(
+            Ponto.objects.filter(cliente_id__in=ids).values('cliente_id')
+            .annotate(total=Sum('valor')).values_list('cliente_id', 'total')
+        )
+        return {linha['cliente_id']: linha for linha in vendas}, pontos
+
+    def reconciliar(self, clientes=None):
+        """
+        Recalcula e grava (upsert) as estatísticas dos clientes indicados ou
+        de todos os clientes da empresa. Devolve o número de clientes
+        reconciliados.
+        """
+        agora = timezone.now()
+        resultado = 0
+        lista = self._clientes(clientes)
+        iterador = lista if isinstance(lista, list) else lista.iterator(chunk_size=self.TAMANHO_BLOCO)
+
+        bloco = []
+        for cliente in iterador:
+            bloco.append(cliente)
+            if len(bloco) >= self.TAMANHO_BLOCO:
+                resultado += self._reconciliar_bloco(bloco, agora)
+                bloco = []
+        if bloco:
+            resultado += self._reconciliar_bloco(bloco, agora)
+        return resultado
+
+    @transaction.atomic
+    def _reconciliar_bloco(self, clientes, agora):
+        """
+        Os registos do bloco são bloqueados antes da agregação: um delta
+        concorrente ou já fez commit (e entra na agregação) ou espera pelo
+        fim do bloco e aplica-se sobre o valor reconciliado.
+        """
+        ids = [cliente.pk for cliente in clientes]
+        list(
+            EstatisticaCliente.objects.select_for_update().filter(cliente_id__in=ids)
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        vendas, pontos = self._calcular(ids)
+
+        registros = []
+        for cliente in clientes:
+            linha = vendas.get(cliente.pk, {})
+            registros.append(EstatisticaCliente(
+                cliente_id=cliente.pk,
+                empresa_id=cliente.empresa_id,
+                total_compras=linha.get('compras') or 0,
+                total_comprado=linha.get('comprado') or ZERO,
+                primeira_compra=linha.get('primeira'),
+                ultima_compra=linha.get('ultima'),
+                total_pontos=pontos.get(cliente.pk) or ZERO,
+                credito_em_aberto=linha.get('credito') or ZERO,
+                atualizado_em=agora,
+                reconciliado_em=agora,
+            ))
+
+        EstatisticaCliente.objects.bulk_create(
+            registros,
+            update_conflicts=True,
+            unique_fields=['cliente'],
+            update_fields=[
+                'empresa', 'total_compras', 'total_comprado', 'primeira_compra', 'ultima_compra',
+                'total_pontos', 'credito_em_aberto', 'atualizado_em', 'reconciliado_em',
+            ],
+        )
+        return len(registros)
+
+
+class FidelidadeService:
+    """
+    Razão de pontos de fidelidade: cada movimentação bloqueia o cartão,
+    atualiza saldo e nível por F() e grava a linha com o saldo resultante.
+    Créditos são lotes com validade consumidos em FIFO por débitos e pela
+    expiração em lote; o estorno de uma venda consome primeiro o lote da
+    própria venda e desconta os pontos do acumulado (e do nível).
+    """
+
+    TAMANHO_BLOCO = 1000
+    VALIDADE_DIAS = getattr(settings, 'FIDELIDADE_VALIDADE_PONTOS_DIAS', 365)
+
+    @staticmethod
+    def _nivel_expr(campo='pontos_totais_acumulados'):
+        return Case(
+            *[When(**{f'{campo}__gte': minimo}, then=Value(nivel)) for minimo, nivel in NIVEIS_FIDELIDADE[:-1]],
+            default=Value(NIVEIS_FIDELIDADE[-1][1]),
+            output_field=CharField(),
+        )
+
+    @classmethod
+    def movimentar(cls, cartao_id, tipo, pontos, descricao="", venda=None, usuario=None,
+                   chave=None, validade_dias=None, lote=None):
+        """
+        Regista uma movimentação. Com ``chave`` a operação é idempotente:
+        uma segunda chamada devolve a movimentação já existente. Débitos
+        com ``lote`` consomem esse lote antes dos restantes.
+        """
+        pontos = int(pontos)
+        if pontos <= 0:
+            raise ValidationError("A quantidade de pontos deve ser positiva")
+        if chave:
+            existente = MovimentacaoFidelidade.objects.filter(chave_idempotencia=chave).first()
+            if existente:
+                return existente
+
+        credito = tipo in MovimentacaoFidelidade.TIPOS_CREDITO
+        hoje = timezone.localdate()
+        try:
+            with transaction.atomic():
+                cartao = CartaoFidelidade.objects.select_for_update().get(pk=cartao_id)
+                if not credito and tipo != 'expiracao' and cartao.pontos_atuais < pontos:
+                    raise ValidationError("Pontos insuficientes")
+
+                if credito:
+                    acumulados = cartao.pontos_totais_acumulados + pontos
+                    campos = {
+                        'pontos_atuais': F('pontos_atuais') + pontos,
+                        'pontos_totais_acumulados': F('pontos_totais_acumulados') + pontos,
+                        'nivel_atual': nivel_fidelidade(acumulados),
+                    }
+                    saldo = cartao.pontos_atuais + pontos
+                elif tipo == 'estorno':
+                    # Os pontos estornados nunca foram ganhos: saem do acumulado
+                    cls._consumir_lotes(cartao.pk, pontos, lote)
+                    acumulados = max(cartao.pontos_totais_acumulados - pontos, 0)
+                    campos = {
+                        'pontos_atuais': F('pontos_atuais') - pontos,
+                        'pontos_totais_acumulados': acumulados,
+                        'nivel_atual': nivel_fidelidade(acumulados),
+                    }
+                    saldo = cartao.pontos_atuais - pontos
+                else:
+                    cls._consumir_lotes(cartao.pk, pontos, lote)
+                    campo = 'pontos_expirados' if tipo == 'expiracao' else 'pontos_utilizados'
+                    campos = {'pontos_atuais': F('pontos_atuais') - pontos, campo: F(campo) + pontos}
+                    saldo = cartao.pontos_atuais - pontos
+                campos['data_ultima_movimentacao'] = hoje
+                CartaoFidelidade.objects.filter(pk=cartao.pk).update(**campos)
+
+                validade = cls.VALIDADE_DIAS if validade_dias is None else validade_dias
+                movimentacao = MovimentacaoFidelidade.objects.create(
+                    cartao_id=cartao.pk,
+                    tipo_movimentacao=tipo,
+                    pontos=pontos,
+                    descricao=descricao[:255],
+                    saldo_apos=saldo,
+                    pontos_restantes=pontos if credito else 0,
+                    data_expiracao=hoje + timedelta(days=validade) if credito and validade else None,
+                    chave_idempotencia=chave,
+                    venda_relacionada=venda,
+                    usuario_responsavel=usuario,
+                )
+                movimentacao.criada = True
+                return movimentacao
+        except IntegrityError:
+            if chave:
+                existente = MovimentacaoFidelidade.objects.filter(chave_idempotencia=chave).first()
+                if existente:
+                    return existente
+            raise
+
+    @staticmethod
+    def _consumir_lotes(cartao_id, pontos, lote=None):
+        """
+        Consome pontos dos lotes abertos, do mais antigo para o mais recente;
+        ``lote`` (id), se indicado, é consumido primeiro.
+        """
+        ordem = [F('data_expiracao').asc(nulls_last=True), 'id']
+        if lote is not None:
+            ordem.insert(0, Case(When(pk=lote, then=Value(0)), default=Value(1)))
+        lotes = (
+            MovimentacaoFidelidade.objects
+            .filter(cartao_id=cartao_id, pontos_restantes__gt=0)
+            .order_by(*ordem)
+            .only('id', 'pontos_restantes')
+        )
+        alterados = []
+        for lote in lotes.iterator():
+            if pontos <= 0:
+                break
+            consumo = min(pontos, lote.pontos_restantes)
+            lote.pontos_restantes -= consumo
+            pontos -= consumo
+            alterados.append(lote)
+        MovimentacaoFidelidade.objects.bulk_update(alterados, ['pontos_restantes'])
+
+    @staticmethod
+    def obter_cartao(cliente):
+        """Cartão do cliente, criado na primeira acumulação"""
+        cartao, _ = CartaoFidelidade.objects.get_or_create(
+            cliente=cliente,
+            defaults={'numero_cartao': f"CF{cliente.pk:010d}"},
+        )
+        return cartao
+
+    # =====================================
+    # VENDAS
+    # =====================================
+
+    @classmethod
+    def pontos_venda(cls, venda):
+        # 1 ponto = 1 Kz gasto
+        return int(venda.total or 0)
+
+    @classmethod
+    def acumular_venda(cls, venda):
+        """
+        Acumula os pontos de uma venda finalizada ou entregue (idempotente
+        por venda). Devolve a movimentação criada ou existente, ou None.
+        """
+        if not venda.cliente_id or venda.status not in STATUS_COMPRA:
+            return None
+        pontos = cls.pontos_venda(venda)
+        if pontos <= 0:
+            return None
+        chave = f"venda:{venda.pk}"
+        if MovimentacaoFidelidade.objects.filter(chave_idempotencia=chave).exists():
+            return None
+
+        cartao = cls.obter_cartao(venda.cliente)
+        if not cartao.ativo:
+            return None
+        with transaction.atomic():
+            movimentacao = cls.movimentar(
+                cartao.pk, 'credito', pontos, f"Compra {venda.numero_documento}",
+                venda=venda, chave=chave,
+            )
+            if getattr(movimentacao, 'criada', False):
+                # Histórico simples de pontos por venda (estatísticas do cliente)
+                Ponto.objects.create(cliente_id=venda.cliente_id, valor=pontos, venda=venda)
+        return movimentacao
+
+    @classmethod
+    def estornar_venda(cls, venda):
+        """
+        Estorna os pontos de uma venda cancelada, limitado ao saldo disponível,
+        a partir do lote da própria venda. O Ponto da venda é sempre removido
+        (o post_delete desconta-o das estatísticas do cliente), mesmo que o
+        cartão já não tenha saldo.
+        """
+        for ponto in Ponto.objects.filter(venda=venda):
+            ponto.delete()
+        acumulacao = MovimentacaoFidelidade.objects.filter(chave_idempotencia=f"venda:{venda.pk}").first()
+        if acumulacao is None:
+            return None
+        chave = f"venda:{venda.pk}:estorno"
+        if MovimentacaoFidelidade.objects.filter(chave_idempotencia=chave).exists():
+            return None
+        saldo = CartaoFidelidade.objects.filter(pk=acumulacao.cartao_id).values_list('pontos_atuais', flat=True).first()
+        pontos = min(acumulacao.pontos, saldo or 0)
+        if pontos <= 0:
+            return None
+        return cls.movimentar(
+            acumulacao.cartao_id, 'estorno', pontos, f"Cancelamento {venda.numero_documento}",
+            venda=venda, chave=chave, lote=acumulacao.pk,
+        )
+
+    # =====================================
+    # JOBS EM LOTE
+    # =====================================
+
+    @classmethod
+    def expirar_pontos(cls, data=None):
+        """
+        Expira os lotes vencidos até ``data``: uma movimentação de expiração
+        por cartão, processando os cartões em blocos. Devolve os pontos expirados.
+        """
+        data = data or timezone.localdate()
+        vencidos = (
+            MovimentacaoFidelidade.objects
+            .filter(pontos_restantes__gt=0, data_expiracao__lt=data)
+            .values('cartao_id')
+            .annotate(total=Sum('pontos_restantes'))
+            .order_by('cartao_id')
+        )
+        total = 0
+        bloco = []
+        for linha in vencidos.iterator():
+            bloco.append(linha)
+            if len(bloco) >= cls.TAMANHO_BLOCO:
+                total += cls._expirar_bloco(bloco, data)
+                bloco = []
+        if bloco:
+            total += cls._expirar_bloco(bloco, data)
+        return total
+
+    @classmethod
+    def _expirar_bloco(cls, linhas, data):
+        ids = [linha['cartao_id'] for linha in linhas]
+        expirados = 0
+        with transaction.atomic():
+            cartoes = CartaoFidelidade.objects.select_for_update().filter(pk__in=ids).in_bulk()
+            # Recalcula com os cartões bloqueados (débitos concorrentes já consumiram lotes)
+            vencidos = dict(
+                MovimentacaoFidelidade.objects
+                .filter(cartao_id__in=ids, pontos_restantes__gt=0, data_expiracao__lt=data)
+                .values('cartao_id').annotate(total=Sum('pontos_restantes'))
+                .values_list('cartao_id', 'total')
+            )
+            movimentacoes = []
+            alterados = []
+            for cartao_id, pontos in vencidos.items():
+                cartao = cartoes[cartao_id]
+                pontos = min(pontos, cartao.pontos_atuais)
+                if pontos <= 0:
+                    # Lotes vencidos sem saldo por trás: só são fechados
+                    continue
+                alterados.append(cartao)
+                cartao.pontos_atuais -= pontos
+                cartao.pontos_expirados += pontos
+                cartao.data_ultima_movimentacao = data
+                expirados += pontos
+                movimentacoes.append(MovimentacaoFidelidade(
+                    cartao_id=cartao_id,
+                    tipo_movimentacao='expiracao',
+                    pontos=pontos,
+                    descricao=f"Expiração de pontos até {data:%d/%m/%Y}",
+                    saldo_apos=cartao.pontos_atuais,
+                    chave_idempotencia=f"expiracao:{cartao_id}:{data:%Y%m%d}",
+                ))
+            MovimentacaoFidelidade.objects.filter(
+                cartao_id__in=ids, pontos_restantes__gt=0, data_expiracao__lt=data,
+            ).update(pontos_restantes=0)
+            CartaoFidelidade.objects.bulk_update(
+                alterados,
+                ['pontos_atuais', 'pontos_expirados', 'data_ultima_movimentacao'],
+            )
+            MovimentacaoFidelidade.objects.bulk_create(movimentacoes)
+        return expirados
+
+    @classmethod
+    def recalcular_niveis(cls, empresa=None):
+        """Recalcula o nível de todos os cartões num único UPDATE"""
+        cartoes = CartaoFidelidade.objects.all()
+        if empresa is not None:
+            cartoes = cartoes.filter(cliente__empresa=empresa)
+        nivel = cls._nivel_expr()
+        return cartoes.exclude(nivel_atual=nivel).update(nivel_atual=nivel)
@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.clientes.models import Cliente, EstatisticaCliente, Ponto
+from apps.clientes.services import EstatisticaClienteService
+
+
+@receiver(post_save, sender=Cliente)
+def criar_estatistica_cliente(sender, instance, created, raw=False, **kwargs):
+    # Registo vazio: as listagens leem-no por JOIN sem precisar de fallback
+    if created and not raw:
+        EstatisticaCliente.objects.bulk_create(
+            [EstatisticaCliente(cliente_id=instance.pk, empresa_id=instance.empresa_id)],
+            ignore_conflicts=True,
+        )
+
+
+@receiver(post_save, sender=Ponto)
+def somar_pontos_cliente(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        EstatisticaClienteService.registrar_pontos(instance.cliente_id, instance.valor)
+
+
+@receiver(post_delete, sender=Ponto)
+def subtrair_pontos_cliente(sender, instance, **kwargs):
+    EstatisticaClienteService.registrar_pontos(instance.cliente_id, -instance.valor, criar=False)
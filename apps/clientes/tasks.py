@@ -0,0 +1,44 @@
+# apps/clientes/tasks.py
+import logging
+
+from celery import shared_task
+
+from apps.core.models import Empresa
+from .services import EstatisticaClienteService, FidelidadeService
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def reconciliar_estatisticas_clientes_task(empresa_id=None):
+    """
+    Recalcula as estatísticas de todos os clientes (ou de uma empresa),
+    corrigindo desvios dos deltas aplicados nas gravações.
+    """
+    empresas = Empresa.objects.filter(ativa=True)
+    if empresa_id:
+        empresas = empresas.filter(pk=empresa_id)
+    total = 0
+    for empresa in empresas:
+        try:
+            total += EstatisticaClienteService(empresa).reconciliar()
+        except Exception as e:
+            logger.error(f'Erro ao reconciliar estatísticas de clientes da empresa {empresa.id}: {e}')
+    logger.info(f'Estatísticas de clientes reconciliadas: {total} clientes')
+    return total
+
+
+@shared_task
+def expirar_pontos_fidelidade_task():
+    """Expira os lotes de pontos de fidelidade vencidos (em blocos de cartões)"""
+    pontos = FidelidadeService.expirar_pontos()
+    logger.info(f'Pontos de fidelidade expirados: {pontos}')
+    return pontos
+
+
+@shared_task
+def recalcular_niveis_fidelidade_task():
+    """Recalcula o nível de todos os cartões de fidelidade"""
+    alterados = FidelidadeService.recalcular_niveis()
+    logger.info(f'Níveis de fidelidade recalculados: {alterados} cartões alterados')
+    return alterados
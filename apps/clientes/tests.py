@@ -1,3 +1,168 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.clientes.models import CartaoFidelidade, Cliente, EstatisticaCliente, MovimentacaoFidelidade, Ponto
+from apps.clientes.services import EstatisticaClienteService, FidelidadeService
+from apps.core.models import Empresa, Loja
+from apps.vendas.models import FormaPagamento, Venda
+
+
+class FidelidadeServiceTest(TestCase):
+    """Acumulação, estorno e expiração de pontos no razão de fidelidade"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            nome='Farmácia Fidelidade', nif='5000000030', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email='fidelidade@exemplo.ao',
+        )
+        cls.loja = Loja.objects.create(
+            empresa=cls.empresa, nome='Loja', codigo='L1', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', postal='0000', provincia='Luanda',
+        )
+        cls.forma_pagamento = FormaPagamento.objects.create(empresa=cls.empresa, nome='Dinheiro')
+
+    def setUp(self):
+        self.cliente = Cliente.objects.create(empresa=self.empresa, nome_completo='Cliente Fidelidade')
+        self.numero_venda = 0
+
+    def _venda(self, total):
+        # O post_save da venda finalizada acumula os pontos
+        self.numero_venda += 1
+        return Venda.objects.create(
+            empresa=self.empresa, loja=self.loja, cliente=self.cliente, forma_pagamento=self.forma_pagamento,
+            numero_documento=f'FR FIDEL/{self.numero_venda}', subtotal=Decimal(total), total=Decimal(total),
+        )
+
+    def _cartao(self):
+        return CartaoFidelidade.objects.get(cliente=self.cliente)
+
+    def _lote(self, venda):
+        return MovimentacaoFidelidade.objects.get(chave_idempotencia=f'venda:{venda.pk}')
+
+    def test_acumular_venda_credita_pontos_e_sobe_nivel(self):
+        venda = self._venda('2500')
+
+        cartao = self._cartao()
+        self.assertEqual((cartao.pontos_atuais, cartao.pontos_totais_acumulados), (2500, 2500))
+        self.assertEqual(cartao.nivel_atual, 'Prata')
+        self.assertEqual(self._lote(venda).pontos_restantes, 2500)
+        self.assertTrue(Ponto.objects.filter(venda=venda, valor=2500).exists())
+
+        # Idempotente por venda
+        self.assertIsNone(FidelidadeService.acumular_venda(venda))
+        self.assertEqual(self._cartao().pontos_atuais, 2500)
+
+    def test_estorno_desconta_acumulado_nivel_e_lote_da_venda(self):
+        primeira = self._venda('1500')
+        segunda = self._venda('1000')
+        self.assertEqual(self._cartao().nivel_atual, 'Prata')
+
+        segunda.status = 'cancelada'
+        segunda.save(update_fields=['status'])
+
+        cartao = self._cartao()
+        self.assertEqual((cartao.pontos_atuais, cartao.pontos_totais_acumulados), (1500, 1500))
+        self.assertEqual(cartao.pontos_utilizados, 0)
+        self.assertEqual(cartao.nivel_atual, 'Bronze')
+        # O lote da venda estornada é consumido, não o mais antigo
+        self.assertEqual(self._lote(primeira).pontos_restantes, 1500)
+        self.assertEqual(self._lote(segunda).pontos_restantes, 0)
+        self.assertFalse(Ponto.objects.filter(venda=segunda).exists())
+
+    def test_estorno_limitado_ao_saldo(self):
+        venda = self._venda('1000')
+        self._cartao().utilizar_pontos(800, 'Desconto')
+
+        self.assertEqual(FidelidadeService.estornar_venda(venda).pontos, 200)
+
+        cartao = self._cartao()
+        self.assertEqual((cartao.pontos_atuais, cartao.pontos_totais_acumulados), (0, 800))
+
+    def test_expiracao_consome_lotes_vencidos(self):
+        cartao = FidelidadeService.obter_cartao(self.cliente)
+        FidelidadeService.movimentar(cartao.pk, 'credito', 300, 'Vencido', validade_dias=1)
+        FidelidadeService.movimentar(cartao.pk, 'credito', 200, 'Em vigor', validade_dias=30)
+
+        data = timezone.localdate() + timedelta(days=5)
+        self.assertEqual(FidelidadeService.expirar_pontos(data), 300)
+
+        cartao.refresh_from_db()
+        self.assertEqual((cartao.pontos_atuais, cartao.pontos_expirados), (200, 300))
+        expiracao = MovimentacaoFidelidade.objects.get(cartao=cartao, tipo_movimentacao='expiracao')
+        self.assertEqual((expiracao.pontos, expiracao.saldo_apos), (300, 200))
+
+        # Segunda execução: nada a expirar
+        self.assertEqual(FidelidadeService.expirar_pontos(data), 0)
+
+    def test_expiracao_sem_saldo_nao_cria_movimentacao_vazia(self):
+        cartao = FidelidadeService.obter_cartao(self.cliente)
+        lote = FidelidadeService.movimentar(cartao.pk, 'credito', 300, 'Vencido', validade_dias=1)
+        # Saldo do cartão já sem os pontos do lote (p.ex. acerto manual)
+        CartaoFidelidade.objects.filter(pk=cartao.pk).update(pontos_atuais=0)
+
+        self.assertEqual(FidelidadeService.expirar_pontos(timezone.localdate() + timedelta(days=5)), 0)
+
+        self.assertFalse(MovimentacaoFidelidade.objects.filter(tipo_movimentacao='expiracao').exists())
+        lote.refresh_from_db()
+        self.assertEqual(lote.pontos_restantes, 0)
+
+
+class EstatisticaClienteServiceTest(TestCase):
+    """Deltas das vendas e reconciliação das estatísticas de clientes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            nome='Farmácia Estatísticas', nif='5000000031', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email='estatisticas@exemplo.ao',
+        )
+        cls.loja = Loja.objects.create(
+            empresa=cls.empresa, nome='Loja', codigo='L1', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', postal='0000', provincia='Luanda',
+        )
+        cls.forma_pagamento = FormaPagamento.objects.create(empresa=cls.empresa, nome='Dinheiro')
+
+    def setUp(self):
+        self.clientes = [
+            Cliente.objects.create(empresa=self.empresa, nome_completo=f'Cliente {indice}') for indice in range(2)
+        ]
+        for numero, (cliente, total) in enumerate([(self.clientes[0], '100'), (self.clientes[0], '50')], start=1):
+            Venda.objects.create(
+                empresa=self.empresa, loja=self.loja, cliente=cliente, forma_pagamento=self.forma_pagamento,
+                numero_documento=f'FR ESTAT/{numero}', subtotal=Decimal(total), total=Decimal(total),
+            )
+
+    def _estatistica(self, cliente):
+        return EstatisticaCliente.objects.get(cliente=cliente)
+
+    def test_deltas_das_vendas(self):
+        estatistica = self._estatistica(self.clientes[0])
+
+        self.assertEqual((estatistica.total_compras, estatistica.total_comprado), (2, Decimal('150')))
+        self.assertEqual(estatistica.ultima_compra, timezone.localdate())
+
+    def test_reconciliar_corrige_desvios_e_devolve_contagem(self):
+        EstatisticaCliente.objects.filter(cliente=self.clientes[0]).update(total_compras=7, total_comprado=0)
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(EstatisticaClienteService(self.empresa).reconciliar(), 2)
+
+        estatistica = self._estatistica(self.clientes[0])
+        self.assertEqual((estatistica.total_compras, estatistica.total_comprado), (2, Decimal('150')))
+        self.assertIsNotNone(estatistica.reconciliado_em)
+        self.assertEqual(self._estatistica(self.clientes[1]).total_compras, 0)
+        if connection.features.has_select_for_update:
+            # Registos bloqueados antes da agregação
+            self.assertTrue(any('FOR UPDATE' in consulta['sql'] for consulta in consultas.captured_queries))
+
+    def test_estatistica_em_falta_e_criada_na_leitura(self):
+        EstatisticaCliente.objects.filter(cliente=self.clientes[0]).delete()
+        cliente = Cliente.objects.get(pk=self.clientes[0].pk)
 
-# Create your tests here.
+        self.assertEqual(cliente.estatistica_compras.total_comprado, Decimal('150'))
@@ -62,6 +62,7 @@ from django.http import HttpResponse
 from django.contrib import messages
 from django.views import View
 from django.core.files.storage import FileSystemStorage
+from django.core.exceptions import ValidationError
 
 from .models import Cliente
 from .forms import ClienteForm
@@ -87,6 +88,7 @@ from .models import (
 from django.db.models import Count, Sum, F, DecimalField
 from django.views.generic import TemplateView
 from .models import Cliente, Ponto, CategoriaCliente, HistoricoCliente
+from .services import FidelidadeService
 from datetime import date, timedelta
 from django.utils import timezone
 from django.contrib.auth.mixins import AccessMixin
@@ -144,12 +146,14 @@ class ClienteDashboardView(TemplateView):
         categoria_data = list(Cliente.objects.values('categoria_cliente__nome').annotate(count=Count('categoria_cliente__nome')))
 
         # Clientes VIP
-        clientes_vip = Cliente.objects.filter(vip=True).order_by('-data_ultima_compra')[:5]
+        clientes_vip = Cliente.objects.filter(vip=True).select_related('estatistica').order_by(
+            F('estatistica__ultima_compra').desc(nulls_last=True)
+        )[:5]
 
         # Clientes com mais pontos
-        clientes_top_pontos = Cliente.objects.annotate(
-            total_pontos=Sum('ponto__valor')
-        ).order_by('-total_pontos')[:5]
+        clientes_top_pontos = Cliente.objects.select_related('estatistica').order_by(
+            F('estatistica__total_pontos').desc(nulls_last=True)
+        )[:5]
         
         # Histórico de interações recentes
         interacoes_recentes = HistoricoCliente.objects.order_by('-data_interacao')[:10]
@@ -230,10 +234,27 @@ def buscar_clientes_api(request):
     
     return JsonResponse({'success': True, 'clientes': clientes_formatados})
 
-class ClienteListView(ListView):
+class ClienteListView(LoginRequiredMixin, ListView):
     model = Cliente
     template_name = "clientes/lista.html"
     context_object_name = "clientes"
+    paginate_by = 50
+
+    def get_empresa(self):
+        user = self.request.user
+        if getattr(user, 'empresa', None):
+            return user.empresa
+        if hasattr(user, 'funcionario') and user.funcionario and user.funcionario.empresa:
+            return user.funcionario.empresa
+        return None
+
+    def get_queryset(self):
+        # Estatísticas desnormalizadas no mesmo JOIN (sem agregações por linha)
+        return (
+            Cliente.objects.filter(empresa=self.get_empresa())
+            .select_related('estatistica')
+            .order_by('nome_completo', 'razao_social', 'pk')
+        )
 
 
 class ClienteDetailView(DetailView):
@@ -424,16 +445,20 @@ class CartaoFidelidadeDetailView(DetailView):
     context_object_name = "cartao"
 
 
+# Saldos e nível são mantidos pelo razão de movimentações (FidelidadeService)
+CAMPOS_CARTAO_EDITAVEIS = ["cliente", "numero_cartao", "codigo_barras", "ativo", "data_proximo_nivel"]
+
+
 class CartaoFidelidadeCreateView(CreateView):
     model = CartaoFidelidade
-    fields = "__all__"
+    fields = CAMPOS_CARTAO_EDITAVEIS
     template_name = "clientes/cartao_form.html"
     success_url = reverse_lazy("clientes:cartoes")
 
 
 class CartaoFidelidadeUpdateView(UpdateView):
     model = CartaoFidelidade
-    fields = "__all__"
+    fields = CAMPOS_CARTAO_EDITAVEIS
     template_name = "clientes/cartao_form.html"
     success_url = reverse_lazy("clientes:cartoes")
 
@@ -461,14 +486,28 @@ class MovimentacaoFidelidadeDetailView(DetailView):
 
 class MovimentacaoFidelidadeCreateView(CreateView):
     model = MovimentacaoFidelidade
-    fields = "__all__"
+    fields = ["cartao", "tipo_movimentacao", "pontos", "descricao"]
     template_name = "clientes/movimentacao_form.html"
     success_url = reverse_lazy("clientes:movimentacoes")
 
+    def form_valid(self, form):
+        # Lançamento pelo razão: bloqueia o cartão e atualiza saldo e nível
+        dados = form.cleaned_data
+        try:
+            self.object = FidelidadeService.movimentar(
+                dados["cartao"].pk, dados["tipo_movimentacao"], dados["pontos"], dados["descricao"],
+                usuario=self.request.user if self.request.user.is_authenticated else None,
+            )
+        except ValidationError as e:
+            form.add_error(None, e)
+            return self.form_invalid(form)
+        return redirect(self.get_success_url())
+
 
 class MovimentacaoFidelidadeUpdateView(UpdateView):
+    """O razão é append-only: só a descrição pode ser corrigida"""
     model = MovimentacaoFidelidade
-    fields = "__all__"
+    fields = ["descricao"]
     template_name = "clientes/movimentacao_form.html"
     success_url = reverse_lazy("clientes:movimentacoes")
 
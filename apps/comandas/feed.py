@@ -0,0 +1,281 @@
+# apps/comandas/feed.py
+"""
+Feed de alterações de comandas e itens para os ecrãs da cozinha e da sala.
+
+As alterações são publicadas depois do commit num broker pub/sub (Redis em
+produção, memória em testes/desenvolvimento) e consumidas pelos endpoints
+SSE, que enviam um snapshot inicial seguido dos deltas.
+
+Canais:
+    comandas:<empresa>:centro:<centro>  -> itens do centro de requisição
+    comandas:<empresa>:salao            -> estado das comandas e mesas
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Avg, Count
+from django.utils.module_loading import import_string
+
+
+STATUS_ITENS_ATIVOS = ['pendente', 'em_preparo']
+STATUS_COMANDAS_ATIVAS = ['aberta', 'em_preparo', 'pronta']
+
+
+def canal_centro(empresa_id, centro_id):
+    return f"comandas:{empresa_id}:centro:{centro_id}"
+
+
+def canal_salao(empresa_id):
+    return f"comandas:{empresa_id}:salao"
+
+
+# =====================================
+# BROKERS
+# =====================================
+
+class MemoriaBroker:
+    """Broker em memória (um único processo): testes e desenvolvimento"""
+
+    def __init__(self):
+        self._assinantes = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publicar(self, canal, mensagem):
+        with self._lock:
+            assinantes = list(self._assinantes.get(canal, ()))
+        for assinatura in assinantes:
+            assinatura.entregar(mensagem)
+
+    def assinar(self, canais):
+        assinatura = _AssinaturaMemoria(self, canais)
+        with self._lock:
+            for canal in canais:
+                self._assinantes[canal].add(assinatura)
+        return assinatura
+
+    def _remover(self, assinatura):
+        with self._lock:
+            for canal in assinatura.canais:
+                self._assinantes[canal].discard(assinatura)
+
+
+class _AssinaturaMemoria:
+    def __init__(self, broker, canais):
+        self.broker = broker
+        self.canais = list(canais)
+        self.loop = asyncio.get_running_loop()
+        self.fila = asyncio.Queue()
+
+    async def iniciar(self):
+        pass
+
+    def entregar(self, mensagem):
+        # Pode ser chamado a partir de outra thread (on_commit de uma view síncrona)
+        self.loop.call_soon_threadsafe(self.fila.put_nowait, mensagem)
+
+    async def receber(self, timeout=None):
+        try:
+            return await asyncio.wait_for(self.fila.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def fechar(self):
+        self.broker._remover(self)
+
+
+class RedisBroker:
+    """Fan-out entre processos/servidores via Redis pub/sub"""
+
+    def __init__(self, url=None):
+        self.url = url or settings.REDIS_URL
+        self._cliente = None
+
+    def _opcoes(self):
+        return {'ssl_cert_reqs': None} if self.url.startswith('rediss://') else {}
+
+    def publicar(self, canal, mensagem):
+        import redis
+
+        if self._cliente is None:
+            self._cliente = redis.Redis.from_url(self.url, **self._opcoes())
+        self._cliente.publish(canal, json.dumps(mensagem, cls=DjangoJSONEncoder))
+
+    def assinar(self, canais):
+        return _AssinaturaRedis(self, canais)
+
+
+class _AssinaturaRedis:
+    def __init__(self, broker, canais):
+        import redis.asyncio as aioredis
+
+        self.canais = list(canais)
+        self.cliente = aioredis.Redis.from_url(broker.url, **broker._opcoes())
+        self.pubsub = self.cliente.pubsub(ignore_subscribe_messages=True)
+
+    async def iniciar(self):
+        await self.pubsub.subscribe(*self.canais)
+
+    async def receber(self, timeout=None):
+        mensagem = await self.pubsub.get_message(timeout=timeout)
+        if mensagem is None:
+            return None
+        return json.loads(mensagem['data'])
+
+    async def fechar(self):
+        await self.pubsub.aclose()
+        await self.cliente.aclose()
+
+
+_broker = None
+
+
+def get_broker():
+    """
+    Broker configurado em ``COMANDAS_FEED_BROKER`` (caminho da classe).
+    Por omissão Redis se ``REDIS_URL`` existir, senão memória.
+    """
+    global _broker
+    if _broker is None:
+        caminho = getattr(settings, 'COMANDAS_FEED_BROKER', None)
+        if caminho:
+            _broker = import_string(caminho)()
+        elif getattr(settings, 'REDIS_URL', None):
+            _broker = RedisBroker()
+        else:
+            _broker = MemoriaBroker()
+    return _broker
+
+
+# =====================================
+# SERIALIZAÇÃO
+# =====================================
+
+def serializar_item(item):
+    comanda = item.comanda
+    return {
+        'id': item.pk,
+        'comanda_id': comanda.pk,
+        'numero_comanda': comanda.numero_comanda,
+        'mesa': comanda.mesa.numero if comanda.mesa_id and comanda.mesa else None,
+        'produto': item.produto.nome,
+        'centro_id': item.produto.centro_requisicao_id,
+        'tempo_preparo_minutos': item.produto.tempo_preparo_minutos,
+        'quantidade': item.quantidade,
+        'status': item.status,
+        'observacoes': item.observacoes,
+        'hora_pedido': item.hora_pedido,
+        'hora_inicio_preparo': item.hora_inicio_preparo,
+        'hora_finalizacao': item.hora_finalizacao,
+        'atualizado_em': item.updated_at,
+    }
+
+
+def serializar_comanda(comanda):
+    return {
+        'id': comanda.pk,
+        'numero_comanda': comanda.numero_comanda,
+        'status': comanda.status,
+        'mesa_id': comanda.mesa_id,
+        'mesa': comanda.mesa.numero if comanda.mesa_id and comanda.mesa else None,
+        'total': comanda.total,
+        'data_abertura': comanda.data_abertura,
+        'atualizado_em': comanda.updated_at,
+    }
+
+
+# =====================================
+# PUBLICAÇÃO
+# =====================================
+
+def _publicar_apos_commit(mensagens):
+    def enviar():
+        broker = get_broker()
+        for canal, mensagem in mensagens:
+            try:
+                broker.publicar(canal, mensagem)
+            except Exception:
+                # O feed é best-effort: os ecrãs recuperam com o próximo snapshot
+                pass
+
+    transaction.on_commit(enviar)
+
+
+def publicar_item(item, acao='atualizado'):
+    """Publica o estado do item no canal do seu centro de requisição"""
+    centro_id = item.produto.centro_requisicao_id
+    if not centro_id:
+        return
+    empresa_id = item.comanda.empresa_id
+    _publicar_apos_commit([
+        (canal_centro(empresa_id, centro_id), {'tipo': 'item', 'acao': acao, 'item': serializar_item(item)}),
+    ])
+
+
+def publicar_comanda(comanda, acao='atualizada'):
+    """Publica o estado da comanda no canal da sala"""
+    _publicar_apos_commit([
+        (canal_salao(comanda.empresa_id), {'tipo': 'comanda', 'acao': acao, 'comanda': serializar_comanda(comanda)}),
+    ])
+
+
+def publicar_mesa(mesa):
+    """Publica o estado da mesa no canal da sala"""
+    _publicar_apos_commit([
+        (canal_salao(mesa.empresa_id), {
+            'tipo': 'mesa',
+            'acao': 'atualizada',
+            'mesa': {'id': mesa.pk, 'numero': mesa.numero, 'nome': mesa.nome, 'status': mesa.status,
+                     'capacidade': mesa.capacidade},
+        }),
+    ])
+
+
+# =====================================
+# SNAPSHOTS
+# =====================================
+
+def itens_ativos(empresa, centro_id=None):
+    from .models import ItemComanda
+
+    itens = ItemComanda.objects.filter(
+        comanda__empresa=empresa,
+        status__in=STATUS_ITENS_ATIVOS,
+    ).select_related('comanda', 'comanda__mesa', 'produto').order_by('hora_pedido')
+    if centro_id is not None:
+        itens = itens.filter(produto__centro_requisicao_id=centro_id)
+    return itens
+
+
+def estatisticas_itens(itens):
+    return itens.aggregate(
+        total_pendentes=Count('id'),
+        tempo_medio_preparo=Avg('produto__tempo_preparo_minutos'),
+    )
+
+
+def snapshot_centro(empresa, centro_id):
+    itens = itens_ativos(empresa, centro_id)
+    return {
+        'centro_id': centro_id,
+        'itens': [serializar_item(item) for item in itens],
+        'estatisticas': estatisticas_itens(itens),
+    }
+
+
+def snapshot_salao(empresa):
+    from .models import Comanda, Mesa
+
+    comandas = Comanda.objects.filter(
+        empresa=empresa,
+        status__in=STATUS_COMANDAS_ATIVAS,
+    ).select_related('mesa')
+    mesas = Mesa.objects.filter(empresa=empresa, ativa=True).values('id', 'numero', 'nome', 'status', 'capacidade')
+    return {
+        'comandas': [serializar_comanda(comanda) for comanda in comandas],
+        'mesas': list(mesas),
+    }
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comandas', '0001_initial'),
+        ('core', '0003_numeracao_blocos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorComandaDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('ultimo_numero', models.PositiveIntegerField(default=0)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.empresa')),
+            ],
+            options={
+                'verbose_name': 'Contador Diário de Comandas',
+                'verbose_name_plural': 'Contadores Diários de Comandas',
+                'constraints': [models.UniqueConstraint(fields=('empresa', 'data'), name='unique_contador_comanda_dia')],
+            },
+        ),
+    ]
@@ -1,14 +1,16 @@
 # apps/comandas/models.py
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Sum
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from apps.core.models import TimeStampedModel, Empresa, Usuario, Loja
 from apps.clientes.models import Cliente
 from apps.funcionarios.models import Funcionario
 from decimal import Decimal
-from datetime import date, datetime, timedelta
+from datetime import datetime, timedelta
 from django.utils import timezone
 import uuid
+from . import feed
 
 class CategoriaComanda(TimeStampedModel):
     """Categorias de produtos para comandas"""
@@ -246,6 +248,10 @@ class Mesa(TimeStampedModel):
     def __str__(self):
         return f"Mesa {self.numero}" + (f" - {self.nome}" if self.nome else "")
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        feed.publicar_mesa(self)
+    
     def ocupar_mesa(self):
         """Ocupa a mesa"""
         if self.status != 'livre':
@@ -258,6 +264,42 @@ class Mesa(TimeStampedModel):
         self.status = 'livre'
         self.save()
 
+class ContadorComandaDiario(models.Model):
+    """Último número de comanda emitido por empresa e dia"""
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE)
+    data = models.DateField()
+    ultimo_numero = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Contador Diário de Comandas"
+        verbose_name_plural = "Contadores Diários de Comandas"
+        constraints = [
+            models.UniqueConstraint(fields=['empresa', 'data'], name='unique_contador_comanda_dia'),
+        ]
+
+    def __str__(self):
+        return f"{self.empresa} {self.data}: {self.ultimo_numero}"
+
+    @classmethod
+    def proximo(cls, empresa_id, data):
+        """
+        Incrementa e devolve o número seguinte. O UPDATE com F() bloqueia a
+        linha até ao fim da transação, pelo que caixas concorrentes nunca
+        obtêm o mesmo número.
+        """
+        contador = cls.objects.filter(empresa_id=empresa_id, data=data)
+        with transaction.atomic():
+            if not contador.update(ultimo_numero=F('ultimo_numero') + 1):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(empresa_id=empresa_id, data=data, ultimo_numero=1)
+                    return 1
+                except IntegrityError:
+                    # Outro processo criou o contador do dia entretanto
+                    contador.update(ultimo_numero=F('ultimo_numero') + 1)
+            return contador.values_list('ultimo_numero', flat=True).get()
+
+
 class Comanda(TimeStampedModel):
     """Comanda principal"""
     STATUS_CHOICES = [
@@ -341,76 +383,217 @@ class Comanda(TimeStampedModel):
         return f"Comanda {self.numero_comanda}"
     
     def save(self, *args, **kwargs):
-        if not self.numero_comanda:
-            self.numero_comanda = self._gerar_numero_comanda()
-        
-        # Calcular valores
-        self._calcular_valores()
+        with transaction.atomic():
+            if not self.numero_comanda:
+                self.numero_comanda = self._gerar_numero_comanda()
+            elif not self._state.adding:
+                # Subtotal e tempo são mantidos pelos itens (aplicar_delta_itens);
+                # uma instância desatualizada não os pode sobrescrever
+                self._sincronizar_valores_itens()
+            
+            self._calcular_total()
+            
+            super().save(*args, **kwargs)
         
-        super().save(*args, **kwargs)
+        # Notificar os ecrãs da sala (após commit)
+        feed.publicar_comanda(self)
     
     def _gerar_numero_comanda(self):
-        """Gera número único da comanda"""
-        hoje = date.today()
-        prefixo = hoje.strftime('%d%m%y')
-        
-        ultimo_numero = Comanda.objects.filter(
-            numero_comanda__startswith=prefixo,
-            empresa=self.empresa
-        ).count() + 1
-        
-        return f"{prefixo}{ultimo_numero:04d}"
-    
-    def _calcular_valores(self):
-        """Calcula valores da comanda"""
-        # Subtotal dos itens
-        self.subtotal = sum(
-            item.total for item in self.itens.all()
-        )
-        
+        """Gera número único da comanda a partir do contador diário da empresa"""
+        hoje = timezone.localdate()
+        numero = ContadorComandaDiario.proximo(self.empresa_id, hoje)
+        return f"{hoje.strftime('%d%m%y')}-{self.empresa_id}-{numero:04d}"
+    
+    def _sincronizar_valores_itens(self):
+        """Lê (com a linha bloqueada) os valores mantidos incrementalmente"""
+        valores = Comanda.objects.select_for_update().filter(pk=self.pk).values(
+            'subtotal', 'tempo_estimado_preparo'
+        ).first()
+        if valores:
+            self.subtotal = valores['subtotal']
+            self.tempo_estimado_preparo = valores['tempo_estimado_preparo']
+    
+    def _calcular_total(self):
+        """Calcula desconto e total a partir do subtotal (sem percorrer os itens)"""
         # Aplicar desconto
         if self.desconto_percentual > 0:
             self.desconto_valor = (self.subtotal * self.desconto_percentual) / 100
         
         # Valor total
         self.total = self.subtotal - self.desconto_valor + self.taxa_servico + self.taxa_entrega
+    
+    def aplicar_delta_itens(self, subtotal=Decimal('0'), tempo=0):
+        """
+        Aplica à comanda a variação de subtotal e de tempo de preparo causada
+        pela inclusão, alteração ou remoção de itens, com a linha bloqueada.
+        """
+        with transaction.atomic():
+            atual = Comanda.objects.select_for_update().get(pk=self.pk)
+            atual.subtotal += subtotal
+            atual.tempo_estimado_preparo += tempo
+            atual._calcular_total()
+            atual.updated_at = timezone.now()
+            Comanda.objects.filter(pk=self.pk).update(
+                subtotal=atual.subtotal,
+                desconto_valor=atual.desconto_valor,
+                total=atual.total,
+                tempo_estimado_preparo=atual.tempo_estimado_preparo,
+                updated_at=atual.updated_at,
+            )
         
-        # Tempo estimado total
-        self.tempo_estimado_preparo = sum(
-            item.produto.tempo_preparo_minutos * item.quantidade 
-            for item in self.itens.all()
+        for campo in ('subtotal', 'desconto_valor', 'total', 'tempo_estimado_preparo', 'updated_at'):
+            setattr(self, campo, getattr(atual, campo))
+        feed.publicar_comanda(self)
+    
+    def recalcular_valores(self):
+        """Recalcula subtotal e tempo de preparo a partir dos itens (correção/auditoria)"""
+        valores = self.itens.aggregate(
+            subtotal=Sum('total'),
+            tempo=Sum(F('quantidade') * F('produto__tempo_preparo_minutos')),
         )
+        with transaction.atomic():
+            atual = Comanda.objects.select_for_update().get(pk=self.pk)
+            self.aplicar_delta_itens(
+                (valores['subtotal'] or Decimal('0')) - atual.subtotal,
+                (valores['tempo'] or 0) - atual.tempo_estimado_preparo,
+            )
     
+    def receber_itens(self, itens_ids):
+        """
+        Transfere para esta comanda os itens indicados (de outras comandas da
+        mesma empresa). O UPDATE em massa não passa pelo ItemComanda.save,
+        por isso os totais de origem e destino recebem aqui os deltas, na
+        mesma transação. Devolve o número de itens transferidos.
+        """
+        with transaction.atomic():
+            itens = ItemComanda.objects.filter(
+                pk__in=itens_ids, comanda__empresa_id=self.empresa_id
+            ).exclude(comanda_id=self.pk)
+            por_origem = list(
+                itens.values('comanda_id').annotate(
+                    subtotal=Sum('total'),
+                    tempo=Sum(F('quantidade') * F('produto__tempo_preparo_minutos')),
+                    itens=Count('id'),
+                ).order_by('comanda_id')
+            )
+            if not por_origem:
+                return 0
+
+            # Bloqueio por ordem de pk para transferências cruzadas não se bloquearem
+            origens = Comanda.objects.select_for_update().in_bulk(
+                sorted({linha['comanda_id'] for linha in por_origem} | {self.pk})
+            )
+            itens.update(comanda=self, updated_at=timezone.now())
+
+            for linha in por_origem:
+                origens[linha['comanda_id']].aplicar_delta_itens(-(linha['subtotal'] or 0), -(linha['tempo'] or 0))
+            self.aplicar_delta_itens(
+                sum((linha['subtotal'] or Decimal('0') for linha in por_origem), Decimal('0')),
+                sum(linha['tempo'] or 0 for linha in por_origem),
+            )
+            return sum(linha['itens'] for linha in por_origem)
+
     def adicionar_item(self, produto, quantidade, observacoes=""):
         """Adiciona item à comanda"""
+        return self.adicionar_itens([(produto, quantidade, observacoes)])[0]
+    
+    def adicionar_itens(self, linhas):
+        """
+        Adiciona vários itens de uma vez (templates, pedidos em lote).
+        
+        ``linhas`` é um iterável de ``(produto, quantidade, observacoes)``.
+        Produtos repetidos são agrupados e juntam-se ao item já existente na
+        comanda. O estoque é validado e baixado com os produtos bloqueados e
+        os totais da comanda recebem um único delta. Devolve os itens
+        criados ou atualizados.
+        """
         if self.status not in ['aberta']:
             raise ValidationError("Não é possível adicionar itens a uma comanda fechada")
         
-        # Verificar estoque
-        if produto.controla_estoque and produto.quantidade_estoque < quantidade:
-            raise ValidationError(f"Estoque insuficiente para {produto.nome}")
+        pedidos = {}
+        for produto, quantidade, observacoes in linhas:
+            if quantidade < 1:
+                raise ValidationError(f"Quantidade inválida para {produto.nome}")
+            pedido = pedidos.setdefault(produto.pk, {'produto': produto, 'quantidade': 0, 'observacoes': []})
+            pedido['quantidade'] += quantidade
+            if observacoes:
+                pedido['observacoes'].append(observacoes)
         
-        # Verificar se item já existe
-        item_existente = self.itens.filter(produto=produto).first()
-        
-        if item_existente:
-            item_existente.quantidade += quantidade
-            item_existente.observacoes += f"\n{observacoes}" if observacoes else ""
-            item_existente.save()
-        else:
-            ItemComanda.objects.create(
-                comanda=self,
-                produto=produto,
-                quantidade=quantidade,
-                preco_unitario=produto.preco_atual,
-                observacoes=observacoes
-            )
+        if not pedidos:
+            return []
         
-        # Baixar estoque
-        produto.baixar_estoque(quantidade)
+        agora = timezone.now()
+        with transaction.atomic():
+            # Verificar e baixar estoque
+            controlados = [pk for pk, pedido in pedidos.items() if pedido['produto'].controla_estoque]
+            if controlados:
+                bloqueados = ProdutoComanda.objects.select_for_update().in_bulk(controlados)
+                for pk in controlados:
+                    produto = bloqueados[pk]
+                    if produto.quantidade_estoque < pedidos[pk]['quantidade']:
+                        raise ValidationError(f"Estoque insuficiente para {produto.nome}")
+                for pk in controlados:
+                    produto = bloqueados[pk]
+                    produto.quantidade_estoque -= pedidos[pk]['quantidade']
+                    produto.updated_at = agora
+                    pedidos[pk]['produto'].quantidade_estoque = produto.quantidade_estoque
+                ProdutoComanda.objects.bulk_update(bloqueados.values(), ['quantidade_estoque', 'updated_at'])
+            
+            # Itens já existentes para os mesmos produtos
+            existentes = {}
+            for item in self.itens.filter(produto_id__in=pedidos).order_by('hora_pedido'):
+                existentes.setdefault(item.produto_id, item)
+            
+            delta_subtotal = Decimal('0')
+            delta_tempo = 0
+            atualizados, novos = [], []
+            for pk, pedido in pedidos.items():
+                produto = pedido['produto']
+                quantidade = pedido['quantidade']
+                delta_tempo += produto.tempo_preparo_minutos * quantidade
+                
+                item = existentes.get(pk)
+                if item:
+                    total_anterior = item.total
+                    item.quantidade += quantidade
+                    for observacoes in pedido['observacoes']:
+                        item.observacoes += f"\n{observacoes}"
+                    item.total = item.quantidade * item.preco_unitario
+                    item.updated_at = agora
+                    delta_subtotal += item.total - total_anterior
+                    atualizados.append(item)
+                else:
+                    item = ItemComanda(
+                        comanda=self,
+                        produto=produto,
+                        quantidade=quantidade,
+                        preco_unitario=produto.preco_atual,
+                        observacoes="\n".join(pedido['observacoes']),
+                    )
+                    item.total = item.quantidade * item.preco_unitario
+                    delta_subtotal += item.total
+                    novos.append(item)
+                item.comanda = self
+                item.produto = produto
+            
+            if atualizados:
+                ItemComanda.objects.bulk_update(atualizados, ['quantidade', 'observacoes', 'total', 'updated_at'])
+            if novos:
+                ItemComanda.objects.bulk_create(novos)
+            
+            # Recalcular valores
+            self.aplicar_delta_itens(delta_subtotal, delta_tempo)
+            
+            # bulk_create/bulk_update não passam pelo save(): notificar aqui
+            for item in atualizados:
+                item._guardar_estado_original()
+                feed.publicar_item(item, 'atualizado')
+            for item in novos:
+                item._state.adding = False
+                item._guardar_estado_original()
+                feed.publicar_item(item, 'criado')
         
-        # Recalcular valores
-        self.save()
+        return atualizados + novos
     
     def fechar_comanda(self, forma_pagamento="dinheiro"):
         """Fecha a comanda"""
@@ -480,12 +663,68 @@ class ItemComanda(TimeStampedModel):
     def __str__(self):
         return f"{self.produto.nome} (x{self.quantidade}) - {self.comanda.numero_comanda}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if {'total', 'quantidade', 'produto_id'} <= set(field_names):
+            instance._guardar_estado_original()
+        return instance
+    
+    def _guardar_estado_original(self):
+        self._estado_original = (self.total, self.quantidade, self.produto_id)
+    
+    def _estado_gravado(self):
+        """(total, quantidade, produto_id) tal como estão na base de dados"""
+        if self._state.adding:
+            return None
+        estado = getattr(self, '_estado_original', None)
+        if estado is None:
+            estado = ItemComanda.objects.filter(pk=self.pk).values_list(
+                'total', 'quantidade', 'produto_id'
+            ).first()
+        return estado
+    
+    def _contribuicao(self, estado):
+        """Subtotal e tempo de preparo com que o estado indicado contribui para a comanda"""
+        if estado is None:
+            return Decimal('0'), 0
+        total, quantidade, produto_id = estado
+        if produto_id == self.produto_id:
+            tempo_unitario = self.produto.tempo_preparo_minutos
+        else:
+            tempo_unitario = ProdutoComanda.objects.values_list(
+                'tempo_preparo_minutos', flat=True
+            ).get(pk=produto_id)
+        return total, tempo_unitario * quantidade
+    
     def save(self, *args, **kwargs):
+        novo = self._state.adding
         self.total = self.quantidade * self.preco_unitario
-        super().save(*args, **kwargs)
+        anterior = self._estado_gravado()
+        atual = (self.total, self.quantidade, self.produto_id)
         
-        # Atualizar valores da comanda
-        self.comanda.save()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            
+            # Notificar o ecrã do centro de requisição (após commit)
+            feed.publicar_item(self, 'criado' if novo else 'atualizado')
+            
+            # Atualizar valores da comanda apenas pela diferença
+            if atual != anterior:
+                subtotal, tempo = self._contribuicao(atual)
+                subtotal_anterior, tempo_anterior = self._contribuicao(anterior)
+                self.comanda.aplicar_delta_itens(subtotal - subtotal_anterior, tempo - tempo_anterior)
+        
+        self._estado_original = atual
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            subtotal, tempo = self._contribuicao(self._estado_gravado())
+            feed.publicar_item(self, 'removido')
+            resultado = super().delete(*args, **kwargs)
+            self.comanda.aplicar_delta_itens(-subtotal, -tempo)
+        self._estado_original = None
+        return resultado
     
     def iniciar_preparo(self):
         """Inicia preparo do item"""
@@ -675,27 +914,27 @@ class TemplateComanda(TimeStampedModel):
     
     def criar_comanda(self, atendente, mesa=None, cliente=None):
         """Cria comanda baseada no template"""
-        comanda = Comanda.objects.create(
-            tipo_atendimento=self.tipo_atendimento_padrao,
-            atendente=atendente,
-            mesa=mesa,
-            cliente=cliente,
-            observacoes=self.observacoes_padrao,
-            observacoes_cozinha=self.observacoes_cozinha_padrao,
-            empresa=self.empresa
-        )
-        
+        dados = {}
         # Aplicar taxa de serviço personalizada se houver
         if self.aplica_taxa_servico and self.taxa_servico_personalizada:
-            comanda.taxa_servico = self.taxa_servico_personalizada
-            comanda.save()
+            dados['taxa_servico'] = self.taxa_servico_personalizada
         
-        # Adicionar itens do template
-        for item_template in self.itens_template.all():
-            comanda.adicionar_item(
-                produto=item_template.produto,
-                quantidade=item_template.quantidade_padrao,
-                observacoes=item_template.observacoes_padrao
+        with transaction.atomic():
+            comanda = Comanda.objects.create(
+                tipo_atendimento=self.tipo_atendimento_padrao,
+                atendente=atendente,
+                mesa=mesa,
+                cliente=cliente,
+                observacoes=self.observacoes_padrao,
+                observacoes_cozinha=self.observacoes_cozinha_padrao,
+                empresa=self.empresa,
+                **dados
+            )
+            
+            # Adicionar itens do template (em lote)
+            comanda.adicionar_itens(
+                (item_template.produto, item_template.quantidade_padrao, item_template.observacoes_padrao)
+                for item_template in self.itens_template.select_related('produto')
             )
         
         return comanda
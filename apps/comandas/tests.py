@@ -1,3 +1,148 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.comandas.models import CategoriaComanda, Comanda, Mesa, ProdutoComanda
+from apps.core.models import Empresa, Loja
+from apps.funcionarios.models import Cargo, Departamento, Funcionario
+
+
+class FeedSalaoViewTest(TestCase):
+    """Feed da sala servido por WSGI: snapshot e reconexão do EventSource"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            nome='Restaurante Feed', nif='5000000040', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email='feed@exemplo.ao',
+        )
+        loja = Loja.objects.create(
+            empresa=cls.empresa, nome='Loja', codigo='L1', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', postal='0000', provincia='Luanda',
+        )
+        cls.mesa = Mesa.objects.create(empresa=cls.empresa, loja=loja, numero='1', status='ocupada')
+        cls.usuario = get_user_model().objects.create(username='sala', empresa=cls.empresa)
+
+    def test_wsgi_envia_snapshot_e_retry(self):
+        self.client.force_login(self.usuario)
+
+        resposta = self.client.get(reverse('comanda:feed_salao'))
+
+        self.assertEqual(resposta['Content-Type'], 'text/event-stream')
+        retry, snapshot = b''.join(resposta.streaming_content).decode().strip().split('\n\n')
+        self.assertEqual(retry, 'retry: 5000')
+        evento, dados = snapshot.split('\n')
+        self.assertEqual(evento, 'event: snapshot')
+        mesas = json.loads(dados[len('data: '):])['mesas']
+        self.assertEqual([(mesa['id'], mesa['status']) for mesa in mesas], [(self.mesa.pk, 'ocupada')])
+
+    def test_sem_autenticacao(self):
+        self.assertEqual(self.client.get(reverse('comanda:feed_salao')).status_code, 401)
+
+
+class ComandaTotaisTest(TestCase):
+    """Totais incrementais, inclusão de itens em lote e numeração diária"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            nome='Restaurante Totais', nif='5000000041', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email='totais@exemplo.ao',
+        )
+        loja = Loja.objects.create(
+            empresa=cls.empresa, nome='Loja', codigo='L1', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', postal='0000', provincia='Luanda',
+        )
+        cargo = Cargo.objects.create(empresa=cls.empresa, nome='Empregado de mesa', codigo='MESA41')
+        departamento = Departamento.objects.create(nome='Sala', codigo='SALA41', loja=loja)
+        cls.atendente = Funcionario.objects.create(
+            empresa=cls.empresa, nome_completo='Atendente', bi='50000000410001',
+            data_nascimento=date(1990, 1, 1), sexo='M', endereco='Rua 1', numero='1', bairro='Centro',
+            cidade='Luanda', postal='0000', cargo=cargo, departamento=departamento,
+            loja_principal=loja, data_admissao=date(2024, 1, 1), salario_atual=Decimal('1000'),
+        )
+        categoria = CategoriaComanda.objects.create(empresa=cls.empresa, nome='Pratos')
+        cls.prato = ProdutoComanda.objects.create(
+            empresa=cls.empresa, categoria=categoria, codigo='PRATO41', nome='Prato do dia',
+            preco_venda=Decimal('10'), tempo_preparo_minutos=5, controla_estoque=True, quantidade_estoque=10,
+        )
+        cls.sumo = ProdutoComanda.objects.create(
+            empresa=cls.empresa, categoria=categoria, codigo='SUMO41', nome='Sumo',
+            preco_venda=Decimal('4'), tempo_preparo_minutos=2,
+        )
+
+    def setUp(self):
+        self.comanda = Comanda.objects.create(
+            empresa=self.empresa, tipo_atendimento='balcao', atendente=self.atendente,
+        )
+
+    def _valores(self):
+        comanda = Comanda.objects.get(pk=self.comanda.pk)
+        return comanda.subtotal, comanda.total, comanda.tempo_estimado_preparo
+
+    def test_adicionar_itens_agrupa_e_aplica_um_delta(self):
+        itens = self.comanda.adicionar_itens([
+            (self.prato, 2, 'Sem sal'), (self.sumo, 1, ''), (self.prato, 1, 'Bem passado'),
+        ])
+
+        self.assertEqual(
+            sorted((item.produto_id, item.quantidade, item.total) for item in itens),
+            sorted([(self.prato.pk, 3, Decimal('30')), (self.sumo.pk, 1, Decimal('4'))]),
+        )
+        self.assertEqual(self._valores(), (Decimal('34'), Decimal('34'), 17))
+        self.assertEqual(ProdutoComanda.objects.get(pk=self.prato.pk).quantidade_estoque, 7)
+
+        # Produto repetido junta-se ao item existente
+        self.comanda.adicionar_item(self.prato, 1)
+        self.assertEqual(self.comanda.itens.filter(produto=self.prato).get().quantidade, 4)
+        self.assertEqual(self._valores(), (Decimal('44'), Decimal('44'), 22))
+
+    def test_estoque_insuficiente_nao_altera_nada(self):
+        with self.assertRaises(ValidationError):
+            self.comanda.adicionar_itens([(self.sumo, 1, ''), (self.prato, 11, '')])
+
+        self.assertFalse(self.comanda.itens.exists())
+        self.assertEqual(self._valores(), (Decimal('0'), Decimal('0'), 0))
+        self.assertEqual(ProdutoComanda.objects.get(pk=self.prato.pk).quantidade_estoque, 10)
+
+    def test_alterar_e_remover_item_aplica_so_a_diferenca(self):
+        itens = {item.produto_id: item for item in self.comanda.adicionar_itens([(self.prato, 2, ''), (self.sumo, 2, '')])}
+        prato, sumo = itens[self.prato.pk], itens[self.sumo.pk]
+
+        prato.quantidade = 1
+        prato.save()
+        self.assertEqual(self._valores(), (Decimal('18'), Decimal('18'), 9))
+
+        sumo.delete()
+        self.assertEqual(self._valores(), (Decimal('10'), Decimal('10'), 5))
+
+    def test_instancia_desatualizada_nao_sobrescreve_subtotal(self):
+        desatualizada = Comanda.objects.get(pk=self.comanda.pk)
+        self.comanda.adicionar_itens([(self.prato, 2, '')])
+
+        desatualizada.desconto_percentual = Decimal('10')
+        desatualizada.save()
+
+        self.assertEqual(self._valores(), (Decimal('20'), Decimal('18'), 10))
+
+    def test_recalcular_valores_corrige_desvios(self):
+        self.comanda.adicionar_itens([(self.prato, 1, ''), (self.sumo, 1, '')])
+        Comanda.objects.filter(pk=self.comanda.pk).update(subtotal=Decimal('99'), tempo_estimado_preparo=0)
+
+        self.comanda.recalcular_valores()
+
+        self.assertEqual(self._valores(), (Decimal('14'), Decimal('14'), 7))
+
+    def test_numeracao_diaria_por_empresa(self):
+        segunda = Comanda.objects.create(empresa=self.empresa, tipo_atendimento='balcao', atendente=self.atendente)
 
-# Create your tests here.
+        prefixo = f"{timezone.localdate().strftime('%d%m%y')}-{self.empresa.pk}-"
+        self.assertEqual(
+            [self.comanda.numero_comanda, segunda.numero_comanda], [f'{prefixo}0001', f'{prefixo}0002'],
+        )
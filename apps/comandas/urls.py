@@ -36,6 +36,7 @@ urlpatterns = [
     # ITENS DA COMANDA
     # =====================================
     path('<int:comanda_pk>/item/adicionar/', views.AdicionarItemView.as_view(), name='adicionar_item'),
+    path('<int:pk>/itens/lote/', views.AdicionarItensLoteView.as_view(), name='adicionar_itens_lote'),
     path('item/<int:pk>/editar/', views.EditarItemView.as_view(), name='editar_item'),
     path('item/<int:pk>/remover/', views.RemoverItemView.as_view(), name='remover_item'),
     path('item/<int:pk>/cancelar/', views.CancelarItemView.as_view(), name='cancelar_item'),
@@ -83,6 +84,13 @@ urlpatterns = [
     path('ajax/calcular-total/', views.CalcularTotalAjaxView.as_view(), name='calcular_total_ajax'),
     path('ajax/buscar-produto/', views.BuscarProdutoComandaView.as_view(), name='buscar_produto'),
     path('ajax/atualizar-mesa/', views.AtualizarMesaAjaxView.as_view(), name='atualizar_mesa_ajax'),
+    
+    # =====================================
+    # COZINHA E FEED EM TEMPO REAL (SSE)
+    # =====================================
+    path('cozinha/', views.CozinhaView.as_view(), name='cozinha'),
+    path('feed/centro/<int:centro_pk>/', views.FeedCentroView.as_view(), name='feed_centro'),
+    path('feed/salao/', views.FeedSalaoView.as_view(), name='feed_salao'),
 
     # =====================================
 # URLS DE MESAS - ADICIONAR AO ARQUIVO DE URLS EXISTENTE
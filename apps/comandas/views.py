@@ -1,6 +1,12 @@
 # apps/comandas/views.py
-from pyexpat.errors import messages
-from django.http import JsonResponse
+from django.contrib import messages
+import abc
+import json
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse, reverse_lazy
 from rest_framework import viewsets, filters, status
@@ -34,7 +40,9 @@ from .forms import (
 )
 from django.views.generic import UpdateView, RedirectView
 from apps.comandas import models
+from apps.comandas import feed
 from django.contrib.auth.mixins import AccessMixin
+from apps.core.mixins import APIOtimizadaMixin
 
 
 
@@ -69,7 +77,7 @@ class PermissaoAcaoMixin(AccessMixin):
 
 
 
-class ComandaViewSet(viewsets.ModelViewSet):
+class ComandaViewSet(APIOtimizadaMixin, viewsets.ModelViewSet):
     serializer_class = ComandaSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -655,6 +663,69 @@ class AdicionarItemComandaView(LoginRequiredMixin, View):
         
         return redirect('comandas:detail', pk=pk)
 
+class AdicionarItensLoteView(LoginRequiredMixin, View):
+    """
+    Adiciona vários itens numa única operação.
+    
+    Corpo JSON: ``{"itens": [{"produto_id": 1, "quantidade": 2, "observacoes": ""}]}``
+    e/ou ``{"template_id": 3}`` para acrescentar os itens de um template.
+    """
+    def post(self, request, pk):
+        comanda = get_object_or_404(Comanda, pk=pk, empresa=request.user.empresa)
+        
+        try:
+            dados = json.loads(request.body or '{}')
+        except ValueError:
+            return JsonResponse({'error': 'JSON inválido'}, status=400)
+        
+        pedidos = dados.get('itens') or []
+        produtos = ProdutoComanda.objects.filter(
+            empresa=request.user.empresa,
+            id__in=[pedido.get('produto_id') for pedido in pedidos]
+        ).in_bulk()
+        
+        linhas = []
+        for pedido in pedidos:
+            produto = produtos.get(pedido.get('produto_id'))
+            if produto is None:
+                return JsonResponse({'error': f"Produto {pedido.get('produto_id')} não encontrado"}, status=400)
+            try:
+                quantidade = int(pedido.get('quantidade', 1))
+            except (TypeError, ValueError):
+                return JsonResponse({'error': f"Quantidade inválida para o produto {produto.pk}"}, status=400)
+            linhas.append((produto, quantidade, pedido.get('observacoes', '')))
+        
+        if dados.get('template_id'):
+            template = get_object_or_404(TemplateComanda, pk=dados['template_id'], empresa=request.user.empresa)
+            linhas.extend(
+                (item.produto, item.quantidade_padrao, item.observacoes_padrao)
+                for item in template.itens_template.select_related('produto')
+            )
+        
+        valor_anterior = comanda.total
+        try:
+            itens = comanda.adicionar_itens(linhas)
+        except ValidationError as e:
+            return JsonResponse({'error': ' '.join(e.messages)}, status=400)
+        
+        MovimentacaoComanda.registrar_movimentacao(
+            comanda=comanda,
+            tipo_movimentacao='adicao_item',
+            descricao=f'Adicionados {len(linhas)} itens em lote',
+            usuario=request.user,
+            valor_anterior=valor_anterior,
+            valor_atual=comanda.total,
+            request=request
+        )
+        
+        return JsonResponse({
+            'comanda_id': comanda.pk,
+            'itens': [item.pk for item in itens],
+            'subtotal': comanda.subtotal,
+            'total': comanda.total,
+            'tempo_estimado_preparo': comanda.tempo_estimado_preparo,
+        }, encoder=DjangoJSONEncoder)
+
 class RemoverItemComandaView(LoginRequiredMixin, View):
     def post(self, request, pk, item_pk):
         comanda = get_object_or_404(Comanda, pk=pk, empresa=request.user.empresa)
@@ -673,8 +744,8 @@ class RemoverItemComandaView(LoginRequiredMixin, View):
             item.produto.quantidade_estoque += item.quantidade
             item.produto.save()
         
-        item.delete()
-        comanda.save()  # Recalcular valores
+        item.delete()  # Atualiza os totais da comanda pela diferença
+        comanda.refresh_from_db()
         
         # Registrar movimentação
         MovimentacaoComanda.registrar_movimentacao(
@@ -763,37 +834,32 @@ class CozinhaView(LoginRequiredMixin, TemplateView):
         empresa = self.request.user.empresa
         
         # Centros de requisição
-        centros = CentroRequisicao.objects.filter(
+        centros = list(CentroRequisicao.objects.filter(
             empresa=empresa,
             ativo=True
-        ).order_by('ordem_preparo')
+        ).order_by('ordem_preparo'))
         
         context['centros'] = centros
         
-        # Itens pendentes por centro
-        itens_por_centro = {}
-        for centro in centros:
-            itens_pendentes = ItemComanda.objects.filter(
-                produto__centro_requisicao=centro,
-                status__in=['pendente', 'em_preparo'],
-                comanda__empresa=empresa
-            ).select_related('comanda', 'produto').order_by('hora_pedido')
-            
-            itens_por_centro[centro] = itens_pendentes
+        # Itens pendentes de todos os centros numa única consulta
+        itens_pendentes = feed.itens_ativos(empresa)
+        itens_por_id = {centro.pk: [] for centro in centros}
+        for item in itens_pendentes:
+            if item.produto.centro_requisicao_id in itens_por_id:
+                itens_por_id[item.produto.centro_requisicao_id].append(item)
         
-        context['itens_por_centro'] = itens_por_centro
+        context['itens_por_centro'] = {centro: itens_por_id[centro.pk] for centro in centros}
         
         # Estatísticas gerais
-        todos_itens_pendentes = ItemComanda.objects.filter(
-            comanda__empresa=empresa,
-            status__in=['pendente', 'em_preparo']
-        )
-        
+        estatisticas = feed.estatisticas_itens(itens_pendentes)
         context['estatisticas'] = {
-            'total_pendentes': todos_itens_pendentes.count(),
-            'tempo_medio_preparo': todos_itens_pendentes.aggregate(
-                media=Avg('produto__tempo_preparo_minutos')
-            )['media'] or 0,
+            'total_pendentes': estatisticas['total_pendentes'],
+            'tempo_medio_preparo': estatisticas['tempo_medio_preparo'] or 0,
+        }
+        
+        # Endpoints SSE para atualização em tempo real (snapshot + deltas)
+        context['feed_urls'] = {
+            centro.pk: reverse('comanda:feed_centro', args=[centro.pk]) for centro in centros
         }
         
         return context
@@ -959,6 +1025,100 @@ class StatusComandaAjaxView(LoginRequiredMixin, View):
             'timestamp': timezone.now().isoformat()
         })
 
+class FeedSSEView(View, metaclass=abc.ABCMeta):
+    """
+    Server-Sent Events: envia um snapshot e depois os deltas publicados no
+    broker do feed (ver apps/comandas/feed.py). Servido por ASGI, cada ecrã
+    mantém uma ligação em vez de fazer polling.
+
+    Servido por WSGI, uma ligação destas ocuparia um worker síncrono
+    enquanto o ecrã estivesse aberto: aí a resposta leva só o snapshot e um
+    ``retry`` e fecha, e o EventSource volta a ligar passado
+    ``intervalo_reconexao_wsgi`` segundos (polling). Os ecrãs tratam os dois
+    casos da mesma forma, pelo que o feed funciona com o deploy atual.
+    """
+    intervalo_keepalive = 15
+    intervalo_reconexao_wsgi = 5
+
+    @abc.abstractmethod
+    def get_canais(self, empresa):
+        """Canais do broker a assinar, ou None se o recurso não existir na empresa"""
+
+    @abc.abstractmethod
+    def get_snapshot(self, empresa):
+        """Estado completo enviado no início de cada ligação"""
+
+    @staticmethod
+    def evento(nome, dados):
+        return f"event: {nome}\ndata: {json.dumps(dados, cls=DjangoJSONEncoder)}\n\n"
+
+    async def get(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({'error': 'Não autenticado'}, status=401)
+        empresa = await sync_to_async(lambda: getattr(user, 'empresa', None))()
+        if empresa is None:
+            return JsonResponse({'error': 'Utilizador sem empresa'}, status=403)
+
+        self.kwargs = kwargs
+        canais = await sync_to_async(self.get_canais)(empresa)
+        if canais is None:
+            return JsonResponse({'error': 'Não encontrado'}, status=404)
+
+        if not isinstance(request, ASGIRequest):
+            snapshot = await sync_to_async(self.get_snapshot)(empresa)
+            response = StreamingHttpResponse(
+                [f"retry: {self.intervalo_reconexao_wsgi * 1000}\n\n", self.evento('snapshot', snapshot)],
+                content_type='text/event-stream',
+            )
+            response['Cache-Control'] = 'no-cache'
+            return response
+
+        async def stream():
+            assinatura = feed.get_broker().assinar(canais)
+            try:
+                # Assinar antes do snapshot para não perder alterações entretanto
+                await assinatura.iniciar()
+                snapshot = await sync_to_async(self.get_snapshot)(empresa)
+                yield self.evento('snapshot', snapshot)
+                while True:
+                    mensagem = await assinatura.receber(timeout=self.intervalo_keepalive)
+                    if mensagem is None:
+                        yield ": keepalive\n\n"
+                        continue
+                    yield self.evento('delta', mensagem)
+            finally:
+                await assinatura.fechar()
+
+        response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class FeedCentroView(FeedSSEView):
+    """Itens pendentes/em preparo de um centro de requisição (ecrã da cozinha/bar)"""
+
+    def get_canais(self, empresa):
+        centro_id = self.kwargs['centro_pk']
+        if not CentroRequisicao.objects.filter(pk=centro_id, empresa=empresa).exists():
+            return None
+        return [feed.canal_centro(empresa.pk, centro_id)]
+
+    def get_snapshot(self, empresa):
+        return feed.snapshot_centro(empresa, self.kwargs['centro_pk'])
+
+
+class FeedSalaoView(FeedSSEView):
+    """Estado das comandas ativas e das mesas (ecrã da sala)"""
+
+    def get_canais(self, empresa):
+        return [feed.canal_salao(empresa.pk)]
+
+    def get_snapshot(self, empresa):
+        return feed.snapshot_salao(empresa)
+
+
 class ProdutosPorCategoriaAjaxView(LoginRequiredMixin, View):
     def get(self, request):
         categoria_id = request.GET.get('categoria_id')
@@ -1655,9 +1815,9 @@ class TransferirItensView(View):
         itens_ids = request.POST.getlist("itens")
         nova_comanda_id = request.POST.get("comanda_destino")
         nova_comanda = get_object_or_404(Comanda, pk=nova_comanda_id)
-        ItemComanda.objects.filter(pk__in=itens_ids).update(comanda=nova_comanda)
+        nova_comanda.receber_itens(itens_ids)
         messages.success(request, "Itens transferidos.")
-        return redirect("comanda:detalhe", pk=nova_comanda.pk)
+        return redirect("comanda:detail", pk=nova_comanda.pk)
 
 
 # =====================================
@@ -1747,12 +1907,14 @@ class AtualizarMesaAjaxView(View):
         return JsonResponse({"ok": True, "status": mesa.status})
 
 
-class MapaMesasView(TemplateView):
+class MapaMesasView(LoginRequiredMixin, TemplateView):
+    """Ecrã da sala: estado inicial renderizado, atualizado pelo feed_salao"""
     template_name = "comandas/mapa_mesas.html"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["mesas"] = Mesa.objects.all().order_by("numero")
+        context["mesas"] = Mesa.objects.filter(empresa=self.request.user.empresa, ativa=True).order_by("numero")
+        context["status_mesas"] = dict(Mesa.STATUS_CHOICES)
         return context
 
 
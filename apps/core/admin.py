@@ -5,7 +5,7 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.html import format_html
 from django.contrib.auth.admin import UserAdmin
 from django.utils import timezone
-from .models import Empresa, Loja, Usuario, Categoria
+from .models import Empresa, Loja, Usuario, Categoria, ContadorDocumento, BlocoNumeracao, LacunaNumeracao
 from apps.licenca.models import Licenca 
 
 # =============================================================================
@@ -311,3 +311,25 @@ class LojaAdmin(admin.ModelAdmin):
     list_display = ['nome', 'empresa', 'codigo', 'cidade', 'eh_matriz', 'ativa']
     list_filter = ['ativa', 'eh_matriz', 'empresa']
     search_fields = ['nome', 'codigo', 'cidade']  # ✅ OBRIGATÓRIO para autocomplete
+
+
+@admin.register(ContadorDocumento)
+class ContadorDocumentoAdmin(admin.ModelAdmin):
+    list_display = ['empresa', 'tipo_documento', 'ano', 'modo', 'tamanho_bloco', 'ultimo_numero']
+    list_filter = ['modo', 'tipo_documento', 'ano', 'empresa']
+    readonly_fields = ['ultimo_numero']
+
+
+@admin.register(BlocoNumeracao)
+class BlocoNumeracaoAdmin(admin.ModelAdmin):
+    list_display = ['empresa', 'tipo_documento', 'ano', 'loja', 'terminal', 'inicio', 'fim', 'ultimo_usado', 'estado']
+    list_filter = ['estado', 'tipo_documento', 'ano', 'empresa']
+    search_fields = ['terminal', 'loja__nome']
+    readonly_fields = ['inicio', 'fim', 'ultimo_usado', 'fechado_em']
+
+
+@admin.register(LacunaNumeracao)
+class LacunaNumeracaoAdmin(admin.ModelAdmin):
+    list_display = ['empresa', 'tipo_documento', 'ano', 'numero', 'motivo', 'detetada_em']
+    list_filter = ['tipo_documento', 'ano', 'empresa']
+    readonly_fields = ['numero', 'detetada_em']
@@ -0,0 +1,71 @@
+# apps/core/api/pagination.py
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class PaginacaoPorPagina(PageNumberPagination):
+    """Paginação por número de página, para ordenações que o cursor não suporta"""
+
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class CursorPaginacao(CursorPagination):
+    """
+    Paginação por cursor (keyset) usada por omissão em toda a API.
+
+    Cada página é um ``WHERE <coluna> < <valor do cursor> ORDER BY <coluna>
+    LIMIT n``: o custo não cresce com a profundidade, ao contrário de
+    ``OFFSET``. A coluna é ``ordenacao_cursor`` da view (por omissão a
+    chave primária) ou a pedida com ``?ordering=``, se for uma das colunas
+    indexadas declaradas em ``campos_cursor``.
+
+    Qualquer outro ``?ordering=`` numa view com ``OrderingFilter`` é
+    respeitado: a ordenação do filtro mantém-se e a listagem passa a ser
+    paginada por número de página (``?page=``).
+    """
+
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = '-pk'
+
+    def __init__(self):
+        self.alternativa = None
+
+    def _pedido(self, request):
+        valor = request.query_params.get(OrderingFilter.ordering_param, '')
+        return [campo.strip() for campo in valor.split(',') if campo.strip()]
+
+    def _ordenacao_no_cursor(self, pedido, view):
+        return len(pedido) == 1 and pedido[0].lstrip('-') in getattr(view, 'campos_cursor', ())
+
+    def _ordenacao_do_filtro(self, request, view):
+        """Verdadeiro se a view ordena pelo ``?ordering=`` pedido e o cursor não o suporta"""
+        pedido = self._pedido(request)
+        if not pedido or self._ordenacao_no_cursor(pedido, view):
+            return False
+        return any(
+            isinstance(backend, type) and issubclass(backend, OrderingFilter)
+            for backend in getattr(view, 'filter_backends', ())
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self._ordenacao_do_filtro(request, view):
+            self.alternativa = PaginacaoPorPagina()
+            return self.alternativa.paginate_queryset(queryset, request, view)
+        self.alternativa = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.alternativa is not None:
+            return self.alternativa.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_ordering(self, request, queryset, view):
+        pedido = self._pedido(request)
+        if self._ordenacao_no_cursor(pedido, view):
+            return (pedido[0],)
+        ordenacao = getattr(view, 'ordenacao_cursor', self.ordering)
+        return (ordenacao,) if isinstance(ordenacao, str) else tuple(ordenacao)
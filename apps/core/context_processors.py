@@ -21,6 +21,7 @@ def dashboard_data(request):
     
     # Produtos vencendo hoje
     vencendo_hoje = Lote.objects.filter(
+        empresa=empresa,
         produto__ativo=True,
         data_validade=hoje,
         quantidade_atual__gt=0
@@ -0,0 +1,62 @@
+# apps/core/management/commands/benchmark_dashboards.py
+
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from apps.core.models import Empresa
+from apps.core.services import PlaneadorKPIService
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark dos KPIs dos dashboards: consultas e latência com uma consulta '
+        'por KPI (comportamento anterior) e com o planeador (uma consulta por tabela, '
+        'sequencial e em paralelo). Não usa a cache; em SQLite não há paralelismo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID da empresa (por omissão a primeira)')
+        parser.add_argument('--conjunto', action='append', help='Conjunto de KPIs (repetível; por omissão todos)')
+        parser.add_argument('--repeticoes', type=int, default=5)
+
+    def handle(self, *args, **options):
+        empresa = (
+            Empresa.objects.filter(pk=options['empresa']).first()
+            if options['empresa'] else Empresa.objects.first()
+        )
+        if not empresa:
+            raise CommandError('Nenhuma empresa encontrada')
+
+        service = PlaneadorKPIService(empresa)
+        conjuntos = options['conjunto'] or sorted(service.conjuntos())
+        self.stdout.write(f'{connection.vendor}: empresa {empresa.pk}, {options["repeticoes"]} repetições (mediana)')
+        for conjunto in conjuntos:
+            kpis = service.definicoes(conjunto)
+            modos = [
+                ('uma consulta por KPI', {'agrupar': False, 'paralelo': False}),
+                ('planeador sequencial', {'agrupar': True, 'paralelo': False}),
+                ('planeador paralelo', {'agrupar': True, 'paralelo': True}),
+            ]
+            referencia = None
+            self.stdout.write(f'[{conjunto}] {len(kpis)} KPIs')
+            for descricao, parametros in modos:
+                consultas, duracao, valores = self._medir(service, kpis, parametros, options['repeticoes'])
+                if referencia is None:
+                    referencia = valores
+                elif valores != referencia:
+                    raise CommandError(f'[{conjunto}] {descricao}: valores diferentes da execução por KPI')
+                self.stdout.write(f'    {descricao:<22} {consultas:>4} consultas  {duracao:>8.2f} ms')
+
+    def _medir(self, service, kpis, parametros, repeticoes):
+        duracoes = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            valores = service.calcular(kpis, **parametros)
+            duracoes.append((time.perf_counter() - inicio) * 1000)
+        # As threads do pool usam outras ligações: o número de consultas é o do planeador
+        with CaptureQueriesContext(connection) as capturadas:
+            service.calcular(kpis, agrupar=parametros['agrupar'], paralelo=False)
+        return len(capturadas), statistics.median(duracoes), valores
@@ -0,0 +1,124 @@
+# apps/core/management/commands/benchmark_paginacao_api.py
+
+import statistics
+import time
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from apps.core.api.pagination import CursorPaginacao
+from apps.core.mixins import APIOtimizadaMixin
+from apps.core.models import Empresa
+from apps.vendas.api.serializers import VendaSerializer
+from apps.vendas.models import FormaPagamento, Venda
+from apps.vendas.views import VendaViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        'Percorre as vendas de uma empresa página a página com a paginação por cursor '
+        'da API (e ?fields=) e compara o custo por página com OFFSET em várias '
+        'profundidades. Com --criar gera vendas sintéticas (apagadas no fim).'
+    )
+
+    PREFIXO = 'BENCH-API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID da empresa (por omissão a primeira)')
+        parser.add_argument('--criar', type=int, default=0, help='Vendas sintéticas a criar (ex.: 1000000)')
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--fields', default='id,numero_documento,total,status,data_venda')
+        parser.add_argument('--manter', action='store_true', help='Não apagar as vendas sintéticas')
+
+    def handle(self, *args, **options):
+        empresa = (
+            Empresa.objects.filter(pk=options['empresa']).first()
+            if options['empresa'] else Empresa.objects.first()
+        )
+        if not empresa:
+            raise CommandError('Nenhuma empresa encontrada')
+
+        if options['criar']:
+            self._criar(empresa, options['criar'])
+        try:
+            self._executar(empresa, options)
+        finally:
+            if options['criar'] and not options['manter']:
+                # DELETE direto: as vendas sintéticas não têm linhas nem pagamentos
+                # e os signals de remoção (por objeto) tornariam a limpeza lenta
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'DELETE FROM {Venda._meta.db_table} WHERE empresa_id = %s AND numero_documento LIKE %s',
+                        [empresa.pk, f'{self.PREFIXO}-%'],
+                    )
+                    self.stdout.write(f'{cursor.rowcount} vendas sintéticas apagadas')
+
+    def _criar(self, empresa, total, lote=10000):
+        forma = FormaPagamento.objects.first()
+        if not forma:
+            raise CommandError('É necessária pelo menos uma forma de pagamento')
+        inicio = time.perf_counter()
+        for base in range(0, total, lote):
+            Venda.objects.bulk_create([
+                Venda(
+                    empresa=empresa, forma_pagamento=forma, status='finalizada', total=i % 1000,
+                    numero_documento=f'{self.PREFIXO}-{empresa.pk}-{i}',
+                )
+                for i in range(base, min(base + lote, total))
+            ], batch_size=lote)
+        self.stdout.write(f'{total} vendas criadas em {time.perf_counter() - inicio:.1f}s')
+
+    def _queryset(self, empresa, campos):
+        return APIOtimizadaMixin.otimizar_queryset(
+            Venda.objects.filter(empresa=empresa), VendaSerializer, campos,
+            extras=[VendaViewSet.ordenacao_cursor.lstrip('-')],
+        )
+
+    def _executar(self, empresa, options):
+        factory = APIRequestFactory()
+        campos = [campo for campo in options['fields'].split(',') if campo]
+        tamanho = options['page_size']
+        total = Venda.objects.filter(empresa=empresa).count()
+        if not total:
+            raise CommandError('A empresa não tem vendas (use --criar)')
+
+        # 1) Cursor: todas as páginas, tempo e consultas por página
+        duracoes, consultas, linhas = [], [], 0
+        parametros = {'page_size': tamanho, 'fields': options['fields']}
+        while True:
+            request = Request(factory.get('/api/vendas/', parametros))
+            paginador = CursorPaginacao()
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                pagina = paginador.paginate_queryset(self._queryset(empresa, campos), request, view=VendaViewSet())
+                duracoes.append((time.perf_counter() - inicio) * 1000)
+            consultas.append(len(capturadas))
+            linhas += len(pagina)
+            proxima = paginador.get_next_link()
+            if not proxima:
+                break
+            parametros['cursor'] = parse_qs(urlparse(proxima).query)['cursor'][0]
+
+        self.stdout.write(
+            f'{connection.vendor}: {total} vendas, {len(duracoes)} páginas de {tamanho} '
+            f'({linhas} linhas lidas), fields={options["fields"]}'
+        )
+        self.stdout.write(f'  cursor: {max(consultas)} consulta(s) por página')
+        decis = max(1, len(duracoes) // 10)
+        for indice in range(0, len(duracoes), decis):
+            bloco = duracoes[indice:indice + decis]
+            self.stdout.write(f'    páginas {indice + 1:>7}-{indice + len(bloco):<7} mediana {statistics.median(bloco):8.2f} ms')
+
+        # 2) OFFSET nas mesmas profundidades (amostras)
+        self.stdout.write('  offset (comparação):')
+        base = Venda.objects.filter(empresa=empresa).order_by('-pk').only(*{'id', *campos} & {
+            campo.name for campo in Venda._meta.concrete_fields
+        })
+        for fracao in (0, 0.25, 0.5, 0.75, 0.99):
+            deslocamento = int(total * fracao)
+            inicio = time.perf_counter()
+            list(base[deslocamento:deslocamento + tamanho])
+            self.stdout.write(f'    offset {deslocamento:>9} {(time.perf_counter() - inicio) * 1000:8.2f} ms')
@@ -0,0 +1,140 @@
+# apps/core/management/commands/teste_carga_numeracao.py
+
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from apps.core.models import Empresa, ContadorDocumento, BlocoNumeracao, EmissaoNumeracao, LacunaNumeracao
+from apps.core.services import NumeracaoDocumentoService
+
+
+class _Revertida(Exception):
+    def __init__(self, numero):
+        super().__init__(numero)
+        self.numero = numero
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga da numeração de documentos: N caixas em paralelo a emitir '
+        'números numa série de teste (ano fictício), nos modos sequência e blocos. '
+        'Só é representativo em PostgreSQL (o SQLite serializa todas as escritas).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID da empresa (por omissão a primeira)')
+        parser.add_argument('--caixas', type=int, default=20)
+        parser.add_argument('--documentos', type=int, default=200, help='Documentos por caixa')
+        parser.add_argument('--modo', choices=['sequencia', 'blocos', 'todos'], default='todos')
+        parser.add_argument('--tamanho-bloco', type=int, default=50)
+        parser.add_argument('--revertidas', type=int, default=0,
+                            help='Cada N-ésima emissão de cada caixa é revertida (0 = nenhuma)')
+        parser.add_argument('--tipo', default='TV')
+        parser.add_argument('--ano', type=int, default=9999, help='Ano da série de teste (é apagada no fim)')
+
+    def handle(self, *args, **options):
+        empresa = (
+            Empresa.objects.filter(pk=options['empresa']).first()
+            if options['empresa'] else Empresa.objects.first()
+        )
+        if not empresa:
+            raise CommandError('Nenhuma empresa encontrada')
+
+        modos = ['sequencia', 'blocos'] if options['modo'] == 'todos' else [options['modo']]
+        for modo in modos:
+            self._limpar(empresa, options)
+            try:
+                self._executar(empresa, modo, options)
+            finally:
+                self._limpar(empresa, options)
+
+    def _executar(self, empresa, modo, options):
+        caixas = options['caixas']
+        documentos = options['documentos']
+        tipo, ano = options['tipo'], options['ano']
+
+        ContadorDocumento.objects.create(
+            empresa=empresa, tipo_documento=tipo, ano=ano,
+            modo=modo, tamanho_bloco=options['tamanho_bloco'],
+        )
+
+        numeros = [[] for _ in range(caixas)]
+        revertidos = [[] for _ in range(caixas)]
+        erros = []
+        barreira = threading.Barrier(caixas)
+
+        def caixa(indice):
+            service = NumeracaoDocumentoService(empresa, tipo, ano=ano)
+            terminal = f'CX{indice + 1:02d}' if modo == 'blocos' else ''
+            try:
+                barreira.wait()
+                for emissao in range(1, documentos + 1):
+                    reverter = options['revertidas'] and emissao % options['revertidas'] == 0
+                    try:
+                        with transaction.atomic():
+                            numero = service.proximo_numero(terminal=terminal)
+                            if reverter:
+                                raise _Revertida(numero)
+                        numeros[indice].append(numero)
+                    except _Revertida as revertida:
+                        revertidos[indice].append(revertida.numero)
+            except Exception as e:
+                erros.append(f'{terminal or indice}: {e}')
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=caixa, args=(i,)) for i in range(caixas)]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duracao = time.perf_counter() - inicio
+
+        emitidos = [n for lista in numeros for n in lista]
+        duplicados = len(emitidos) - len(set(emitidos))
+
+        # Fecho dos caixas: os números restantes de cada bloco ficam como lacuna
+        service = NumeracaoDocumentoService(empresa, tipo, ano=ano)
+        blocos_fechados = 0
+        if modo == 'blocos':
+            for i in range(caixas):
+                blocos_fechados += service.fechar_blocos(terminal=f'CX{i + 1:02d}', motivo='Fim do teste de carga')
+        else:
+            service.auditar_lacunas(idade_minima=timedelta(0))
+        numeros_lacuna = sum(fim - primeiro + 1 for primeiro, fim, _ in service.lacunas())
+        total_revertidos = sum(len(lista) for lista in revertidos)
+
+        self.stdout.write(
+            f'[{modo}] {connection.vendor}: {caixas} caixas x {documentos} documentos = '
+            f'{len(emitidos)} números em {duracao:.2f}s '
+            f'({len(emitidos) / duracao if duracao else 0:.0f} doc/s)'
+        )
+        self.stdout.write(f'    duplicados: {duplicados} | erros: {len(erros)} | '
+                          f'blocos fechados: {blocos_fechados} | revertidos: {total_revertidos} | '
+                          f'números em lacuna: {numeros_lacuna}')
+        for erro in erros[:5]:
+            self.stdout.write(self.style.ERROR(f'    {erro}'))
+        if duplicados:
+            raise CommandError('Foram emitidos números duplicados')
+        if modo == 'sequencia' and emitidos:
+            # Sem lacunas por justificar: tudo o que não foi emitido abaixo do
+            # último número tem de estar registado como lacuna.
+            nao_emitidos = set(range(1, max(emitidos))) - set(emitidos)
+            justificados = {primeiro for primeiro, _, _ in service.lacunas()}
+            if nao_emitidos - justificados:
+                raise CommandError(f'Lacunas por justificar: {sorted(nao_emitidos - justificados)[:10]}')
+
+    def _limpar(self, empresa, options):
+        tipo, ano = options['tipo'], options['ano']
+        BlocoNumeracao.objects.filter(empresa=empresa, tipo_documento=tipo, ano=ano).delete()
+        EmissaoNumeracao.objects.filter(empresa=empresa, tipo_documento=tipo, ano=ano).delete()
+        LacunaNumeracao.objects.filter(empresa=empresa, tipo_documento=tipo, ano=ano).delete()
+        service = NumeracaoDocumentoService(empresa, tipo, ano=ano)
+        if service.usa_sequence:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP SEQUENCE IF EXISTS "{service.nome_sequence}"')
+            NumeracaoDocumentoService._sequencias_criadas.discard(service.nome_sequence)
+        ContadorDocumento.objects.filter(empresa=empresa, tipo_documento=tipo, ano=ano).delete()
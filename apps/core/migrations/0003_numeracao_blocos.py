@@ -0,0 +1,105 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+TIPO_CHOICES = [('FR', 'Fatura Recibo'), ('FT', 'Fatura'), ('REC', 'Recibo'), ('PP', 'Fatura Proforma'), ('NC', 'Nota de Crédito'), ('ND', 'Nota de Débito'), ('DT', 'Documento de Transporte'), ('VD', 'Venda a Dinheiro'), ('TV', 'Talão de Venda'), ('TD', 'Talão de Devolução'), ('AA', 'Alienação de Ativos'), ('DA', 'Devolução de Ativos'), ('RP', 'Prémio ou Penalização'), ('RE', 'Estorno ou Anulação'), ('CS', 'Imputação a Co-Produtos'), ('LD', 'Lançamentos Diversos'), ('RA', 'Resseguro Aceite'), ('RC', 'Resseguro Cedido')]
+
+
+def marcar_numeros_existentes(apps, schema_editor):
+    """Os números emitidos antes do registo de emissões não entram na auditoria"""
+    ContadorDocumento = apps.get_model('core', 'ContadorDocumento')
+    ContadorDocumento.objects.update(auditado_ate=F('ultimo_numero'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_empresa_codigo_validacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contadordocumento',
+            name='modo',
+            field=models.CharField(choices=[('sequencia', 'Sequência estrita (SAF-T)'), ('blocos', 'Blocos reservados por loja/terminal')], default='sequencia', help_text='Sequência estrita: números sem lock por documento (SEQUENCE em PostgreSQL), números de emissões revertidas registados como lacuna. Blocos: cada loja/terminal consome um intervalo pré-reservado.', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='contadordocumento',
+            name='tamanho_bloco',
+            field=models.PositiveIntegerField(default=100, help_text='Números reservados por bloco (modo blocos)'),
+        ),
+        migrations.AddField(
+            model_name='contadordocumento',
+            name='auditado_ate',
+            field=models.IntegerField(default=0, help_text='Números até aqui já verificados pela auditoria de lacunas'),
+        ),
+        migrations.AlterField(
+            model_name='contadordocumento',
+            name='tipo_documento',
+            field=models.CharField(choices=TIPO_CHOICES, max_length=5, verbose_name='Tipo de Documento'),
+        ),
+        migrations.CreateModel(
+            name='BlocoNumeracao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo_documento', models.CharField(choices=TIPO_CHOICES, max_length=5)),
+                ('ano', models.IntegerField()),
+                ('terminal', models.CharField(blank=True, max_length=50)),
+                ('inicio', models.PositiveIntegerField()),
+                ('fim', models.PositiveIntegerField()),
+                ('ultimo_usado', models.PositiveIntegerField(help_text='Último número emitido (inicio - 1 se nenhum)')),
+                ('estado', models.CharField(choices=[('ativo', 'Ativo'), ('esgotado', 'Esgotado'), ('fechado', 'Fechado')], default='ativo', max_length=20)),
+                ('motivo_fecho', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('fechado_em', models.DateTimeField(blank=True, null=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blocos_numeracao', to='core.empresa')),
+                ('loja', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='blocos_numeracao', to='core.loja')),
+            ],
+            options={
+                'verbose_name': 'Bloco de Numeração',
+                'verbose_name_plural': 'Blocos de Numeração',
+                'ordering': ['empresa', 'tipo_documento', 'ano', 'inicio'],
+                'indexes': [models.Index(condition=models.Q(('estado', 'ativo')), fields=['empresa', 'tipo_documento', 'ano', 'loja', 'terminal'], name='idx_bloco_numeracao_ativo')],
+                'constraints': [models.UniqueConstraint(fields=('empresa', 'tipo_documento', 'ano', 'inicio'), name='unique_bloco_numeracao_inicio')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EmissaoNumeracao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo_documento', models.CharField(choices=TIPO_CHOICES, max_length=5)),
+                ('ano', models.IntegerField()),
+                ('numero', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='emissoes_numeracao', to='core.empresa')),
+            ],
+            options={
+                'verbose_name': 'Emissão de Numeração',
+                'verbose_name_plural': 'Emissões de Numeração',
+                'ordering': ['empresa', 'tipo_documento', 'ano', 'numero'],
+                'constraints': [models.UniqueConstraint(fields=('empresa', 'tipo_documento', 'ano', 'numero'), name='unique_emissao_numeracao')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LacunaNumeracao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo_documento', models.CharField(choices=TIPO_CHOICES, max_length=5)),
+                ('ano', models.IntegerField()),
+                ('numero', models.PositiveIntegerField()),
+                ('motivo', models.CharField(blank=True, max_length=200)),
+                ('detetada_em', models.DateTimeField(auto_now_add=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lacunas_numeracao', to='core.empresa')),
+            ],
+            options={
+                'verbose_name': 'Lacuna de Numeração',
+                'verbose_name_plural': 'Lacunas de Numeração',
+                'ordering': ['empresa', 'tipo_documento', 'ano', 'numero'],
+                'constraints': [models.UniqueConstraint(fields=('empresa', 'tipo_documento', 'ano', 'numero'), name='unique_lacuna_numeracao')],
+            },
+        ),
+        migrations.RunPython(marcar_numeros_existentes, migrations.RunPython.noop),
+    ]
@@ -3,6 +3,7 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.utils.translation import gettext_lazy as _
 from django.db import models
+from django.core.exceptions import FieldDoesNotExist
 from django.contrib.auth.mixins import LoginRequiredMixin
 
 
@@ -47,6 +48,117 @@ class SuccessMessageMixin:
         return response
 
 
+class APIOtimizadaMixin:
+    """
+    Leituras da API sem colunas nem consultas desnecessárias.
+
+    - ``?fields=a,b`` devolve só esses campos do serializer e, quando todos
+      vêm de colunas do modelo, limita o SELECT com ``.only()``;
+    - ``Meta.relacionados`` do serializer declara, por campo, os caminhos a
+      carregar de antemão (``{'cliente_nome': 'cliente', 'itens':
+      'itens__produto'}``): relações diretas vão para ``select_related`` e
+      as restantes (ou objetos ``Prefetch``) para ``prefetch_related``. Só
+      são aplicados os dos campos pedidos.
+    """
+
+    parametro_campos = 'fields'
+
+    def campos_pedidos(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method != 'GET':
+            return None
+        valor = request.query_params.get(self.parametro_campos)
+        if not valor:
+            return None
+        return [campo.strip() for campo in valor.split(',') if campo.strip()]
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        campos = self.campos_pedidos()
+        if campos:
+            alvo = getattr(serializer, 'child', serializer)
+            for nome in set(alvo.fields) - set(campos):
+                alvo.fields.pop(nome)
+        return serializer
+
+    def filter_queryset(self, queryset):
+        # Depois do get_queryset/filtros da view, para respeitar os
+        # select_related que a própria view já aplica
+        queryset = super().filter_queryset(queryset)
+        if getattr(self, 'request', None) is None or self.request.method != 'GET':
+            return queryset
+        # As colunas do cursor de paginação são lidas em todas as linhas
+        ordenacao = getattr(self, 'ordenacao_cursor', 'pk')
+        colunas_cursor = [ordenacao] if isinstance(ordenacao, str) else list(ordenacao)
+        colunas_cursor += list(getattr(self, 'campos_cursor', ()))
+        return self.otimizar_queryset(
+            queryset, self.get_serializer_class(), self.campos_pedidos(),
+            extras=[coluna.lstrip('-') for coluna in colunas_cursor],
+        )
+
+    @classmethod
+    def otimizar_queryset(cls, queryset, serializer_class, campos=None, extras=()):
+        modelo = queryset.model
+        serializer = serializer_class()
+        todos = serializer.fields
+        nomes = [nome for nome in (campos or todos) if nome in todos]
+        relacionados = getattr(getattr(serializer_class, 'Meta', None), 'relacionados', {})
+
+        selecionar, pre_carregar = [], []
+        for nome in nomes:
+            caminhos = relacionados.get(nome, ())
+            for caminho in (caminhos if isinstance(caminhos, (list, tuple)) else [caminhos]):
+                if isinstance(caminho, str) and cls._relacao_direta(modelo, caminho):
+                    selecionar.append(caminho)
+                else:
+                    pre_carregar.append(caminho)
+        if selecionar:
+            queryset = queryset.select_related(*selecionar)
+        if pre_carregar:
+            queryset = queryset.prefetch_related(*pre_carregar)
+
+        if campos:
+            colunas = cls._colunas(modelo, [todos[nome] for nome in nomes])
+            if colunas is not None:
+                if isinstance(queryset.query.select_related, dict):
+                    colunas.update(queryset.query.select_related)
+                colunas.update(coluna for coluna in extras if coluna != 'pk')
+                queryset = queryset.only(*colunas)
+        return queryset
+
+    @staticmethod
+    def _relacao_direta(modelo, caminho):
+        """Verdadeiro se todo o caminho são FK/OneToOne diretas (select_related)"""
+        for parte in caminho.split('__'):
+            try:
+                campo = modelo._meta.get_field(parte)
+            except FieldDoesNotExist:
+                return False
+            if not (campo.is_relation and (campo.many_to_one or campo.one_to_one) and campo.concrete):
+                return False
+            modelo = campo.related_model
+        return True
+
+    @staticmethod
+    def _colunas(modelo, campos):
+        """
+        Colunas do modelo lidas pelos campos do serializer, ou ``None`` se
+        algum depende do objeto inteiro (``source='*'``, propriedades, métodos).
+        """
+        colunas = {modelo._meta.pk.name}
+        for campo in campos:
+            if campo.source == '*':
+                return None
+            primeiro = campo.source.split('.')[0]
+            try:
+                campo_modelo = modelo._meta.get_field(primeiro)
+            except FieldDoesNotExist:
+                return None
+            if campo_modelo.concrete and not campo_modelo.many_to_many:
+                colunas.add(campo_modelo.name)
+        return colunas
+
+
 class IsAuthenticatedMixin:
     """
     Garante que todas as views herdem autenticação por padrão.
@@ -215,10 +215,25 @@ class ContadorDocumento(models.Model):
         ('RC', 'Resseguro Cedido'),
     ]
 
+    MODO_CHOICES = [
+        ('sequencia', 'Sequência estrita (SAF-T)'),
+        ('blocos', 'Blocos reservados por loja/terminal'),
+    ]
+
     empresa = models.ForeignKey('core.Empresa', on_delete=models.CASCADE)
-    tipo_documento = models.CharField(max_length=5, choices=TIPO_CHOICES, unique=True, verbose_name="Tipo de Documento")
+    tipo_documento = models.CharField(max_length=5, choices=TIPO_CHOICES, verbose_name="Tipo de Documento")
     ano = models.IntegerField(default=2025) # Ajustar para o ano atual dinamicamente
     ultimo_numero = models.IntegerField(default=0)
+    modo = models.CharField(
+        max_length=20,
+        choices=MODO_CHOICES,
+        default='sequencia',
+        help_text="Sequência estrita: números sem lock por documento (SEQUENCE em PostgreSQL), "
+                  "números de emissões revertidas registados como lacuna. "
+                  "Blocos: cada loja/terminal consome um intervalo pré-reservado."
+    )
+    tamanho_bloco = models.PositiveIntegerField(default=100, help_text="Números reservados por bloco (modo blocos)")
+    auditado_ate = models.IntegerField(default=0, help_text="Números até aqui já verificados pela auditoria de lacunas")
     
     class Meta:
         # Garante que só pode haver uma entrada por Tipo, Empresa e Ano.
@@ -230,3 +245,113 @@ class ContadorDocumento(models.Model):
         return f"Série {self.tipo_documento} de {self.empresa.nome} ({self.ano}): {self.ultimo_numero}"
 
 
+class BlocoNumeracao(models.Model):
+    """
+    Intervalo contíguo [inicio, fim] de uma série reservado para uma loja ou
+    terminal. Os números não usados de blocos fechados ficam registados
+    como lacunas da série.
+    """
+    ESTADO_CHOICES = [
+        ('ativo', 'Ativo'),
+        ('esgotado', 'Esgotado'),
+        ('fechado', 'Fechado'),
+    ]
+
+    empresa = models.ForeignKey('core.Empresa', on_delete=models.CASCADE, related_name='blocos_numeracao')
+    tipo_documento = models.CharField(max_length=5, choices=ContadorDocumento.TIPO_CHOICES)
+    ano = models.IntegerField()
+    loja = models.ForeignKey('core.Loja', on_delete=models.PROTECT, null=True, blank=True, related_name='blocos_numeracao')
+    terminal = models.CharField(max_length=50, blank=True)
+    inicio = models.PositiveIntegerField()
+    fim = models.PositiveIntegerField()
+    ultimo_usado = models.PositiveIntegerField(help_text="Último número emitido (inicio - 1 se nenhum)")
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='ativo')
+    motivo_fecho = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    fechado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Bloco de Numeração'
+        verbose_name_plural = 'Blocos de Numeração'
+        ordering = ['empresa', 'tipo_documento', 'ano', 'inicio']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['empresa', 'tipo_documento', 'ano', 'inicio'],
+                name='unique_bloco_numeracao_inicio'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['empresa', 'tipo_documento', 'ano', 'loja', 'terminal'],
+                name='idx_bloco_numeracao_ativo',
+                condition=models.Q(estado='ativo'),
+            ),
+        ]
+
+    def __str__(self):
+        destino = self.terminal or (self.loja.nome if self.loja else 'Empresa')
+        return f"{self.tipo_documento}/{self.ano} [{self.inicio}-{self.fim}] {destino}"
+
+    @property
+    def disponiveis(self):
+        return self.fim - self.ultimo_usado
+
+    @property
+    def numeros_nao_usados(self):
+        """Números que nunca serão emitidos (lacuna) se o bloco estiver fechado"""
+        return self.disponiveis if self.estado == 'fechado' else 0
+
+
+class EmissaoNumeracao(models.Model):
+    """
+    Número de uma série estrita efetivamente emitido. A linha é criada na
+    transação de quem emite: se a emissão for revertida a linha desaparece
+    com ela e o número passa a ser detetado como lacuna pela auditoria.
+    """
+    empresa = models.ForeignKey('core.Empresa', on_delete=models.CASCADE, related_name='emissoes_numeracao')
+    tipo_documento = models.CharField(max_length=5, choices=ContadorDocumento.TIPO_CHOICES)
+    ano = models.IntegerField()
+    numero = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Emissão de Numeração'
+        verbose_name_plural = 'Emissões de Numeração'
+        ordering = ['empresa', 'tipo_documento', 'ano', 'numero']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['empresa', 'tipo_documento', 'ano', 'numero'],
+                name='unique_emissao_numeracao'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo_documento}/{self.ano} nº {self.numero}"
+
+
+class LacunaNumeracao(models.Model):
+    """
+    Número reservado numa série estrita que nunca chegou a ser emitido
+    (transação revertida). Registado pela auditoria de lacunas para que a
+    série fique justificada perante a AGT.
+    """
+    empresa = models.ForeignKey('core.Empresa', on_delete=models.CASCADE, related_name='lacunas_numeracao')
+    tipo_documento = models.CharField(max_length=5, choices=ContadorDocumento.TIPO_CHOICES)
+    ano = models.IntegerField()
+    numero = models.PositiveIntegerField()
+    motivo = models.CharField(max_length=200, blank=True)
+    detetada_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Lacuna de Numeração'
+        verbose_name_plural = 'Lacunas de Numeração'
+        ordering = ['empresa', 'tipo_documento', 'ano', 'numero']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['empresa', 'tipo_documento', 'ano', 'numero'],
+                name='unique_lacuna_numeracao'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo_documento}/{self.ano} nº {self.numero} (lacuna)"
@@ -1,57 +1,674 @@
 #apps/core/services.py
-from django.db import transaction
-from django.utils import timezone
-from apps.core.models import ContadorDocumento # Assumindo a localização
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import reduce
+from operator import or_
 
-import random
-import string
-from django.db import transaction
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import (
+    DatabaseError, InterfaceError, OperationalError, ProgrammingError, close_old_connections, connection,
+    transaction,
+)
+from django.db.models import Count, F, Max
+from django.utils.module_loading import autodiscover_modules
 from django.utils import timezone
-from apps.core.models import ContadorDocumento
+from apps.core.models import ContadorDocumento, BlocoNumeracao, EmissaoNumeracao, LacunaNumeracao
+
+logger = logging.getLogger(__name__)
+
 
-def gerar_numero_documento(empresa, tipo_documento):
+class NumeracaoDocumentoService:
     """
-    Gera e reserva o próximo número sequencial no formato:
-    FR PMA1XYZ2025/001
-    
-    Onde:
-        FR    -> Tipo do documento
-        PMA   -> 3 iniciais da empresa
-        1     -> ID da empresa
-        XYZ   -> 3 letras aleatórias (A–Z)
-        2025  -> Ano em curso
-        /001  -> Número sequencial de 6 dígitos
-    """
-    ano_atual = timezone.now().year
-
-    with transaction.atomic():
-        contador, created = ContadorDocumento.objects.select_for_update().get_or_create(
-            empresa=empresa,
-            tipo_documento=tipo_documento,
-            ano=ano_atual,
+    Atribuição de números de documentos.
+
+    - Séries em modo ``sequencia`` (estritas, SAF-T): em PostgreSQL cada série
+      (empresa, tipo, ano) tem uma SEQUENCE própria e ``nextval`` não bloqueia
+      outros caixas; noutros motores usa-se o lock de linha do contador. Cada
+      número emitido fica em ``EmissaoNumeracao``, na transação de quem
+      emite: um número de uma transação revertida não volta a ser emitido e
+      ``auditar_lacunas`` regista-o em ``LacunaNumeracao``.
+    - Séries em modo ``blocos``: o contador só é bloqueado para reservar um
+      intervalo contíguo para a loja/terminal; dentro do bloco cada emissão
+      bloqueia apenas a linha do próprio bloco.
+
+    ``ContadorDocumento.ultimo_numero`` é acertado com a SEQUENCE sempre que
+    o contador é bloqueado (reserva de blocos, números avulsos) e na
+    auditoria, pelo que mudar o modo da série não volta a emitir números.
+    """
+
+    # Emissões mais recentes do que isto ainda podem estar em curso noutro
+    # caixa: a auditoria só declara lacunas abaixo delas.
+    IDADE_MINIMA_LACUNA = timedelta(minutes=10)
+    TAMANHO_LOTE_AUDITORIA = 10000
+    MOTIVO_LACUNA = 'Emissão revertida (transação sem commit)'
+    SQLSTATE_TABELA_INEXISTENTE = '42P01'  # undefined_table
+
+    _sequencias_criadas = set()
+
+    def __init__(self, empresa, tipo_documento, ano=None):
+        self.empresa = empresa
+        self.tipo_documento = tipo_documento
+        self.ano = ano or timezone.now().year
+
+    # ------------------------------------------------------------------
+    # Contador
+    # ------------------------------------------------------------------
+    def contador(self, bloquear=False):
+        queryset = ContadorDocumento.objects
+        if bloquear:
+            queryset = queryset.select_for_update()
+        contador, _ = queryset.get_or_create(
+            empresa=self.empresa,
+            tipo_documento=self.tipo_documento,
+            ano=self.ano,
             defaults={'ultimo_numero': 0}
         )
+        return contador
+
+    def _serie(self):
+        return {'empresa': self.empresa, 'tipo_documento': self.tipo_documento, 'ano': self.ano}
+
+    # ------------------------------------------------------------------
+    # Sequência estrita
+    # ------------------------------------------------------------------
+    @property
+    def usa_sequence(self):
+        return connection.vendor == 'postgresql'
+
+    @property
+    def nome_sequence(self):
+        return f"doc_seq_{self.empresa.pk}_{self.tipo_documento.lower()}_{self.ano}"
+
+    def _garantir_sequence(self, contador):
+        nome = self.nome_sequence
+        if nome in self._sequencias_criadas:
+            return nome
+        # Nunca recomeça abaixo de um número já emitido, mesmo com o contador atrasado
+        emitido = EmissaoNumeracao.objects.filter(**self._serie()).aggregate(ultimo=Max('numero'))['ultimo'] or 0
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f'CREATE SEQUENCE IF NOT EXISTS "{nome}" START WITH {max(contador.ultimo_numero, emitido) + 1}'
+                )
+        except DatabaseError:
+            # Criada em paralelo por outro processo
+            pass
+        # O CREATE SEQUENCE pertence à transação de quem emite: só fica em
+        # cache depois do commit, senão um rollback deixava o nome na cache
+        # de uma SEQUENCE que já não existe.
+        transaction.on_commit(lambda: self._sequencias_criadas.add(nome))
+        return nome
+
+    def _ler_sequence(self, contador, sql, parametros=None):
+        """
+        Executa ``sql`` (com ``{nome}``) sobre a SEQUENCE da série e devolve a
+        primeira linha. Se a SEQUENCE em cache já não existir (criada numa
+        transação revertida noutro pedido), sai da cache e é recriada.
+        """
+        for tentativa in range(2):
+            nome = self._garantir_sequence(contador)
+            try:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute(sql.format(nome=nome), parametros)
+                    return cursor.fetchone()
+            except ProgrammingError as e:
+                codigo = getattr(e.__cause__, 'pgcode', None)
+                if tentativa or codigo != self.SQLSTATE_TABELA_INEXISTENTE:
+                    raise
+                logger.warning(f'SEQUENCE {nome} em cache mas inexistente: a recriar')
+                self._sequencias_criadas.discard(nome)
+
+    def _ultimo_da_sequence(self, contador):
+        """Último número entregue pela SEQUENCE (0 se nunca usada)"""
+        last_value, is_called = self._ler_sequence(contador, 'SELECT last_value, is_called FROM "{nome}"')
+        return last_value if is_called else last_value - 1
+
+    def _acertar_contador(self, contador):
+        """
+        Com o contador bloqueado: traz ``ultimo_numero`` até ao último valor
+        da SEQUENCE. Chamado antes de tirar números diretamente do contador.
+        """
+        if self.usa_sequence:
+            contador.ultimo_numero = max(contador.ultimo_numero, self._ultimo_da_sequence(contador))
+        return contador
+
+    def _acertar_sequence(self, contador):
+        """Avança a SEQUENCE até ``ultimo_numero`` (números tirados do contador)"""
+        if self.usa_sequence and contador.ultimo_numero > 0:
+            self._ler_sequence(
+                contador,
+                'SELECT setval(\'"{nome}"\', GREATEST(%s, (SELECT CASE WHEN is_called THEN last_value '
+                'ELSE last_value - 1 END FROM "{nome}")))',
+                [contador.ultimo_numero],
+            )
+
+    def _registar_emissao(self, numero):
+        EmissaoNumeracao.objects.create(numero=numero, **self._serie())
+        return numero
+
+    def proximo_sequencial(self, contador=None):
+        """Próximo número da série estrita"""
+        if not self.usa_sequence:
+            with transaction.atomic():
+                contador = self.contador(bloquear=True)
+                contador.ultimo_numero += 1
+                contador.save(update_fields=['ultimo_numero'])
+                return self._registar_emissao(contador.ultimo_numero)
+
+        numero, = self._ler_sequence(contador or self.contador(), 'SELECT nextval(\'"{nome}"\')')
+        return self._registar_emissao(numero)
+
+    def proximo_avulso(self):
+        """Número retirado diretamente do contador (série por blocos sem loja/terminal)"""
+        with transaction.atomic():
+            contador = self._acertar_contador(self.contador(bloquear=True))
+            contador.ultimo_numero += 1
+            contador.save(update_fields=['ultimo_numero'])
+            self._acertar_sequence(contador)
+            return self._registar_emissao(contador.ultimo_numero)
+
+    def auditar_lacunas(self, idade_minima=None):
+        """
+        Regista em ``LacunaNumeracao`` os números entregues pela série e
+        nunca emitidos (transação revertida) e acerta ``ultimo_numero`` do
+        contador. Só percorre os números acima de ``auditado_ate`` e abaixo
+        da última emissão com mais de ``idade_minima``: acima dela ainda pode
+        haver vendas por confirmar. Devolve o número de lacunas novas.
+        """
+        idade_minima = self.IDADE_MINIMA_LACUNA if idade_minima is None else idade_minima
+        emissoes = EmissaoNumeracao.objects.filter(**self._serie())
+        limite = (
+            emissoes.filter(created_at__lte=timezone.now() - idade_minima)
+            .order_by('-numero').values_list('numero', flat=True).first()
+        ) or 0
 
-        contador.ultimo_numero += 1
-        contador.save()
+        with transaction.atomic():
+            contador = self._acertar_contador(self.contador(bloquear=True))
+            inicio_auditoria = contador.auditado_ate + 1
+            contador.auditado_ate = max(contador.auditado_ate, limite)
+            contador.save(update_fields=['ultimo_numero', 'auditado_ate'])
+
+        # Os números de blocos reservados são justificados pelo próprio bloco
+        blocos = list(
+            BlocoNumeracao.objects.filter(**self._serie(), fim__gte=inicio_auditoria, inicio__lt=limite)
+            .values_list('inicio', 'fim')
+        )
+        em_bloco = lambda numero: any(inicio <= numero <= fim for inicio, fim in blocos)
+
+        novas = []
+        for inicio in range(inicio_auditoria, limite, self.TAMANHO_LOTE_AUDITORIA):
+            fim = min(inicio + self.TAMANHO_LOTE_AUDITORIA, limite)
+            emitidos = set(
+                emissoes.filter(numero__gte=inicio, numero__lt=fim).values_list('numero', flat=True)
+            )
+            novas.extend(
+                LacunaNumeracao(numero=numero, motivo=self.MOTIVO_LACUNA, **self._serie())
+                for numero in range(inicio, fim)
+                if numero not in emitidos and not em_bloco(numero)
+            )
+        LacunaNumeracao.objects.bulk_create(novas, batch_size=1000, ignore_conflicts=True)
+        return len(novas)
+
+    # ------------------------------------------------------------------
+    # Blocos reservados
+    # ------------------------------------------------------------------
+    def _blocos(self, loja=None, terminal=''):
+        return BlocoNumeracao.objects.filter(
+            **self._serie(),
+            loja=loja,
+            terminal=terminal or '',
+        )
+
+    def reservar_bloco(self, loja=None, terminal='', tamanho=None):
+        """Reserva o próximo intervalo contíguo da série para a loja/terminal"""
+        with transaction.atomic():
+            contador = self.contador(bloquear=True)
+            if contador.modo != 'blocos':
+                raise ValueError(
+                    f"A série {self.tipo_documento}/{self.ano} é estrita e não admite blocos reservados."
+                )
+            self._acertar_contador(contador)
+            tamanho = tamanho or contador.tamanho_bloco
+            inicio = contador.ultimo_numero + 1
+            contador.ultimo_numero += tamanho
+            contador.save(update_fields=['ultimo_numero'])
+            self._acertar_sequence(contador)
+
+            return BlocoNumeracao.objects.create(
+                empresa=self.empresa,
+                tipo_documento=self.tipo_documento,
+                ano=self.ano,
+                loja=loja,
+                terminal=terminal or '',
+                inicio=inicio,
+                fim=contador.ultimo_numero,
+                ultimo_usado=inicio - 1,
+            )
+
+    def proximo_do_bloco(self, loja=None, terminal=''):
+        """Próximo número do bloco ativo da loja/terminal (reserva outro se esgotado)"""
+        with transaction.atomic():
+            bloco = self._blocos(loja, terminal).filter(estado='ativo').select_for_update().order_by('inicio').first()
+            if bloco and bloco.ultimo_usado >= bloco.fim:
+                bloco.estado = 'esgotado'
+                bloco.save(update_fields=['estado'])
+                bloco = None
+            if bloco is None:
+                bloco = self.reservar_bloco(loja, terminal)
+
+            bloco.ultimo_usado += 1
+            campos = ['ultimo_usado']
+            if bloco.ultimo_usado >= bloco.fim:
+                bloco.estado = 'esgotado'
+                campos.append('estado')
+            bloco.save(update_fields=campos)
+            return self._registar_emissao(bloco.ultimo_usado)
+
+    def fechar_blocos(self, loja=None, terminal='', motivo=''):
+        """Fecha os blocos ativos da loja/terminal; os números não usados ficam como lacuna"""
+        return self._blocos(loja, terminal).filter(estado='ativo').update(
+            estado='fechado',
+            motivo_fecho=motivo[:200],
+            fechado_em=timezone.now(),
+        )
+
+    def lacunas(self):
+        """
+        Intervalos (inicio, fim, motivo) nunca emitidos da série: restos de
+        blocos fechados e números revertidos registados pela auditoria.
+        """
+        blocos = BlocoNumeracao.objects.filter(
+            **self._serie(),
+            estado='fechado',
+            ultimo_usado__lt=F('fim'),
+        )
+        intervalos = [(b.ultimo_usado + 1, b.fim, b.motivo_fecho) for b in blocos]
+        intervalos.extend(
+            (numero, numero, motivo)
+            for numero, motivo in LacunaNumeracao.objects.filter(**self._serie()).values_list('numero', 'motivo')
+        )
+        return sorted(intervalos)
+
+    # ------------------------------------------------------------------
+    # Emissão
+    # ------------------------------------------------------------------
+    def proximo_numero(self, loja=None, terminal=''):
+        contador = self.contador()
+        if contador.modo == 'blocos':
+            if loja is not None or terminal:
+                return self.proximo_do_bloco(loja, terminal)
+            return self.proximo_avulso()
+        return self.proximo_sequencial(contador)
+
+    def formatar(self, numero):
+        """
+        Formato: FR PMA12025/001
+
+            FR    -> Tipo do documento
+            PMA   -> 5 primeiras letras da empresa
+            1     -> ID da empresa
+            2025  -> Ano da série
+            /001  -> Número sequencial
+        """
+        prefixo_empresa = ''.join(self.empresa.nome.upper().split())[:5]
+        return f"{self.tipo_documento} {prefixo_empresa}{self.empresa.pk}{self.ano}/{numero:03d}"
+
+
+def gerar_numero_documento(empresa, tipo_documento, loja=None, terminal=''):
+    """
+    Gera e reserva o próximo número sequencial no formato:
+    FR PMA12025/001
+
+    ``loja``/``terminal`` só são usados em séries configuradas em modo blocos.
+    """
+    service = NumeracaoDocumentoService(empresa, tipo_documento)
+    return service.formatar(service.proximo_numero(loja=loja, terminal=terminal))
 
-        # 1️⃣ Três primeiras letras da empresa (sem espaços)
-        prefixo_empresa = ''.join(empresa.nome.upper().split())[:5]
 
-        # 2️⃣ ID da empresa
-        id_empresa = str(empresa.pk)
 
-        # 3️⃣ Sufixo aleatório (3 letras entre A–Z)
-        sufixo_random = ''.join(random.choices(string.ascii_uppercase, k=3))
+class CacheBIService:
+    """
+    Cache dos conjuntos de dados de B.I. (cache ``B_I``) por empresa.
+
+    As chaves levam a empresa, o dataset, as gerações e um hash dos
+    parâmetros: ``bi:<empresa>:<dataset>:g<geral>.<dataset>:<hash>``.
+    Invalidar é incrementar a geração (da empresa ou de um dataset); as
+    entradas antigas deixam de ser alcançáveis e expiram pelo TTL, sem
+    ``clear()`` nem varrimento de chaves, e sem tocar noutras empresas.
+
+    Num miss só um processo recalcula (lock com ``cache.add``); os
+    restantes esperam pelo valor até ``ESPERA_MAXIMA`` segundos e só então
+    calculam por conta própria. Hits, misses, recálculos e tempo de
+    recálculo ficam em contadores por empresa/dataset (``metricas``).
+    """
+
+    ALIAS = "B_I"
+    DATASETS = ('rentabilidade',)
+    # Datasets que dependem das vendas: invalidados a cada venda da empresa
+    DATASETS_VENDAS = ('rentabilidade',)
+    TTL = 60 * 60
+    LOCK_TIMEOUT = 60
+    ESPERA_MAXIMA = 10
+    INTERVALO_ESPERA = 0.05
+    METRICAS = ('hits', 'misses', 'recalculos', 'esperas', 'tempo_recalculo_ms')
+
+    def __init__(self, empresa_id, dataset):
+        if dataset not in self.datasets():
+            raise ValueError(f"Dataset de B.I. desconhecido: {dataset}")
+        self.empresa_id = empresa_id
+        self.dataset = dataset
+        self.cache = caches[self.ALIAS]
+
+    @classmethod
+    def datasets(cls):
+        """Datasets fixos e os conjuntos de KPIs dos dashboards (``kpi_<conjunto>``)"""
+        return cls.DATASETS + tuple(f"kpi_{nome}" for nome in PlaneadorKPIService.conjuntos())
+
+    # ------------------------------
+    # Gerações
+    # ------------------------------
+    @staticmethod
+    def _chave_geracao(empresa_id, dataset=None):
+        return f"bi:{empresa_id}:{dataset or '*'}:geracao"
+
+    def _geracoes(self):
+        chaves = [self._chave_geracao(self.empresa_id), self._chave_geracao(self.empresa_id, self.dataset)]
+        valores = self.cache.get_many(chaves)
+        em_falta = [chave for chave in chaves if chave not in valores]
+        if em_falta:
+            # Uma geração perdida (eviction) recomeça num valor novo, nunca
+            # num já usado: as entradas antigas continuam inalcançáveis.
+            inicial = time.time_ns() // 1000
+            for chave in em_falta:
+                self.cache.add(chave, inicial, timeout=None)
+            valores.update(self.cache.get_many(em_falta))
+        return tuple(valores.get(chave, 0) for chave in chaves)
+
+    @classmethod
+    def invalidar(cls, empresa_id, datasets=None):
+        """
+        Incrementa a geração da empresa (``datasets=None``) ou dos datasets
+        indicados. Executado após o commit, para que um recálculo concorrente
+        nunca grave dados anteriores à alteração na geração nova.
+        """
+        cache = caches[cls.ALIAS]
+        chaves = [cls._chave_geracao(empresa_id, dataset) for dataset in (datasets or [None])]
+
+        def incrementar():
+            for chave in chaves:
+                try:
+                    cache.incr(chave)
+                except ValueError:
+                    # Ainda sem geração: nada em cache para esta chave
+                    pass
+
+        transaction.on_commit(incrementar, robust=True)
+
+    @classmethod
+    def invalidar_vendas(cls, empresa_id):
+        cls.invalidar(empresa_id, cls.DATASETS_VENDAS)
+
+    # ------------------------------
+    # Leitura
+    # ------------------------------
+    def chave(self, parametros=None, geracoes=None):
+        geral, dataset = geracoes or self._geracoes()
+        conteudo = json.dumps(parametros or {}, sort_keys=True, cls=DjangoJSONEncoder)
+        resumo = hashlib.sha1(conteudo.encode()).hexdigest()[:16]
+        return f"bi:{self.empresa_id}:{self.dataset}:g{geral}.{dataset}:{resumo}"
+
+    def obter(self, parametros, calcular, timeout=None):
+        """Valor em cache para ``parametros`` ou o resultado de ``calcular()``"""
+        chave = self.chave(parametros)
+        valor = self.cache.get(chave)
+        if valor is not None:
+            self._contar('hits')
+            return valor
+
+        self._contar('misses')
+        chave_lock = f"{chave}:lock"
+        token = uuid.uuid4().hex
+        if not self.cache.add(chave_lock, token, timeout=self.LOCK_TIMEOUT):
+            valor = self._esperar(chave)
+            if valor is not None:
+                self._contar('esperas')
+                return valor
+            logger.warning("Cache B.I. %s/%s: espera esgotada, a recalcular", self.empresa_id, self.dataset)
+            token = None
+
+        try:
+            inicio = time.monotonic()
+            valor = calcular()
+            self._contar('recalculos')
+            self._contar('tempo_recalculo_ms', int((time.monotonic() - inicio) * 1000))
+            self.cache.set(chave, valor, timeout=timeout or self.TTL)
+        finally:
+            if token and self.cache.get(chave_lock) == token:
+                self.cache.delete(chave_lock)
+        return valor
+
+    def _esperar(self, chave):
+        limite = time.monotonic() + self.ESPERA_MAXIMA
+        while time.monotonic() < limite:
+            time.sleep(self.INTERVALO_ESPERA)
+            valor = self.cache.get(chave)
+            if valor is not None:
+                return valor
+            if self.cache.get(f"{chave}:lock") is None:
+                # O recálculo falhou: o valor não vai chegar
+                return self.cache.get(chave)
+        return None
+
+    # ------------------------------
+    # Métricas
+    # ------------------------------
+    @staticmethod
+    def _chave_metrica(empresa_id, dataset, metrica):
+        return f"bi:{empresa_id}:{dataset}:metricas:{metrica}"
+
+    def _contar(self, metrica, valor=1):
+        chave = self._chave_metrica(self.empresa_id, self.dataset, metrica)
+        try:
+            self.cache.incr(chave, valor)
+        except ValueError:
+            if not self.cache.add(chave, valor, timeout=None):
+                self.cache.incr(chave, valor)
+
+    @classmethod
+    def metricas(cls, empresa_id):
+        """Contadores por dataset, com taxa de acerto e tempo médio de recálculo"""
+        cache = caches[cls.ALIAS]
+        datasets = cls.datasets()
+        chaves = {
+            (dataset, metrica): cls._chave_metrica(empresa_id, dataset, metrica)
+            for dataset in datasets for metrica in cls.METRICAS
+        }
+        valores = cache.get_many(list(chaves.values()))
+        resultado = {}
+        for dataset in datasets:
+            dados = {metrica: valores.get(chaves[dataset, metrica], 0) for metrica in cls.METRICAS}
+            pedidos = dados['hits'] + dados['misses']
+            dados['taxa_acerto'] = round(100 * (pedidos - dados['recalculos']) / pedidos, 2) if pedidos else None
+            dados['tempo_medio_recalculo_ms'] = (
+                round(dados['tempo_recalculo_ms'] / dados['recalculos'], 1) if dados['recalculos'] else None
+            )
+            resultado[dataset] = dados
+        return resultado
+
+    @classmethod
+    def reiniciar_metricas(cls, empresa_id):
+        caches[cls.ALIAS].delete_many([
+            cls._chave_metrica(empresa_id, dataset, metrica)
+            for dataset in cls.datasets() for metrica in cls.METRICAS
+        ])
+
+
+
+class KPI:
+    """
+    Indicador de dashboard: ``funcao(campo)`` sobre ``modelo`` com ``filtro``.
+
+    ``campo_empresa`` é o caminho até à empresa (``None`` para tabelas
+    globais); ``padrao`` substitui o ``None`` dos agregados sem linhas.
+    """
+
+    def __init__(self, nome, modelo, funcao=Count, campo='pk', filtro=None,
+                 campo_empresa='empresa', padrao=0, **extra):
+        self.nome = nome
+        self.modelo = modelo
+        self.funcao = funcao
+        self.campo = campo
+        self.filtro = filtro
+        self.campo_empresa = campo_empresa
+        self.padrao = padrao
+        self.extra = extra
+
+    @property
+    def grupo(self):
+        return (self.modelo, self.campo_empresa)
+
+    def agregado(self):
+        return self.funcao(self.campo, filter=self.filtro, **self.extra)
+
+
+class PlaneadorKPIService:
+    """
+    Executor dos conjuntos de KPIs dos dashboards.
+
+    Os conjuntos são registados nos módulos ``kpis.py`` das apps
+    (``@PlaneadorKPIService.registrar('vendas')``): funções
+    ``(empresa, hoje) -> [KPI, ...]``. Todos os KPIs do mesmo modelo são
+    resolvidos numa única consulta de agregação condicional
+    (``Sum(..., filter=Q(...))``), restringida à união dos filtros; os
+    grupos de modelos diferentes correm em paralelo num pool de threads,
+    cada uma com a sua ligação persistente. O resultado fica em cache por empresa
+    durante ``CACHE_TTL`` segundos (``CacheBIService``, dataset
+    ``kpi_<conjunto>``).
+    """
+
+    CACHE_TTL = 60
+    MAX_THREADS = 4
+
+    _conjuntos = {}
+    _descobertos = False
+    _pool = None
+    _pool_lock = threading.Lock()
+
+    def __init__(self, empresa):
+        self.empresa = empresa
+        self.ultima_execucao = {}
+
+    # ------------------------------
+    # Registo
+    # ------------------------------
+    @classmethod
+    def registrar(cls, nome):
+        def decorador(funcao):
+            cls._conjuntos[nome] = funcao
+            return funcao
+        return decorador
+
+    @classmethod
+    def conjuntos(cls):
+        if not cls._descobertos:
+            cls._descobertos = True
+            autodiscover_modules('kpis')
+        return dict(cls._conjuntos)
+
+    def definicoes(self, conjunto, hoje=None):
+        construtor = self.conjuntos().get(conjunto)
+        if construtor is None:
+            raise ValueError(f"Conjunto de KPIs desconhecido: {conjunto}")
+        return construtor(self.empresa, hoje or timezone.localdate())
+
+    # ------------------------------
+    # Execução
+    # ------------------------------
+    def executar(self, conjunto, hoje=None, usar_cache=True):
+        """Valores ``{nome: valor}`` do conjunto, da cache quando possível"""
+        hoje = hoje or timezone.localdate()
+        if not usar_cache:
+            return self.calcular(self.definicoes(conjunto, hoje))
+        return CacheBIService(self.empresa.pk, f"kpi_{conjunto}").obter(
+            {'hoje': hoje.isoformat()},
+            lambda: self.calcular(self.definicoes(conjunto, hoje)),
+            timeout=self.CACHE_TTL,
+        )
+
+    def calcular(self, kpis, agrupar=True, paralelo=True):
+        """
+        Resolve os KPIs: uma consulta por modelo (``agrupar``) ou uma por KPI,
+        como os dashboards faziam antes (usado no benchmark).
+        """
+        if agrupar:
+            grupos = {}
+            for kpi in kpis:
+                grupos.setdefault(kpi.grupo, []).append(kpi)
+            grupos = list(grupos.values())
+        else:
+            grupos = [[kpi] for kpi in kpis]
+
+        inicio = time.perf_counter()
+        # Dentro de uma transação as outras ligações não veem o que ainda
+        # não foi confirmado: nesse caso tudo corre na ligação corrente. O
+        # SQLite serializa as leituras, pelo que também corre em sequência.
+        if (paralelo and len(grupos) > 1 and not connection.in_atomic_block
+                and connection.vendor != 'sqlite'):
+            resultados = list(self._executor().map(self._consultar_em_thread, grupos))
+        else:
+            resultados = [self._consultar(grupo) for grupo in grupos]
 
-        # 4️⃣ Ano atual
-        ano = str(ano_atual)
+        valores = {}
+        for resultado in resultados:
+            valores.update(resultado)
+        self.ultima_execucao = {
+            'kpis': len(kpis),
+            'consultas': len(grupos),
+            'duracao_ms': round((time.perf_counter() - inicio) * 1000, 2),
+        }
+        return {kpi.nome: valores[kpi.nome] for kpi in kpis}
 
-        # 5️⃣ Sequencial
-        numero_sequencial = f"{contador.ultimo_numero:03d}"
+    def _consultar(self, kpis):
+        modelo, campo_empresa = kpis[0].grupo
+        queryset = modelo._default_manager.all()
+        if campo_empresa:
+            queryset = queryset.filter(**{campo_empresa: self.empresa})
+        filtros = [kpi.filtro for kpi in kpis]
+        if all(filtro is not None for filtro in filtros):
+            queryset = queryset.filter(reduce(or_, filtros))
+        valores = queryset.aggregate(**{kpi.nome: kpi.agregado() for kpi in kpis})
+        return {
+            kpi.nome: kpi.padrao if valores[kpi.nome] is None else valores[kpi.nome]
+            for kpi in kpis
+        }
 
-        # 6️⃣ Montagem final
-        numero_final = f"{tipo_documento} {prefixo_empresa}{id_empresa}{sufixo_random}{ano}/{numero_sequencial}"
+    def _consultar_em_thread(self, kpis):
+        # As threads do pool mantêm a sua ligação aberta entre pedidos (evita
+        # reabrir ligações a cada dashboard), mas não passam pelos signals de
+        # pedido: close_old_connections() aplica aqui o CONN_MAX_AGE e os
+        # health checks. Uma ligação cortada pelo servidor entretanto é
+        # fechada e a consulta repetida uma vez numa ligação nova.
+        close_old_connections()
+        try:
+            try:
+                return self._consultar(kpis)
+            except (InterfaceError, OperationalError):
+                connection.close()
+                return self._consultar(kpis)
+        except DatabaseError:
+            connection.close()
+            raise
 
-        return numero_final
-  
\ No newline at end of file
+    @classmethod
+    def _executor(cls):
+        with cls._pool_lock:
+            if cls._pool is None:
+                cls._pool = ThreadPoolExecutor(max_workers=cls.MAX_THREADS, thread_name_prefix='kpis')
+            return cls._pool
@@ -0,0 +1,27 @@
+# apps/core/tasks.py
+import logging
+
+from celery import shared_task
+
+from .models import ContadorDocumento
+from .services import NumeracaoDocumentoService
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def auditar_lacunas_numeracao_task():
+    """
+    Regista as lacunas (números de emissões revertidas) de todas as séries
+    das empresas ativas e acerta os contadores com as SEQUENCEs.
+    """
+    total = 0
+    for contador in ContadorDocumento.objects.filter(empresa__ativa=True).select_related('empresa'):
+        try:
+            total += NumeracaoDocumentoService(
+                contador.empresa, contador.tipo_documento, ano=contador.ano
+            ).auditar_lacunas()
+        except Exception as e:
+            logger.error(f'Erro ao auditar a série {contador.tipo_documento}/{contador.ano} da empresa {contador.empresa_id}: {e}')
+    logger.info(f'Auditoria de numeração: {total} lacunas novas')
+    return total
@@ -1,3 +1,305 @@
-from django.test import TestCase
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+from django.test import TestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.core.models import Empresa, LacunaNumeracao, Loja
+from apps.core.services import KPI, CacheBIService, NumeracaoDocumentoService, PlaneadorKPIService
+from apps.clientes.models import Cliente
+from apps.financeiro.api.viewsets import LancamentoViewSet
+from apps.financeiro.models import LancamentoFinanceiro, PlanoContas
+from apps.vendas.models import FormaPagamento, Venda
+
+CACHES_TESTE = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'testes-{alias}'}
+    for alias in ('default', CacheBIService.ALIAS)
+}
+
+
+class NumeracaoDocumentoServiceTest(TestCase):
+    """Séries estritas: números consecutivos e recuperação após rollback"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            nome='Farmácia Numeração', nif='5000000010', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email='numeracao@exemplo.ao',
+        )
+
+    def _service(self, tipo_documento='FR'):
+        service = NumeracaoDocumentoService(self.empresa, tipo_documento, 2030)
+        self.addCleanup(NumeracaoDocumentoService._sequencias_criadas.discard, service.nome_sequence)
+        return service
+
+    def test_numeros_consecutivos(self):
+        service = self._service()
+
+        self.assertEqual([service.proximo_numero() for _ in range(5)], [1, 2, 3, 4, 5])
+        self.assertEqual(service.formatar(6), f'FR FARMÁ{self.empresa.pk}2030/006')
+
+    def test_rollback_da_primeira_emissao_nao_deixa_sequence_em_cache(self):
+        service = self._service()
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.assertEqual(service.proximo_numero(), 1)
+            raise RuntimeError('venda cancelada')
+
+        # A SEQUENCE criada dentro da transação revertida desapareceu com ela
+        self.assertNotIn(service.nome_sequence, NumeracaoDocumentoService._sequencias_criadas)
+        self.assertEqual([service.proximo_numero(), service.proximo_numero()], [1, 2])
+
+    @skipUnless(connection.vendor == 'postgresql', 'SEQUENCE por série só em PostgreSQL')
+    def test_sequence_em_cache_mas_inexistente_e_recriada(self):
+        service = self._service()
+        NumeracaoDocumentoService._sequencias_criadas.add(service.nome_sequence)
+
+        self.assertEqual(service.proximo_numero(), 1)
+
+    @skipUnless(connection.vendor == 'postgresql', 'SEQUENCE por série só em PostgreSQL')
+    def test_cache_so_depois_do_commit(self):
+        service = self._service()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            service.proximo_numero()
+            self.assertNotIn(service.nome_sequence, NumeracaoDocumentoService._sequencias_criadas)
+        self.assertIn(service.nome_sequence, NumeracaoDocumentoService._sequencias_criadas)
+
+    @skipUnless(connection.vendor == 'postgresql', 'SEQUENCE por série só em PostgreSQL')
+    def test_numero_revertido_fica_registado_como_lacuna(self):
+        service = self._service('FT')
+        self.assertEqual(service.proximo_numero(), 1)
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.assertEqual(service.proximo_numero(), 2)
+            raise RuntimeError('venda cancelada')
+
+        # nextval não é transacional: o 2 não volta a ser emitido
+        self.assertEqual(service.proximo_numero(), 3)
+        self.assertEqual(service.auditar_lacunas(idade_minima=timedelta(0)), 1)
+        self.assertEqual(
+            list(LacunaNumeracao.objects.filter(empresa=self.empresa).values_list('numero', flat=True)), [2]
+        )
+
+
+class APIPaginacaoCursorTest(TestCase):
+    """Paginação por cursor, campos esparsos e filtro por empresa na API"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa, cls.outra = [
+            Empresa.objects.create(
+                nome=f'Farmácia API {indice}', nif=f'50000001{indice:02d}', endereco='Rua 1', bairro='Centro',
+                cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000',
+                email=f'api{indice}@exemplo.ao',
+            )
+            for indice in (1, 2)
+        ]
+        cls.usuario = get_user_model().objects.create(username='api', empresa=cls.empresa)
+        usuario_outra = get_user_model().objects.create(username='api_outra', empresa=cls.outra)
+
+        cls.lancamentos = [
+            cls._lancamento(cls.empresa, cls.usuario, numero, valor)
+            for numero, valor in enumerate(['30.00', '10.00', '20.00'], start=1)
+        ]
+        cls._lancamento(cls.outra, usuario_outra, 4, '99.00')
+
+    @staticmethod
+    def _lancamento(empresa, usuario, numero, valor):
+        conta, _ = PlanoContas.objects.get_or_create(
+            empresa=empresa, codigo='61', defaults={'nome': 'Vendas', 'tipo_conta': 'receita', 'natureza': 'credito'},
+        )
+        return LancamentoFinanceiro.objects.create(
+            numero_lancamento=f'202601-{numero:04d}', data_lancamento=date(2026, 1, numero), descricao=f'Lançamento {numero}',
+            tipo='credito', valor=Decimal(valor), plano_contas=conta, usuario_responsavel=usuario, empresa=empresa,
+        )
+
+    def _listar(self, **parametros):
+        request = APIRequestFactory().get('/api/lancamentos/', parametros)
+        force_authenticate(request, user=self.usuario)
+        resposta = LancamentoViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.data
+
+    def test_cursor_percorre_so_os_lancamentos_da_empresa(self):
+        pagina = self._listar(page_size=2)
+        self.assertNotIn('count', pagina)
+        ids = [linha['id'] for linha in pagina['results']]
+
+        cursor = parse_qs(urlparse(pagina['next']).query)['cursor'][0]
+        pagina = self._listar(page_size=2, cursor=cursor)
+        ids += [linha['id'] for linha in pagina['results']]
+
+        self.assertIsNone(pagina['next'])
+        self.assertEqual(ids, sorted((lancamento.pk for lancamento in self.lancamentos), reverse=True))
+
+    def test_fields_limita_os_campos(self):
+        pagina = self._listar(fields='id,valor')
+
+        self.assertEqual([set(linha) for linha in pagina['results']], [{'id', 'valor'}] * 3)
+
+    def test_ordering_fora_do_cursor_usa_paginacao_por_pagina(self):
+        pagina = self._listar(ordering='valor')
+
+        self.assertEqual(pagina['count'], 3)
+        self.assertEqual([linha['valor'] for linha in pagina['results']], ['10.00', '20.00', '30.00'])
+
+
+@override_settings(CACHES=CACHES_TESTE)
+class CacheBIServiceTest(TestCase):
+    """Cache de B.I. por empresa: gerações, invalidação após o commit e lock no miss"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa, cls.outra = [
+            Empresa.objects.create(
+                nome=f'Farmácia B.I. {indice}', nif=f'500000001{indice}', endereco='Rua 1', bairro='Centro',
+                cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000',
+                email=f'bi{indice}@exemplo.ao',
+            )
+            for indice in (1, 2)
+        ]
+
+    def setUp(self):
+        caches[CacheBIService.ALIAS].clear()
+        self.calculos = 0
+
+    def _calcular(self):
+        self.calculos += 1
+        return {'calculo': self.calculos}
+
+    def _obter(self, empresa, parametros=None):
+        return CacheBIService(empresa.pk, 'rentabilidade').obter(parametros or {'ano': 2026}, self._calcular)
+
+    def test_hit_depois_do_primeiro_calculo(self):
+        self.assertEqual([self._obter(self.empresa) for _ in range(3)], [{'calculo': 1}] * 3)
+        self.assertEqual(self._obter(self.empresa, {'ano': 2025}), {'calculo': 2})
+
+        metricas = CacheBIService.metricas(self.empresa.pk)['rentabilidade']
+        self.assertEqual((metricas['hits'], metricas['misses'], metricas['recalculos']), (2, 2, 2))
+        self.assertEqual(metricas['taxa_acerto'], 50.0)
+
+    def test_invalidar_so_a_empresa_e_apos_o_commit(self):
+        self._obter(self.empresa)
+        self._obter(self.outra)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CacheBIService.invalidar(self.empresa.pk)
+            self.assertEqual(self._obter(self.empresa), {'calculo': 1})
+
+        self.assertEqual(self._obter(self.empresa), {'calculo': 3})
+        self.assertEqual(self._obter(self.outra), {'calculo': 2})
+
+    def test_venda_invalida_datasets_de_vendas(self):
+        loja = Loja.objects.create(
+            empresa=self.empresa, nome='Loja', codigo='L1', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', postal='0000', provincia='Luanda',
+        )
+        forma_pagamento = FormaPagamento.objects.create(empresa=self.empresa, nome='Dinheiro')
+        self._obter(self.empresa)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Venda.objects.create(
+                empresa=self.empresa, loja=loja, forma_pagamento=forma_pagamento,
+                numero_documento='FR BI/1', subtotal=Decimal('10'), total=Decimal('10'),
+            )
+
+        self.assertEqual(self._obter(self.empresa), {'calculo': 2})
+
+    def test_miss_com_lock_espera_pelo_valor(self):
+        service = CacheBIService(self.empresa.pk, 'rentabilidade')
+        chave = service.chave({'ano': 2026})
+        service.cache.add(f'{chave}:lock', 'outro processo')
+        entrega = threading.Timer(0.1, service.cache.set, (chave, {'calculo': 'outro processo'}))
+        entrega.start()
+        self.addCleanup(entrega.join)
+
+        calcular = mock.Mock()
+        self.assertEqual(service.obter({'ano': 2026}, calcular), {'calculo': 'outro processo'})
+        calcular.assert_not_called()
+        self.assertEqual(CacheBIService.metricas(self.empresa.pk)['rentabilidade']['esperas'], 1)
+
+    def test_dataset_desconhecido(self):
+        with self.assertRaises(ValueError):
+            CacheBIService(self.empresa.pk, 'inexistente')
+
+
+@override_settings(CACHES=CACHES_TESTE)
+class PlaneadorKPIServiceTest(TestCase):
+    """KPIs do mesmo modelo numa só consulta, filtrados pela empresa e em cache"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa, outra = [
+            Empresa.objects.create(
+                nome=f'Farmácia KPI {indice}', nif=f'500000001{indice}', endereco='Rua 1', bairro='Centro',
+                cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000',
+                email=f'kpi{indice}@exemplo.ao',
+            )
+            for indice in (3, 4)
+        ]
+        for empresa, totais in ((cls.empresa, ['10', '20', '30']), (outra, ['99'])):
+            loja = Loja.objects.create(
+                empresa=empresa, nome='Loja', codigo='L1', endereco='Rua 1', bairro='Centro',
+                cidade='Luanda', postal='0000', provincia='Luanda',
+            )
+            forma_pagamento = FormaPagamento.objects.create(empresa=empresa, nome='Dinheiro')
+            for numero, total in enumerate(totais, start=1):
+                Venda.objects.create(
+                    empresa=empresa, loja=loja, forma_pagamento=forma_pagamento,
+                    numero_documento=f'FR KPI{empresa.nif}/{numero}', subtotal=Decimal(total), total=Decimal(total),
+                )
+            Cliente.objects.create(empresa=empresa, nome_completo=f'Cliente {empresa.nif}')
+        Venda.objects.filter(empresa=cls.empresa, total=Decimal('30')).update(status='cancelada')
+
+    def setUp(self):
+        caches[CacheBIService.ALIAS].clear()
+        self.planeador = PlaneadorKPIService(self.empresa)
+
+    def _kpis(self):
+        finalizadas = Q(status='finalizada')
+        return [
+            KPI('vendas_total', Venda, Sum, 'total', finalizadas),
+            KPI('vendas_quantidade', Venda, filtro=finalizadas),
+            KPI('vendas_canceladas', Venda, filtro=Q(status='cancelada')),
+            KPI('vendas_devolvidas_total', Venda, Sum, 'total', Q(status='devolvida'), padrao=Decimal('0')),
+            KPI('clientes', Cliente),
+        ]
+
+    def test_uma_consulta_por_modelo(self):
+        with self.assertNumQueries(2):
+            valores = self.planeador.calcular(self._kpis())
+
+        self.assertEqual(valores, {
+            'vendas_total': Decimal('30'), 'vendas_quantidade': 2, 'vendas_canceladas': 1,
+            'vendas_devolvidas_total': Decimal('0'), 'clientes': 1,
+        })
+        self.assertEqual((self.planeador.ultima_execucao['kpis'], self.planeador.ultima_execucao['consultas']), (5, 2))
+
+    def test_agrupado_igual_a_uma_consulta_por_kpi(self):
+        agrupado = self.planeador.calcular(self._kpis())
+
+        with self.assertNumQueries(5):
+            separado = self.planeador.calcular(self._kpis(), agrupar=False)
+        self.assertEqual(agrupado, separado)
+
+    def test_conjunto_registado_fica_em_cache(self):
+        self.assertIn('vendas', PlaneadorKPIService.conjuntos())
+        valores = self.planeador.executar('vendas')
+
+        self.assertEqual(valores['vendas_hoje_quantidade'], 2)
+        self.assertEqual(valores['vendas_hoje_total'], Decimal('30'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.planeador.executar('vendas'), valores)
+        self.assertEqual(self.planeador.executar('vendas', usar_cache=False), valores)
+
+    def test_conjunto_desconhecido(self):
+        with self.assertRaises(ValueError):
+            self.planeador.definicoes('inexistente')
@@ -0,0 +1,24 @@
+# apps/estoque/kpis.py
+from datetime import timedelta
+
+from django.db.models import Count, F, Q
+
+from apps.core.services import KPI, PlaneadorKPIService
+from apps.estoque.models import AlertaEstoque
+from apps.produtos.models import Lote, Produto
+
+
+@PlaneadorKPIService.registrar('estoque')
+def kpis_estoque(empresa, hoje):
+    """Produtos ativos, estoque baixo, lotes com saldo a vencer em 30 dias e alertas"""
+    return [
+        KPI('total_produtos_ativos', Produto, Count, 'id', Q(ativo=True)),
+        KPI('produtos_estoque_baixo', Produto, Count, 'id',
+            Q(ativo=True, estoque_atual__lte=F('estoque_minimo'))),
+        KPI('lotes_a_vencer', Lote, Count, 'id', Q(
+            quantidade_atual__gt=0,
+            data_validade__gt=hoje,
+            data_validade__lte=hoje + timedelta(days=30),
+        )),
+        KPI('alertas_ativos', AlertaEstoque, Count, 'id', Q(ativo=True)),
+    ]
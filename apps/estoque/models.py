@@ -462,75 +462,93 @@ class AlertaEstoque(TimeStampedModel):
     
     @classmethod
     def gerar_alertas_automaticos(cls, empresa):
-        """Gera alertas automáticos para a empresa"""
+        """
+        Gera alertas automáticos para a empresa (estoque baixo/zerado e
+        vencimento), com uma consulta por tipo e um INSERT para os novos.
+        Os alertas de vencimento partem da previsão noturna de risco de
+        validade (RiscoValidadeLote): só lotes com quantidade que ficará
+        por vender, por ordem de valor em risco.
+        """
         from datetime import timedelta
-        
-        # Alertas de estoque baixo
+        from django.db.models import F
+        from apps.produtos.models import RiscoValidadeLote
+
+        # Stock gerido por empresa: os alertas ficam na loja matriz
+        loja = Loja.objects.filter(empresa=empresa).order_by('-eh_matriz', 'id').first()
+        if loja is None:
+            return 0
+
+        ativos = set(
+            cls.objects.filter(empresa=empresa, ativo=True)
+            .values_list('tipo_alerta', 'produto_id', 'lote_id')
+        )
+        novos = []
+
+        # Alertas de estoque baixo / zerado
         produtos_estoque_baixo = Produto.objects.filter(
             empresa=empresa,
-            ativo=True
-        )
+            ativo=True,
+            estoque_atual__lte=F('estoque_minimo'),
+        ).only('id', 'nome_produto', 'estoque_atual', 'estoque_minimo', 'estoque_maximo')
         
         for produto in produtos_estoque_baixo:
-            estoque_atual = MovimentacaoEstoque.calcular_estoque_atual(produto, loja=produto.loja_padrao)
-            
-            if estoque_atual <= 0:
-                # Alerta de estoque zerado
-                cls.objects.get_or_create(
-                    tipo_alerta='estoque_zerado',
-                    produto=produto,
-                    empresa=empresa,
-                    ativo=True,
-                    defaults={
-                        'prioridade': 'critica',
-                        'titulo': f'Estoque zerado: {produto.nome_produto}',
-                        'descricao': f'O produto {produto.nome_produto} está com estoque zerado.',
-                        'quantidade_atual': estoque_atual,
-                        'quantidade_recomendada': produto.ponto_reposicao
-                    }
-                )
-            elif estoque_atual <= produto.estoque_minimo:
-                # Alerta de estoque baixo
-                cls.objects.get_or_create(
-                    tipo_alerta='estoque_baixo',
-                    produto=produto,
-                    empresa=empresa,
-                    ativo=True,
-                    defaults={
-                        'prioridade': 'alta',
-                        'titulo': f'Estoque baixo: {produto.nome_produto}',
-                        'descricao': f'O produto {produto.nome_produto} está com estoque baixo ({estoque_atual} unidades).',
-                        'quantidade_atual': estoque_atual,
-                        'quantidade_recomendada': produto.ponto_reposicao
-                    }
-                )
+            estoque_atual = int(produto.estoque_atual)
+            zerado = estoque_atual <= 0
+            tipo = 'estoque_zerado' if zerado else 'estoque_baixo'
+            if (tipo, produto.pk, None) in ativos:
+                continue
+            novos.append(cls(
+                tipo_alerta=tipo,
+                prioridade='critica' if zerado else 'alta',
+                produto=produto,
+                loja=loja,
+                empresa=empresa,
+                titulo=f'Estoque zerado: {produto.nome_produto}' if zerado else f'Estoque baixo: {produto.nome_produto}',
+                descricao=(
+                    f'O produto {produto.nome_produto} está com estoque zerado.' if zerado else
+                    f'O produto {produto.nome_produto} está com estoque baixo ({estoque_atual} unidades).'
+                ),
+                quantidade_atual=estoque_atual,
+                quantidade_recomendada=max(int(produto.estoque_maximo - produto.estoque_atual), 0),
+            ))
         
-        # Alertas de vencimento
+        # Alertas de vencimento (lotes em risco a 30 dias ou já vencidos)
         data_limite = date.today() + timedelta(days=30)
-        lotes_vencendo = Lote.objects.filter(
-            produto__empresa=empresa,
-            data_validade__lte=data_limite,#era __lte=data_limite
-            data_vencimento__gt=date.today(),
-            quantidade_atual__gt=0,
-            ativo=True
-        )
+        riscos = RiscoValidadeLote.objects.filter(
+            empresa=empresa,
+            data_validade__lte=data_limite,
+        ).select_related('lote', 'produto').order_by('-valor_em_risco')
         
-        for lote in lotes_vencendo:
-            dias_restantes = (lote.data_vencimento - date.today()).days
-            
-            cls.objects.get_or_create(
-                tipo_alerta='vencimento_proximo',
-                produto=lote.produto,
-                lote=lote,
+        for risco in riscos:
+            vencido = risco.dias_restantes < 0
+            tipo = 'produto_vencido' if vencido else 'vencimento_proximo'
+            if (tipo, risco.produto_id, risco.lote_id) in ativos:
+                continue
+            if vencido:
+                prioridade = 'critica'
+                descricao = f'Lote {risco.lote.numero_lote} venceu em {risco.data_validade}.'
+            else:
+                prioridade = 'alta' if risco.dias_restantes <= 7 or risco.nivel == 'alto' else 'media'
+                descricao = (
+                    f'Lote {risco.lote.numero_lote} vence em {risco.dias_restantes} dias ({risco.data_validade}). '
+                    f'Previsão: {risco.quantidade_em_risco} unidades por vender ({risco.valor_em_risco} em risco).'
+                )
+            novos.append(cls(
+                tipo_alerta=tipo,
+                prioridade=prioridade,
+                produto=risco.produto,
+                lote=risco.lote,
+                loja=loja,
                 empresa=empresa,
-                ativo=True,
-                defaults={
-                    'prioridade': 'alta' if dias_restantes <= 7 else 'media',
-                    'titulo': f'Vencimento próximo: {lote.produto.nome_produto}',
-                    'descricao': f'Lote {lote.numero_lote} vence em {dias_restantes} dias ({lote.data_vencimento}).',
-                    'quantidade_atual': lote.quantidade_atual
-                }
-            )
+                titulo=f'{"Produto vencido" if vencido else "Vencimento próximo"}: {risco.produto.nome_produto}',
+                descricao=descricao,
+                quantidade_atual=risco.quantidade_atual,
+                quantidade_recomendada=risco.quantidade_prevista_venda,
+            ))
+
+        cls.objects.bulk_create(novos)
+        return len(novos)
+
 
 class LocalizacaoEstoque(models.Model):
     nome = models.CharField(max_length=100, unique=True, help_text="Nome do local ou setor do estoque")
@@ -7,6 +7,7 @@ from django.http import JsonResponse
 from django.contrib.auth.mixins import LoginRequiredMixin
 from datetime import timedelta
 from django.db.models import F
+from apps.core.services import PlaneadorKPIService
 from apps.core.views import BaseMPAView
 from apps.estoque.api.serializers import MovimentacaoEstoqueSerializer
 from apps.produtos.forms import ProdutoForm
@@ -103,6 +104,13 @@ class EstoqueDashboardView(LoginRequiredMixin, TemplateView):
             empresa=empresa,
             ativo=True
         ).order_by('-created_at')
+
+        # Cartões do topo numa consulta por tabela (apps/estoque/kpis.py)
+        kpis = PlaneadorKPIService(empresa).executar('estoque')
+        context['total_produtos_ativos'] = kpis['total_produtos_ativos']
+        context['produtos_estoque_baixo'] = kpis['produtos_estoque_baixo']
+        context['lotes_a_vencer'] = kpis['lotes_a_vencer']
+        context['total_alertas_ativos'] = kpis['alertas_ativos']
         
         context['title'] = "Dashboard de Estoque" # Adicionado título para consistência
         return context
@@ -17,7 +17,7 @@ from .models import (
     PlanoContas, CentroCusto, ContaBancaria, MovimentacaoFinanceira,
     ContaPai, ContaPagar, ContaReceber, FluxoCaixa, ConciliacaoBancaria,
     OrcamentoFinanceiro, CategoriaFinanceira, LancamentoFinanceiro,
-    MovimentoCaixa, ImpostoTributo, ConfiguracaoImposto
+    MovimentoCaixa, ImpostoTributo, ConfiguracaoImposto, FechoMensalContabil, SaldoMensalConta
 )
 
 # ============================================================================
@@ -1632,4 +1632,29 @@ class LancamentoFinanceiroAdmin(admin.ModelAdmin):
     list_display = ['numero_lancamento', 'data_lancamento', 'tipo', 'valor', 'plano_contas', 'descricao']
     list_filter = ['tipo', 'data_lancamento']
     search_fields = ['numero_lancamento', 'descricao']
-    
+
+
+class SaldoMensalContaInline(admin.TabularInline):
+    model = SaldoMensalConta
+    extra = 0
+    can_delete = False
+    fields = ['plano_contas', 'debito_mes', 'credito_mes', 'debito_acumulado', 'credito_acumulado']
+    readonly_fields = fields
+
+
+@admin.register(FechoMensalContabil)
+class FechoMensalContabilAdmin(admin.ModelAdmin):
+    list_display = ['empresa', 'mes_referencia', 'fechado_por', 'created_at']
+    list_filter = ['empresa', 'mes_referencia']
+    inlines = [SaldoMensalContaInline]
+    actions = ['recalcular_fecho']
+
+    @admin.action(description='Recalcular saldos dos meses selecionados')
+    def recalcular_fecho(self, request, queryset):
+        from .services import SaldoContabilService
+
+        for fecho in queryset.order_by('mes_referencia'):
+            SaldoContabilService(fecho.empresa).fechar_mes(
+                fecho.mes_referencia.year, fecho.mes_referencia.month, usuario=request.user
+            )
+        messages.success(request, f'{queryset.count()} fecho(s) recalculado(s).')
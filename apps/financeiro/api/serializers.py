@@ -19,6 +19,7 @@ class ContaReceberSerializer(serializers.ModelSerializer):
     class Meta:
         model = ContaReceber
         fields = '__all__'
+        relacionados = {'cliente_nome': 'cliente'}
 
 class ContaPagarSerializer(serializers.ModelSerializer):
     fornecedor_nome = serializers.CharField(source='fornecedor.nome', read_only=True)
@@ -27,10 +28,13 @@ class ContaPagarSerializer(serializers.ModelSerializer):
     class Meta:
         model = ContaPagar
         fields = '__all__'
+        relacionados = {'fornecedor_nome': 'fornecedor'}
 
 class LancamentoFinanceiroSerializer(serializers.ModelSerializer):
+    data = serializers.DateField(source='data_lancamento')
+    criado_por = serializers.PrimaryKeyRelatedField(source='usuario_responsavel', read_only=True)
     criado_por_nome = serializers.CharField(
-        source='criado_por.nome', 
+        source='usuario_responsavel.get_full_name', 
         read_only=True
     )
     tipo_display = serializers.CharField(
@@ -46,6 +50,7 @@ class LancamentoFinanceiroSerializer(serializers.ModelSerializer):
             'tipo_display', 'data', 'criado_por', 'criado_por_nome'
         ]
         read_only_fields = ['criado_por']
+        relacionados = {'criado_por_nome': 'usuario_responsavel'}
     
     def get_valor_formatado(self, obj):
         """Retorna valor formatado como moeda"""
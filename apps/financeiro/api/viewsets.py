@@ -3,6 +3,7 @@ from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from apps.core.mixins import APIOtimizadaMixin
 from django.db.models import Sum, Count, Q, Avg
 from django.utils import timezone
 from datetime import date, timedelta
@@ -10,7 +11,7 @@ from decimal import Decimal
 from ..models import ContaPagar, ContaReceber, LancamentoFinanceiro, CategoriaFinanceira
 from .serializers import ContaPagarSerializer, ContaReceberSerializer, LancamentoFinanceiroSerializer, CategoriaFinanceiraSerializer
 
-class LancamentoViewSet(viewsets.ModelViewSet):
+class LancamentoViewSet(APIOtimizadaMixin, viewsets.ModelViewSet):
     """ViewSet para Lançamentos Financeiros"""
     
     queryset = LancamentoFinanceiro.objects.all()
@@ -19,27 +20,18 @@ class LancamentoViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     
     # Filtros
-    filterset_fields = ['tipo', 'criado_por']
+    filterset_fields = ['tipo', 'usuario_responsavel']
     search_fields = ['descricao']
-    ordering_fields = ['data', 'valor', 'created_at']
-    ordering = ['-data', '-created_at']
+    ordering_fields = ['data_lancamento', 'valor', 'created_at']
+    ordering = ['-data_lancamento', '-created_at']
     
     def get_queryset(self):
         """Filtrar por empresa do usuário"""
-        queryset = super().get_queryset()
-        
-        # Se usuário tem empresa, filtrar por ela
-        if hasattr(self.request.user, 'empresa'):
-            # Como LancamentoFinanceiro não tem campo empresa diretamente,
-            # vamos filtrar por usuário da mesma empresa
-            usuarios_empresa = self.request.user.empresa.funcionarios.values_list('usuario_id', flat=True)
-            queryset = queryset.filter(criado_por__in=usuarios_empresa)
-        
-        return queryset.select_related('criado_por')
+        return super().get_queryset().filter(empresa=self.request.user.empresa)
     
     def perform_create(self, serializer):
         """Definir usuário criador ao criar lançamento"""
-        serializer.save(criado_por=self.request.user)
+        serializer.save(usuario_responsavel=self.request.user, empresa=self.request.user.empresa)
     
     @action(detail=False, methods=['get'])
     def resumo_periodo(self, request):
@@ -627,14 +619,17 @@ class CategoriaFinanceiraViewSet(viewsets.ModelViewSet):
             )
 
 
-class ContaReceberViewSet(viewsets.ModelViewSet):
+class ContaReceberViewSet(APIOtimizadaMixin, viewsets.ModelViewSet):
     queryset = ContaReceber.objects.all()
     serializer_class = ContaReceberSerializer
 
+    def get_queryset(self):
+        return ContaReceber.objects.filter(empresa=self.request.user.empresa)
 
 
 
-class ContaPagarViewSet(viewsets.ModelViewSet):
+
+class ContaPagarViewSet(APIOtimizadaMixin, viewsets.ModelViewSet):
     """
     API endpoint para gerenciar Contas a Pagar.
     Permite listar, criar, atualizar e deletar registros.
@@ -642,4 +637,7 @@ class ContaPagarViewSet(viewsets.ModelViewSet):
     queryset = ContaPagar.objects.all()
     serializer_class = ContaPagarSerializer
 
+    def get_queryset(self):
+        return ContaPagar.objects.filter(empresa=self.request.user.empresa)
+
 
@@ -0,0 +1,79 @@
+# apps/financeiro/kpis.py
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+
+from apps.core.services import KPI, PlaneadorKPIService
+from apps.financeiro.models import (
+    ContaBancaria, ContaPagar, ContaReceber, ImpostoTributo, LancamentoFinanceiro,
+    MovimentacaoFinanceira, MovimentoCaixa,
+)
+from apps.vendas.models import Venda
+
+ZERO = Decimal('0.00')
+DIAS_FLUXO = 30
+MESES_EVOLUCAO = 12
+
+
+def meses_evolucao(hoje):
+    """Primeiro dia dos últimos ``MESES_EVOLUCAO`` meses, do mais recente para o mais antigo"""
+    meses = [hoje.replace(day=1)]
+    while len(meses) < MESES_EVOLUCAO:
+        meses.append((meses[-1] - timedelta(days=1)).replace(day=1))
+    return meses
+
+
+def _kpis_contas(prefixo, modelo, hoje):
+    em_aberto = Q(status__in=['aberta', 'vencida'])
+    kpis = [
+        KPI(f'total_{prefixo}', modelo, Sum, 'valor_saldo', em_aberto, padrao=ZERO),
+        KPI(f'contas_{prefixo}_vencidas', modelo, Count, 'id', em_aberto & Q(data_vencimento__lt=hoje)),
+        KPI(f'contas_{prefixo}_vencendo', modelo, Count, 'id', Q(
+            status='aberta', data_vencimento__gte=hoje, data_vencimento__lte=hoje + timedelta(days=7),
+        )),
+        KPI(f'{prefixo}_em_dia_valor', modelo, Sum, 'valor_saldo',
+            Q(status='aberta', data_vencimento__gte=hoje), padrao=ZERO),
+        KPI(f'{prefixo}_vencidas_valor', modelo, Sum, 'valor_saldo', Q(status='vencida'), padrao=ZERO),
+    ]
+    # Fluxo de caixa previsto: um KPI por dia na mesma consulta
+    kpis += [
+        KPI(f'fluxo_{prefixo}_{dia}', modelo, Sum, 'valor_saldo',
+            Q(status='aberta', data_vencimento=hoje + timedelta(days=dia)), padrao=ZERO)
+        for dia in range(DIAS_FLUXO)
+    ]
+    return kpis
+
+
+@PlaneadorKPIService.registrar('financeiro')
+def kpis_financeiro(empresa, hoje):
+    """Resumo, vencimentos, fluxo previsto e evolução de saldos do dashboard financeiro"""
+    inicio_mes = hoje.replace(day=1)
+    kpis = _kpis_contas('receber', ContaReceber, hoje) + _kpis_contas('pagar', ContaPagar, hoje)
+    kpis += [
+        KPI('saldo_caixa', MovimentoCaixa, Sum, 'valor', Q(confirmado=True), padrao=ZERO),
+        KPI('saldo_bancos', ContaBancaria, Sum, 'saldo_atual', Q(ativa=True), padrao=ZERO),
+        KPI('receitas_mes', LancamentoFinanceiro, Sum, 'valor', Q(
+            plano_contas__tipo_conta='receita', data_lancamento__gte=inicio_mes, data_lancamento__lte=hoje,
+        ), padrao=ZERO),
+        KPI('despesas_mes', LancamentoFinanceiro, Sum, 'valor', Q(
+            plano_contas__tipo_conta='despesa', data_lancamento__gte=inicio_mes, data_lancamento__lte=hoje,
+        ), padrao=ZERO),
+        KPI('impostos_pendentes', ImpostoTributo, Count, 'id',
+            Q(situacao__in=['pendente', 'calculado', 'vencido'])),
+        KPI('impostos_valor_devido', ImpostoTributo, Sum, 'valor_devido',
+            Q(situacao__in=['calculado', 'vencido']), padrao=ZERO),
+        KPI('total_vendas_mes', Venda, Sum, 'total', Q(
+            status='finalizada', data_venda__date__gte=inicio_mes, data_venda__date__lte=hoje,
+        ), padrao=ZERO),
+    ]
+    # Evolução dos saldos: entradas e saídas confirmadas até ao fim de cada mês
+    for indice, mes in enumerate(meses_evolucao(hoje)):
+        ate_fim_mes = Q(confirmada=True, data_movimentacao__lte=mes.replace(day=28))
+        kpis += [
+            KPI(f'evolucao_entradas_{indice}', MovimentacaoFinanceira, Sum, 'valor',
+                ate_fim_mes & Q(tipo_movimentacao='entrada'), padrao=ZERO),
+            KPI(f'evolucao_saidas_{indice}', MovimentacaoFinanceira, Sum, 'valor',
+                ate_fim_mes & Q(tipo_movimentacao='saida'), padrao=ZERO),
+        ]
+    return kpis
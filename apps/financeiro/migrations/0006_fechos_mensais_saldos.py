@@ -0,0 +1,55 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:34
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_numeracao_blocos'),
+        ('financeiro', '0005_remove_fluxocaixa_created_at_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FechoMensalContabil',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('mes_referencia', models.DateField(help_text='Primeiro dia do mês fechado')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fechos_contabeis', to='core.empresa')),
+                ('fechado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Fecho Mensal Contábil',
+                'verbose_name_plural': 'Fechos Mensais Contábeis',
+                'ordering': ['empresa', '-mes_referencia'],
+                'unique_together': {('empresa', 'mes_referencia')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SaldoMensalConta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes_referencia', models.DateField()),
+                ('debito_mes', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('credito_mes', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('debito_acumulado', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('credito_acumulado', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_mensais_contas', to='core.empresa')),
+                ('fecho', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos', to='financeiro.fechomensalcontabil')),
+                ('plano_contas', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_mensais', to='financeiro.planocontas')),
+            ],
+            options={
+                'verbose_name': 'Saldo Mensal de Conta',
+                'verbose_name_plural': 'Saldos Mensais de Contas',
+                'indexes': [models.Index(fields=['empresa', 'mes_referencia', 'plano_contas'], name='financeiro__empresa_e6ea43_idx')],
+                'unique_together': {('fecho', 'plano_contas')},
+            },
+        ),
+    ]
@@ -1036,6 +1036,58 @@ class LancamentoFinanceiro(TimeStampedModel): # Use TimeStampedModel para tracki
         return f"{self.numero_lancamento} | {self.data_lancamento} | {self.tipo.upper()} {self.valor}"
 
 
+class FechoMensalContabil(TimeStampedModel):
+    """Mês contabilístico fechado: a partir daqui os saldos ficam em SaldoMensalConta"""
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='fechos_contabeis')
+    mes_referencia = models.DateField(help_text="Primeiro dia do mês fechado")
+    fechado_por = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Fecho Mensal Contábil"
+        verbose_name_plural = "Fechos Mensais Contábeis"
+        unique_together = [['empresa', 'mes_referencia']]
+        ordering = ['empresa', '-mes_referencia']
+
+    def __str__(self):
+        return f"{self.empresa} - {self.mes_referencia:%m/%Y}"
+
+    @property
+    def ultimo_dia(self):
+        return (self.mes_referencia + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+
+class SaldoMensalConta(models.Model):
+    """
+    Débitos/créditos de uma conta num mês fechado: movimento do mês e
+    acumulado desde o início (saldo de fecho). Lançamentos com data num mês
+    já fechado atualizam estas linhas de forma incremental.
+    """
+    fecho = models.ForeignKey(FechoMensalContabil, on_delete=models.CASCADE, related_name='saldos')
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='saldos_mensais_contas')
+    plano_contas = models.ForeignKey(PlanoContas, on_delete=models.CASCADE, related_name='saldos_mensais')
+    mes_referencia = models.DateField()
+    debito_mes = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+    credito_mes = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+    debito_acumulado = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+    credito_acumulado = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        verbose_name = "Saldo Mensal de Conta"
+        verbose_name_plural = "Saldos Mensais de Contas"
+        unique_together = [['fecho', 'plano_contas']]
+        indexes = [
+            models.Index(fields=['empresa', 'mes_referencia', 'plano_contas']),
+        ]
+
+    def __str__(self):
+        return f"{self.plano_contas.codigo} {self.mes_referencia:%m/%Y}: D {self.debito_acumulado} C {self.credito_acumulado}"
+
+    @property
+    def saldo(self):
+        """Saldo de fecho (positivo = devedor, negativo = credor)"""
+        return self.debito_acumulado - self.credito_acumulado
+
+
 class MovimentoCaixa(TimeStampedModel):
     """Movimentações do caixa físico"""
     TIPO_MOVIMENTO_CHOICES = [
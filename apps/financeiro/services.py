@@ -0,0 +1,208 @@
+# apps/financeiro/services.py
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+
+from apps.financeiro.models import (
+    FechoMensalContabil, LancamentoFinanceiro, PlanoContas, SaldoMensalConta
+)
+
+
+ZERO = Decimal('0.00')
+
+
+def _ultimo_dia_mes(data):
+    return (data.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+
+class SaldoContabilService:
+    """
+    Saldos do razão geral a partir dos fechos mensais.
+
+    O saldo de qualquer conta numa data é o acumulado do fecho mensal mais
+    próximo (SaldoMensalConta) mais uma consulta agrupada aos lançamentos
+    posteriores a esse fecho, em vez de somar todo o histórico.
+    """
+
+    def __init__(self, empresa):
+        self.empresa = empresa
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+    def _movimentos(self, data_inicio=None, data_fim=None, contas=None):
+        """Débitos e créditos por conta entre as datas (inclusive)"""
+        lancamentos = LancamentoFinanceiro.objects.filter(empresa=self.empresa)
+        if data_inicio:
+            lancamentos = lancamentos.filter(data_lancamento__gte=data_inicio)
+        if data_fim:
+            lancamentos = lancamentos.filter(data_lancamento__lte=data_fim)
+        if contas is not None:
+            lancamentos = lancamentos.filter(plano_contas__in=contas)
+
+        linhas = lancamentos.values('plano_contas_id').annotate(
+            debito=Sum('valor', filter=Q(tipo='debito')),
+            credito=Sum('valor', filter=Q(tipo='credito')),
+        ).order_by()
+        return {
+            linha['plano_contas_id']: (linha['debito'] or ZERO, linha['credito'] or ZERO)
+            for linha in linhas
+        }
+
+    def fecho_anterior(self, data_corte):
+        """Último mês fechado que termina antes de ``data_corte``"""
+        return FechoMensalContabil.objects.filter(
+            empresa=self.empresa,
+            mes_referencia__lt=data_corte.replace(day=1),
+        ).order_by('-mes_referencia').first()
+
+    def saldos_ate(self, data_corte, contas=None):
+        """
+        Débito e crédito acumulados de cada conta antes de ``data_corte``
+        (exclusive): {plano_contas_id: (debito, credito)}.
+        """
+        saldos = defaultdict(lambda: [ZERO, ZERO])
+        inicio_delta = None
+
+        fecho = self.fecho_anterior(data_corte)
+        if fecho:
+            linhas = SaldoMensalConta.objects.filter(fecho=fecho)
+            if contas is not None:
+                linhas = linhas.filter(plano_contas__in=contas)
+            for conta_id, debito, credito in linhas.values_list(
+                'plano_contas_id', 'debito_acumulado', 'credito_acumulado'
+            ):
+                saldos[conta_id] = [debito, credito]
+            inicio_delta = fecho.ultimo_dia + timedelta(days=1)
+
+        if inicio_delta is None or inicio_delta < data_corte:
+            delta = self._movimentos(inicio_delta, data_corte - timedelta(days=1), contas)
+            for conta_id, (debito, credito) in delta.items():
+                saldos[conta_id][0] += debito
+                saldos[conta_id][1] += credito
+
+        return {conta_id: tuple(valores) for conta_id, valores in saldos.items()}
+
+    def saldo_inicial(self, conta, data_corte):
+        """Saldo da conta antes de ``data_corte`` (positivo = devedor)"""
+        debito, credito = self.saldos_ate(data_corte, contas=[conta.pk]).get(conta.pk, (ZERO, ZERO))
+        return debito - credito
+
+    def movimento_periodo(self, data_inicio, data_fim, contas=None):
+        """Débitos e créditos de cada conta no período (inclusive): só os lançamentos do período"""
+        return self._movimentos(data_inicio, data_fim, contas)
+
+    def saldos_periodo(self, data_inicio, data_fim, contas=None):
+        """
+        Saldos de abertura (antes de ``data_inicio``) e de fecho (até
+        ``data_fim``): o fecho é a abertura mais o movimento do período, em
+        vez de um segundo acumulado desde o último fecho mensal.
+        """
+        abertura = self.saldos_ate(data_inicio, contas)
+        fecho = {conta_id: list(valores) for conta_id, valores in abertura.items()}
+        for conta_id, (debito, credito) in self.movimento_periodo(data_inicio, data_fim, contas).items():
+            valores = fecho.setdefault(conta_id, [ZERO, ZERO])
+            valores[0] += debito
+            valores[1] += credito
+        return abertura, {conta_id: tuple(valores) for conta_id, valores in fecho.items()}
+
+    def totais_por_tipo(self, saldos):
+        """Agrupa saldos {conta: (d, c)} por tipo de conta, com o sinal da natureza"""
+        contas = PlanoContas.objects.filter(pk__in=saldos.keys()).values_list('pk', 'tipo_conta', 'codigo', 'nome')
+        totais = defaultdict(list)
+        for conta_id, tipo_conta, codigo, nome in contas:
+            debito, credito = saldos[conta_id]
+            valor = debito - credito if tipo_conta in ('ativo', 'despesa') else credito - debito
+            totais[tipo_conta].append({'id': conta_id, 'codigo': codigo, 'nome': nome, 'total': valor})
+        for linhas in totais.values():
+            linhas.sort(key=lambda linha: linha['codigo'])
+        return totais
+
+    # ------------------------------------------------------------------
+    # Fecho e atualização incremental
+    # ------------------------------------------------------------------
+    @transaction.atomic
+    def fechar_mes(self, ano, mes, usuario=None):
+        """
+        Calcula (ou recalcula) os saldos de fecho de todas as contas no mês.
+        Os meses fechados posteriores partem deste acumulado e são
+        recalculados a seguir, por ordem.
+        """
+        mes_referencia = date(ano, mes, 1)
+        fecho = self._fechar(mes_referencia, usuario)
+
+        posteriores = FechoMensalContabil.objects.filter(
+            empresa=self.empresa, mes_referencia__gt=mes_referencia
+        ).order_by('mes_referencia').values_list('mes_referencia', flat=True)
+        for posterior in list(posteriores):
+            self._fechar(posterior)
+        return fecho
+
+    def _fechar(self, mes_referencia, usuario=None):
+        anteriores = self.saldos_ate(mes_referencia)
+        do_mes = self._movimentos(mes_referencia, _ultimo_dia_mes(mes_referencia))
+
+        fecho, _ = FechoMensalContabil.objects.get_or_create(
+            empresa=self.empresa,
+            mes_referencia=mes_referencia,
+            defaults={'fechado_por': usuario},
+        )
+        fecho.saldos.all().delete()
+
+        saldos = []
+        for conta_id in set(anteriores) | set(do_mes):
+            debito_ant, credito_ant = anteriores.get(conta_id, (ZERO, ZERO))
+            debito_mes, credito_mes = do_mes.get(conta_id, (ZERO, ZERO))
+            saldos.append(SaldoMensalConta(
+                fecho=fecho,
+                empresa=self.empresa,
+                plano_contas_id=conta_id,
+                mes_referencia=mes_referencia,
+                debito_mes=debito_mes,
+                credito_mes=credito_mes,
+                debito_acumulado=debito_ant + debito_mes,
+                credito_acumulado=credito_ant + credito_mes,
+            ))
+        SaldoMensalConta.objects.bulk_create(saldos, batch_size=1000)
+        return fecho
+
+    def aplicar_lancamento(self, plano_contas_id, data_lancamento, debito=ZERO, credito=ZERO):
+        """
+        Reflete um lançamento (ou o seu estorno, com valores negativos) nos
+        meses já fechados a partir de ``data_lancamento``.
+        """
+        mes_referencia = data_lancamento.replace(day=1)
+        fechos = list(
+            FechoMensalContabil.objects.filter(
+                empresa=self.empresa, mes_referencia__gte=mes_referencia
+            ).values_list('pk', 'mes_referencia')
+        )
+        if not fechos:
+            return 0
+
+        existentes = set(
+            SaldoMensalConta.objects.filter(
+                fecho_id__in=[pk for pk, _ in fechos], plano_contas_id=plano_contas_id
+            ).values_list('fecho_id', flat=True)
+        )
+        SaldoMensalConta.objects.bulk_create([
+            SaldoMensalConta(
+                fecho_id=pk, empresa=self.empresa, plano_contas_id=plano_contas_id, mes_referencia=mes
+            )
+            for pk, mes in fechos if pk not in existentes
+        ])
+
+        linhas = SaldoMensalConta.objects.filter(
+            fecho_id__in=[pk for pk, _ in fechos], plano_contas_id=plano_contas_id
+        )
+        linhas.filter(mes_referencia=mes_referencia).update(
+            debito_mes=F('debito_mes') + debito,
+            credito_mes=F('credito_mes') + credito,
+        )
+        return linhas.update(
+            debito_acumulado=F('debito_acumulado') + debito,
+            credito_acumulado=F('credito_acumulado') + credito,
+        )
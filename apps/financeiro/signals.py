@@ -1,8 +1,8 @@
 # apps/financeiro/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from apps.core.models import Empresa
-from apps.financeiro.models import PlanoContas
+from apps.financeiro.models import LancamentoFinanceiro, PlanoContas
 
 
 @receiver(post_save, sender=Empresa)
@@ -206,3 +206,43 @@ def criar_plano_contas_basico(sender, instance, created, **kwargs):
                 empresa=instance
             )
 
+
+# -------------------------------------------------------------------
+# Saldos mensais: lançamentos em meses já fechados
+# -------------------------------------------------------------------
+def _aplicar_nos_fechos(empresa_id, plano_contas_id, data_lancamento, tipo, valor, sinal=1):
+    from apps.financeiro.services import SaldoContabilService
+
+    valor = valor * sinal
+    SaldoContabilService(Empresa(pk=empresa_id)).aplicar_lancamento(
+        plano_contas_id,
+        data_lancamento,
+        debito=valor if tipo == 'debito' else 0,
+        credito=valor if tipo == 'credito' else 0,
+    )
+
+
+@receiver(pre_save, sender=LancamentoFinanceiro)
+def guardar_lancamento_anterior(sender, instance, **kwargs):
+    instance._lancamento_anterior = None
+    if instance.pk:
+        instance._lancamento_anterior = LancamentoFinanceiro.objects.filter(pk=instance.pk).values(
+            'empresa_id', 'plano_contas_id', 'data_lancamento', 'tipo', 'valor'
+        ).first()
+
+
+@receiver(post_save, sender=LancamentoFinanceiro)
+def atualizar_saldos_mensais(sender, instance, created, **kwargs):
+    anterior = getattr(instance, '_lancamento_anterior', None)
+    if anterior:
+        _aplicar_nos_fechos(sinal=-1, **anterior)
+    _aplicar_nos_fechos(
+        instance.empresa_id, instance.plano_contas_id, instance.data_lancamento, instance.tipo, instance.valor
+    )
+
+
+@receiver(post_delete, sender=LancamentoFinanceiro)
+def estornar_saldos_mensais(sender, instance, **kwargs):
+    _aplicar_nos_fechos(
+        instance.empresa_id, instance.plano_contas_id, instance.data_lancamento, instance.tipo, instance.valor, sinal=-1
+    )
@@ -0,0 +1,31 @@
+# apps/financeiro/tasks.py
+import logging
+from datetime import date, timedelta
+
+from celery import shared_task
+
+from apps.core.models import Empresa
+from .services import SaldoContabilService
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def fechar_mes_contabil_task(ano=None, mes=None):
+    """
+    Fecha o mês contabilístico (por omissão o mês anterior) de todas as
+    empresas ativas, gravando os saldos de fecho por conta.
+    """
+    if not (ano and mes):
+        anterior = date.today().replace(day=1) - timedelta(days=1)
+        ano, mes = anterior.year, anterior.month
+
+    fechados = 0
+    for empresa in Empresa.objects.filter(ativa=True):
+        try:
+            SaldoContabilService(empresa).fechar_mes(ano, mes)
+            fechados += 1
+        except Exception as e:
+            logger.error(f'Erro ao fechar {mes:02d}/{ano} da empresa {empresa.id}: {e}')
+    logger.info(f'Fecho contabilístico {mes:02d}/{ano}: {fechados} empresas')
+    return fechados
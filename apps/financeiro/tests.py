@@ -1,3 +1,65 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-# Create your tests here.
+from apps.core.models import Empresa
+from apps.financeiro.models import LancamentoFinanceiro, PlanoContas
+from apps.financeiro.services import SaldoContabilService
+
+
+class SaldoContabilServiceTest(TestCase):
+    """Saldos de abertura, movimento e fecho a partir dos fechos mensais"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            nome='Farmácia Saldos', nif='5000000040', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email='saldos@exemplo.ao',
+        )
+        cls.usuario = get_user_model().objects.create(username='saldos', empresa=cls.empresa)
+        cls.caixa = PlanoContas.objects.create(
+            empresa=cls.empresa, codigo='45', nome='Caixa', tipo_conta='ativo', natureza='debito',
+        )
+        cls.vendas = PlanoContas.objects.create(
+            empresa=cls.empresa, codigo='61', nome='Vendas', tipo_conta='receita', natureza='credito',
+        )
+        lancamentos = [
+            (date(2026, 1, 10), '100.00'),
+            (date(2026, 1, 25), '50.00'),
+            (date(2026, 2, 5), '30.00'),
+            (date(2026, 3, 15), '20.00'),
+        ]
+        for numero, (data, valor) in enumerate(lancamentos, start=1):
+            cls._lancamento(numero * 2 - 1, data, cls.caixa, 'debito', valor)
+            cls._lancamento(numero * 2, data, cls.vendas, 'credito', valor)
+        SaldoContabilService(cls.empresa).fechar_mes(2026, 1)
+
+    @classmethod
+    def _lancamento(cls, numero, data, conta, tipo, valor):
+        LancamentoFinanceiro.objects.create(
+            numero_lancamento=f'SALDO-{numero:04d}', data_lancamento=data, descricao=f'Lançamento {numero}',
+            tipo=tipo, valor=Decimal(valor), plano_contas=conta, usuario_responsavel=cls.usuario, empresa=cls.empresa,
+        )
+
+    def setUp(self):
+        self.service = SaldoContabilService(self.empresa)
+
+    def test_movimento_periodo_le_so_o_periodo(self):
+        with self.assertNumQueries(1):
+            movimento = self.service.movimento_periodo(date(2026, 1, 20), date(2026, 2, 28))
+
+        self.assertEqual(movimento, {
+            self.caixa.pk: (Decimal('80.00'), Decimal('0.00')),
+            self.vendas.pk: (Decimal('0.00'), Decimal('80.00')),
+        })
+
+    def test_saldos_periodo_iguais_aos_acumulados(self):
+        inicio, fim = date(2026, 2, 1), date(2026, 3, 31)
+
+        abertura, fecho = self.service.saldos_periodo(inicio, fim)
+
+        self.assertEqual(abertura, self.service.saldos_ate(inicio))
+        self.assertEqual(fecho, self.service.saldos_ate(fim + timedelta(days=1)))
+        self.assertEqual(fecho[self.caixa.pk], (Decimal('200.00'), Decimal('0.00')))
@@ -18,8 +18,10 @@ from rest_framework import viewsets
 from jsonschema import ValidationError
 from apps.clientes.models import Cliente
 from apps.core.models import Empresa
+from apps.core.services import PlaneadorKPIService
 from apps.core.views import BaseMPAView
 from apps.financeiro.api.serializers import CategoriaFinanceiraSerializer, LancamentoFinanceiroSerializer
+from apps.financeiro.kpis import DIAS_FLUXO, meses_evolucao
 from apps.fornecedores.models import Fornecedor
 from apps.vendas.models import Venda
 from .models import (
@@ -43,6 +45,7 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from .models import PlanoContas
 from .forms import PlanoContasForm
+from .services import SaldoContabilService
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -1055,145 +1058,44 @@ class FinanceiroDashboardView(LoginRequiredMixin, PermissaoAcaoMixin, TemplateVi
         context = super().get_context_data(**kwargs)
         empresa = self.request.user.empresa  # ou self.get_empresa()
         hoje = date.today()
-        inicio_mes = hoje.replace(day=1)
-        
-        # ====== RESUMO FINANCEIRO ======
-        context['total_receber'] = ContaReceber.objects.filter(
-            empresa=empresa,
-            status__in=['aberta', 'vencida']
-        ).aggregate(total=Sum('valor_saldo'))['total'] or Decimal('0.00')
-        
-        context['total_pagar'] = ContaPagar.objects.filter(
-            empresa=empresa,
-            status__in=['aberta', 'vencida']
-        ).aggregate(total=Sum('valor_saldo'))['total'] or Decimal('0.00')
-        
-        context['saldo_caixa'] = self._calcular_saldo_caixa(empresa)
-        context['saldo_bancos'] = self._calcular_saldo_bancos(empresa)
-        
-        # ====== CONTAS VENCIDAS ======
-        context['contas_receber_vencidas'] = ContaReceber.objects.filter(
-            empresa=empresa,
-            status__in=['aberta', 'vencida'],
-            data_vencimento__lt=hoje
-        ).count()
-        
-        context['contas_pagar_vencidas'] = ContaPagar.objects.filter(
-            empresa=empresa,
-            status__in=['aberta', 'vencida'],
-            data_vencimento__lt=hoje
-        ).count()
-        
-        # ====== RECEITAS E DESPESAS DO MÊS ======
-        # CORRIGIDO: Usar plano_contas__tipo_conta em vez de tipo
-        context['receitas_mes'] = LancamentoFinanceiro.objects.filter(
-            empresa=empresa,
-            plano_contas__tipo_conta='receita',  # CORRIGIDO
-            data_lancamento__gte=inicio_mes,
-            data_lancamento__lte=hoje
-        ).aggregate(total=Sum('valor'))['total'] or Decimal('0.00')
-        
-        context['despesas_mes'] = LancamentoFinanceiro.objects.filter(
-            empresa=empresa,
-            plano_contas__tipo_conta='despesa',  # CORRIGIDO
-            data_lancamento__gte=inicio_mes,
-            data_lancamento__lte=hoje
-        ).aggregate(total=Sum('valor'))['total'] or Decimal('0.00')
-        
-        # ====== CONTAS VENCENDO (próximos 7 dias) ======
-        proximos_7_dias = hoje + timedelta(days=7)
-        
-        context['contas_receber_vencendo'] = ContaReceber.objects.filter(
-            empresa=empresa,
-            status='aberta',
-            data_vencimento__gte=hoje,
-            data_vencimento__lte=proximos_7_dias
-        ).count()
-        
-        context['contas_pagar_vencendo'] = ContaPagar.objects.filter(
-            empresa=empresa,
-            status='aberta',
-            data_vencimento__gte=hoje,
-            data_vencimento__lte=proximos_7_dias
-        ).count()
-        
-        # ====== IMPOSTOS ======
-        context['impostos_pendentes'] = ImpostoTributo.objects.filter(
-            empresa=empresa,
-            situacao__in=['pendente', 'calculado', 'vencido']
-        ).count()
-        
-        context['impostos_valor_devido'] = ImpostoTributo.objects.filter(
-            empresa=empresa,
-            situacao__in=['calculado', 'vencido']
-        ).aggregate(total=Sum('valor_devido'))['total'] or Decimal('0.00')
 
-        # ====== VENDAS DO MÊS ======
-        context['total_vendas_mes'] = Venda.objects.filter(
-            empresa=empresa,
-            data_venda__gte=inicio_mes,
-            data_venda__lte=hoje,
-            status='confirmada'
-        ).aggregate(total=Sum('valor_total'))['total'] or Decimal('0.00')
+        # Todos os indicadores escalares (resumo, vencimentos, fluxo previsto,
+        # evolução de saldos) numa consulta por tabela: apps/financeiro/kpis.py
+        kpis = PlaneadorKPIService(empresa).executar('financeiro', hoje=hoje)
 
-        # ====== CÁLCULOS ======
-        context['lucro_mes'] = context['total_vendas_mes'] - context['despesas_mes']
-        context['liquidez'] = context['saldo_caixa'] + context['saldo_bancos']
-        context['saldo_liquido'] = context['total_receber'] - context['total_pagar']
+        # ====== RESUMO FINANCEIRO ======
+        for nome in (
+            'total_receber', 'total_pagar', 'saldo_caixa', 'saldo_bancos',
+            'contas_receber_vencidas', 'contas_pagar_vencidas',
+            'receitas_mes', 'despesas_mes',
+            'contas_receber_vencendo', 'contas_pagar_vencendo',
+            'impostos_pendentes', 'impostos_valor_devido', 'total_vendas_mes',
+        ):
+            context[nome] = kpis[nome]
 
-        
         # ====== CÁLCULOS ======
         context['lucro_mes'] = context['receitas_mes'] - context['despesas_mes']
         context['liquidez'] = context['saldo_caixa'] + context['saldo_bancos']
         context['saldo_liquido'] = context['total_receber'] - context['total_pagar']
         
         # ====== DADOS PARA GRÁFICOS ======
-        context['dados_fluxo_caixa'] = json.dumps(self._get_dados_fluxo_caixa(empresa))
+        context['dados_fluxo_caixa'] = json.dumps(self._get_dados_fluxo_caixa(kpis, hoje))
         context['receitas_por_categoria'] = json.dumps(self._get_receitas_por_categoria(empresa))
         context['despesas_por_categoria'] = json.dumps(self._get_despesas_por_categoria(empresa))
-        context['evolucao_saldos'] = json.dumps(self._get_evolucao_saldos(empresa))
-        context['contas_vencimento'] = json.dumps(self._get_contas_por_vencimento(empresa))
+        context['evolucao_saldos'] = json.dumps(self._get_evolucao_saldos(kpis, hoje))
+        context['contas_vencimento'] = json.dumps(self._get_contas_por_vencimento(kpis))
         
         return context
     
-    def _calcular_saldo_caixa(self, empresa):
-        """Calcula saldo atual do caixa"""
-        return MovimentoCaixa.objects.filter(
-            empresa=empresa,
-            confirmado=True
-        ).aggregate(total=Sum('valor'))['total'] or Decimal('0.00')
-    
-    def _calcular_saldo_bancos(self, empresa):
-        """Calcula saldo total das contas bancárias"""
-        return ContaBancaria.objects.filter(
-            empresa=empresa,
-            ativa=True
-        ).aggregate(total=Sum('saldo_atual'))['total'] or Decimal('0.00')
-    
-    def _get_dados_fluxo_caixa(self, empresa):
+    def _get_dados_fluxo_caixa(self, kpis, hoje):
         """Dados para gráfico de fluxo de caixa (próximos 30 dias)"""
-        hoje = date.today()
         dados = {'labels': [], 'entradas': [], 'saidas': [], 'saldo_acumulado': []}
+        saldo_atual = kpis['saldo_caixa'] + kpis['saldo_bancos']
         
-        saldo_atual = self._calcular_saldo_caixa(empresa) + self._calcular_saldo_bancos(empresa)
-        
-        for i in range(30):
+        for i in range(DIAS_FLUXO):
             data_ref = hoje + timedelta(days=i)
-            
-            # Entradas previstas (contas a receber)
-            entradas = ContaReceber.objects.filter(
-                empresa=empresa,
-                data_vencimento=data_ref,
-                status='aberta'
-            ).aggregate(total=Sum('valor_saldo'))['total'] or Decimal('0.00')
-            
-            # Saídas previstas (contas a pagar)
-            saidas = ContaPagar.objects.filter(
-                empresa=empresa,
-                data_vencimento=data_ref,
-                status='aberta'
-            ).aggregate(total=Sum('valor_saldo'))['total'] or Decimal('0.00')
-            
+            entradas = kpis[f'fluxo_receber_{i}']
+            saidas = kpis[f'fluxo_pagar_{i}']
             saldo_atual = saldo_atual + entradas - saidas
             
             dados['labels'].append(data_ref.strftime('%d/%m'))
@@ -1241,66 +1143,25 @@ class FinanceiroDashboardView(LoginRequiredMixin, PermissaoAcaoMixin, TemplateVi
             'valores': [float(item['total']) for item in despesas]
         }
     
-    def _get_evolucao_saldos(self, empresa):
+    def _get_evolucao_saldos(self, kpis, hoje):
         """Evolução dos saldos bancários (últimos 12 meses)"""
         dados = {'labels': [], 'valores': []}
         
-        for i in range(12):
-            if i == 0:
-                mes_ref = date.today().replace(day=1)
-            else:
-                mes_anterior = mes_ref - timedelta(days=1)
-                mes_ref = mes_anterior.replace(day=1)
-            
-            fim_mes = mes_ref.replace(day=28)  # Aproximação
-            
-            # Calcular saldo no final do mês
-            movimentacoes = MovimentacaoFinanceira.objects.filter(
-                empresa=empresa,
-                data_movimentacao__lte=fim_mes,
-                confirmada=True
-            )
-            
-            entradas = movimentacoes.filter(tipo_movimentacao='entrada').aggregate(
-                total=Sum('valor')
-            )['total'] or Decimal('0.00')
-            
-            saidas = movimentacoes.filter(tipo_movimentacao='saida').aggregate(
-                total=Sum('valor')
-            )['total'] or Decimal('0.00')
-            
-            saldo_mes = entradas - saidas
-            
+        for i, mes_ref in enumerate(meses_evolucao(hoje)):
+            saldo_mes = kpis[f'evolucao_entradas_{i}'] - kpis[f'evolucao_saidas_{i}']
             dados['labels'].insert(0, mes_ref.strftime('%b/%Y'))
             dados['valores'].insert(0, float(saldo_mes))
         
         return dados
     
-    def _get_contas_por_vencimento(self, empresa):
+    def _get_contas_por_vencimento(self, kpis):
         """Distribuição de contas por status de vencimento"""
-        hoje = date.today()
-        
-        # Contas a receber
-        receber_aberta = ContaReceber.objects.filter(
-            empresa=empresa, status='aberta', data_vencimento__gte=hoje
-        ).aggregate(total=Sum('valor_saldo'))['total'] or Decimal('0.00')
-        
-        receber_vencida = ContaReceber.objects.filter(
-            empresa=empresa, status='vencida'
-        ).aggregate(total=Sum('valor_saldo'))['total'] or Decimal('0.00')
-        
-        # Contas a pagar
-        pagar_aberta = ContaPagar.objects.filter(
-            empresa=empresa, status='aberta', data_vencimento__gte=hoje
-        ).aggregate(total=Sum('valor_saldo'))['total'] or Decimal('0.00')
-        
-        pagar_vencida = ContaPagar.objects.filter(
-            empresa=empresa, status='vencida'
-        ).aggregate(total=Sum('valor_saldo'))['total'] or Decimal('0.00')
-        
         return {
             'labels': ['A Receber em Dia', 'A Receber Vencidas', 'A Pagar em Dia', 'A Pagar Vencidas'],
-            'valores': [float(receber_aberta), float(receber_vencida), float(pagar_aberta), float(pagar_vencida)],
+            'valores': [
+                float(kpis['receber_em_dia_valor']), float(kpis['receber_vencidas_valor']),
+                float(kpis['pagar_em_dia_valor']), float(kpis['pagar_vencidas_valor']),
+            ],
             'cores': ['#10B981', '#EF4444', '#F59E0B', '#DC2626']
         }
 
@@ -1391,24 +1252,14 @@ class DREView(LoginRequiredMixin, PermissaoAcaoMixin, TemplateView):
         else:
             fim_periodo = date(ano, mes + 1, 1) - timedelta(days=1)
         
-        # Receitas
-        receitas = LancamentoFinanceiro.objects.filter(
-            tipo='entrada',
-            data__range=[inicio_periodo, fim_periodo]
-        ).values('categoria__nome').annotate(
-            total=Sum('valor')
-        )
-        
-        # Despesas
-        despesas = LancamentoFinanceiro.objects.filter(
-            tipo='saida',
-            data__range=[inicio_periodo, fim_periodo]
-        ).values('categoria__nome').annotate(
-            total=Sum('valor')
-        )
+        # Movimento do período por conta (fechos mensais + delta)
+        service = SaldoContabilService(self.request.user.empresa)
+        contas = service.totais_por_tipo(service.movimento_periodo(inicio_periodo, fim_periodo))
+        receitas = contas.get('receita', [])
+        despesas = contas.get('despesa', [])
         
-        total_receitas = sum(item['total'] for item in receitas)
-        total_despesas = sum(item['total'] for item in despesas)
+        total_receitas = sum((item['total'] for item in receitas), Decimal('0.00'))
+        total_despesas = sum((item['total'] for item in despesas), Decimal('0.00'))
         
         context.update({
             'mes': mes,
@@ -1429,7 +1280,10 @@ class BalancoPatrimonialView(LoginRequiredMixin, PermissaoAcaoMixin, TemplateVie
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Implementar cálculo do balanço patrimonial
+        # Saldos até hoje a partir do último fecho mensal
+        service = SaldoContabilService(self.request.user.empresa)
+        self.contas = service.totais_por_tipo(service.saldos_ate(date.today() + timedelta(days=1)))
+        
         context.update({
             'ativo_circulante': self._calcular_ativo_circulante(),
             'ativo_nao_circulante': self._calcular_ativo_nao_circulante(),
@@ -1440,20 +1294,31 @@ class BalancoPatrimonialView(LoginRequiredMixin, PermissaoAcaoMixin, TemplateVie
         
         return context
     
+    def _somar(self, tipo_conta, circulante=None):
+        # Plano de contas básico: 1.1 / 2.1 são os grupos circulantes
+        prefixo = {'ativo': '1.1', 'passivo': '2.1'}.get(tipo_conta)
+        total = Decimal('0.00')
+        for conta in self.contas.get(tipo_conta, []):
+            eh_circulante = bool(prefixo) and (conta['codigo'] == prefixo or conta['codigo'].startswith(prefixo + '.'))
+            if circulante is None or circulante == eh_circulante:
+                total += conta['total']
+        return total
+    
     def _calcular_ativo_circulante(self):
-        return 0  # Implementar
+        return self._somar('ativo', circulante=True)
     
     def _calcular_ativo_nao_circulante(self):
-        return 0  # Implementar
+        return self._somar('ativo', circulante=False)
     
     def _calcular_passivo_circulante(self):
-        return 0  # Implementar
+        return self._somar('passivo', circulante=True)
     
     def _calcular_passivo_nao_circulante(self):
-        return 0  # Implementar
+        return self._somar('passivo', circulante=False)
     
     def _calcular_patrimonio_liquido(self):
-        return 0  # Implementar
+        # Capital próprio + resultado acumulado (receitas - despesas)
+        return self._somar('patrimonio') + self._somar('receita') - self._somar('despesa')
 
 # =====================================
 # CONTAS A RECEBER
@@ -0,0 +1,91 @@
+# apps/fiscal/management/commands/benchmark_saft_paralelo.py
+
+import hashlib
+import os
+import tempfile
+import time
+from datetime import date, datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.core.models import Empresa
+from apps.fiscal.services import ExportacaoSAFTParalela
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede a exportação SAF-T paralela (ExportacaoSAFTParalela) com 1, 2, 4... processos '
+        'sobre os dados reais de uma empresa: tempo, aceleração face a 1 processo e '
+        'se o ficheiro gerado é idêntico ao da construção sequencial.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID da empresa (por omissão a primeira)')
+        parser.add_argument('--data-inicio', help='YYYY-MM-DD (por omissão 1 de janeiro do ano corrente)')
+        parser.add_argument('--data-fim', help='YYYY-MM-DD (por omissão hoje)')
+        parser.add_argument('--processos', default='1,2,4', help='Lista de números de processos a medir')
+        parser.add_argument('--repeticoes', type=int, default=3, help='Execuções por configuração (conta a melhor)')
+
+    def handle(self, *args, **options):
+        empresa = (
+            Empresa.objects.filter(pk=options['empresa']).first()
+            if options['empresa'] else Empresa.objects.first()
+        )
+        if not empresa:
+            raise CommandError('Nenhuma empresa encontrada')
+
+        try:
+            data_inicio = self._data(options['data_inicio']) or date.today().replace(month=1, day=1)
+            data_fim = self._data(options['data_fim']) or date.today()
+            processos = sorted({int(n) for n in options['processos'].split(',')})
+        except ValueError as e:
+            raise CommandError(f'Parâmetros inválidos: {e}')
+        if 1 not in processos:
+            processos.insert(0, 1)
+
+        self.stdout.write(
+            f'{empresa.nome}: {data_inicio} a {data_fim} | CPUs: {os.cpu_count()} | '
+            f'repetições: {options["repeticoes"]}'
+        )
+
+        with tempfile.TemporaryDirectory(prefix='saft_benchmark_') as diretorio:
+            # Aquecimento: sela os meses fechados, para todas as configurações
+            # partirem dos mesmos fragmentos
+            ExportacaoSAFTParalela(empresa, data_inicio, data_fim, processos=1).gerar(
+                os.path.join(diretorio, 'aquecimento.xml')
+            )
+
+            referencia = base = None
+            for n in processos:
+                melhor, resumo = None, None
+                for repeticao in range(options['repeticoes']):
+                    caminho = os.path.join(diretorio, f'saft_{n}_{repeticao}.xml')
+                    inicio = time.perf_counter()
+                    ExportacaoSAFTParalela(empresa, data_inicio, data_fim, processos=n).gerar(caminho)
+                    duracao = time.perf_counter() - inicio
+                    melhor = duracao if melhor is None else min(melhor, duracao)
+                    resumo = self._resumo(caminho)
+                    os.remove(caminho)
+
+                if n == 1:
+                    referencia, base = resumo, melhor
+                aceleracao = base / melhor if melhor else 0
+                self.stdout.write(
+                    f'  {n:>2} processo(s): {melhor:8.2f}s | aceleração {aceleracao:5.2f}x | '
+                    f'eficiência {aceleracao / n:6.1%} | '
+                    f'{"idêntico" if resumo == referencia else "DIFERENTE"} ao sequencial'
+                )
+                if resumo != referencia:
+                    raise CommandError(f'O ficheiro gerado com {n} processos difere do sequencial')
+
+    @staticmethod
+    def _data(texto):
+        return datetime.strptime(texto, '%Y-%m-%d').date() if texto else None
+
+    @staticmethod
+    def _resumo(caminho):
+        """SHA-256 do ficheiro (o DateCreated só tem o dia, igual em todas as execuções)"""
+        sha = hashlib.sha256()
+        with open(caminho, 'rb') as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(bloco)
+        return sha.hexdigest()
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.5 on 2026-10-19 13:37
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_numeracao_blocos'),
+        ('fiscal', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FragmentoSAFTMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('seccao', models.CharField(choices=[('SalesInvoices', 'Faturas de venda'), ('GeneralLedgerEntries', 'Lançamentos contabilísticos')], max_length=30)),
+                ('mes_referencia', models.DateField(help_text='Primeiro dia do mês selado')),
+                ('conteudo', models.BinaryField(help_text='Partes XML [(chave, xml)] em JSON comprimido com zlib')),
+                ('impressao', models.CharField(help_text='Impressão dos documentos de origem do mês', max_length=64)),
+                ('versao', models.PositiveSmallIntegerField(default=1)),
+                ('documentos', models.PositiveIntegerField(default=0)),
+                ('numero_entradas', models.PositiveIntegerField(default=0)),
+                ('total_debito', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('total_credito', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fragmentos_saft', to='core.empresa')),
+            ],
+            options={
+                'verbose_name': 'Fragmento SAF-T Mensal',
+                'verbose_name_plural': 'Fragmentos SAF-T Mensais',
+                'ordering': ['empresa', 'seccao', 'mes_referencia'],
+                'unique_together': {('empresa', 'seccao', 'mes_referencia')},
+            },
+        ),
+    ]
@@ -1154,3 +1154,40 @@ class SAFTExport(TimeStampedModel):
             self.status = 'falhou'
             self.save(update_fields=['log_geracao', 'status', 'updated_at'])
 
+
+
+class FragmentoSAFTMensal(TimeStampedModel):
+    """
+    Secção SAF-T de um mês fechado, já serializada e comprimida.
+
+    As exportações que abrangem vários meses cosem estes fragmentos em vez
+    de voltar a gerar faturas e lançamentos de meses que já não mudam; só
+    o mês em curso (ou meses parciais) é gerado de raiz. A impressão dos
+    dados de origem invalida o fragmento quando um documento do mês é
+    alterado, anulado ou lançado com atraso.
+    """
+
+    SECCAO_CHOICES = [
+        ('SalesInvoices', 'Faturas de venda'),
+        ('GeneralLedgerEntries', 'Lançamentos contabilísticos'),
+    ]
+
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='fragmentos_saft')
+    seccao = models.CharField(max_length=30, choices=SECCAO_CHOICES)
+    mes_referencia = models.DateField(help_text="Primeiro dia do mês selado")
+    conteudo = models.BinaryField(help_text="Partes XML [(chave, xml)] em JSON comprimido com zlib")
+    impressao = models.CharField(max_length=64, help_text="Impressão dos documentos de origem do mês")
+    versao = models.PositiveSmallIntegerField(default=1)
+    documentos = models.PositiveIntegerField(default=0)
+    numero_entradas = models.PositiveIntegerField(default=0)
+    total_debito = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+    total_credito = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        verbose_name = "Fragmento SAF-T Mensal"
+        verbose_name_plural = "Fragmentos SAF-T Mensais"
+        unique_together = [['empresa', 'seccao', 'mes_referencia']]
+        ordering = ['empresa', 'seccao', 'mes_referencia']
+
+    def __str__(self):
+        return f"{self.empresa} - {self.seccao} {self.mes_referencia:%m/%Y}"
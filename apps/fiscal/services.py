@@ -1,8 +1,10 @@
 import logging
 import hashlib
 import json
+import re
+import zlib
 import xml.etree.ElementTree as ET
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from decimal import Decimal
 from typing import Dict, List, Optional, Tuple
 from django.db import transaction
@@ -12,9 +14,10 @@ from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.backends import default_backend
 import base64
-from .models import TaxaIVAAGT, AssinaturaDigital, RetencaoFonte
+from .models import TaxaIVAAGT, AssinaturaDigital, RetencaoFonte, FragmentoSAFTMensal
 from apps.core.models import Empresa
 from apps.financeiro.models import LancamentoFinanceiro, PlanoContas
+from apps.financeiro.services import SaldoContabilService
 from apps.vendas.models import Venda
 from django.db import transaction
 from apps.fiscal.models import DocumentoFiscal, DocumentoFiscalLinha
@@ -563,7 +566,6 @@ import os
 import zipfile
 import hashlib
 import logging
-from pathlib import Path
 import xml.etree.ElementTree as ET
 from datetime import date
 from decimal import Decimal
@@ -581,15 +583,23 @@ class FiscalServiceError(Exception):
 
 import os
 import hashlib
+import multiprocessing
+import shutil
+import tempfile
 import zipfile
 import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import billiard
 from datetime import date
 from decimal import Decimal
-from pathlib import Path
+from itertools import repeat
 from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections
 from django.utils import timezone
 from lxml import etree
 import logging
+from apps.saft.utils.saft_validator import SAFT_VERSAO_PADRAO, validar_documento, validar_ficheiro
 
 logger = logging.getLogger(__name__)
 
@@ -605,15 +615,13 @@ class SAFTExportService:
     """
 
     NAMESPACE = "urn:OECD:StandardAuditFile-Tax:AO_1.01_01"
+    TAMANHO_LOTE = 2000  # registos por lote nos cursores das secções
 
     @staticmethod
     def validar_xsd(xml_str: str):
-        """Valida o XML conforme schema oficial SAF-T AO 1.01_01"""
-        xsd_path = os.path.join(settings.BASE_DIR, "apps", "fiscal", "schemas", "SAFTAO1.01_01.xsd")
-        xmlschema_doc = etree.parse(str(Path(xsd_path)))
-        xmlschema = etree.XMLSchema(xmlschema_doc)
+        """Valida o XML conforme schema oficial SAF-T AO 1.01_01 (XSD compilado uma vez por processo)"""
         xml_doc = etree.fromstring(xml_str.encode('utf-8'))
-        xmlschema.assertValid(xml_doc)
+        validar_documento(xml_doc, SAFT_VERSAO_PADRAO)
         logger.info("Validação XSD SAF-T AO concluída com sucesso.")
 
     @staticmethod
@@ -626,22 +634,17 @@ class SAFTExportService:
                        'data_fim': data_fim.isoformat()}
             )
 
-            ET.register_namespace('', SAFTExportService.NAMESPACE)
-            root = ET.Element("{%s}AuditFile" % SAFTExportService.NAMESPACE)
-
-            root.append(SAFTExportService._criar_header(empresa, data_inicio, data_fim))
-            root.append(SAFTExportService._criar_master_files(empresa))
-
-            general_ledger = SAFTExportService._criar_general_ledger_entries(empresa, data_inicio, data_fim)
-            if general_ledger is not None:
-                root.append(general_ledger)
-
-            source_docs = SAFTExportService._criar_source_documents(empresa, data_inicio, data_fim)
-            if source_docs is not None:
-                root.append(source_docs)
+            # Meses fechados vêm dos fragmentos selados; só os restantes são gerados
+            fragmentos = FragmentosSAFTService(empresa)
+            root = SAFTExportService._criar_audit_file(empresa, data_inicio, data_fim, fragmentos)
 
             xml_string = ET.tostring(root, encoding='utf-8', xml_declaration=True)
-            xml_formatted = xml_string.decode('utf-8')
+            xml_formatted = fragmentos.costurar(xml_string.decode('utf-8'))
+
+            logger.info(
+                "Fragmentos SAF-T: %(reutilizados)s reutilizados, %(selados)s selados, %(gerados)s gerados",
+                fragmentos.estatisticas
+            )
 
             SAFTExportService.validar_xsd(xml_formatted)
 
@@ -652,6 +655,29 @@ class SAFTExportService:
             logger.error(f"Erro ao gerar SAF-T AO: {e}")
             raise FiscalServiceError(f"Erro na geração SAF-T: {e}")
 
+    @staticmethod
+    def _criar_audit_file(empresa, data_inicio: date, data_fim: date, fragmentos, master_files=None):
+        """Cria o AuditFile; as secções mensais ficam como marcadores dos fragmentos"""
+        ET.register_namespace('', SAFTExportService.NAMESPACE)
+        root = ET.Element("{%s}AuditFile" % SAFTExportService.NAMESPACE)
+
+        root.append(SAFTExportService._criar_header(empresa, data_inicio, data_fim))
+        if master_files is None:
+            master_files = SAFTExportService._criar_master_files(empresa, data_inicio, data_fim)
+        root.append(master_files)
+
+        general_ledger = SAFTExportService._criar_general_ledger_entries(
+            empresa, data_inicio, data_fim, fragmentos
+        )
+        if general_ledger is not None:
+            root.append(general_ledger)
+
+        source_docs = SAFTExportService._criar_source_documents(empresa, data_inicio, data_fim, fragmentos)
+        if source_docs is not None:
+            root.append(source_docs)
+
+        return root
+
     @staticmethod
     def _criar_elemento(tag, texto=None):
         """Cria elemento XML com namespace correto"""
@@ -722,11 +748,11 @@ class SAFTExportService:
         return header
 
     @staticmethod
-    def _criar_master_files(empresa):
+    def _criar_master_files(empresa, data_inicio: Optional[date] = None, data_fim: Optional[date] = None):
         """Cria o elemento MasterFiles conforme XSD"""
         master_files = SAFTExportService._criar_elemento("MasterFiles")
 
-        SAFTExportService._criar_general_ledger_accounts(master_files, empresa)
+        SAFTExportService._criar_general_ledger_accounts(master_files, empresa, data_inicio, data_fim)
         SAFTExportService._criar_customers(master_files, empresa)
         SAFTExportService._criar_suppliers(master_files, empresa)
         SAFTExportService._criar_products(master_files, empresa)
@@ -735,30 +761,28 @@ class SAFTExportService:
         return master_files
 
     @staticmethod
-    def _criar_general_ledger_accounts(master_files, empresa):
-        """Cria GeneralLedgerAccounts conforme XSD"""
+    def _criar_general_ledger_accounts(master_files, empresa, data_inicio: Optional[date] = None,
+                                       data_fim: Optional[date] = None):
+        """Cria GeneralLedgerAccounts conforme XSD, com saldos dos fechos mensais"""
         if not hasattr(empresa, 'planos_contas'):
             return
 
+        saldos = SAFTExportService._saldos_general_ledger(empresa, data_inicio, data_fim)
+        zero = (Decimal("0.00"), Decimal("0.00"))
+
         contas = empresa.planos_contas.filter(ativa=True)
-        for conta in contas:
+        for conta in contas.iterator(chunk_size=SAFTExportService.TAMANHO_LOTE):
             gl_account = SAFTExportService._criar_subelemento(master_files, "GeneralLedgerAccounts")
             account = SAFTExportService._criar_subelemento(gl_account, "Account")
 
             SAFTExportService._criar_subelemento(account, "AccountID", conta.codigo[:30])
             SAFTExportService._criar_subelemento(account, "AccountDescription", conta.nome[:100])
 
-            saldo_abertura_debito = getattr(conta, 'saldo_abertura_debito', Decimal("0.00"))
-            SAFTExportService._criar_subelemento(account, "OpeningDebitBalance", f"{saldo_abertura_debito:.2f}")
-
-            saldo_abertura_credito = getattr(conta, 'saldo_abertura_credito', Decimal("0.00"))
-            SAFTExportService._criar_subelemento(account, "OpeningCreditBalance", f"{saldo_abertura_credito:.2f}")
-
-            saldo_encerramento_debito = getattr(conta, 'saldo_encerramento_debito', Decimal("0.00"))
-            SAFTExportService._criar_subelemento(account, "ClosingDebitBalance", f"{saldo_encerramento_debito:.2f}")
-
-            saldo_encerramento_credito = getattr(conta, 'saldo_encerramento_credito', Decimal("0.00"))
-            SAFTExportService._criar_subelemento(account, "ClosingCreditBalance", f"{saldo_encerramento_credito:.2f}")
+            abertura, encerramento = saldos.get(conta.pk, (zero, zero))
+            SAFTExportService._criar_subelemento(account, "OpeningDebitBalance", f"{abertura[0]:.2f}")
+            SAFTExportService._criar_subelemento(account, "OpeningCreditBalance", f"{abertura[1]:.2f}")
+            SAFTExportService._criar_subelemento(account, "ClosingDebitBalance", f"{encerramento[0]:.2f}")
+            SAFTExportService._criar_subelemento(account, "ClosingCreditBalance", f"{encerramento[1]:.2f}")
 
             grouping_category = SAFTExportService._determinar_grouping_category(conta)
             SAFTExportService._criar_subelemento(account, "GroupingCategory", grouping_category)
@@ -766,6 +790,40 @@ class SAFTExportService:
             if hasattr(conta, 'conta_pai') and conta.conta_pai and grouping_category != "GR":
                 SAFTExportService._criar_subelemento(account, "GroupingCode", conta.conta_pai.codigo[:30])
 
+    @staticmethod
+    def _saldos_general_ledger(empresa, data_inicio: Optional[date] = None, data_fim: Optional[date] = None) -> Dict:
+        """
+        Saldos de abertura (antes de ``data_inicio``) e de encerramento (até
+        ``data_fim``) por conta: {conta_id: ((debito, credito), (debito, credito))}.
+
+        Vêm de SaldoContabilService (fecho mensal mais próximo + lançamentos
+        posteriores). As contas de agrupamento somam os saldos das contas
+        filhas; cada saldo fica no lado da sua natureza (devedor ou credor).
+        """
+        data_inicio = data_inicio or date.today().replace(month=1, day=1)
+        data_fim = data_fim or date.today()
+        service = SaldoContabilService(empresa)
+        periodos = service.saldos_periodo(data_inicio, data_fim)
+
+        pais = dict(empresa.planos_contas.values_list('pk', 'conta_pai_id'))
+        acumulados = ({}, {})
+        for indice, saldos in enumerate(periodos):
+            for conta_id, (debito, credito) in saldos.items():
+                vistas = set()
+                while conta_id is not None and conta_id not in vistas:
+                    vistas.add(conta_id)
+                    acumulados[indice][conta_id] = acumulados[indice].get(conta_id, Decimal("0.00")) + debito - credito
+                    conta_id = pais.get(conta_id)
+
+        def lados(saldo):
+            return (saldo, Decimal("0.00")) if saldo >= 0 else (Decimal("0.00"), -saldo)
+
+        zero = Decimal("0.00")
+        return {
+            conta_id: (lados(acumulados[0].get(conta_id, zero)), lados(acumulados[1].get(conta_id, zero)))
+            for conta_id in set(acumulados[0]) | set(acumulados[1])
+        }
+
     @staticmethod
     def _determinar_grouping_category(conta):
         """Determina a categoria da conta"""
@@ -788,7 +846,7 @@ class SAFTExportService:
         from apps.clientes.models import Cliente
 
         clientes = Cliente.objects.filter(empresa=empresa)
-        for cliente in clientes:
+        for cliente in clientes.iterator(chunk_size=SAFTExportService.TAMANHO_LOTE):
             customer = SAFTExportService._criar_subelemento(master_files, "Customer")
 
             SAFTExportService._criar_subelemento(customer, "CustomerID", str(cliente.id)[:30])
@@ -815,7 +873,7 @@ class SAFTExportService:
         from apps.fornecedores.models import Fornecedor
 
         fornecedores = Fornecedor.objects.filter(empresa=empresa)
-        for fornecedor in fornecedores:
+        for fornecedor in fornecedores.iterator(chunk_size=SAFTExportService.TAMANHO_LOTE):
             supplier = SAFTExportService._criar_subelemento(master_files, "Supplier")
 
             SAFTExportService._criar_subelemento(supplier, "SupplierID", str(fornecedor.id)[:30])
@@ -867,7 +925,7 @@ class SAFTExportService:
             return
 
         produtos = empresa.produtos.all()
-        for produto in produtos:
+        for produto in produtos.iterator(chunk_size=SAFTExportService.TAMANHO_LOTE):
             product = SAFTExportService._criar_subelemento(master_files, "Product")
 
             product_type = getattr(produto, 'tipo_produto', 'P')
@@ -924,55 +982,10 @@ class SAFTExportService:
                 SAFTExportService._criar_subelemento(tax_entry, "TaxPercentage", "0.00")
 
     @staticmethod
-    def _criar_general_ledger_entries(empresa, data_inicio: date, data_fim: date):
-        """Cria elemento GeneralLedgerEntries conforme XSD"""
-        from apps.financeiro.models import MovimentacaoFinanceira
-
-        if not hasattr(MovimentacaoFinanceira, 'objects'):
-            return None
-
-        movimentacoes = MovimentacaoFinanceira.objects.filter(
-            empresa=empresa,
-            data_movimentacao__gte=data_inicio,
-            data_movimentacao__lte=data_fim,
-            status="confirmada"
-        ).select_related('plano_contas', 'cliente', 'fornecedor').order_by('data_movimentacao', 'id')
-
-        if not movimentacoes.exists():
-            return None
-
-        gl_entries = SAFTExportService._criar_elemento("GeneralLedgerEntries")
-
-        SAFTExportService._criar_subelemento(gl_entries, "NumberOfEntries", str(movimentacoes.count()))
-
-        total_debit = sum(mov.debito or Decimal("0.00") for mov in movimentacoes)
-        SAFTExportService._criar_subelemento(gl_entries, "TotalDebit", f"{total_debit:.2f}")
-
-        total_credit = sum(mov.credito or Decimal("0.00") for mov in movimentacoes)
-        SAFTExportService._criar_subelemento(gl_entries, "TotalCredit", f"{total_credit:.2f}")
-
-        journals = {}
-        for mov in movimentacoes:
-            journal_id = getattr(mov, 'diario_id', None) or "GERAL"
-            if journal_id not in journals:
-                journals[journal_id] = []
-            journals[journal_id].append(mov)
-
-        for journal_id, movimentos in journals.items():
-            SAFTExportService._criar_journal(gl_entries, journal_id, movimentos)
-
-        return gl_entries
-
-    @staticmethod
-    def _criar_journal(gl_entries, journal_id, movimentos):
-        """Cria um Journal dentro de GeneralLedgerEntries"""
-        journal = SAFTExportService._criar_subelemento(gl_entries, "Journal")
-
-        SAFTExportService._criar_subelemento(journal, "JournalID", str(journal_id)[:30])
-        SAFTExportService._criar_subelemento(journal, "Description", f"Diário {journal_id}"[:200])
-
-        for mov in movimentos:
-            SAFTExportService._criar_transaction(journal, mov)
+    def _criar_general_ledger_entries(empresa, data_inicio: date, data_fim: date, fragmentos=None):
+        """Cria elemento GeneralLedgerEntries conforme XSD (com fragmentos por costurar)"""
+        fragmentos = fragmentos or FragmentosSAFTService(empresa)
+        return fragmentos.general_ledger_entries(data_inicio, data_fim)
 
     @staticmethod
     def _criar_transaction(journal, mov):
@@ -1031,12 +1044,12 @@ class SAFTExportService:
             SAFTExportService._criar_subelemento(credit_line, "CreditAmount", f"{mov.credito:.2f}")
 
     @staticmethod
-    def _criar_source_documents(empresa, data_inicio: date, data_fim: date):
+    def _criar_source_documents(empresa, data_inicio: date, data_fim: date, fragmentos=None):
         """Cria elemento SourceDocuments conforme XSD"""
         source_documents = SAFTExportService._criar_elemento("SourceDocuments")
         has_content = False
 
-        sales_invoices = SAFTExportService._criar_sales_invoices(empresa, data_inicio, data_fim)
+        sales_invoices = SAFTExportService._criar_sales_invoices(empresa, data_inicio, data_fim, fragmentos)
         if sales_invoices is not None:
             source_documents.append(sales_invoices)
             has_content = True
@@ -1059,35 +1072,10 @@ class SAFTExportService:
         return source_documents if has_content else None
 
     @staticmethod
-    def _criar_sales_invoices(empresa, data_inicio: date, data_fim: date):
-        """Cria elemento SalesInvoices conforme XSD"""
-        from apps.vendas.models import Venda
-
-        vendas = Venda.objects.filter(
-            empresa=empresa,
-            data_venda__date__gte=data_inicio,
-            data_venda__date__lte=data_fim,
-            status="finalizada"
-        ).select_related("cliente").prefetch_related("itens__taxa_iva").order_by('data_venda', 'id')
-
-        if not vendas.exists():
-            return None
-
-        sales_invoices = SAFTExportService._criar_elemento("SalesInvoices")
-
-        vendas_normais = [v for v in vendas if getattr(v, 'invoice_status', 'N') == 'N']
-        SAFTExportService._criar_subelemento(sales_invoices, "NumberOfEntries", str(len(vendas_normais)))
-
-        total_debit = Decimal("0.00")
-        total_credit = sum(v.total for v in vendas_normais)
-
-        SAFTExportService._criar_subelemento(sales_invoices, "TotalDebit", f"{total_debit:.2f}")
-        SAFTExportService._criar_subelemento(sales_invoices, "TotalCredit", f"{total_credit:.2f}")
-
-        for venda in vendas:
-            SAFTExportService._criar_invoice(sales_invoices, venda)
-
-        return sales_invoices
+    def _criar_sales_invoices(empresa, data_inicio: date, data_fim: date, fragmentos=None):
+        """Cria elemento SalesInvoices conforme XSD (com fragmentos por costurar)"""
+        fragmentos = fragmentos or FragmentosSAFTService(empresa)
+        return fragmentos.sales_invoices(data_inicio, data_fim)
 
     @staticmethod
     def _criar_invoice(sales_invoices, venda):
@@ -1246,6 +1234,592 @@ class SAFTExportService:
 
 
 
+class FragmentosSAFTService:
+    """
+    Fragmentos SAF-T selados por mês (SalesInvoices e GeneralLedgerEntries).
+
+    Cada mês fechado é gerado uma única vez e guardado em FragmentoSAFTMensal
+    já serializado e comprimido, junto com os totais de controlo. Numa
+    exportação de vários meses as secções recebem os totais somados e um
+    comentário marcador no lugar dos documentos; `costurar` troca os
+    marcadores pelo XML dos fragmentos depois da serialização, pelo que só
+    o mês em curso (ou meses parciais do período) volta a ser gerado.
+
+    Um fragmento só é reutilizado se a impressão dos documentos de origem
+    do mês (contagem, ids e última alteração) coincidir com a guardada;
+    anulações e documentos lançados com atraso mudam a impressão e levam à
+    nova selagem desse mês apenas.
+    """
+
+    VERSAO = 1
+    SECCOES = ('SalesInvoices', 'GeneralLedgerEntries')
+    _RE_MARCADOR = re.compile(r'<!--SAFT-FRAGMENTO-(\d+)-->')
+    _CHAVE_PENDENTES = '_fragmentos_saft_pendentes'
+
+    def __init__(self, empresa, hoje: Optional[date] = None):
+        self.empresa = empresa
+        self.hoje = hoje or timezone.localdate()
+        self.estatisticas = {'reutilizados': 0, 'selados': 0, 'gerados': 0}
+        self._substituicoes: List[List] = []
+
+    # ------------------------------------------------------------------
+    # Secções para SAFTExportService
+    # ------------------------------------------------------------------
+
+    def sales_invoices(self, data_inicio: date, data_fim: date):
+        """Elemento SalesInvoices com os totais do período e as faturas por costurar"""
+        return self.elemento_sales_invoices(self.conteudo('SalesInvoices', data_inicio, data_fim))
+
+    def general_ledger_entries(self, data_inicio: date, data_fim: date):
+        """Elemento GeneralLedgerEntries com os diários do período por costurar"""
+        return self.elemento_general_ledger(self.conteudo('GeneralLedgerEntries', data_inicio, data_fim))
+
+    def elemento_sales_invoices(self, conteudo: Dict):
+        """Elemento SalesInvoices a partir dos totais e partes já reunidos"""
+        if not conteudo['documentos']:
+            return None
+
+        sales_invoices = SAFTExportService._criar_elemento("SalesInvoices")
+        SAFTExportService._criar_subelemento(sales_invoices, "NumberOfEntries", str(conteudo['numero_entradas']))
+        SAFTExportService._criar_subelemento(sales_invoices, "TotalDebit", f"{conteudo['total_debito']:.2f}")
+        SAFTExportService._criar_subelemento(sales_invoices, "TotalCredit", f"{conteudo['total_credito']:.2f}")
+        sales_invoices.append(self.marcador([parte for _, parte in conteudo['partes']]))
+        return sales_invoices
+
+    def elemento_general_ledger(self, conteudo: Dict):
+        """Elemento GeneralLedgerEntries a partir dos totais e partes já reunidos"""
+        if not conteudo['documentos']:
+            return None
+
+        gl_entries = SAFTExportService._criar_elemento("GeneralLedgerEntries")
+        SAFTExportService._criar_subelemento(gl_entries, "NumberOfEntries", str(conteudo['numero_entradas']))
+        SAFTExportService._criar_subelemento(gl_entries, "TotalDebit", f"{conteudo['total_debito']:.2f}")
+        SAFTExportService._criar_subelemento(gl_entries, "TotalCredit", f"{conteudo['total_credito']:.2f}")
+
+        # Os diários mantêm a ordem da primeira ocorrência no período
+        diarios: Dict[str, List] = {}
+        for journal_id, parte in conteudo['partes']:
+            diarios.setdefault(journal_id, []).append(parte)
+
+        for journal_id, partes in diarios.items():
+            journal = SAFTExportService._criar_subelemento(gl_entries, "Journal")
+            SAFTExportService._criar_subelemento(journal, "JournalID", journal_id[:30])
+            SAFTExportService._criar_subelemento(journal, "Description", f"Diário {journal_id}"[:200])
+            journal.append(self.marcador(partes))
+
+        return gl_entries
+
+    def marcador(self, partes: List):
+        """Comentário que reserva o lugar das partes no XML serializado"""
+        self._substituicoes.append(partes)
+        return ET.Comment(f"SAFT-FRAGMENTO-{len(self._substituicoes) - 1}")
+
+    def pedacos(self, xml: str):
+        """Percorre o XML serializado: texto (str) alternado com as partes de cada marcador"""
+        for indice, pedaco in enumerate(self._RE_MARCADOR.split(xml)):
+            yield pedaco if indice % 2 == 0 else self._substituicoes[int(pedaco)]
+
+    def costurar(self, xml: str) -> str:
+        """Substitui os marcadores pelo XML dos fragmentos"""
+        if not self._substituicoes:
+            return xml
+        return ''.join(p if isinstance(p, str) else ''.join(p) for p in self.pedacos(xml))
+
+    # ------------------------------------------------------------------
+    # Selagem
+    # ------------------------------------------------------------------
+
+    def selar_mes(self, mes: date, forcar: bool = False) -> int:
+        """Sela (ou confirma) as secções de um mês fechado; devolve quantas foram seladas"""
+        mes = mes.replace(day=1)
+        if mes >= self.hoje.replace(day=1):
+            return 0
+
+        selados = 0
+        for seccao in self.SECCOES:
+            impressao = self._impressoes(seccao, [mes]).get(mes, self._impressao(None))
+            fragmento = FragmentoSAFTMensal.objects.filter(
+                empresa=self.empresa, seccao=seccao, mes_referencia=mes
+            ).only('impressao', 'versao').first()
+
+            if not forcar and fragmento and fragmento.versao == self.VERSAO and fragmento.impressao == impressao:
+                continue
+
+            self._guardar(seccao, mes, impressao, self._gerar(seccao, mes, _ultimo_dia_mes(mes)))
+            selados += 1
+
+        return selados
+
+    @classmethod
+    def marcar(cls, empresa_id: int, data) -> None:
+        """
+        Agenda a re-selagem do mês de `data` para depois do commit.
+
+        O mês em curso é ignorado (ainda não tem fragmento); vários documentos
+        do mesmo mês na mesma transação resultam numa única tarefa.
+        """
+        if not empresa_id or not data:
+            return
+        if isinstance(data, datetime):
+            data = timezone.localtime(data).date() if timezone.is_aware(data) else data.date()
+
+        mes = data.replace(day=1)
+        if mes >= timezone.localdate().replace(day=1):
+            return
+
+        conexao = transaction.get_connection()
+        pendentes = conexao.__dict__.setdefault(cls._CHAVE_PENDENTES, set())
+        pendentes.add((empresa_id, mes))
+        # Vários callbacks por transação: o primeiro agenda tudo, os restantes encontram o conjunto vazio
+        transaction.on_commit(cls._agendar_pendentes, robust=True)
+
+    @classmethod
+    def _agendar_pendentes(cls):
+        from apps.fiscal.tasks import selar_fragmentos_saft_task
+
+        pendentes = transaction.get_connection().__dict__.pop(cls._CHAVE_PENDENTES, None) or set()
+        por_empresa: Dict[int, List[str]] = {}
+        for empresa_id, mes in pendentes:
+            por_empresa.setdefault(empresa_id, []).append(mes.isoformat())
+
+        for empresa_id, meses in por_empresa.items():
+            selar_fragmentos_saft_task.delay(empresa_id, sorted(meses))
+
+    # ------------------------------------------------------------------
+    # Conteúdo por mês
+    # ------------------------------------------------------------------
+
+    def pecas(self, data_inicio: date, data_fim: date) -> List[Tuple[date, date, Optional[date]]]:
+        """Divide o período em (início, fim, mês selável ou None)"""
+        mes_aberto = self.hoje.replace(day=1)
+        pecas = []
+        inicio = data_inicio
+        while inicio <= data_fim:
+            mes = inicio.replace(day=1)
+            ultimo = _ultimo_dia_mes(mes)
+            fim = min(ultimo, data_fim)
+            completo = inicio == mes and fim == ultimo and mes < mes_aberto
+            pecas.append((inicio, fim, mes if completo else None))
+            inicio = fim + timedelta(days=1)
+        return pecas
+
+    def conteudo(self, seccao: str, data_inicio: date, data_fim: date) -> Dict:
+        """Totais e partes XML da secção no período, mês a mês"""
+        pecas = self.pecas(data_inicio, data_fim)
+        meses = [mes for _, _, mes in pecas if mes]
+        impressoes = self._impressoes(seccao, meses) if meses else {}
+        selados = {
+            f.mes_referencia: f
+            for f in FragmentoSAFTMensal.objects.filter(
+                empresa=self.empresa, seccao=seccao, mes_referencia__in=meses, versao=self.VERSAO
+            )
+        } if meses else {}
+
+        total = {
+            'documentos': 0, 'numero_entradas': 0,
+            'total_debito': Decimal('0.00'), 'total_credito': Decimal('0.00'), 'partes': [],
+        }
+        for inicio, fim, mes in pecas:
+            if mes is None:
+                dados = self._gerar(seccao, inicio, fim)
+                self.estatisticas['gerados'] += 1
+            else:
+                impressao = impressoes.get(mes, self._impressao(None))
+                fragmento = selados.get(mes)
+                if fragmento and fragmento.impressao == impressao:
+                    dados = self._ler(fragmento)
+                    self.estatisticas['reutilizados'] += 1
+                else:
+                    dados = self._gerar(seccao, inicio, fim)
+                    try:
+                        self._guardar(seccao, mes, impressao, dados)
+                        self.estatisticas['selados'] += 1
+                    except DatabaseError as e:
+                        # A selagem é uma cache: a exportação segue com o mês gerado
+                        logger.warning(f"Fragmento SAF-T {seccao} {mes:%m/%Y} não selado: {e}")
+                        self.estatisticas['gerados'] += 1
+
+            for campo in ('documentos', 'numero_entradas', 'total_debito', 'total_credito'):
+                total[campo] += dados[campo]
+            total['partes'].extend(dados['partes'])
+
+        return total
+
+    # ------------------------------------------------------------------
+    # Internos
+    # ------------------------------------------------------------------
+
+    def _gerar(self, seccao: str, data_inicio: date, data_fim: date) -> Dict:
+        if seccao == 'SalesInvoices':
+            return self._gerar_sales_invoices(data_inicio, data_fim)
+        return self._gerar_general_ledger(data_inicio, data_fim)
+
+    def _gerar_sales_invoices(self, data_inicio: date, data_fim: date) -> Dict:
+        vendas = Venda.objects.filter(
+            empresa=self.empresa,
+            data_venda__date__gte=data_inicio,
+            data_venda__date__lte=data_fim,
+            status="finalizada"
+        ).select_related("cliente").prefetch_related("itens__taxa_iva").order_by('data_venda', 'id')
+
+        faturas = SAFTExportService._criar_elemento("SalesInvoices")
+        documentos = entradas = 0
+        total_credit = Decimal('0.00')
+        for venda in vendas.iterator(chunk_size=SAFTExportService.TAMANHO_LOTE):
+            documentos += 1
+            if getattr(venda, 'invoice_status', 'N') == 'N':
+                entradas += 1
+                total_credit += venda.total
+            SAFTExportService._criar_invoice(faturas, venda)
+
+        return {
+            'documentos': documentos, 'numero_entradas': entradas,
+            'total_debito': Decimal('0.00'), 'total_credito': total_credit,
+            'partes': [['', self._serializar_filhos(faturas)]] if documentos else [],
+        }
+
+    def _gerar_general_ledger(self, data_inicio: date, data_fim: date) -> Dict:
+        from apps.financeiro.models import MovimentacaoFinanceira
+
+        movimentacoes = MovimentacaoFinanceira.objects.filter(
+            empresa=self.empresa,
+            data_movimentacao__gte=data_inicio,
+            data_movimentacao__lte=data_fim,
+            status="confirmada"
+        ).select_related('plano_contas', 'cliente', 'fornecedor').order_by('data_movimentacao', 'id')
+
+        diarios = {}
+        documentos = 0
+        total_debit = total_credit = Decimal('0.00')
+        for mov in movimentacoes.iterator(chunk_size=SAFTExportService.TAMANHO_LOTE):
+            documentos += 1
+            total_debit += mov.debito or Decimal("0.00")
+            total_credit += mov.credito or Decimal("0.00")
+            journal_id = str(getattr(mov, 'diario_id', None) or "GERAL")
+            if journal_id not in diarios:
+                diarios[journal_id] = SAFTExportService._criar_elemento("Journal")
+            SAFTExportService._criar_transaction(diarios[journal_id], mov)
+
+        return {
+            'documentos': documentos, 'numero_entradas': documentos,
+            'total_debito': total_debit, 'total_credito': total_credit,
+            'partes': [[journal_id, self._serializar_filhos(el)] for journal_id, el in diarios.items()],
+        }
+
+    def _impressoes(self, seccao: str, meses: List[date]) -> Dict[date, str]:
+        """Impressão dos documentos de origem de cada mês, numa só consulta agregada"""
+        from django.db.models import Count, DateField, Max, Sum
+        from django.db.models.functions import TruncMonth
+
+        inicio, fim = min(meses), _ultimo_dia_mes(max(meses))
+        if seccao == 'SalesInvoices':
+            # Sem filtrar o estado: anular uma venda também muda o mês
+            linhas = Venda.objects.filter(
+                empresa=self.empresa, data_venda__date__gte=inicio, data_venda__date__lte=fim
+            ).annotate(
+                mes=TruncMonth('data_venda', output_field=DateField())
+            ).values('mes').annotate(
+                n=Count('id', distinct=True), ids=Sum('id', distinct=True), alterado=Max('updated_at'),
+                linhas=Count('itens'), linhas_alteradas=Max('itens__updated_at'),
+            ).order_by()
+        else:
+            from apps.financeiro.models import MovimentacaoFinanceira
+
+            linhas = MovimentacaoFinanceira.objects.filter(
+                empresa=self.empresa, data_movimentacao__gte=inicio, data_movimentacao__lte=fim
+            ).annotate(
+                mes=TruncMonth('data_movimentacao', output_field=DateField())
+            ).values('mes').annotate(
+                n=Count('id'), ids=Sum('id'), alterado=Max('updated_at'),
+            ).order_by()
+
+        return {linha.pop('mes'): self._impressao(linha) for linha in linhas}
+
+    @classmethod
+    def _impressao(cls, valores: Optional[Dict]) -> str:
+        texto = json.dumps([cls.VERSAO, sorted((valores or {}).items())], default=str)
+        return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _serializar_filhos(elemento) -> str:
+        """XML dos filhos do elemento, sem a tag envolvente"""
+        if not len(elemento):
+            return ''
+        ET.register_namespace('', SAFTExportService.NAMESPACE)
+        xml = ET.tostring(elemento, encoding='unicode')
+        return xml[xml.index('>') + 1:xml.rindex('</')]
+
+    def _guardar(self, seccao: str, mes: date, impressao: str, dados: Dict):
+        FragmentoSAFTMensal.objects.update_or_create(
+            empresa=self.empresa, seccao=seccao, mes_referencia=mes,
+            defaults={
+                'conteudo': zlib.compress(json.dumps(dados['partes']).encode('utf-8')),
+                'impressao': impressao,
+                'versao': self.VERSAO,
+                'documentos': dados['documentos'],
+                'numero_entradas': dados['numero_entradas'],
+                'total_debito': dados['total_debito'],
+                'total_credito': dados['total_credito'],
+            }
+        )
+
+    @staticmethod
+    def _ler(fragmento) -> Dict:
+        return {
+            'documentos': fragmento.documentos,
+            'numero_entradas': fragmento.numero_entradas,
+            'total_debito': fragmento.total_debito,
+            'total_credito': fragmento.total_credito,
+            'partes': json.loads(zlib.decompress(bytes(fragmento.conteudo)).decode('utf-8')),
+        }
+
+
+def _ultimo_dia_mes(mes: date) -> date:
+    return (mes.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+
+class ExportacaoSAFTParalela:
+    """
+    Exportação SAF-T com as secções construídas em paralelo.
+
+    O período é dividido em unidades independentes: cada tabela das
+    MasterFiles e cada mês de GeneralLedgerEntries e SalesInvoices (estes
+    através dos fragmentos selados). As unidades correm num pool de
+    processos, cada um com a sua ligação à base de dados e cursores em
+    lotes, e escrevem o XML em ficheiros temporários. O processo principal
+    soma os totais de controlo das unidades, serializa o AuditFile com
+    marcadores no lugar das partes e copia os ficheiros para o destino,
+    sem ter o documento completo em memória.
+
+    Em PostgreSQL todas as unidades leem o mesmo snapshot REPEATABLE READ,
+    exportado por uma ligação dedicada (``pg_export_snapshot``) e importado
+    por cada processo (``SET TRANSACTION SNAPSHOT``): MasterFiles e
+    SourceDocuments concordam mesmo com vendas a entrar durante a exportação.
+    """
+
+    MASTER_FILES = (
+        '_criar_general_ledger_accounts', '_criar_customers', '_criar_suppliers',
+        '_criar_products', '_criar_tax_table',
+    )
+    SECCOES = ('GeneralLedgerEntries', 'SalesInvoices')
+
+    def __init__(self, empresa, data_inicio: date, data_fim: date, processos: Optional[int] = None):
+        self.empresa = empresa
+        self.data_inicio = data_inicio
+        self.data_fim = data_fim
+        self.processos = processos or getattr(settings, 'SAFT_EXPORT_PROCESSOS', 1)
+
+    def gerar(self, caminho: str) -> Dict:
+        """Gera o AuditFile validado em `caminho` e devolve os totais de controlo por secção"""
+        logger.info(
+            "Iniciando geração SAF-T AO paralela",
+            extra={'empresa_id': self.empresa.id, 'data_inicio': self.data_inicio.isoformat(),
+                   'data_fim': self.data_fim.isoformat(), 'processos': self.processos}
+        )
+
+        diretorio = tempfile.mkdtemp(prefix='saft_')
+        try:
+            unidades = self._unidades()
+            resultados = self._executar(unidades, diretorio)
+            totais = self._escrever(caminho, unidades, resultados)
+        except Exception as e:
+            logger.error(f"Erro ao gerar SAF-T AO: {e}")
+            raise FiscalServiceError(f"Erro na geração SAF-T: {e}")
+        finally:
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+        try:
+            validar_ficheiro(caminho, SAFT_VERSAO_PADRAO)
+        except etree.XMLSyntaxError as e:
+            os.remove(caminho)
+            logger.error(f"Erro ao gerar SAF-T AO: {e}")
+            raise FiscalServiceError(f"Erro na geração SAF-T: {e}")
+
+        logger.info("SAF-T AO gerado e validado com sucesso.")
+        return totais
+
+    def _unidades(self) -> List[Tuple]:
+        unidades = [('MasterFiles', metodo, self.data_inicio, self.data_fim) for metodo in self.MASTER_FILES]
+        pecas = FragmentosSAFTService(self.empresa).pecas(self.data_inicio, self.data_fim)
+        for seccao in self.SECCOES:
+            unidades.extend((seccao, inicio, fim) for inicio, fim, _ in pecas)
+        return unidades
+
+    def _executar(self, unidades: List[Tuple], diretorio: str) -> List[Dict]:
+        prefixos = [os.path.join(diretorio, f"{indice:04d}") for indice in range(len(unidades))]
+
+        # Dentro de uma transação as ligações não podem ser fechadas antes do
+        # fork; a transação de quem chama já dá uma leitura consistente
+        if transaction.get_connection().in_atomic_block:
+            return [_construir_unidade_saft(self.empresa.pk, u, p) for u, p in zip(unidades, prefixos)]
+
+        if self.processos <= 1:
+            with transaction.atomic():
+                _iniciar_snapshot()
+                return [_construir_unidade_saft(self.empresa.pk, u, p) for u, p in zip(unidades, prefixos)]
+
+        # Os processos herdam as ligações abertas; fechadas aqui, cada um abre a sua
+        connections.close_all()
+        with _snapshot_exportado() as snapshot:
+            argumentos = list(zip(repeat(self.empresa.pk), unidades, prefixos, repeat(snapshot)))
+
+            # Os filhos do worker Celery (prefork) são daemónicos e o multiprocessing
+            # da biblioteca padrão recusa-lhes processos filhos; o billiard permite-o
+            if multiprocessing.current_process().daemon or billiard.current_process().daemon:
+                pool = billiard.get_context('fork').Pool(processes=self.processos)
+                try:
+                    return pool.starmap(_construir_unidade_saft_processo, argumentos)
+                finally:
+                    pool.terminate()
+                    pool.join()
+
+            with ProcessPoolExecutor(max_workers=self.processos, mp_context=multiprocessing.get_context('fork')) as pool:
+                return list(pool.map(_construir_unidade_saft_processo, *zip(*argumentos)))
+
+    def _escrever(self, caminho: str, unidades: List[Tuple], resultados: List[Dict]) -> Dict:
+        """Junta as partes das unidades no AuditFile final, com os totais reconciliados"""
+        reunidos = {
+            seccao: {
+                'documentos': 0, 'numero_entradas': 0,
+                'total_debito': Decimal('0.00'), 'total_credito': Decimal('0.00'), 'partes': [],
+            }
+            for seccao in self.SECCOES
+        }
+        partes_master = []
+        estatisticas = {'reutilizados': 0, 'selados': 0, 'gerados': 0}
+
+        for (seccao, *_), dados in zip(unidades, resultados):
+            if seccao == 'MasterFiles':
+                partes_master.extend(ficheiro for _, ficheiro in dados['partes'] if os.path.getsize(ficheiro))
+                continue
+            for campo in ('documentos', 'numero_entradas', 'total_debito', 'total_credito'):
+                reunidos[seccao][campo] += dados[campo]
+            reunidos[seccao]['partes'].extend(dados['partes'])
+            for campo, valor in dados['estatisticas'].items():
+                estatisticas[campo] += valor
+
+        fragmentos = _FragmentosReunidos(self.empresa, reunidos)
+        master_files = SAFTExportService._criar_elemento("MasterFiles")
+        if partes_master:
+            master_files.append(fragmentos.marcador(partes_master))
+
+        root = SAFTExportService._criar_audit_file(
+            self.empresa, self.data_inicio, self.data_fim, fragmentos, master_files
+        )
+        xml = ET.tostring(root, encoding='utf-8', xml_declaration=True).decode('utf-8')
+
+        os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        with open(caminho, 'wb') as destino:
+            for pedaco in fragmentos.pedacos(xml):
+                if isinstance(pedaco, str):
+                    destino.write(pedaco.encode('utf-8'))
+                    continue
+                for ficheiro in pedaco:
+                    with open(ficheiro, 'rb') as origem:
+                        shutil.copyfileobj(origem, destino, 1024 * 1024)
+
+        logger.info(
+            "Fragmentos SAF-T: %(reutilizados)s reutilizados, %(selados)s selados, %(gerados)s gerados",
+            estatisticas
+        )
+        return {
+            seccao: {campo: valor for campo, valor in dados.items() if campo != 'partes'}
+            for seccao, dados in reunidos.items()
+        }
+
+
+class _FragmentosReunidos(FragmentosSAFTService):
+    """Fragmentos cujo conteúdo já foi construído pelas unidades paralelas"""
+
+    def __init__(self, empresa, reunidos: Dict[str, Dict]):
+        super().__init__(empresa)
+        self.reunidos = reunidos
+
+    def conteudo(self, seccao: str, data_inicio: date, data_fim: date) -> Dict:
+        return self.reunidos[seccao]
+
+
+def _construir_unidade_saft(empresa_id: int, unidade: Tuple, prefixo: str) -> Dict:
+    """
+    Constrói uma unidade da exportação paralela.
+
+    O XML de cada parte vai para `prefixo.N`; devolve os totais de controlo
+    da unidade com as partes como (chave, ficheiro).
+    """
+    empresa = Empresa.objects.get(pk=empresa_id)
+    seccao = unidade[0]
+
+    if seccao == 'MasterFiles':
+        master_files = SAFTExportService._criar_elemento("MasterFiles")
+        if unidade[1] == '_criar_general_ledger_accounts':
+            # Os saldos de abertura e encerramento dependem do período
+            SAFTExportService._criar_general_ledger_accounts(master_files, empresa, unidade[2], unidade[3])
+        else:
+            getattr(SAFTExportService, unidade[1])(master_files, empresa)
+        dados = {'partes': [['', FragmentosSAFTService._serializar_filhos(master_files)]]}
+    else:
+        fragmentos = FragmentosSAFTService(empresa)
+        dados = fragmentos.conteudo(seccao, unidade[1], unidade[2])
+        dados['estatisticas'] = fragmentos.estatisticas
+
+    partes = []
+    for indice, (chave, xml) in enumerate(dados['partes']):
+        ficheiro = f"{prefixo}.{indice}"
+        with open(ficheiro, 'wb') as f:
+            f.write(xml.encode('utf-8'))
+        partes.append((chave, ficheiro))
+    dados['partes'] = partes
+    return dados
+
+
+def _construir_unidade_saft_processo(empresa_id: int, unidade: Tuple, prefixo: str,
+                                     snapshot: Optional[str] = None) -> Dict:
+    """
+    Unidade num processo do pool, dentro do snapshot exportado pelo processo
+    principal; a ligação à base de dados é fechada no fim.
+    """
+    try:
+        with transaction.atomic():
+            _iniciar_snapshot(snapshot)
+            return _construir_unidade_saft(empresa_id, unidade, prefixo)
+    finally:
+        connections.close_all()
+
+
+def _iniciar_snapshot(snapshot: Optional[str] = None) -> None:
+    """Primeira instrução da transação: REPEATABLE READ, no snapshot indicado se houver"""
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        if snapshot:
+            cursor.execute('SET TRANSACTION SNAPSHOT %s', [snapshot])
+
+
+@contextmanager
+def _snapshot_exportado():
+    """
+    Identificador de um snapshot REPEATABLE READ para as unidades paralelas
+    (None fora de PostgreSQL). A ligação que o exporta é dedicada, fora de
+    ``connections``, e mantém a transação aberta até as unidades terminarem.
+    """
+    if connections[DEFAULT_DB_ALIAS].vendor != 'postgresql':
+        yield None
+        return
+
+    ligacao = connections.create_connection(DEFAULT_DB_ALIAS)
+    try:
+        ligacao.set_autocommit(False)
+        with ligacao.cursor() as cursor:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            cursor.execute('SELECT pg_export_snapshot()')
+            snapshot, = cursor.fetchone()
+        yield snapshot
+    finally:
+        ligacao.rollback()
+        ligacao.close()
+
+
 class FiscalDashboardService:
     """
     Serviço para métricas e dashboard fiscal
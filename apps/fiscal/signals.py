@@ -6,8 +6,8 @@ from django.utils import timezone
 from decimal import Decimal
 
 from .models import TaxaIVAAGT, AssinaturaDigital, RetencaoFonte
-from .services import AssinaturaDigitalService, RetencaoFonteService, FiscalServiceError
-from apps.vendas.models import Venda, FaturaCredito, NotaCredito, NotaDebito, Recibo
+from .services import AssinaturaDigitalService, RetencaoFonteService, FiscalServiceError, FragmentosSAFTService
+from apps.vendas.models import Venda, ItemVenda, FaturaCredito, NotaCredito, NotaDebito, Recibo
 from apps.financeiro.models import LancamentoFinanceiro, MovimentacaoFinanceira
 from apps.core.models import Empresa
 from .tasks import (
@@ -447,6 +447,46 @@ def inicializar_cache_empresa_fiscal(sender, instance, created, **kwargs):
         )
 
 
+# =====================================
+# Signals para Fragmentos SAF-T mensais
+# =====================================
+
+@receiver(post_save, sender=Venda)
+@receiver(post_delete, sender=Venda)
+def invalidar_fragmento_saft_venda(sender, instance, **kwargs):
+    """
+    Re-sela o mês da venda quando um documento de um mês fechado muda
+    (anulação, documento lançado com atraso). Mudanças de data são
+    apanhadas pela impressão do mês de origem na exportação seguinte.
+    """
+    FragmentosSAFTService.marcar(instance.empresa_id, instance.data_venda)
+
+
+@receiver(post_save, sender=ItemVenda)
+@receiver(post_delete, sender=ItemVenda)
+def invalidar_fragmento_saft_item_venda(sender, instance, **kwargs):
+    """
+    Re-sela o mês da venda a que a linha pertence
+    """
+    if ItemVenda.venda.is_cached(instance):
+        venda = instance.venda
+        FragmentosSAFTService.marcar(venda.empresa_id, venda.data_venda)
+        return
+
+    venda = Venda.objects.filter(pk=instance.venda_id).values('empresa_id', 'data_venda').first()
+    if venda:
+        FragmentosSAFTService.marcar(venda['empresa_id'], venda['data_venda'])
+
+
+@receiver(post_save, sender=MovimentacaoFinanceira)
+@receiver(post_delete, sender=MovimentacaoFinanceira)
+def invalidar_fragmento_saft_movimentacao(sender, instance, **kwargs):
+    """
+    Re-sela o mês da movimentação nos lançamentos contabilísticos
+    """
+    FragmentosSAFTService.marcar(instance.empresa_id, instance.data_movimentacao)
+
+
 # =====================================
 # Signal personalizado para eventos fiscais
 # =====================================
@@ -16,8 +16,9 @@ from django.core.cache import cache
 from django.template.loader import render_to_string
 from .models import TaxaIVAAGT, AssinaturaDigital, RetencaoFonte
 from .services import (
-    AssinaturaDigitalService, SAFTExportService, 
-    FiscalDashboardService, FiscalServiceError
+    AssinaturaDigitalService,
+    FiscalDashboardService, FiscalServiceError, FragmentosSAFTService,
+    ExportacaoSAFTParalela
 )
 from apps.fiscal import signals
 from apps.core.models import Empresa
@@ -243,14 +244,11 @@ def gerar_saft_async(self, empresa_id: int, data_inicio: str, data_fim: str,
             }
         )
         
-        # Gerar SAF-T
-        xml_content = SAFTExportService.gerar_saft_ao(
-            empresa, data_inicio_obj, data_fim_obj
-        )
-        
-        # Salvar arquivo
+        # Gerar SAF-T (secções em paralelo, escritas diretamente no arquivo)
         filename = f"SAFT_AO_{empresa.nif}_{data_inicio}_{data_fim}.xml"
-        file_path = _salvar_arquivo_saft(filename, xml_content)
+        file_path = _caminho_arquivo_saft(filename)
+        ExportacaoSAFTParalela(empresa, data_inicio_obj, data_fim_obj).gerar(file_path)
+        tamanho = os.path.getsize(file_path)
         
         # Enviar por email se solicitado
         if enviar_email:
@@ -271,7 +269,7 @@ def gerar_saft_async(self, empresa_id: int, data_inicio: str, data_fim: str,
                 'task_id': self.request.id,
                 'empresa_id': empresa_id,
                 'arquivo': filename,
-                'tamanho': len(xml_content)
+                'tamanho': tamanho
             }
         )
         
@@ -279,7 +277,7 @@ def gerar_saft_async(self, empresa_id: int, data_inicio: str, data_fim: str,
             'success': True,
             'filename': filename,
             'file_path': file_path,
-            'size': len(xml_content),
+            'size': tamanho,
             'generated_at': timezone.now().isoformat()
         }
         
@@ -288,18 +286,41 @@ def gerar_saft_async(self, empresa_id: int, data_inicio: str, data_fim: str,
         return {'success': False, 'error': str(e)}
 
 
-def _salvar_arquivo_saft(filename: str, content: str) -> str:
-    """Salva arquivo SAF-T no sistema de arquivos"""
+@shared_task
+def selar_fragmentos_saft_task(empresa_id: int = None, meses: List[str] = None):
+    """
+    Sela os fragmentos SAF-T mensais (meses em ISO, primeiro dia do mês).
+
+    Sem argumentos sela o mês anterior de todas as empresas ativas, para que
+    as exportações do ano já encontrem os meses fechados prontos a coser.
+    """
+    if meses:
+        meses = [date.fromisoformat(mes) for mes in meses]
+    else:
+        meses = [(timezone.localdate().replace(day=1) - timedelta(days=1)).replace(day=1)]
+
+    empresas = Empresa.objects.filter(pk=empresa_id) if empresa_id else Empresa.objects.filter(ativa=True)
+
+    selados = 0
+    for empresa in empresas:
+        fragmentos = FragmentosSAFTService(empresa)
+        for mes in meses:
+            try:
+                selados += fragmentos.selar_mes(mes)
+            except Exception as e:
+                logger.error(f"Erro ao selar fragmentos SAF-T de {mes:%m/%Y} (empresa {empresa.id}): {e}")
+
+    logger.info(f"Fragmentos SAF-T selados: {selados}")
+    return selados
+
+
+def _caminho_arquivo_saft(filename: str) -> str:
+    """Caminho do arquivo SAF-T no sistema de arquivos"""
     # Diretório para arquivos SAF-T
     saft_dir = os.path.join(settings.MEDIA_ROOT, 'saft_exports')
     os.makedirs(saft_dir, exist_ok=True)
     
-    file_path = os.path.join(saft_dir, filename)
-    
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(content)
-    
-    return file_path
+    return os.path.join(saft_dir, filename)
 
 
 @shared_task
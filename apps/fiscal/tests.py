@@ -1,3 +1,193 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from apps.clientes.models import Cliente
+from apps.core.models import Empresa, Loja
+from apps.fiscal.models import FragmentoSAFTMensal, TaxaIVAAGT
+from apps.fiscal.services import ExportacaoSAFTParalela, FragmentosSAFTService, SAFTExportService
+from apps.produtos.models import Produto
+from apps.vendas.models import FormaPagamento, ItemVenda, Venda
+
+
+@mock.patch('apps.fiscal.services.validar_ficheiro')
+class ExportacaoSAFTParalelaTest(TransactionTestCase):
+    """
+    A exportação paralela (processos com snapshot partilhado) produz o mesmo
+    XML que a sequencial. TransactionTestCase: os processos do pool só veem
+    dados com commit.
+    """
+
+    def setUp(self):
+        self.empresa = Empresa.objects.create(
+            nome='Farmácia SAF-T', nif='5000000020', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email='saft@exemplo.ao',
+        )
+        self.loja = Loja.objects.create(
+            empresa=self.empresa, nome='Loja', codigo='L1', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', postal='0000', provincia='Luanda',
+        )
+        self.taxa = TaxaIVAAGT.objects.create(
+            pk=1, empresa=self.empresa, nome='IVA 14%', tax_type='IVA', tax_code='NOR', tax_percentage=Decimal('14'),
+        )
+        self.forma_pagamento = FormaPagamento.objects.create(empresa=self.empresa, nome='Dinheiro')
+        self.cliente = Cliente.objects.create(empresa=self.empresa, nome_completo='Cliente SAF-T')
+        self.produto = Produto.objects.create(
+            empresa=self.empresa, codigo_interno='SAFT1', codigo_barras='5600000001',
+            nome_produto='Paracetamol', nome_comercial='Paracetamol',
+            preco_custo=Decimal('10'), preco_venda=Decimal('12'), margem_lucro=Decimal('20'),
+        )
+
+        self.hoje = timezone.localdate()
+        self.data_inicio = (self.hoje.replace(day=1) - timedelta(days=40)).replace(day=1)
+        dia = self.data_inicio
+        for numero in range(1, 7):
+            self._venda(numero, dia)
+            dia += timedelta(days=12)
+
+        self.diretorio = tempfile.mkdtemp(prefix='saft_teste_')
+        self.addCleanup(shutil.rmtree, self.diretorio, ignore_errors=True)
+
+    def _venda(self, numero, dia):
+        venda = Venda.objects.create(
+            empresa=self.empresa, loja=self.loja, cliente=self.cliente, forma_pagamento=self.forma_pagamento,
+            numero_documento=f'FT SAFT/{numero}', subtotal=Decimal('12'), total=Decimal('13.68'),
+        )
+        ItemVenda.objects.create(
+            venda=venda, produto=self.produto, nome_produto=self.produto.nome_produto, quantidade=1,
+            preco_unitario=Decimal('12'), taxa_iva=self.taxa,
+        )
+        # data_venda é auto_now_add
+        momento = timezone.make_aware(datetime.combine(min(dia, self.hoje), time(10)))
+        Venda.objects.filter(pk=venda.pk).update(data_venda=momento)
+
+    def _exportar(self, processos):
+        caminho = os.path.join(self.diretorio, f'saft_{processos}.xml')
+        totais = ExportacaoSAFTParalela(self.empresa, self.data_inicio, self.hoje, processos=processos).gerar(caminho)
+        with open(caminho, 'rb') as ficheiro:
+            return ficheiro.read(), totais
+
+    def test_paralela_igual_a_sequencial(self, _validar):
+        sequencial, totais_sequencial = self._exportar(1)
+        paralela, totais_paralela = self._exportar(3)
+
+        self.assertEqual(totais_paralela, totais_sequencial)
+        self.assertEqual(totais_sequencial['SalesInvoices']['documentos'], 6)
+        self.assertEqual(paralela, sequencial)
+
+
+class FragmentosSAFTServiceTest(TestCase):
+    """Meses fechados selados uma vez e cosidos nas exportações seguintes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            nome='Farmácia Fragmentos', nif='5000000021', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email='fragmentos@exemplo.ao',
+        )
+        cls.loja = Loja.objects.create(
+            empresa=cls.empresa, nome='Loja', codigo='L1', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', postal='0000', provincia='Luanda',
+        )
+        cls.taxa = TaxaIVAAGT.objects.create(
+            pk=1, empresa=cls.empresa, nome='IVA 14%', tax_type='IVA', tax_code='NOR', tax_percentage=Decimal('14'),
+        )
+        cls.forma_pagamento = FormaPagamento.objects.create(empresa=cls.empresa, nome='Dinheiro')
+        cls.cliente = Cliente.objects.create(empresa=cls.empresa, nome_completo='Cliente Fragmentos')
+        cls.produto = Produto.objects.create(
+            empresa=cls.empresa, codigo_interno='FRAG1', codigo_barras='5600000021',
+            nome_produto='Ibuprofeno', nome_comercial='Ibuprofeno',
+            preco_custo=Decimal('10'), preco_venda=Decimal('12'), margem_lucro=Decimal('20'),
+        )
+
+        cls.hoje = timezone.localdate()
+        cls.mes_atual = cls.hoje.replace(day=1)
+        cls.mes_anterior = (cls.mes_atual - timedelta(days=1)).replace(day=1)
+        cls.inicio = (cls.mes_anterior - timedelta(days=1)).replace(day=1)
+        # Dois meses fechados e o mês em curso
+        cls.vendas = [
+            cls._venda(numero, dia)
+            for numero, dia in enumerate(
+                [cls.inicio + timedelta(days=4), cls.inicio + timedelta(days=14),
+                 cls.mes_anterior + timedelta(days=9), cls.hoje],
+                start=1,
+            )
+        ]
+
+    @classmethod
+    def _venda(cls, numero, dia):
+        venda = Venda.objects.create(
+            empresa=cls.empresa, loja=cls.loja, cliente=cls.cliente, forma_pagamento=cls.forma_pagamento,
+            numero_documento=f'FT FRAG/{numero}', subtotal=Decimal('12'), total=Decimal('13.68'),
+        )
+        ItemVenda.objects.create(
+            venda=venda, produto=cls.produto, nome_produto=cls.produto.nome_produto, quantidade=1,
+            preco_unitario=Decimal('12'), taxa_iva=cls.taxa,
+        )
+        # data_venda é auto_now_add
+        Venda.objects.filter(pk=venda.pk).update(data_venda=timezone.make_aware(datetime.combine(dia, time(10))))
+        return venda
+
+    def _conteudo(self):
+        fragmentos = FragmentosSAFTService(self.empresa)
+        return fragmentos, fragmentos.conteudo('SalesInvoices', self.inicio, self.hoje)
+
+    def test_meses_fechados_selados_e_reutilizados(self):
+        primeira, conteudo = self._conteudo()
+        self.assertEqual(primeira.estatisticas, {'reutilizados': 0, 'selados': 2, 'gerados': 1})
+        self.assertEqual(
+            sorted(FragmentoSAFTMensal.objects.filter(empresa=self.empresa, seccao='SalesInvoices')
+                   .values_list('mes_referencia', 'documentos')),
+            [(self.inicio, 2), (self.mes_anterior, 1)],
+        )
+
+        segunda, reutilizado = self._conteudo()
+        self.assertEqual(segunda.estatisticas, {'reutilizados': 2, 'selados': 0, 'gerados': 1})
+        self.assertEqual(reutilizado, conteudo)
+        self.assertEqual((conteudo['documentos'], conteudo['total_credito']), (4, Decimal('54.72')))
+
+    def test_anulacao_resela_so_o_seu_mes(self):
+        self._conteudo()
+        Venda.objects.filter(pk=self.vendas[0].pk).update(status='cancelada', updated_at=timezone.now())
+
+        fragmentos, conteudo = self._conteudo()
+
+        self.assertEqual(fragmentos.estatisticas, {'reutilizados': 1, 'selados': 1, 'gerados': 1})
+        self.assertEqual(conteudo['documentos'], 3)
+        self.assertEqual(
+            FragmentoSAFTMensal.objects.get(empresa=self.empresa, seccao='SalesInvoices', mes_referencia=self.inicio)
+            .documentos,
+            1,
+        )
+
+    @mock.patch.object(SAFTExportService, 'validar_xsd')
+    def test_xml_cosido_igual_ao_gerado(self, _validar):
+        gerado = SAFTExportService.gerar_saft_ao(self.empresa, self.inicio, self.hoje)
+        cosido = SAFTExportService.gerar_saft_ao(self.empresa, self.inicio, self.hoje)
+
+        self.assertEqual(cosido, gerado)
+        self.assertNotIn('SAFT-FRAGMENTO', cosido)
+        self.assertEqual(cosido.count('<InvoiceNo>'), 4)
+
+    def test_selagem_ignora_o_mes_em_curso(self):
+        fragmentos = FragmentosSAFTService(self.empresa)
+
+        self.assertEqual(fragmentos.selar_mes(self.mes_atual), 0)
+        self.assertEqual(fragmentos.selar_mes(self.mes_anterior), 2)
+        self.assertEqual(fragmentos.selar_mes(self.mes_anterior), 0)
+
+    @mock.patch('apps.fiscal.tasks.selar_fragmentos_saft_task.delay')
+    def test_marcar_agenda_uma_tarefa_por_empresa_apos_o_commit(self, delay):
+        with self.captureOnCommitCallbacks(execute=True):
+            FragmentosSAFTService.marcar(self.empresa.pk, self.inicio + timedelta(days=1))
+            FragmentosSAFTService.marcar(self.empresa.pk, self.inicio + timedelta(days=2))
+            FragmentosSAFTService.marcar(self.empresa.pk, self.hoje)
+            delay.assert_not_called()
+
+        delay.assert_called_once_with(self.empresa.pk, [self.inicio.isoformat()])
@@ -5,10 +5,12 @@ from django.urls import reverse
 from django.utils.safestring import mark_safe
 from django.db.models import Sum, Count, Avg
 from django.contrib import messages
+from django.db import transaction
 from .models import (
     Fornecedor, ContatoFornecedor, CondicaoPagamento, 
-    Pedido, ItemPedido, HistoricoPedido, AvaliacaoFornecedor
+    Pedido, ItemPedido, HistoricoPedido, AvaliacaoFornecedor, ScorecardFornecedor, PlanoReposicao
 )
+from .services import ScorecardFornecedorService
 
 class ContatoFornecedorInline(admin.TabularInline):
     model = ContatoFornecedor
@@ -76,6 +78,9 @@ class FornecedorAdmin(admin.ModelAdmin):
     inlines = [ContatoFornecedorInline]
     actions = ['ativar_fornecedores', 'bloquear_fornecedores', 'desbloquear_fornecedores']
     
+    def get_queryset(self, request):
+        return ScorecardFornecedorService.anotar(super().get_queryset(request))
+    
     def total_pedidos_display(self, obj):
         count = obj.total_pedidos
         if count > 0:
@@ -141,7 +146,7 @@ class PedidoAdmin(admin.ModelAdmin):
     ]
     list_filter = [
         'status', 'urgencia', 'data_pedido', 'fornecedor',
-        'condicao_pagamento', 'data_entrega_prevista'
+        'condicao_pagamento', 'data_entrega_prevista', 'plano_reposicao'
     ]
     search_fields = ['numero_pedido', 'fornecedor__razao_social', 'observacoes']
     readonly_fields = [
@@ -271,3 +276,49 @@ class AvaliacaoFornecedorAdmin(admin.ModelAdmin):
         }),
     )
 
+
+
+@admin.register(ScorecardFornecedor)
+class ScorecardFornecedorAdmin(admin.ModelAdmin):
+    list_display = [
+        'fornecedor', 'mes', 'total_pedidos', 'total_comprado', 'entregas', 'entregas_no_prazo',
+        'dias_atraso', 'quantidade_recebida', 'quantidade_devolvida', 'avaliacoes',
+    ]
+    list_filter = ['empresa', 'mes']
+    search_fields = ['fornecedor__razao_social', 'fornecedor__nome_fantasia']
+    list_select_related = ['fornecedor']
+    date_hierarchy = 'mes'
+
+
+@admin.register(PlanoReposicao)
+class PlanoReposicaoAdmin(admin.ModelAdmin):
+    list_display = [
+        'id', 'empresa', 'estado', 'produtos_analisados', 'lojas_analisadas', 'produtos_a_repor',
+        'pedidos_gerados', 'valor_total', 'duracao_segundos', 'created_at',
+    ]
+    list_filter = ['estado', 'empresa']
+    readonly_fields = [
+        'estado', 'produtos_analisados', 'lojas_analisadas', 'produtos_a_repor', 'pedidos_gerados',
+        'valor_total', 'duracao_segundos', 'mensagem_erro', 'iniciado_em', 'concluido_em',
+    ]
+    date_hierarchy = 'created_at'
+    actions = ['executar_novamente']
+
+    def save_model(self, request, obj, form, change):
+        if not change and not obj.solicitante_id:
+            obj.solicitante = request.user
+        super().save_model(request, obj, form, change)
+        if not change:
+            from .tasks import executar_plano_reposicao_task
+            transaction.on_commit(lambda: executar_plano_reposicao_task.delay(obj.pk))
+
+    def executar_novamente(self, request, queryset):
+        from .tasks import executar_plano_reposicao_task
+        for plano in queryset:
+            novo = PlanoReposicao.objects.create(
+                empresa=plano.empresa, solicitante=request.user, dias_historico=plano.dias_historico,
+                nivel_servico=plano.nivel_servico, dias_cobertura=plano.dias_cobertura,
+            )
+            transaction.on_commit(lambda pk=novo.pk: executar_plano_reposicao_task.delay(pk))
+        messages.success(request, f'{queryset.count()} planos de reposição agendados.')
+    executar_novamente.short_description = "Executar novamente com os mesmos parâmetros"
@@ -14,12 +14,13 @@ class ContatoFornecedorSerializer(serializers.ModelSerializer):
 class FornecedorSerializer(serializers.ModelSerializer):
     contatos = ContatoFornecedorSerializer(many=True, read_only=True)
     total_pedidos = serializers.IntegerField(read_only=True)
-    total_compras = serializers.DecimalField(max_digits=15, decimal_places=2, read_only=True)
+    total_compras = serializers.DecimalField(source='total_comprado', max_digits=15, decimal_places=2, read_only=True)
     
     class Meta:
         model = Fornecedor
         fields = '__all__'
         read_only_fields = ['created_at', 'updated_at']
+        relacionados = {'contatos': 'contatos'}
 
 class ItemPedidoCompraSerializer(serializers.ModelSerializer):
     produto_nome = serializers.CharField(source='produto.nome_comercial', read_only=True)
@@ -27,6 +28,7 @@ class ItemPedidoCompraSerializer(serializers.ModelSerializer):
     class Meta:
         model = ItemPedido
         fields = '__all__'
+        relacionados = {'produto_nome': 'produto'}
 
 class PedidoCompraSerializer(serializers.ModelSerializer):
     fornecedor_nome = serializers.CharField(source='fornecedor.nome', read_only=True)
@@ -36,6 +38,7 @@ class PedidoCompraSerializer(serializers.ModelSerializer):
         model = Pedido
         fields = '__all__'
         read_only_fields = ['numero_pedido', 'created_at', 'updated_at']
+        relacionados = {'fornecedor_nome': 'fornecedor', 'itens': 'itens__produto'}
 
 class AvaliacaoFornecedorSerializer(serializers.ModelSerializer):
     fornecedor_nome = serializers.CharField(source='fornecedor.nome', read_only=True)
@@ -3,15 +3,41 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from ..models import Fornecedor, ContatoFornecedor, Pedido, AvaliacaoFornecedor
+from apps.core.mixins import APIOtimizadaMixin
+from ..models import Fornecedor, ContatoFornecedor, Pedido, AvaliacaoFornecedor, ScorecardFornecedor
+from ..services import ScorecardFornecedorService
 from .serializers import FornecedorSerializer, ContatoFornecedorSerializer, PedidoCompraSerializer, AvaliacaoFornecedorSerializer
 
-class FornecedorViewSet(viewsets.ModelViewSet):
+class FornecedorViewSet(APIOtimizadaMixin, viewsets.ModelViewSet):
     queryset = Fornecedor.objects.all()
     serializer_class = FornecedorSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['ativo', 'tipo_fornecedor']
+    filterset_fields = ['ativo', 'categoria']
+    
+    def get_queryset(self):
+        # Filtrado pela empresa; totais dos scorecards no mesmo JOIN
+        # (os contatos são pré-carregados pelo Meta.relacionados do serializer)
+        return ScorecardFornecedorService.anotar(
+            Fornecedor.objects.filter(empresa=self.request.user.empresa)
+        )
+    
+    @action(detail=True, methods=['get'])
+    def scorecard(self, request, pk=None):
+        fornecedor = self.get_object()
+        meses = ScorecardFornecedor.objects.filter(fornecedor=fornecedor).order_by('-mes')[:24]
+        return Response([
+            {
+                'mes': linha.mes,
+                'total_pedidos': linha.total_pedidos,
+                'total_comprado': linha.total_comprado,
+                'percentual_no_prazo': linha.percentual_no_prazo,
+                'atraso_medio': linha.atraso_medio,
+                'percentual_defeitos': linha.percentual_defeitos,
+                'avaliacao_media': linha.avaliacao_media,
+            }
+            for linha in meses
+        ])
     
     @action(detail=True, methods=['get'])
     def avaliacoes(self, request, pk=None):
@@ -20,12 +46,15 @@ class FornecedorViewSet(viewsets.ModelViewSet):
         serializer = AvaliacaoFornecedorSerializer(avaliacoes, many=True)
         return Response(serializer.data)
 
-class PedidoCompraViewSet(viewsets.ModelViewSet):
+class PedidoCompraViewSet(APIOtimizadaMixin, viewsets.ModelViewSet):
     queryset = Pedido.objects.all()
     serializer_class = PedidoCompraSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['status', 'fornecedor']
+
+    def get_queryset(self):
+        return Pedido.objects.filter(empresa=self.request.user.empresa)
     
     @action(detail=True, methods=['post'])
     def aprovar(self, request, pk=None):
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FornecedoresConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.fornecedores'
+
+    def ready(self):
+        import apps.fornecedores.signals
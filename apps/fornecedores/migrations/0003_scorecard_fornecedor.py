@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_numeracao_blocos'),
+        ('fornecedores', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScorecardFornecedor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primeiro dia do mês')),
+                ('total_pedidos', models.PositiveIntegerField(default=0)),
+                ('total_comprado', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('entregas', models.PositiveIntegerField(default=0)),
+                ('entregas_no_prazo', models.PositiveIntegerField(default=0)),
+                ('dias_atraso', models.PositiveIntegerField(default=0, help_text='Soma dos dias de atraso das entregas')),
+                ('quantidade_recebida', models.PositiveIntegerField(default=0)),
+                ('quantidade_devolvida', models.PositiveIntegerField(default=0)),
+                ('avaliacoes', models.PositiveIntegerField(default=0)),
+                ('soma_notas', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scorecards_fornecedores', to='core.empresa')),
+                ('fornecedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scorecards', to='fornecedores.fornecedor')),
+            ],
+            options={
+                'verbose_name': 'Scorecard do Fornecedor',
+                'verbose_name_plural': 'Scorecards dos Fornecedores',
+                'ordering': ['-mes'],
+                'indexes': [models.Index(fields=['empresa', 'mes'], name='idx_scorecard_empresa_mes')],
+                'constraints': [models.UniqueConstraint(fields=('fornecedor', 'mes'), name='uniq_scorecard_fornecedor_mes')],
+            },
+        ),
+    ]
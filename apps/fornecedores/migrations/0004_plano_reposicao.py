@@ -0,0 +1,52 @@
+# Generated by Django 5.1.5 on 2026-10-19 13:02
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_numeracao_blocos'),
+        ('fornecedores', '0003_scorecard_fornecedor'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanoReposicao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('dias_historico', models.PositiveIntegerField(default=90, help_text='Janela de vendas usada na procura')),
+                ('nivel_servico', models.DecimalField(decimal_places=3, default=Decimal('0.950'), help_text='Probabilidade de não haver rutura durante o prazo de entrega', max_digits=4, validators=[django.core.validators.MinValueValidator(Decimal('0.500')), django.core.validators.MaxValueValidator(Decimal('0.999'))])),
+                ('dias_cobertura', models.PositiveIntegerField(default=7, help_text='Dias de procura cobertos além do ponto de encomenda')),
+                ('estado', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluido', 'Concluído'), ('falhou', 'Falhou')], default='pendente', max_length=15)),
+                ('produtos_analisados', models.PositiveIntegerField(default=0)),
+                ('lojas_analisadas', models.PositiveIntegerField(default=0)),
+                ('produtos_a_repor', models.PositiveIntegerField(default=0)),
+                ('pedidos_gerados', models.PositiveIntegerField(default=0)),
+                ('valor_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('duracao_segundos', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True)),
+                ('mensagem_erro', models.TextField(blank=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='planos_reposicao', to='core.empresa')),
+                ('solicitante', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='planos_reposicao', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Plano de Reposição',
+                'verbose_name_plural': 'Planos de Reposição',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='plano_reposicao',
+            field=models.ForeignKey(blank=True, help_text='Plano de reposição que gerou o rascunho', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pedidos', to='fornecedores.planoreposicao'),
+        ),
+    ]
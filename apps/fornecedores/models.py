@@ -265,18 +265,30 @@ class Fornecedor(TimeStampedModel):
         ]
         return " - ".join(filter(None, endereco_parts))
     
+    def _totais_scorecard(self):
+        # Anotados por ScorecardFornecedorService.anotar (listagens) ou somados dos scorecards
+        if not hasattr(self, 'pedidos_scorecard'):
+            totais = self.scorecards.aggregate(
+                pedidos=models.Sum('total_pedidos'), comprado=models.Sum('total_comprado'),
+            )
+            self.pedidos_scorecard = totais['pedidos']
+            self.comprado_scorecard = totais['comprado']
+        return self.pedidos_scorecard or 0, self.comprado_scorecard or Decimal('0.00')
+    
     @property
     def total_pedidos(self):
         """Total de pedidos realizados"""
-        return self.pedidos.filter(status__in=['aprovado', 'recebido', 'finalizado']).count()
+        return self._totais_scorecard()[0]
     
     @property
     def total_comprado(self):
         """Valor total comprado do fornecedor"""
-        total = self.pedidos.filter(
-            status__in=['aprovado', 'recebido', 'finalizado']
-        ).aggregate(total=models.Sum('total'))['total']
-        return total or Decimal('0.00')
+        return self._totais_scorecard()[1]
+    
+    def atualizar_nota_avaliacao(self):
+        """Atualiza o scorecard do mês e os indicadores do fornecedor"""
+        from .services import ScorecardFornecedorService
+        ScorecardFornecedorService.recalcular_fornecedores([self.pk])
     
     @property
     def dias_sem_pedido(self):
@@ -417,7 +429,15 @@ class Pedido(TimeStampedModel):
     numero_orcamento_fornecedor = models.CharField(max_length=50, blank=True)
     
     empresa = models.ForeignKey('core.Empresa', on_delete=models.CASCADE)
-    
+    plano_reposicao = models.ForeignKey(
+        'PlanoReposicao',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='pedidos',
+        help_text="Plano de reposição que gerou o rascunho"
+    )
+
     class Meta:
         verbose_name = "Pedido"
         verbose_name_plural = "Pedidos"
@@ -432,6 +452,14 @@ class Pedido(TimeStampedModel):
     def __str__(self):
         return f"{self.numero_pedido} - {self.fornecedor.razao_social}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Célula (fornecedor, mês) carregada: alterações de fornecedor/data recalculam as duas
+        if 'fornecedor_id' in field_names and 'data_pedido' in field_names:
+            instance._celula_scorecard = (instance.fornecedor_id, instance.data_pedido)
+        return instance
+    
     def save(self, *args, **kwargs):
         # Gera número automático se não fornecido
         if not self.numero_pedido:
@@ -443,10 +471,11 @@ class Pedido(TimeStampedModel):
         super().save(*args, **kwargs)
     
     def gerar_numero_pedido(self):
-        """Gera número sequencial do pedido"""
+        """Gera número sequencial do pedido (por empresa; o número é único entre empresas)"""
         from django.db.models import Max
+        prefixo = f"PED-{self.empresa_id}-"
         ultimo_numero = Pedido.objects.filter(
-            empresa=self.empresa
+            empresa=self.empresa, numero_pedido__startswith=prefixo
         ).aggregate(Max('numero_pedido'))['numero_pedido__max']
         
         if ultimo_numero:
@@ -457,12 +486,13 @@ class Pedido(TimeStampedModel):
         else:
             numero = 1
         
-        return f"PED-{numero:06d}"
+        return f"{prefixo}{numero:06d}"
     
     def calcular_totais(self):
         """Calcula os totais do pedido"""
-        # Subtotal dos itens
-        self.subtotal = sum(item.total for item in self.itens.all())
+        # Subtotal dos itens (pedido novo ainda não tem itens)
+        if self.pk:
+            self.subtotal = self.itens.aggregate(total=models.Sum('total'))['total'] or Decimal('0.00')
         
         # Desconto em valor se percentual informado
         if self.desconto_percentual and not self.desconto_valor:
@@ -727,6 +757,124 @@ class AvaliacaoFornecedor(TimeStampedModel):
         super().delete(*args, **kwargs)
         fornecedor.atualizar_nota_avaliacao()
 
+class ScorecardFornecedor(models.Model):
+    """
+    Indicadores materializados por fornecedor e mês (data do pedido).
+    Recalculados por célula quando pedidos, itens ou avaliações mudam
+    (ScorecardFornecedorService); os relatórios e listagens leem daqui.
+    """
+    empresa = models.ForeignKey('core.Empresa', on_delete=models.CASCADE, related_name='scorecards_fornecedores')
+    fornecedor = models.ForeignKey(Fornecedor, on_delete=models.CASCADE, related_name='scorecards')
+    mes = models.DateField(help_text="Primeiro dia do mês")
+    
+    # Compras
+    total_pedidos = models.PositiveIntegerField(default=0)
+    total_comprado = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    # Entregas (pedidos com data prevista e real)
+    entregas = models.PositiveIntegerField(default=0)
+    entregas_no_prazo = models.PositiveIntegerField(default=0)
+    dias_atraso = models.PositiveIntegerField(default=0, help_text="Soma dos dias de atraso das entregas")
+    
+    # Qualidade
+    quantidade_recebida = models.PositiveIntegerField(default=0)
+    quantidade_devolvida = models.PositiveIntegerField(default=0)
+    
+    # Avaliações
+    avaliacoes = models.PositiveIntegerField(default=0)
+    soma_notas = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    
+    atualizado_em = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Scorecard do Fornecedor"
+        verbose_name_plural = "Scorecards dos Fornecedores"
+        ordering = ['-mes']
+        constraints = [
+            models.UniqueConstraint(fields=['fornecedor', 'mes'], name='uniq_scorecard_fornecedor_mes'),
+        ]
+        indexes = [
+            models.Index(fields=['empresa', 'mes'], name='idx_scorecard_empresa_mes'),
+        ]
+    
+    def __str__(self):
+        return f"{self.fornecedor_id} {self.mes:%m/%Y}"
+    
+    @property
+    def percentual_no_prazo(self):
+        return (Decimal(self.entregas_no_prazo) * 100 / self.entregas) if self.entregas else None
+    
+    @property
+    def atraso_medio(self):
+        return (Decimal(self.dias_atraso) / self.entregas) if self.entregas else None
+    
+    @property
+    def percentual_defeitos(self):
+        if self.quantidade_recebida:
+            return Decimal(self.quantidade_devolvida) * 100 / self.quantidade_recebida
+        return None
+    
+    @property
+    def avaliacao_media(self):
+        return (self.soma_notas / self.avaliacoes) if self.avaliacoes else None
+
+
+class PlanoReposicao(TimeStampedModel):
+    """
+    Execução do planeador de reposição (ReposicaoService): calcula a
+    necessidade de compra de todo o catálogo e gera pedidos em rascunho
+    agrupados por fornecedor. Os rascunhos de planos anteriores ainda não
+    enviados são substituídos pela execução seguinte.
+    """
+    ESTADO_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('concluido', 'Concluído'),
+        ('falhou', 'Falhou'),
+    ]
+
+    empresa = models.ForeignKey('core.Empresa', on_delete=models.CASCADE, related_name='planos_reposicao')
+    solicitante = models.ForeignKey(
+        'core.Usuario', on_delete=models.SET_NULL, null=True, blank=True, related_name='planos_reposicao'
+    )
+
+    # Parâmetros
+    dias_historico = models.PositiveIntegerField(default=90, help_text="Janela de vendas usada na procura")
+    nivel_servico = models.DecimalField(
+        max_digits=4,
+        decimal_places=3,
+        default=Decimal('0.950'),
+        validators=[MinValueValidator(Decimal('0.500')), MaxValueValidator(Decimal('0.999'))],
+        help_text="Probabilidade de não haver rutura durante o prazo de entrega"
+    )
+    dias_cobertura = models.PositiveIntegerField(default=7, help_text="Dias de procura cobertos além do ponto de encomenda")
+
+    # Resultados
+    estado = models.CharField(max_length=15, choices=ESTADO_CHOICES, default='pendente')
+    produtos_analisados = models.PositiveIntegerField(default=0)
+    lojas_analisadas = models.PositiveIntegerField(default=0)
+    produtos_a_repor = models.PositiveIntegerField(default=0)
+    pedidos_gerados = models.PositiveIntegerField(default=0)
+    valor_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    duracao_segundos = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
+    mensagem_erro = models.TextField(blank=True)
+
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Plano de Reposição"
+        verbose_name_plural = "Planos de Reposição"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Plano de reposição {self.pk} ({self.get_estado_display()})"
+
+    @property
+    def em_andamento(self):
+        return self.estado in ('pendente', 'processando')
+
+
 class DocumentoFornecedor(models.Model):
     TIPO_DOCUMENTO_CHOICES = [
         ('NIF', 'NIF'),
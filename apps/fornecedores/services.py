@@ -0,0 +1,670 @@
+# apps/fornecedores/services.py
+"""
+Scorecards de fornecedores (ScorecardFornecedor): indicadores por
+fornecedor e mês materializados a partir de Pedido/ItemPedido/Avaliação.
+
+As gravações marcam a célula (fornecedor, mês) afetada; as células marcadas
+numa transação são recalculadas uma única vez depois do commit. A
+reconstrução completa corre diariamente e corrige qualquer desvio.
+
+Planeador de reposição (ReposicaoService): necessidade de compra de todo o
+catálogo calculada num único passo vetorizado e convertida em pedidos em
+rascunho por fornecedor.
+"""
+import logging
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from statistics import NormalDist
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+
+from apps.core.models import Loja, Usuario
+from apps.produtos.models import Produto
+from apps.vendas.models import ItemVenda
+from .models import AvaliacaoFornecedor, Fornecedor, ItemPedido, Pedido, ScorecardFornecedor
+
+logger = logging.getLogger(__name__)
+
+# Pedidos que contam como compra efetiva
+STATUS_COMPRA = ('aprovado', 'em_producao', 'em_transito', 'recebido_parcial', 'recebido', 'finalizado')
+
+CAMPOS_SCORECARD = [
+    'empresa', 'total_pedidos', 'total_comprado', 'entregas', 'entregas_no_prazo', 'dias_atraso',
+    'quantidade_recebida', 'quantidade_devolvida', 'avaliacoes', 'soma_notas', 'atualizado_em',
+]
+
+
+def inicio_mes(data):
+    return date(data.year, data.month, 1)
+
+
+def proximo_mes(data):
+    return date(data.year + (data.month == 12), data.month % 12 + 1, 1)
+
+
+class ScorecardFornecedorService:
+    """Materialização e leitura dos scorecards de fornecedores"""
+
+    # =====================================
+    # MARCAÇÃO (caminhos de escrita)
+    # =====================================
+
+    @classmethod
+    def marcar(cls, fornecedor_id, data):
+        """Marca a célula (fornecedor, mês) para recálculo após o commit"""
+        if not fornecedor_id or not data:
+            return
+        conexao = transaction.get_connection()
+        pendentes = conexao.__dict__.setdefault('_scorecards_pendentes', set())
+        pendentes.add((fornecedor_id, inicio_mes(data)))
+        # Vários callbacks por transação: o primeiro processa tudo, os restantes encontram o conjunto vazio
+        transaction.on_commit(cls._processar_pendentes, robust=True)
+
+    @classmethod
+    def _processar_pendentes(cls):
+        conexao = transaction.get_connection()
+        pendentes = conexao.__dict__.pop('_scorecards_pendentes', None)
+        if pendentes:
+            cls.recalcular_celulas(pendentes)
+
+    # =====================================
+    # RECÁLCULO
+    # =====================================
+
+    @classmethod
+    def recalcular_celulas(cls, celulas):
+        """Recalcula as células (fornecedor_id, mês) indicadas"""
+        celulas = {(fornecedor_id, inicio_mes(mes)) for fornecedor_id, mes in celulas}
+        if not celulas:
+            return 0
+
+        def filtro(prefixo=''):
+            q = Q()
+            for fornecedor_id, mes in celulas:
+                q |= Q(**{
+                    f'{prefixo}fornecedor_id': fornecedor_id,
+                    f'{prefixo}data_pedido__gte': mes,
+                    f'{prefixo}data_pedido__lt': proximo_mes(mes),
+                })
+            return q
+
+        fornecedor_ids = {fornecedor_id for fornecedor_id, _ in celulas}
+        return cls._materializar(filtro, fornecedor_ids, celulas=celulas)
+
+    @classmethod
+    def recalcular_fornecedores(cls, fornecedor_ids):
+        """Recalcula todos os meses dos fornecedores indicados"""
+        fornecedor_ids = set(fornecedor_ids)
+        if not fornecedor_ids:
+            return 0
+        return cls._materializar(
+            lambda prefixo='': Q(**{f'{prefixo}fornecedor_id__in': fornecedor_ids}),
+            fornecedor_ids,
+        )
+
+    @classmethod
+    def reconstruir(cls, empresa):
+        """Reconstrói os scorecards de todos os fornecedores da empresa"""
+        fornecedor_ids = set(Fornecedor.objects.filter(empresa=empresa).values_list('id', flat=True))
+        return cls.recalcular_fornecedores(fornecedor_ids)
+
+    @classmethod
+    def _agregar(cls, filtro):
+        """Agrega pedidos, itens e avaliações por (fornecedor, mês) em quatro queries"""
+        celulas = {}
+
+        def celula(fornecedor_id, mes):
+            return celulas.setdefault((fornecedor_id, mes), {
+                'total_pedidos': 0, 'total_comprado': Decimal('0.00'),
+                'entregas': 0, 'entregas_no_prazo': 0, 'dias_atraso': 0,
+                'quantidade_recebida': 0, 'quantidade_devolvida': 0,
+                'avaliacoes': 0, 'soma_notas': Decimal('0.00'),
+            })
+
+        pedidos = Pedido.objects.filter(filtro()).annotate(mes=TruncMonth('data_pedido'))
+        for linha in (
+            pedidos.filter(status__in=STATUS_COMPRA).values('fornecedor_id', 'mes')
+            .annotate(n=Count('id'), total=Sum('total')).order_by()
+        ):
+            dados = celula(linha['fornecedor_id'], linha['mes'])
+            dados['total_pedidos'] = linha['n']
+            dados['total_comprado'] = linha['total'] or Decimal('0.00')
+
+        entregas = pedidos.filter(
+            data_entrega_real__isnull=False, data_entrega_prevista__isnull=False,
+        ).exclude(status='cancelado').values_list('fornecedor_id', 'mes', 'data_entrega_prevista', 'data_entrega_real')
+        for fornecedor_id, mes, prevista, real in entregas.iterator():
+            dados = celula(fornecedor_id, mes)
+            dados['entregas'] += 1
+            atraso = (real - prevista).days
+            if atraso <= 0:
+                dados['entregas_no_prazo'] += 1
+            else:
+                dados['dias_atraso'] += atraso
+
+        itens = (
+            ItemPedido.objects.filter(filtro('pedido__'), quantidade_recebida__gt=0)
+            .annotate(mes=TruncMonth('pedido__data_pedido'))
+            .values('pedido__fornecedor_id', 'mes')
+            .annotate(recebida=Sum('quantidade_recebida'), devolvida=Sum('quantidade_devolvida'))
+            .order_by()
+        )
+        for linha in itens:
+            dados = celula(linha['pedido__fornecedor_id'], linha['mes'])
+            dados['quantidade_recebida'] = linha['recebida'] or 0
+            dados['quantidade_devolvida'] = linha['devolvida'] or 0
+
+        avaliacoes = (
+            AvaliacaoFornecedor.objects.filter(filtro('pedido__'))
+            .annotate(mes=TruncMonth('pedido__data_pedido'))
+            .values('fornecedor_id', 'mes')
+            .annotate(n=Count('id'), soma=Sum('nota_geral'))
+            .order_by()
+        )
+        for linha in avaliacoes:
+            dados = celula(linha['fornecedor_id'], linha['mes'])
+            dados['avaliacoes'] = linha['n']
+            dados['soma_notas'] = linha['soma'] or Decimal('0.00')
+
+        return celulas
+
+    @classmethod
+    def _materializar(cls, filtro, fornecedor_ids, celulas=None):
+        dados = cls._agregar(filtro)
+        empresas = dict(Fornecedor.objects.filter(pk__in=fornecedor_ids).values_list('id', 'empresa_id'))
+        agora = timezone.now()
+        registros = [
+            ScorecardFornecedor(
+                empresa_id=empresas[fornecedor_id], fornecedor_id=fornecedor_id, mes=mes,
+                atualizado_em=agora, **valores,
+            )
+            for (fornecedor_id, mes), valores in dados.items()
+            if fornecedor_id in empresas
+        ]
+
+        with transaction.atomic():
+            # Células sem dados (pedido movido/cancelado/eliminado) deixam de existir
+            if celulas is not None:
+                vazias = [celula for celula in celulas if celula not in dados]
+            else:
+                vazias = [
+                    (fornecedor_id, mes) for fornecedor_id, mes in
+                    ScorecardFornecedor.objects.filter(fornecedor_id__in=fornecedor_ids).values_list('fornecedor_id', 'mes')
+                    if (fornecedor_id, mes) not in dados
+                ]
+            if vazias:
+                ScorecardFornecedor.objects.filter(
+                    Q(*[Q(fornecedor_id=f, mes=m) for f, m in vazias], _connector=Q.OR)
+                ).delete()
+
+            ScorecardFornecedor.objects.bulk_create(
+                registros,
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=['fornecedor', 'mes'],
+                update_fields=CAMPOS_SCORECARD,
+            )
+            cls._atualizar_indicadores(fornecedor_ids)
+        return len(registros)
+
+    @classmethod
+    def _atualizar_indicadores(cls, fornecedor_ids):
+        """Nota, pontualidade, qualidade e datas de pedido do fornecedor a partir dos scorecards"""
+        totais = {
+            linha['fornecedor_id']: linha
+            for linha in ScorecardFornecedor.objects.filter(fornecedor_id__in=fornecedor_ids)
+            .values('fornecedor_id')
+            .annotate(
+                entregas=Sum('entregas'), no_prazo=Sum('entregas_no_prazo'),
+                recebida=Sum('quantidade_recebida'), devolvida=Sum('quantidade_devolvida'),
+                avaliacoes=Sum('avaliacoes'), soma_notas=Sum('soma_notas'),
+            )
+            .order_by()
+        }
+        datas = {
+            linha['fornecedor_id']: linha
+            for linha in Pedido.objects.filter(fornecedor_id__in=fornecedor_ids, status__in=STATUS_COMPRA)
+            .values('fornecedor_id').annotate(primeiro=Min('data_pedido'), ultimo=Max('data_pedido')).order_by()
+        }
+
+        fornecedores = list(Fornecedor.objects.filter(pk__in=fornecedor_ids).only(
+            'id', 'nota_avaliacao', 'pontualidade_entrega', 'qualidade_produtos',
+            'data_primeiro_pedido', 'data_ultimo_pedido',
+        ))
+        for fornecedor in fornecedores:
+            linha = totais.get(fornecedor.pk, {})
+            if linha.get('avaliacoes'):
+                fornecedor.nota_avaliacao = round(linha['soma_notas'] / linha['avaliacoes'], 2)
+            else:
+                fornecedor.nota_avaliacao = None
+            if linha.get('entregas'):
+                fornecedor.pontualidade_entrega = round(Decimal(linha['no_prazo']) * 100 / linha['entregas'], 2)
+            else:
+                fornecedor.pontualidade_entrega = Decimal('0.00')
+            if linha.get('recebida'):
+                fornecedor.qualidade_produtos = round(
+                    10 - Decimal(linha['devolvida']) * 10 / linha['recebida'], 2
+                )
+            else:
+                fornecedor.qualidade_produtos = None
+            fornecedor.data_primeiro_pedido = datas.get(fornecedor.pk, {}).get('primeiro')
+            fornecedor.data_ultimo_pedido = datas.get(fornecedor.pk, {}).get('ultimo')
+        Fornecedor.objects.bulk_update(fornecedores, [
+            'nota_avaliacao', 'pontualidade_entrega', 'qualidade_produtos',
+            'data_primeiro_pedido', 'data_ultimo_pedido',
+        ])
+
+    # =====================================
+    # LEITURA
+    # =====================================
+
+    @staticmethod
+    def anotar(queryset, desde=None):
+        """Anota totais de pedidos/compras (lidos pelas propriedades do Fornecedor) num único JOIN"""
+        filtro = Q(scorecards__mes__gte=inicio_mes(desde)) if desde else Q()
+        return queryset.annotate(
+            pedidos_scorecard=Sum('scorecards__total_pedidos', filter=filtro),
+            comprado_scorecard=Sum('scorecards__total_comprado', filter=filtro),
+        )
+
+    @staticmethod
+    def resumo(empresa, data_inicio=None, data_fim=None):
+        """
+        Indicadores por fornecedor no período (meses que intersetam o
+        intervalo): pedidos, compras, % no prazo, atraso médio, % de
+        defeitos e avaliação média.
+        """
+        scorecards = ScorecardFornecedor.objects.filter(empresa=empresa)
+        if data_inicio:
+            scorecards = scorecards.filter(mes__gte=inicio_mes(data_inicio))
+        if data_fim:
+            scorecards = scorecards.filter(mes__lte=data_fim)
+        linhas = (
+            scorecards.values('fornecedor_id', 'fornecedor__razao_social', 'fornecedor__nome_fantasia')
+            .annotate(
+                total_pedidos=Sum('total_pedidos'), total_comprado=Sum('total_comprado'),
+                entregas=Sum('entregas'), entregas_no_prazo=Sum('entregas_no_prazo'),
+                dias_atraso=Sum('dias_atraso'),
+                quantidade_recebida=Sum('quantidade_recebida'), quantidade_devolvida=Sum('quantidade_devolvida'),
+                avaliacoes=Sum('avaliacoes'), soma_notas=Sum('soma_notas'),
+            )
+            .order_by('-total_comprado')
+        )
+
+        resultado = []
+        for linha in linhas:
+            entregas = linha['entregas'] or 0
+            recebida = linha['quantidade_recebida'] or 0
+            linha['fornecedor'] = linha['fornecedor__nome_fantasia'] or linha['fornecedor__razao_social']
+            linha['percentual_no_prazo'] = (
+                round(Decimal(linha['entregas_no_prazo']) * 100 / entregas, 2) if entregas else None
+            )
+            linha['atraso_medio'] = round(Decimal(linha['dias_atraso']) / entregas, 2) if entregas else None
+            linha['percentual_defeitos'] = (
+                round(Decimal(linha['quantidade_devolvida']) * 100 / recebida, 2) if recebida else None
+            )
+            linha['avaliacao_media'] = (
+                round(linha['soma_notas'] / linha['avaliacoes'], 2) if linha['avaliacoes'] else None
+            )
+            resultado.append(linha)
+        return resultado
+
+
+# =====================================
+# REPOSIÇÃO
+# =====================================
+
+# Vendas que contam como procura
+STATUS_VENDA_PROCURA = ('finalizada', 'entregue')
+
+# Pedidos enviados ao fornecedor e ainda por receber (stock em trânsito)
+STATUS_EM_ENCOMENDA = ('enviado', 'confirmado', 'aprovado', 'em_producao', 'em_transito', 'recebido_parcial')
+
+# Pedidos cujo prazo de entrega real entra no lead time
+STATUS_RECEBIDO = ('recebido_parcial', 'recebido', 'finalizado')
+
+
+def calcular_necessidades(soma, soma_quadrados, dias, lead_media, lead_desvio, estoque, em_encomenda,
+                          estoque_minimo, estoque_maximo, z, dias_cobertura):
+    """
+    Núcleo vetorizado do planeador (sem acesso à base de dados).
+
+    ``soma``/``soma_quadrados`` são matrizes produtos × lojas com a soma das
+    vendas diárias e dos seus quadrados na janela de ``dias``; os restantes
+    argumentos são vetores por produto. Para cada (produto, loja):
+
+        stock de segurança = z · √(L·σ² + μ²·σL²)
+        ponto de encomenda = μ·L + stock de segurança
+        nível alvo         = ponto de encomenda + μ·dias_cobertura
+
+    O stock é gerido por empresa, por isso a posição (stock + em encomenda)
+    é comparada com a soma das lojas. Repõe-se até ao nível alvo (nunca
+    abaixo do ``estoque_minimo``) quando a posição está no ponto de
+    encomenda ou abaixo do mínimo, sem ultrapassar o ``estoque_maximo``
+    (``estoque_maximo`` <= 0 = sem limite).
+
+    Devolve ``(quantidade, alvo)``: unidades inteiras a encomendar por
+    produto e a matriz de níveis alvo por loja (usada na distribuição).
+    """
+    media = soma / dias
+    variancia = np.maximum(soma_quadrados / dias - media ** 2, 0.0)
+    lead = lead_media[:, None]
+    desvio_lead = lead_desvio[:, None]
+
+    seguranca = z * np.sqrt(lead * variancia + media ** 2 * desvio_lead ** 2)
+    ponto_encomenda = media * lead + seguranca
+    alvo = ponto_encomenda + media * dias_cobertura
+
+    posicao = estoque + em_encomenda
+    repor = (posicao <= ponto_encomenda.sum(axis=1)) | (posicao < estoque_minimo)
+    quantidade = np.where(repor, np.maximum(alvo.sum(axis=1), estoque_minimo) - posicao, 0.0)
+
+    teto = np.where(estoque_maximo > 0, np.floor(np.maximum(estoque_maximo - posicao, 0.0)), np.inf)
+    quantidade = np.minimum(np.ceil(np.maximum(quantidade, 0.0)), teto)
+    return quantidade.astype(np.int64), alvo
+
+
+class ReposicaoService:
+    """
+    Planeador de reposição da empresa.
+
+    Lê o catálogo, as vendas diárias por (produto, loja), os prazos de
+    entrega reais por fornecedor e as quantidades em encomenda com uma
+    consulta agregada cada, monta matrizes NumPy e calcula a necessidade de
+    todo o catálogo num único passo (``calcular_necessidades``). As
+    quantidades a encomendar são gravadas como pedidos em rascunho, um por
+    fornecedor, substituindo os rascunhos gerados por planos anteriores.
+    """
+
+    # Os mesmos limites dos validadores de PlanoReposicao.nivel_servico, que
+    # não são aplicados a planos criados por código (task, admin)
+    NIVEL_SERVICO_MINIMO = 0.5
+    NIVEL_SERVICO_MAXIMO = 0.999
+
+    def __init__(self, plano):
+        self.plano = plano
+        self.empresa = plano.empresa
+
+    @classmethod
+    def fator_seguranca(cls, nivel_servico):
+        """Quantil normal do nível de serviço, limitado ao intervalo aceite (inv_cdf falha em 0 e 1)"""
+        nivel = min(max(float(nivel_servico), cls.NIVEL_SERVICO_MINIMO), cls.NIVEL_SERVICO_MAXIMO)
+        return NormalDist().inv_cdf(nivel)
+
+    # ------------------------------
+    # Leitura (uma consulta por fonte)
+    # ------------------------------
+    def _catalogo(self):
+        linhas = list(
+            Produto.objects.filter(
+                empresa=self.empresa, ativo=True,
+                fornecedor__isnull=False, fornecedor__ativo=True, fornecedor__bloqueado=False,
+            )
+            .order_by('id')
+            .values_list('id', 'fornecedor_id', 'estoque_atual', 'estoque_minimo', 'estoque_maximo', 'preco_custo')
+        )
+        colunas = np.array(linhas, dtype=np.float64).reshape(-1, 6)
+        return {
+            'id': colunas[:, 0].astype(np.int64),
+            'fornecedor_id': colunas[:, 1].astype(np.int64),
+            'estoque': colunas[:, 2],
+            'estoque_minimo': colunas[:, 3],
+            'estoque_maximo': colunas[:, 4],
+            'preco_custo': colunas[:, 5],
+        }
+
+    @staticmethod
+    def _indices(ids_ordenados, valores):
+        """Posição de cada valor no vetor ordenado de ids (-1 se não existir)"""
+        if not len(ids_ordenados):
+            return np.full(len(valores), -1, dtype=np.int64)
+        posicoes = np.searchsorted(ids_ordenados, valores)
+        posicoes = np.minimum(posicoes, len(ids_ordenados) - 1)
+        return np.where(ids_ordenados[posicoes] == valores, posicoes, -1)
+
+    def _vendas(self, produto_ids, loja_ids, inicio):
+        """Somas das vendas diárias e dos seus quadrados por (produto, loja); última coluna = sem loja"""
+        linhas = list(
+            ItemVenda.objects.filter(
+                venda__empresa=self.empresa,
+                venda__status__in=STATUS_VENDA_PROCURA,
+                venda__data_venda__gte=inicio,
+                produto__isnull=False,
+            )
+            .annotate(dia=TruncDate('venda__data_venda'), loja=Coalesce('venda__loja_id', 0))
+            .values('produto_id', 'loja', 'dia')
+            .annotate(quantidade_dia=Sum('quantidade'))
+            .values_list('produto_id', 'loja', 'quantidade_dia')
+            .order_by()
+        )
+        forma = (len(produto_ids), len(loja_ids) + 1)
+        soma = np.zeros(forma)
+        soma_quadrados = np.zeros(forma)
+        if not linhas:
+            return soma, soma_quadrados
+
+        dados = np.array(linhas, dtype=np.float64)
+        linha = self._indices(produto_ids, dados[:, 0].astype(np.int64))
+        coluna = self._indices(loja_ids, dados[:, 1].astype(np.int64))
+        coluna = np.where(coluna < 0, len(loja_ids), coluna)
+        validos = linha >= 0
+        celula = linha[validos] * forma[1] + coluna[validos]
+        quantidade = dados[validos, 2]
+        tamanho = forma[0] * forma[1]
+        soma = np.bincount(celula, weights=quantidade, minlength=tamanho).reshape(forma)
+        soma_quadrados = np.bincount(celula, weights=quantidade ** 2, minlength=tamanho).reshape(forma)
+        return soma, soma_quadrados
+
+    def _lead_times(self, fornecedor_ids):
+        """Média e desvio do prazo real (dias) por fornecedor; sem histórico usa ``prazo_entrega_dias``"""
+        prazos = dict(Fornecedor.objects.filter(id__in=fornecedor_ids.tolist()).values_list('id', 'prazo_entrega_dias'))
+        media = np.array([max(prazos.get(fid, 0) or 0, 1) for fid in fornecedor_ids], dtype=np.float64)
+        desvio = np.zeros(len(fornecedor_ids))
+
+        entregas = list(
+            Pedido.objects.filter(
+                empresa=self.empresa,
+                fornecedor_id__in=fornecedor_ids.tolist(),
+                status__in=STATUS_RECEBIDO,
+                data_entrega_real__isnull=False,
+                data_entrega_real__gte=timezone.localdate() - timedelta(days=365),
+            ).values_list('fornecedor_id', 'data_pedido', 'data_entrega_real')
+        )
+        if not entregas:
+            return media, desvio
+
+        indice = self._indices(fornecedor_ids, np.array([e[0] for e in entregas], dtype=np.int64))
+        dias = np.array([max((fim - inicio).days, 0) for _, inicio, fim in entregas], dtype=np.float64)
+        n = np.bincount(indice, minlength=len(fornecedor_ids))
+        soma = np.bincount(indice, weights=dias, minlength=len(fornecedor_ids))
+        soma_quadrados = np.bincount(indice, weights=dias ** 2, minlength=len(fornecedor_ids))
+
+        com_historico = n > 0
+        media_real = np.divide(soma, n, out=np.zeros_like(soma), where=com_historico)
+        variancia = np.divide(soma_quadrados, n, out=np.zeros_like(soma), where=com_historico) - media_real ** 2
+        media = np.where(com_historico, np.maximum(media_real, 1.0), media)
+        desvio = np.where(n > 1, np.sqrt(np.maximum(variancia, 0.0)), 0.0)
+        return media, desvio
+
+    def _em_encomenda(self, produto_ids):
+        em_encomenda = np.zeros(len(produto_ids))
+        linhas = list(
+            ItemPedido.objects.filter(
+                pedido__empresa=self.empresa,
+                pedido__status__in=STATUS_EM_ENCOMENDA,
+            )
+            .values('produto_id')
+            .annotate(pendente=Sum(F('quantidade') - F('quantidade_recebida')))
+            .values_list('produto_id', 'pendente')
+            .order_by()
+        )
+        if linhas:
+            dados = np.array(linhas, dtype=np.float64)
+            indice = self._indices(produto_ids, dados[:, 0].astype(np.int64))
+            validos = indice >= 0
+            np.add.at(em_encomenda, indice[validos], np.maximum(dados[validos, 1], 0.0))
+        return em_encomenda
+
+    def _solicitante(self):
+        if self.plano.solicitante_id:
+            return self.plano.solicitante
+        return (
+            Usuario.objects.filter(empresa=self.empresa, is_active=True)
+            .order_by('-e_administrador_empresa', '-is_superuser', 'id')
+            .first()
+        )
+
+    # ------------------------------
+    # Cálculo
+    # ------------------------------
+    def calcular(self):
+        """
+        Necessidade de todo o catálogo. Devolve um dicionário de vetores
+        (apenas produtos a repor) e as lojas consideradas.
+        """
+        plano = self.plano
+        catalogo = self._catalogo()
+        produto_ids = catalogo['id']
+        lojas = list(Loja.objects.filter(empresa=self.empresa).order_by('id').values_list('id', 'nome'))
+        loja_ids = np.array([loja_id for loja_id, _ in lojas], dtype=np.int64)
+
+        inicio = timezone.now() - timedelta(days=plano.dias_historico)
+        soma, soma_quadrados = self._vendas(produto_ids, loja_ids, inicio)
+
+        fornecedor_ids, fornecedor_produto = np.unique(catalogo['fornecedor_id'], return_inverse=True)
+        lead_media, lead_desvio = self._lead_times(fornecedor_ids)
+        em_encomenda = self._em_encomenda(produto_ids)
+
+        quantidade, alvo = calcular_necessidades(
+            soma, soma_quadrados, plano.dias_historico,
+            lead_media[fornecedor_produto], lead_desvio[fornecedor_produto],
+            catalogo['estoque'], em_encomenda,
+            catalogo['estoque_minimo'], catalogo['estoque_maximo'],
+            self.fator_seguranca(plano.nivel_servico), plano.dias_cobertura,
+        )
+
+        repor = quantidade > 0
+        # Distribuição da quantidade pelas lojas, proporcional ao nível alvo de cada uma
+        alvo = alvo[repor]
+        total_alvo = alvo.sum(axis=1, keepdims=True)
+        distribuicao = np.round(
+            np.divide(alvo, total_alvo, out=np.zeros_like(alvo), where=total_alvo > 0) * quantidade[repor, None]
+        ).astype(np.int64)
+
+        return {
+            'produto_id': produto_ids[repor],
+            'fornecedor_id': catalogo['fornecedor_id'][repor],
+            'quantidade': quantidade[repor],
+            'preco_custo': catalogo['preco_custo'][repor],
+            'rutura': (catalogo['estoque'] + em_encomenda)[repor] <= 0,
+            'lead_time': lead_media[fornecedor_produto][repor],
+            'distribuicao': distribuicao,
+            'produtos_analisados': len(produto_ids),
+        }, lojas
+
+    # ------------------------------
+    # Gravação
+    # ------------------------------
+    def _observacao_lojas(self, linha, lojas):
+        nomes = [nome for _, nome in lojas] + ['Sem loja']
+        partes = [f"{nomes[j]}: {int(q)}" for j, q in enumerate(linha) if q > 0]
+        return f"Distribuição por loja: {', '.join(partes)}" if partes else ''
+
+    @transaction.atomic
+    def gerar_pedidos(self, necessidades, lojas):
+        """Substitui os rascunhos de planos anteriores por um pedido por fornecedor"""
+        Pedido.objects.filter(
+            empresa=self.empresa, status='rascunho', plano_reposicao__isnull=False,
+        ).delete()
+        if not len(necessidades['produto_id']):
+            return 0, Decimal('0.00')
+
+        solicitante = self._solicitante()
+        if solicitante is None:
+            raise ValueError("A empresa não tem utilizadores ativos para figurar como solicitante dos pedidos")
+
+        hoje = timezone.localdate()
+        ordem = np.argsort(necessidades['fornecedor_id'], kind='stable')
+        fornecedores, inicios = np.unique(necessidades['fornecedor_id'][ordem], return_index=True)
+        grupos = np.split(ordem, inicios[1:])
+
+        itens = []
+        valor_total = Decimal('0.00')
+        for fornecedor_id, grupo in zip(fornecedores.tolist(), grupos):
+            linhas = []
+            subtotal = Decimal('0.00')
+            for i in grupo.tolist():
+                preco = Decimal(str(necessidades['preco_custo'][i])).quantize(Decimal('0.01'))
+                quantidade = int(necessidades['quantidade'][i])
+                total = preco * quantidade
+                subtotal += total
+                linhas.append(ItemPedido(
+                    produto_id=int(necessidades['produto_id'][i]),
+                    quantidade=quantidade,
+                    preco_unitario=preco,
+                    preco_custo_atual=preco,
+                    desconto_item=Decimal('0'),
+                    total=total,
+                    observacoes=self._observacao_lojas(necessidades['distribuicao'][i], lojas),
+                ))
+
+            pedido = Pedido(
+                empresa=self.empresa,
+                fornecedor_id=fornecedor_id,
+                solicitante=solicitante,
+                plano_reposicao=self.plano,
+                status='rascunho',
+                urgencia='urgente' if necessidades['rutura'][grupo].any() else 'normal',
+                data_entrega_prevista=hoje + timedelta(days=int(round(necessidades['lead_time'][grupo[0]]))),
+                subtotal=subtotal,
+                observacoes_internas=f"Gerado pelo plano de reposição {self.plano.pk}",
+            )
+            # Pedido novo: calcular_totais mantém o subtotal e deriva o total
+            pedido.save()
+            for item in linhas:
+                item.pedido = pedido
+            itens.extend(linhas)
+            valor_total += pedido.total
+
+        # bulk_create: ItemPedido.save regravaria o pedido a cada item
+        ItemPedido.objects.bulk_create(itens, batch_size=1000)
+        return len(fornecedores), valor_total
+
+    def executar(self):
+        plano = self.plano
+        plano.estado = 'processando'
+        plano.iniciado_em = timezone.now()
+        plano.save(update_fields=['estado', 'iniciado_em', 'updated_at'])
+        inicio = time.monotonic()
+
+        try:
+            necessidades, lojas = self.calcular()
+            pedidos, valor_total = self.gerar_pedidos(necessidades, lojas)
+        except Exception as e:
+            logger.exception(f"Erro no plano de reposição {plano.pk}: {e}")
+            plano.estado = 'falhou'
+            plano.mensagem_erro = str(e)
+            plano.concluido_em = timezone.now()
+            plano.duracao_segundos = round(Decimal(time.monotonic() - inicio), 2)
+            plano.save(update_fields=['estado', 'mensagem_erro', 'concluido_em', 'duracao_segundos', 'updated_at'])
+            raise
+
+        plano.estado = 'concluido'
+        plano.produtos_analisados = necessidades['produtos_analisados']
+        plano.lojas_analisadas = len(lojas)
+        plano.produtos_a_repor = len(necessidades['produto_id'])
+        plano.pedidos_gerados = pedidos
+        plano.valor_total = valor_total
+        plano.concluido_em = timezone.now()
+        plano.duracao_segundos = round(Decimal(time.monotonic() - inicio), 2)
+        plano.save()
+        logger.info(
+            f"Plano de reposição {plano.pk}: {plano.produtos_a_repor}/{plano.produtos_analisados} produtos "
+            f"a repor em {pedidos} pedidos ({plano.duracao_segundos}s)"
+        )
+        return plano
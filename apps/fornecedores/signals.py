@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.fornecedores.models import AvaliacaoFornecedor, ItemPedido, Pedido
+from apps.fornecedores.services import ScorecardFornecedorService
+
+
+@receiver(post_save, sender=Pedido)
+@receiver(post_delete, sender=Pedido)
+def marcar_scorecard_pedido(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ScorecardFornecedorService.marcar(instance.fornecedor_id, instance.data_pedido)
+    anterior = getattr(instance, '_celula_scorecard', None)
+    if anterior and anterior != (instance.fornecedor_id, instance.data_pedido):
+        ScorecardFornecedorService.marcar(*anterior)
+    instance._celula_scorecard = (instance.fornecedor_id, instance.data_pedido)
+
+
+@receiver(post_delete, sender=ItemPedido)
+def marcar_scorecard_item(sender, instance, **kwargs):
+    # A gravação de itens já grava o pedido; a eliminação não
+    pedido = Pedido.objects.filter(pk=instance.pedido_id).values_list('fornecedor_id', 'data_pedido').first()
+    if pedido:
+        ScorecardFornecedorService.marcar(*pedido)
+
+
+@receiver(post_save, sender=AvaliacaoFornecedor)
+@receiver(post_delete, sender=AvaliacaoFornecedor)
+def marcar_scorecard_avaliacao(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    pedido = Pedido.objects.filter(pk=instance.pedido_id).values_list('fornecedor_id', 'data_pedido').first()
+    if pedido:
+        ScorecardFornecedorService.marcar(*pedido)
@@ -0,0 +1,54 @@
+# apps/fornecedores/tasks.py
+import logging
+
+from celery import shared_task
+
+from apps.core.models import Empresa
+from .models import PlanoReposicao
+from .services import ReposicaoService, ScorecardFornecedorService
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def reconstruir_scorecards_fornecedores_task(empresa_id=None):
+    """Reconstrói os scorecards de fornecedores (corrige desvios das atualizações por célula)"""
+    empresas = Empresa.objects.filter(ativa=True)
+    if empresa_id:
+        empresas = empresas.filter(pk=empresa_id)
+    total = 0
+    for empresa in empresas:
+        try:
+            total += ScorecardFornecedorService.reconstruir(empresa)
+        except Exception as e:
+            logger.error(f'Erro ao reconstruir scorecards de fornecedores da empresa {empresa.id}: {e}')
+    logger.info(f'Scorecards de fornecedores reconstruídos: {total} células')
+    return total
+
+
+@shared_task
+def gerar_planos_reposicao_task(empresa_id=None):
+    """Executa o planeador de reposição e gera pedidos em rascunho por fornecedor"""
+    empresas = Empresa.objects.filter(ativa=True)
+    if empresa_id:
+        empresas = empresas.filter(pk=empresa_id)
+    pedidos = 0
+    for empresa in empresas:
+        plano = PlanoReposicao.objects.create(empresa=empresa)
+        try:
+            pedidos += ReposicaoService(plano).executar().pedidos_gerados
+        except Exception as e:
+            logger.error(f'Erro no plano de reposição da empresa {empresa.id}: {e}')
+    logger.info(f'Planos de reposição concluídos: {pedidos} pedidos em rascunho')
+    return pedidos
+
+
+@shared_task
+def executar_plano_reposicao_task(plano_id):
+    """Executa um plano de reposição pedido manualmente"""
+    plano = PlanoReposicao.objects.select_related('empresa', 'solicitante').get(pk=plano_id)
+    if plano.estado != 'pendente':
+        logger.warning(f'Plano de reposição {plano_id} já processado ({plano.estado})')
+        return plano.estado
+    plano = ReposicaoService(plano).executar()
+    return {'plano_id': plano.pk, 'pedidos': plano.pedidos_gerados, 'produtos': plano.produtos_a_repor}
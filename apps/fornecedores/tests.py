@@ -1,3 +1,201 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+
+from apps.core.models import Empresa
+from apps.fornecedores.models import (
+    AvaliacaoFornecedor, Fornecedor, ItemPedido, Pedido, PlanoReposicao, ScorecardFornecedor,
+)
+from apps.fornecedores.services import ReposicaoService, ScorecardFornecedorService, calcular_necessidades
+from apps.produtos.models import Produto
+
+
+class FornecedoresTestMixin:
+    """Empresa, utilizador e fornecedor comuns aos testes de compras"""
+
+    @classmethod
+    def criar_estrutura(cls, nif):
+        cls.empresa = Empresa.objects.create(
+            nome='Farmácia Compras', nif=nif, endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email=f'compras{nif}@exemplo.ao',
+        )
+        cls.usuario = get_user_model().objects.create(username=f'compras_{nif}', empresa=cls.empresa)
+
+    @classmethod
+    def criar_fornecedor(cls, indice, **campos):
+        return Fornecedor.objects.create(
+            empresa=cls.empresa, codigo_fornecedor=f'F{cls.empresa.nif}{indice}', razao_social=f'Fornecedor {indice}',
+            nif_bi=f'{int(cls.empresa.nif) + 1000 * indice}', endereco='Rua 1', numero='1', bairro='Centro',
+            cidade='Luanda', provincia='LUA', postal='00000-000', email_principal=f'fornecedor{indice}@exemplo.ao',
+            **campos,
+        )
+
+    @classmethod
+    def criar_produto(cls, indice, fornecedor=None, **campos):
+        return Produto.objects.create(
+            empresa=cls.empresa, fornecedor=fornecedor, codigo_interno=f'C{cls.empresa.nif}{indice}',
+            codigo_barras=f'{cls.empresa.nif}{indice:03d}', nome_produto=f'Produto {indice}',
+            nome_comercial=f'Produto {indice}', preco_custo=Decimal('5'), preco_venda=Decimal('8'),
+            margem_lucro=Decimal('60'), **campos,
+        )
+
+
+class ScorecardFornecedorServiceTest(FornecedoresTestMixin, TestCase):
+    """Scorecards mensais recalculados por célula após o commit"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.criar_estrutura('5000000080')
+        cls.fornecedor = cls.criar_fornecedor(1)
+        cls.produto = cls.criar_produto(1, cls.fornecedor)
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            # Janeiro: uma entrega com 3 dias de atraso e uma no prazo; fevereiro: sem entrega
+            self.atrasado = self._pedido(
+                date(2026, 1, 10), 'recebido', date(2026, 1, 15), date(2026, 1, 18),
+                quantidade=10, preco='5', recebida=10, devolvida=1,
+            )
+            self.no_prazo = self._pedido(
+                date(2026, 1, 20), 'aprovado', date(2026, 1, 25), date(2026, 1, 24), quantidade=4, preco='10',
+            )
+            self.fevereiro = self._pedido(date(2026, 2, 3), 'finalizado', quantidade=2, preco='5')
+            AvaliacaoFornecedor.objects.create(
+                fornecedor=self.fornecedor, pedido=self.atrasado, avaliador=self.usuario,
+                nota_pontualidade=Decimal('6'), nota_qualidade=Decimal('8'),
+                nota_atendimento=Decimal('9'), nota_preco=Decimal('9'),
+            )
+
+    def _pedido(self, data_pedido, status, prevista=None, real=None, *, quantidade, preco, recebida=0, devolvida=0):
+        pedido = Pedido.objects.create(
+            empresa=self.empresa, fornecedor=self.fornecedor, solicitante=self.usuario, data_pedido=data_pedido,
+            status=status, data_entrega_prevista=prevista, data_entrega_real=real,
+        )
+        ItemPedido.objects.create(
+            pedido=pedido, produto=self.produto, quantidade=quantidade, preco_unitario=Decimal(preco),
+            quantidade_recebida=recebida, quantidade_devolvida=devolvida,
+        )
+        return pedido
+
+    def _scorecards(self, *campos):
+        return {
+            linha[0]: linha[1:]
+            for linha in ScorecardFornecedor.objects.filter(fornecedor=self.fornecedor).values_list('mes', *campos)
+        }
+
+    def test_celulas_por_mes(self):
+        janeiro = ScorecardFornecedor.objects.get(fornecedor=self.fornecedor, mes=date(2026, 1, 1))
+
+        self.assertEqual((janeiro.total_pedidos, janeiro.total_comprado), (2, Decimal('90.00')))
+        self.assertEqual((janeiro.entregas, janeiro.entregas_no_prazo, janeiro.dias_atraso), (2, 1, 3))
+        self.assertEqual((janeiro.quantidade_recebida, janeiro.quantidade_devolvida), (10, 1))
+        self.assertEqual((janeiro.avaliacoes, janeiro.soma_notas), (1, Decimal('8.00')))
+        self.assertEqual(self._scorecards('total_pedidos')[date(2026, 2, 1)], (1,))
+
+    def test_indicadores_do_fornecedor(self):
+        fornecedor = Fornecedor.objects.get(pk=self.fornecedor.pk)
+
+        self.assertEqual(fornecedor.nota_avaliacao, Decimal('8.00'))
+        self.assertEqual(fornecedor.pontualidade_entrega, Decimal('50.00'))
+        self.assertEqual(fornecedor.qualidade_produtos, Decimal('9.00'))
+        self.assertEqual((fornecedor.data_primeiro_pedido, fornecedor.data_ultimo_pedido),
+                         (date(2026, 1, 10), date(2026, 2, 3)))
+        self.assertEqual((fornecedor.total_pedidos, fornecedor.total_comprado), (3, Decimal('100.00')))
+
+        anotado = ScorecardFornecedorService.anotar(Fornecedor.objects.filter(pk=self.fornecedor.pk)).get()
+        self.assertEqual((anotado.total_pedidos, anotado.total_comprado), (3, Decimal('100.00')))
+
+    def test_mudanca_de_mes_recalcula_as_duas_celulas(self):
+        pedido = Pedido.objects.get(pk=self.no_prazo.pk)
+        pedido.data_pedido = date(2026, 2, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            pedido.save()
+
+        self.assertEqual(self._scorecards('total_pedidos', 'total_comprado'), {
+            date(2026, 1, 1): (1, Decimal('50.00')),
+            date(2026, 2, 1): (2, Decimal('50.00')),
+        })
+
+    def test_celula_sem_dados_e_removida(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fevereiro.delete()
+
+        self.assertEqual(list(self._scorecards()), [date(2026, 1, 1)])
+
+    def test_reconstruir_corrige_desvios(self):
+        ScorecardFornecedor.objects.filter(fornecedor=self.fornecedor).update(total_pedidos=0, entregas=0)
+
+        ScorecardFornecedorService.reconstruir(self.empresa)
+
+        self.assertEqual(self._scorecards('total_pedidos', 'entregas'), {
+            date(2026, 1, 1): (2, 2),
+            date(2026, 2, 1): (1, 0),
+        })
+
+
+class ReposicaoServiceTest(FornecedoresTestMixin, TestCase):
+    """Necessidades do catálogo e pedidos em rascunho por fornecedor"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.criar_estrutura('5000000081')
+        cls.fornecedor = cls.criar_fornecedor(1, prazo_entrega_dias=5)
+        # Abaixo do mínimo e sem stock; o segundo tem stock suficiente
+        cls.em_rutura = cls.criar_produto(1, cls.fornecedor, estoque_atual=0, estoque_minimo=10, estoque_maximo=0)
+        cls.com_stock = cls.criar_produto(2, cls.fornecedor, estoque_atual=50, estoque_minimo=10)
+        cls.criar_produto(3, estoque_atual=0, estoque_minimo=10)
+
+    def _executar(self):
+        plano = PlanoReposicao.objects.create(empresa=self.empresa, solicitante=self.usuario)
+        return ReposicaoService(plano).executar()
+
+    def _rascunhos(self):
+        return Pedido.objects.filter(empresa=self.empresa, status='rascunho', plano_reposicao__isnull=False)
+
+    def test_calcular_necessidades(self):
+        # Procura constante de 2/dia, prazo de 5 dias: ponto de encomenda 10, alvo 10 + 2·7
+        uns = np.ones(3)
+        quantidade, alvo = calcular_necessidades(
+            soma=np.full((3, 1), 20.0), soma_quadrados=np.full((3, 1), 40.0), dias=10,
+            lead_media=uns * 5, lead_desvio=uns * 0, estoque=np.array([5.0, 50.0, 0.0]), em_encomenda=uns * 0,
+            estoque_minimo=uns, estoque_maximo=np.array([100.0, 100.0, 20.0]), z=1.645, dias_cobertura=7,
+        )
+
+        self.assertEqual(quantidade.tolist(), [19, 0, 20])
+        self.assertEqual(alvo[:, 0].tolist(), [24.0, 24.0, 24.0])
+
+    def test_pedido_em_rascunho_por_fornecedor(self):
+        plano = self._executar()
+
+        self.assertEqual(plano.estado, 'concluido')
+        self.assertEqual((plano.produtos_analisados, plano.produtos_a_repor, plano.pedidos_gerados), (2, 1, 1))
+        self.assertEqual(plano.valor_total, Decimal('50.00'))
+        pedido = self._rascunhos().get()
+        self.assertEqual((pedido.fornecedor_id, pedido.urgencia, pedido.total), (self.fornecedor.pk, 'urgente', Decimal('50.00')))
+        self.assertEqual(pedido.data_entrega_prevista, timezone.localdate() + timedelta(days=5))
+        self.assertEqual(list(pedido.itens.values_list('produto_id', 'quantidade')), [(self.em_rutura.pk, 10)])
+
+    def test_quantidade_em_encomenda_desconta_da_necessidade(self):
+        enviado = Pedido.objects.create(
+            empresa=self.empresa, fornecedor=self.fornecedor, solicitante=self.usuario, status='enviado',
+        )
+        ItemPedido.objects.create(pedido=enviado, produto=self.em_rutura, quantidade=4, preco_unitario=Decimal('5'))
+
+        self._executar()
+
+        item = ItemPedido.objects.select_related('pedido').get(pedido__in=self._rascunhos())
+        self.assertEqual(item.quantidade, 6)
+        # Com unidades em trânsito já não é rutura
+        self.assertEqual(item.pedido.urgencia, 'normal')
+
+    def test_nova_execucao_substitui_so_os_rascunhos_dos_planos(self):
+        manual = Pedido.objects.create(empresa=self.empresa, fornecedor=self.fornecedor, solicitante=self.usuario)
+        self._executar()
+        segundo = self._executar()
 
-# Create your tests here.
+        self.assertEqual(list(self._rascunhos().values_list('plano_reposicao_id', flat=True)), [segundo.pk])
+        self.assertTrue(Pedido.objects.filter(pk=manual.pk).exists())
@@ -17,8 +17,10 @@ from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 
 from .models import (
-    ContatoFornecedor, ContratoFornecedor, CotacaoFornecedor, Fornecedor, Pedido, AvaliacaoFornecedor
+    ContatoFornecedor, ContratoFornecedor, CotacaoFornecedor, Fornecedor, Pedido, AvaliacaoFornecedor,
+    ScorecardFornecedor
 )
+from .services import ScorecardFornecedorService
 from .forms import AvaliacaoForm, ContatoForm, ContratoForm, CotacaoForm, FornecedorForm, PedidoCompraForm
 from .filters import FornecedorFilter, PedidoCompraFilter
 from .api.serializers import (
@@ -68,12 +70,13 @@ class FornecedorViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = FornecedorFilter
     search_fields = ['nome_fantasia', 'razao_social', 'nif', 'email_principal']
-    ordering_fields = ['nome_fantasia', 'avaliacao', 'total_comprado', 'created_at']
+    ordering_fields = ['nome_fantasia', 'nota_avaliacao', 'comprado_scorecard', 'created_at']
     ordering = ['nome_fantasia']
     
     def get_queryset(self):
-        return Fornecedor.objects.filter(
-            empresa=self.request.user.empresa
+        # Totais de pedidos/compras vêm dos scorecards mensais, no mesmo JOIN
+        return ScorecardFornecedorService.anotar(
+            Fornecedor.objects.filter(empresa=self.request.user.empresa)
         ).select_related('empresa').prefetch_related('contatos', 'documentos')
     
     def perform_create(self, serializer):
@@ -86,10 +89,10 @@ class FornecedorViewSet(viewsets.ModelViewSet):
         
         stats = {
             'total_fornecedores': queryset.count(),
-            'fornecedores_ativos': queryset.filter(status='ativo').count(),
-            'fornecedores_inativos': queryset.filter(status='inativo').count(),
-            'fornecedores_bloqueados': queryset.filter(status='bloqueado').count(),
-            'avaliacao_media': queryset.aggregate(Avg('avaliacao'))['avaliacao__avg'] or 0,
+            'fornecedores_ativos': queryset.filter(ativo=True, bloqueado=False).count(),
+            'fornecedores_inativos': queryset.filter(ativo=False).count(),
+            'fornecedores_bloqueados': queryset.filter(bloqueado=True).count(),
+            'avaliacao_media': queryset.aggregate(Avg('nota_avaliacao'))['nota_avaliacao__avg'] or 0,
             'total_comprado_mes': self.get_total_comprado_mes(),
             'pedidos_pendentes': self.get_pedidos_pendentes(),
         }
@@ -99,11 +102,10 @@ class FornecedorViewSet(viewsets.ModelViewSet):
     def get_total_comprado_mes(self):
         """Total comprado no mês atual"""
         inicio_mes = date.today().replace(day=1)
-        return Pedido.objects.filter(
+        return ScorecardFornecedor.objects.filter(
             empresa=self.request.user.empresa,
-            data_pedido__gte=inicio_mes,
-            status='finalizado'
-        ).aggregate(Sum('total'))['total__sum'] or 0
+            mes=inicio_mes,
+        ).aggregate(Sum('total_comprado'))['total_comprado__sum'] or 0
     
     def get_pedidos_pendentes(self):
         """Número de pedidos pendentes"""
@@ -163,9 +165,9 @@ class FornecedorViewSet(viewsets.ModelViewSet):
     def melhores_avaliados(self, request):
         """Fornecedores com melhor avaliação"""
         fornecedores = self.get_queryset().filter(
-            status='ativo',
-            avaliacao__gt=0
-        ).order_by('-avaliacao')[:10]
+            ativo=True,
+            nota_avaliacao__gt=0
+        ).order_by('-nota_avaliacao', '-pontualidade_entrega')[:10]
         
         serializer = self.get_serializer(fornecedores, many=True)
         return Response(serializer.data)
@@ -174,10 +176,12 @@ class FornecedorViewSet(viewsets.ModelViewSet):
     def com_pedidos_atrasados(self, request):
         """Fornecedores com pedidos atrasados"""
         hoje = date.today()
+        # Atraso em aberto depende da data de hoje: consulta direta (uma query, sem N+1)
         fornecedores_ids = Pedido.objects.filter(
             empresa=self.request.user.empresa,
-            status__in=['enviado', 'confirmado', 'entregue_parcial'],
-            data_prevista_entrega__lt=hoje
+            status__in=['enviado', 'confirmado', 'aprovado', 'em_producao', 'em_transito', 'recebido_parcial'],
+            data_entrega_prevista__lt=hoje,
+            data_entrega_real__isnull=True,
         ).values_list('fornecedor_id', flat=True).distinct()
         
         fornecedores = self.get_queryset().filter(id__in=fornecedores_ids)
@@ -302,6 +306,9 @@ class FornecedorListView(EmpresaQuerysetMixin, PermissaoAcaoMixin, ListView):
     template_name = 'fornecedores/fornecedor_list.html'
     context_object_name = 'fornecedores'
 
+    def get_queryset(self):
+        return ScorecardFornecedorService.anotar(super().get_queryset())
+
 
 
 class FornecedorDetailView(EmpresaQuerysetMixin, DetailView):
@@ -495,7 +502,9 @@ class CancelarPedidoView(View):
 class ReceberPedidoView(View):
     def post(self, request, pk):
         pedido = get_object_or_404(Pedido, pk=pk)
-        pedido.status = "RECEBIDO"
+        pedido.status = "recebido"
+        if not pedido.data_entrega_real:
+            pedido.data_entrega_real = date.today()
         pedido.save()
         messages.success(request, "Pedido recebido.")
         return redirect("fornecedores:pedido_detail", pk=pk)
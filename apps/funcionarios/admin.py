@@ -8,7 +8,7 @@ from django.contrib import messages
 from django.contrib.auth.models import User
 from .models import (
     Cargo, Departamento, Funcionario, EscalaTrabalho,
-    RegistroPonto, Capacitacao, AvaliacaoDesempenho
+    RegistroPonto, ResumoPontoDiario, Capacitacao, AvaliacaoDesempenho
 )
 
 from django.contrib import admin
@@ -277,6 +277,21 @@ class RegistroPontoAdmin(admin.ModelAdmin):
     date_hierarchy = 'data_registro'
 
 
+@admin.register(ResumoPontoDiario)
+class ResumoPontoDiarioAdmin(admin.ModelAdmin):
+    list_display = [
+        'funcionario', 'data', 'primeira_entrada', 'ultima_saida', 'minutos_trabalhados',
+        'minutos_extra', 'minutos_atraso', 'turno_aberto'
+    ]
+    list_filter = ['turno_aberto', 'loja', 'data']
+    search_fields = ['funcionario__nome_completo', 'funcionario__matricula']
+    date_hierarchy = 'data'
+    readonly_fields = [
+        'primeira_entrada', 'ultima_saida', 'total_marcacoes', 'turno_aberto', 'minutos_previstos',
+        'minutos_trabalhados', 'minutos_extra', 'minutos_atraso'
+    ]
+
+
 @admin.register(Capacitacao)
 class CapacitacaoAdmin(admin.ModelAdmin):
     list_display = [
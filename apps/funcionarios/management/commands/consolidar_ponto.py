@@ -0,0 +1,56 @@
+# apps/funcionarios/management/commands/consolidar_ponto.py
+
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from apps.core.models import Empresa
+from apps.funcionarios.models import RegistroPonto
+from apps.funcionarios.services import ConsolidacaoPontoService
+
+
+class Command(BaseCommand):
+    help = (
+        'Consolida em ResumoPontoDiario o histórico de marcações (RegistroPonto). '
+        'A tarefa diária só reconsolida os últimos dias; este comando preenche o '
+        'histórico, por omissão desde a primeira marcação de cada empresa, em '
+        'blocos de dias.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID da empresa (por omissão todas as ativas)')
+        parser.add_argument('--desde', type=date.fromisoformat, help='Data inicial (AAAA-MM-DD)')
+        parser.add_argument('--ate', type=date.fromisoformat, help='Data final (por omissão hoje)')
+        parser.add_argument('--dias-bloco', type=int, default=31, help='Dias consolidados de cada vez')
+
+    def handle(self, *args, **options):
+        empresas = Empresa.objects.filter(ativa=True)
+        if options['empresa']:
+            empresas = Empresa.objects.filter(pk=options['empresa'])
+            if not empresas.exists():
+                raise CommandError('Empresa não encontrada')
+
+        data_fim = options['ate'] or timezone.now().date()
+        bloco = max(options['dias_bloco'], 1)
+        total_geral = 0
+
+        for empresa in empresas:
+            data_inicio = options['desde'] or RegistroPonto.objects.filter(
+                funcionario__empresa=empresa
+            ).aggregate(inicio=Min('data_registro'))['inicio']
+            if data_inicio is None or data_inicio > data_fim:
+                continue
+
+            service = ConsolidacaoPontoService(empresa)
+            total = 0
+            inicio = data_inicio
+            while inicio <= data_fim:
+                fim = min(inicio + timedelta(days=bloco - 1), data_fim)
+                total += service.consolidar_periodo(inicio, fim)
+                inicio = fim + timedelta(days=1)
+
+            total_geral += total
+            self.stdout.write(f'Empresa {empresa.pk}: {total} resumos ({data_inicio} a {data_fim})')
+
+        self.stdout.write(self.style.SUCCESS(f'Ponto consolidado: {total_geral} resumos'))
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_empresa_codigo_validacao'),
+        ('funcionarios', '0002_cargo_selecionar_todos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoPontoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('data', models.DateField()),
+                ('primeira_entrada', models.TimeField(blank=True, null=True)),
+                ('ultima_saida', models.TimeField(blank=True, null=True)),
+                ('total_marcacoes', models.PositiveIntegerField(default=0)),
+                ('turno_aberto', models.BooleanField(default=False, help_text='Última marcação do dia é uma entrada')),
+                ('minutos_previstos', models.PositiveIntegerField(default=0)),
+                ('minutos_trabalhados', models.PositiveIntegerField(default=0)),
+                ('minutos_extra', models.PositiveIntegerField(default=0)),
+                ('minutos_atraso', models.PositiveIntegerField(default=0)),
+                ('funcionario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos_ponto', to='funcionarios.funcionario')),
+                ('loja', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.loja')),
+            ],
+            options={
+                'verbose_name': 'Resumo Diário de Ponto',
+                'verbose_name_plural': 'Resumos Diários de Ponto',
+                'ordering': ['-data', 'funcionario'],
+                'indexes': [models.Index(fields=['data', 'funcionario'], name='funcionario_data_c5148b_idx'), models.Index(condition=models.Q(('turno_aberto', True)), fields=['funcionario', 'data'], name='idx_resumo_ponto_turno_aberto')],
+                'unique_together': {('funcionario', 'data')},
+            },
+        ),
+    ]
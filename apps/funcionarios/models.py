@@ -1072,6 +1072,54 @@ class PontoEletronico(TimeStampedModel):
         total = self.horas_periodo_manha + self.horas_periodo_tarde
         return total if total.total_seconds() > 0 else timezone.timedelta(0)
 
+class ResumoPontoDiario(TimeStampedModel):
+    """
+    Consolidação diária do ponto de um funcionário: marcações de RegistroPonto
+    emparelhadas em turnos e comparadas com a escala/jornada prevista.
+    Mantido pelo ConsolidacaoPontoService (ver services.py).
+    """
+
+    funcionario = models.ForeignKey(Funcionario, on_delete=models.CASCADE, related_name='resumos_ponto')
+    data = models.DateField()
+    loja = models.ForeignKey(Loja, on_delete=models.SET_NULL, null=True, blank=True)
+
+    # Marcações
+    primeira_entrada = models.TimeField(null=True, blank=True)
+    ultima_saida = models.TimeField(null=True, blank=True)
+    total_marcacoes = models.PositiveIntegerField(default=0)
+    turno_aberto = models.BooleanField(default=False, help_text="Última marcação do dia é uma entrada")
+
+    # Totais em minutos
+    minutos_previstos = models.PositiveIntegerField(default=0)
+    minutos_trabalhados = models.PositiveIntegerField(default=0)
+    minutos_extra = models.PositiveIntegerField(default=0)
+    minutos_atraso = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Resumo Diário de Ponto"
+        verbose_name_plural = "Resumos Diários de Ponto"
+        unique_together = ['funcionario', 'data']
+        ordering = ['-data', 'funcionario']
+        indexes = [
+            models.Index(fields=['data', 'funcionario']),
+            models.Index(
+                fields=['funcionario', 'data'],
+                condition=models.Q(turno_aberto=True),
+                name='idx_resumo_ponto_turno_aberto',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.funcionario} - {self.data} ({self.horas_trabalhadas}h)"
+
+    @property
+    def horas_trabalhadas(self):
+        return round(self.minutos_trabalhados / 60, 2)
+
+    @property
+    def horas_extra(self):
+        return round(self.minutos_extra / 60, 2)
+
 class Formacao(models.Model):
     funcionario = models.OneToOneField(Funcionario, on_delete=models.CASCADE, related_name="funcionario")
     especialidade_principal = models.CharField(max_length=100, blank=True)
@@ -1286,35 +1334,11 @@ class FolhaPagamento(TimeStampedModel):
         """Verifica se a folha pode ser fechada"""
         return self.status == 'aprovada'
     
-    def calcular_folha(self):
-        """Calcula todos os valores da folha"""
-        if not self.pode_editar:
-            raise ValidationError("Folha não pode ser recalculada neste status")
-        
-        # Resetar totalizadores
-        self.total_funcionarios = 0
-        self.total_salario_bruto = Decimal('0.00')
-        self.total_descontos = Decimal('0.00')
-        self.total_beneficios = Decimal('0.00')
-        self.total_liquido = Decimal('0.00')
-        self.total_inss_empresa = Decimal('0.00')
-        self.total_fgts = Decimal('0.00')
-        
-        # Calcular cada item da folha
-        for item in self.itens.all():
-            item.calcular()
-            
-            # Somar aos totalizadores
-            self.total_funcionarios += 1
-            self.total_salario_bruto += item.salario_bruto
-            self.total_descontos += item.total_descontos
-            self.total_beneficios += item.total_beneficios
-            self.total_liquido += item.salario_liquido
-            self.total_inss_empresa += item.inss_empresa
-            self.total_fgts += item.fgts
-        
-        self.status = 'calculada'
-        self.save()
+    def calcular_folha(self, callback_progresso=None):
+        """Calcula todos os valores da folha (em lote, ver FolhaPagamentoService)"""
+        from .services import FolhaPagamentoService
+
+        FolhaPagamentoService(self, callback_progresso=callback_progresso).calcular()
     
     def aprovar_folha(self, usuario):
         """Aprova a folha de pagamento"""
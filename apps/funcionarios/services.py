@@ -0,0 +1,455 @@
+# apps/funcionarios/services.py
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    EscalaTrabalho, FolhaPagamento, Funcionario, ItemFolhaPagamento,
+    JornadaTrabalho, RegistroPonto, ResumoPontoDiario,
+)
+
+
+class FolhaPagamentoService:
+    """
+    Motor de cálculo em lote da folha de pagamento.
+
+    Reproduz exatamente ``ItemFolhaPagamento.calcular`` (mesma aritmética
+    ``Decimal``, mesmas faixas), mas aplica as tabelas de INSS/IRRF sobre
+    arrays de todos os itens de uma só vez e grava com ``bulk_update``.
+    Os arrays são de ``dtype=object`` para manter a precisão decimal: o
+    resultado gravado é idêntico ao do cálculo item a item.
+    """
+
+    # Tabela INSS: limite superior de cada faixa e respetiva alíquota
+    INSS_LIMITES = [Decimal('1412.00'), Decimal('2666.68'), Decimal('4000.03'), Decimal('7786.02')]
+    INSS_ALIQUOTAS = [Decimal('0.075'), Decimal('0.09'), Decimal('0.12'), Decimal('0.14')]
+    INSS_TETO = Decimal('1089.72')
+
+    # Tabela IRRF: limite superior de cada faixa, alíquota e parcela a deduzir
+    IRRF_LIMITES = [Decimal('2112.00'), Decimal('2826.65'), Decimal('3751.05'), Decimal('4664.68')]
+    IRRF_ALIQUOTAS = [Decimal('0'), Decimal('0.075'), Decimal('0.15'), Decimal('0.225'), Decimal('0.275')]
+    IRRF_DEDUCOES = [Decimal('0'), Decimal('158.40'), Decimal('370.40'), Decimal('651.73'), Decimal('884.96')]
+    DEDUCAO_DEPENDENTES = Decimal('189.59') * 0  # Assumindo 0 dependentes
+
+    ALIQUOTA_INSS_EMPRESA = Decimal('0.20')
+    ALIQUOTA_FGTS = Decimal('0.08')
+
+    CAMPOS_ENTRADA = [
+        'id', 'salario_base', 'dias_trabalhados', 'horas_extras', 'valor_hora_extra',
+        'valor_horas_extras', 'adicional_noturno', 'adicional_insalubridade',
+        'adicional_periculosidade', 'comissoes', 'bonus', 'outros_proventos',
+        'vale_transporte', 'vale_refeicao', 'plano_saude', 'adiantamentos',
+        'faltas', 'outros_descontos',
+    ]
+    CAMPOS_CALCULADOS = [
+        'salario_bruto', 'valor_horas_extras', 'total_proventos', 'inss_funcionario',
+        'irrf', 'total_descontos', 'total_beneficios', 'salario_liquido',
+        'inss_empresa', 'fgts', 'updated_at',
+    ]
+
+    def __init__(self, folha, tamanho_lote=500, callback_progresso=None):
+        self.folha = folha
+        self.tamanho_lote = tamanho_lote
+        self.callback_progresso = callback_progresso
+
+    # ------------------------------------------------------------------
+    # Tabelas vetorizadas
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _array(valores):
+        return np.array(valores, dtype=object)
+
+    @classmethod
+    def calcular_inss_lote(cls, total_proventos):
+        """INSS do funcionário para um array de totais de proventos."""
+        faixa = np.searchsorted(cls._array(cls.INSS_LIMITES), total_proventos, side='left')
+        ultima_faixa = len(cls.INSS_LIMITES)
+        aliquotas = cls._array(cls.INSS_ALIQUOTAS + [Decimal('0')])[faixa]
+        return np.where(faixa < ultima_faixa, total_proventos * aliquotas, cls.INSS_TETO)
+
+    @classmethod
+    def calcular_irrf_lote(cls, total_proventos, inss_funcionario):
+        """IRRF para arrays de proventos e INSS já descontado."""
+        base_calculo = total_proventos - inss_funcionario
+        base_calculo = base_calculo - cls.DEDUCAO_DEPENDENTES
+        faixa = np.searchsorted(cls._array(cls.IRRF_LIMITES), base_calculo, side='left')
+        aliquotas = cls._array(cls.IRRF_ALIQUOTAS)[faixa]
+        deducoes = cls._array(cls.IRRF_DEDUCOES)[faixa]
+        return np.where(faixa == 0, Decimal('0.00'), (base_calculo * aliquotas) - deducoes)
+
+    # ------------------------------------------------------------------
+    # Cálculo
+    # ------------------------------------------------------------------
+
+    def _carregar_itens(self):
+        return list(
+            ItemFolhaPagamento.objects
+            .filter(folha=self.folha)
+            .only(*self.CAMPOS_ENTRADA)
+            .order_by('id')
+        )
+
+    def _calcular_lote(self, itens):
+        """Calcula um lote de itens em memória (sem gravar)."""
+        col = lambda campo: self._array([getattr(item, campo) for item in itens])
+
+        salario_base = col('salario_base')
+        dias = col('dias_trabalhados')
+        horas_extras = col('horas_extras')
+        valor_hora_extra = col('valor_hora_extra')
+
+        # 1. Salário proporcional
+        salario_bruto = np.where(dias < 30, (salario_base / 30) * dias, salario_base)
+
+        # 2. Horas extras (mantém o valor anterior quando não há horas)
+        com_horas = (horas_extras > 0) & (valor_hora_extra > 0)
+        valor_horas_extras = np.where(com_horas, horas_extras * valor_hora_extra, col('valor_horas_extras'))
+
+        # 3. Total de proventos
+        total_proventos = (
+            salario_bruto +
+            valor_horas_extras +
+            col('adicional_noturno') +
+            col('adicional_insalubridade') +
+            col('adicional_periculosidade') +
+            col('comissoes') +
+            col('bonus') +
+            col('outros_proventos')
+        )
+
+        # 4-5. INSS e IRRF
+        inss_funcionario = self.calcular_inss_lote(total_proventos)
+        irrf = self.calcular_irrf_lote(total_proventos, inss_funcionario)
+
+        # 6. Descontos
+        total_descontos = (
+            inss_funcionario +
+            irrf +
+            col('vale_transporte') +
+            col('adiantamentos') +
+            col('faltas') +
+            col('outros_descontos')
+        )
+
+        # 7. Benefícios (não descontados)
+        total_beneficios = col('vale_refeicao') + col('plano_saude')
+
+        # 8-9. Líquido e encargos
+        salario_liquido = total_proventos - total_descontos
+        inss_empresa = total_proventos * self.ALIQUOTA_INSS_EMPRESA
+        fgts = total_proventos * self.ALIQUOTA_FGTS
+
+        agora = timezone.now()
+        resultados = {
+            'salario_bruto': salario_bruto,
+            'valor_horas_extras': valor_horas_extras,
+            'total_proventos': total_proventos,
+            'inss_funcionario': inss_funcionario,
+            'irrf': irrf,
+            'total_descontos': total_descontos,
+            'total_beneficios': total_beneficios,
+            'salario_liquido': salario_liquido,
+            'inss_empresa': inss_empresa,
+            'fgts': fgts,
+        }
+        for indice, item in enumerate(itens):
+            for campo, valores in resultados.items():
+                setattr(item, campo, valores[indice])
+            item.updated_at = agora
+
+    def _notificar(self, processados, total):
+        if self.callback_progresso:
+            self.callback_progresso(processados, total)
+
+    def calcular(self):
+        """
+        Calcula e grava todos os itens e os totalizadores da folha numa
+        única transação.
+        """
+        if not self.folha.pode_editar:
+            raise ValidationError("Folha não pode ser recalculada neste status")
+
+        itens = self._carregar_itens()
+        total = len(itens)
+
+        totais = {
+            'total_salario_bruto': Decimal('0.00'),
+            'total_descontos': Decimal('0.00'),
+            'total_beneficios': Decimal('0.00'),
+            'total_liquido': Decimal('0.00'),
+            'total_inss_empresa': Decimal('0.00'),
+            'total_fgts': Decimal('0.00'),
+        }
+
+        with transaction.atomic():
+            processados = 0
+            self._notificar(processados, total)
+
+            for inicio in range(0, total, self.tamanho_lote):
+                lote = itens[inicio:inicio + self.tamanho_lote]
+                self._calcular_lote(lote)
+                ItemFolhaPagamento.objects.bulk_update(lote, self.CAMPOS_CALCULADOS)
+
+                for item in lote:
+                    totais['total_salario_bruto'] += item.salario_bruto
+                    totais['total_descontos'] += item.total_descontos
+                    totais['total_beneficios'] += item.total_beneficios
+                    totais['total_liquido'] += item.salario_liquido
+                    totais['total_inss_empresa'] += item.inss_empresa
+                    totais['total_fgts'] += item.fgts
+
+                processados += len(lote)
+                self._notificar(processados, total)
+
+            self.folha.total_funcionarios = total
+            for campo, valor in totais.items():
+                setattr(self.folha, campo, valor)
+            self.folha.status = 'calculada'
+            self.folha.save()
+
+        return self.folha
+
+
+def calcular_folha_em_lote(folha_id, callback_progresso=None):
+    """Atalho usado pela task Celery e pelos comandos."""
+    folha = FolhaPagamento.objects.get(pk=folha_id)
+    return FolhaPagamentoService(folha, callback_progresso=callback_progresso).calcular()
+
+
+def _minutos_entre(inicio, fim):
+    """Minutos entre dois horários do mesmo dia (passa a meia-noite se fim < inicio)."""
+    if not (inicio and fim):
+        return 0
+    delta = datetime.combine(date.min, fim) - datetime.combine(date.min, inicio)
+    if delta < timedelta(0):
+        delta += timedelta(days=1)
+    return int(delta.total_seconds() // 60)
+
+
+def _minutos_horario(entrada, saida, almoco_inicio=None, almoco_fim=None):
+    """Duração prevista de uma escala/jornada, descontando o almoço."""
+    total = _minutos_entre(entrada, saida)
+    if almoco_inicio and almoco_fim:
+        total -= _minutos_entre(almoco_inicio, almoco_fim)
+    return max(total, 0)
+
+
+class ConsolidacaoPontoService:
+    """
+    Motor de consolidação do ponto.
+
+    Emparelha as marcações de entrada/saída de RegistroPonto em turnos e
+    calcula, numa só passagem, os minutos trabalhados, extra e de atraso de
+    cada funcionário/dia face à EscalaTrabalho do dia (ou, na falta desta, à
+    JornadaTrabalho da loja/departamento). O resultado é gravado em
+    ResumoPontoDiario, que serve também de índice de turnos abertos.
+    """
+
+    TIPOS_ENTRADA = {'entrada', 'volta_almoco', 'entrada_extra'}
+    TIPOS_SAIDA = {'saida_almoco', 'saida', 'saida_extra'}
+    TOLERANCIA_ATRASO_MINUTOS = 0
+
+    CAMPOS_RESUMO = [
+        'loja', 'primeira_entrada', 'ultima_saida', 'total_marcacoes', 'turno_aberto',
+        'minutos_previstos', 'minutos_trabalhados', 'minutos_extra', 'minutos_atraso',
+        'updated_at',
+    ]
+
+    def __init__(self, empresa=None):
+        self.empresa = empresa
+
+    # ------------------------------------------------------------------
+    # Cálculo de um dia
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def emparelhar(cls, marcacoes):
+        """
+        Recebe [(hora, tipo_registro), ...] ordenado por hora e devolve
+        (turnos, hora_aberta): turnos como [(entrada, saida), ...] e a hora da
+        entrada ainda sem saída (ou None).
+        """
+        turnos = []
+        aberta = None
+        for hora, tipo in marcacoes:
+            if tipo in cls.TIPOS_ENTRADA:
+                if aberta is None:
+                    aberta = hora
+            elif tipo in cls.TIPOS_SAIDA and aberta is not None:
+                turnos.append((aberta, hora))
+                aberta = None
+        return turnos, aberta
+
+    @classmethod
+    def calcular_dia(cls, marcacoes, previsto=None):
+        """
+        Calcula os totais de um funcionário num dia.
+
+        ``previsto`` é um dict com ``entrada`` (hora prevista de entrada) e
+        ``minutos`` (duração prevista), ou None quando não há escala.
+        """
+        turnos, aberta = cls.emparelhar(marcacoes)
+        entradas = [hora for hora, tipo in marcacoes if tipo in cls.TIPOS_ENTRADA]
+        saidas = [hora for hora, tipo in marcacoes if tipo in cls.TIPOS_SAIDA]
+
+        trabalhados = sum(_minutos_entre(inicio, fim) for inicio, fim in turnos)
+        primeira_entrada = entradas[0] if entradas else None
+
+        minutos_previstos = previsto['minutos'] if previsto else 0
+        minutos_extra = max(trabalhados - minutos_previstos, 0) if minutos_previstos else 0
+
+        minutos_atraso = 0
+        if previsto and primeira_entrada and previsto.get('entrada'):
+            atraso = (
+                datetime.combine(date.min, primeira_entrada) -
+                datetime.combine(date.min, previsto['entrada'])
+            ).total_seconds() // 60
+            if atraso > cls.TOLERANCIA_ATRASO_MINUTOS:
+                minutos_atraso = int(atraso)
+
+        return {
+            'primeira_entrada': primeira_entrada,
+            'ultima_saida': saidas[-1] if saidas else None,
+            'total_marcacoes': len(marcacoes),
+            'turno_aberto': aberta is not None,
+            'minutos_previstos': minutos_previstos,
+            'minutos_trabalhados': trabalhados,
+            'minutos_extra': minutos_extra,
+            'minutos_atraso': minutos_atraso,
+        }
+
+    # ------------------------------------------------------------------
+    # Carregamento em lote
+    # ------------------------------------------------------------------
+
+    def _funcionarios(self, funcionario_ids=None):
+        qs = Funcionario.objects.all()
+        if self.empresa is not None:
+            qs = qs.filter(empresa=self.empresa)
+        if funcionario_ids is not None:
+            qs = qs.filter(id__in=funcionario_ids)
+        return {
+            f['id']: f
+            for f in qs.values('id', 'loja_principal_id', 'departamento_id')
+        }
+
+    def _previstos(self, funcionarios, data_inicio, data_fim):
+        """Escalas por (funcionario, data) e jornadas por (loja, departamento)."""
+        escalas = defaultdict(list)
+        for escala in EscalaTrabalho.objects.filter(
+            funcionario_id__in=funcionarios.keys(),
+            data_trabalho__range=(data_inicio, data_fim),
+        ).values(
+            'funcionario_id', 'data_trabalho', 'horario_entrada', 'horario_saida',
+            'horario_almoco_inicio', 'horario_almoco_fim',
+        ):
+            escalas[(escala['funcionario_id'], escala['data_trabalho'])].append(escala)
+
+        lojas = {f['loja_principal_id'] for f in funcionarios.values()}
+        jornadas = {}
+        for jornada in JornadaTrabalho.objects.filter(loja_id__in=lojas).order_by('horario_entrada').values(
+            'loja_id', 'departamento_id', 'horario_entrada', 'horario_saida',
+            'horario_almoco_inicio', 'horario_almoco_fim',
+        ):
+            jornadas.setdefault((jornada['loja_id'], jornada['departamento_id']), jornada)
+
+        return escalas, jornadas
+
+    @staticmethod
+    def _resumir_horarios(horarios):
+        return {
+            'entrada': min(h['horario_entrada'] for h in horarios),
+            'minutos': sum(
+                _minutos_horario(
+                    h['horario_entrada'], h['horario_saida'],
+                    h['horario_almoco_inicio'], h['horario_almoco_fim'],
+                )
+                for h in horarios
+            ),
+        }
+
+    def _previsto_para(self, funcionario, dia, escalas, jornadas):
+        horarios = escalas.get((funcionario['id'], dia))
+        if horarios:
+            return self._resumir_horarios(horarios)
+        jornada = (
+            jornadas.get((funcionario['loja_principal_id'], funcionario['departamento_id'])) or
+            jornadas.get((funcionario['loja_principal_id'], None))
+        )
+        return self._resumir_horarios([jornada]) if jornada else None
+
+    # ------------------------------------------------------------------
+    # Consolidação
+    # ------------------------------------------------------------------
+
+    def consolidar_periodo(self, data_inicio, data_fim, funcionario_ids=None):
+        """
+        Recalcula os resumos de todos os funcionários (da empresa) no período.
+        O número de queries é constante (leituras em lote e um upsert),
+        independentemente do número de funcionários e dias.
+        """
+        funcionarios = self._funcionarios(funcionario_ids)
+        if not funcionarios:
+            return 0
+
+        escalas, jornadas = self._previstos(funcionarios, data_inicio, data_fim)
+
+        marcacoes = defaultdict(list)
+        lojas_dia = {}
+        for funcionario_id, dia, hora, tipo, loja_id in RegistroPonto.objects.filter(
+            funcionario_id__in=funcionarios.keys(),
+            data_registro__range=(data_inicio, data_fim),
+        ).order_by('funcionario_id', 'data_registro', 'hora_registro').values_list(
+            'funcionario_id', 'data_registro', 'hora_registro', 'tipo_registro', 'loja_id'
+        ):
+            marcacoes[(funcionario_id, dia)].append((hora, tipo))
+            lojas_dia[(funcionario_id, dia)] = loja_id
+
+        agora = timezone.now()
+        resumos = []
+        for (funcionario_id, dia), registros in marcacoes.items():
+            funcionario = funcionarios[funcionario_id]
+            totais = self.calcular_dia(
+                registros, self._previsto_para(funcionario, dia, escalas, jornadas)
+            )
+            resumos.append(ResumoPontoDiario(
+                funcionario_id=funcionario_id,
+                data=dia,
+                loja_id=lojas_dia[(funcionario_id, dia)],
+                updated_at=agora,
+                **totais,
+            ))
+
+        with transaction.atomic():
+            # Dias cujas marcações foram todas removidas deixam de ter resumo
+            obsoletos = [
+                resumo_id
+                for resumo_id, funcionario_id, dia in ResumoPontoDiario.objects.filter(
+                    funcionario_id__in=funcionarios.keys(),
+                    data__range=(data_inicio, data_fim),
+                ).values_list('id', 'funcionario_id', 'data')
+                if (funcionario_id, dia) not in marcacoes
+            ]
+            if obsoletos:
+                ResumoPontoDiario.objects.filter(id__in=obsoletos).delete()
+
+            ResumoPontoDiario.objects.bulk_create(
+                resumos,
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=['funcionario', 'data'],
+                update_fields=self.CAMPOS_RESUMO,
+            )
+
+        return len(resumos)
+
+    def consolidar_dia(self, funcionario_id, dia):
+        """Atualização incremental após uma marcação (usada pelo signal)."""
+        return self.consolidar_periodo(dia, dia, funcionario_ids=[funcionario_id])
+
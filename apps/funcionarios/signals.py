@@ -225,6 +225,22 @@ def notificar_rh_novo_funcionario(sender, instance, created, **kwargs):
     if created:
         print(f"[INFO - RH] Novo funcionário criado: {instance.nome_completo} ({instance.matricula}) na empresa {instance.empresa.nome}")
 
+# ==============================================================
+# 🔹 7. CONSOLIDAÇÃO DO PONTO (RESUMO DIÁRIO / TURNO ABERTO)
+# ==============================================================
+
+from django.db.models.signals import post_delete
+from .models import RegistroPonto
+
+
+@receiver(post_save, sender=RegistroPonto)
+@receiver(post_delete, sender=RegistroPonto)
+def atualizar_resumo_ponto(sender, instance, **kwargs):
+    """Recalcula o ResumoPontoDiario do funcionário/dia da marcação."""
+    from .services import ConsolidacaoPontoService
+
+    ConsolidacaoPontoService().consolidar_dia(instance.funcionario_id, instance.data_registro)
+
 # models.py ou signals.py
 from django.contrib.auth.models import Group
 
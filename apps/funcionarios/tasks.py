@@ -0,0 +1,51 @@
+# apps/funcionarios/tasks.py
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.utils import timezone
+
+from apps.core.models import Empresa
+from .services import ConsolidacaoPontoService, calcular_folha_em_lote
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True)
+def calcular_folha_task(self, folha_id):
+    """
+    Calcula a folha de pagamento em segundo plano, publicando o progresso
+    (itens processados / total) no estado da task.
+    """
+    def progresso(processados, total):
+        self.update_state(state='PROGRESS', meta={'processados': processados, 'total': total})
+
+    try:
+        folha = calcular_folha_em_lote(folha_id, callback_progresso=progresso)
+        logger.info(f'Folha {folha_id} calculada: {folha.total_funcionarios} funcionários')
+        return {
+            'folha_id': folha.id,
+            'total_funcionarios': folha.total_funcionarios,
+            'total_liquido': str(folha.total_liquido),
+        }
+    except Exception as e:
+        logger.error(f'Erro ao calcular folha {folha_id}: {e}')
+        raise
+
+
+@shared_task
+def consolidar_ponto_task(dias=2):
+    """
+    Reconsolida os resumos de ponto dos últimos ``dias`` dias de todas as
+    empresas ativas (cobre ajustes manuais e marcações fora de hora).
+    """
+    data_fim = timezone.now().date()
+    data_inicio = data_fim - timedelta(days=dias - 1)
+    total = 0
+    for empresa in Empresa.objects.filter(ativa=True):
+        try:
+            total += ConsolidacaoPontoService(empresa).consolidar_periodo(data_inicio, data_fim)
+        except Exception as e:
+            logger.error(f'Erro ao consolidar ponto da empresa {empresa.id}: {e}')
+    logger.info(f'Ponto consolidado: {total} resumos ({data_inicio} a {data_fim})')
+    return total
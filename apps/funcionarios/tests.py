@@ -1,3 +1,160 @@
+from datetime import date, time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.test import TestCase
 
-# Create your tests here.
+from apps.core.models import Empresa, Loja
+from apps.funcionarios.models import (
+    Cargo, Departamento, EscalaTrabalho, FolhaPagamento, Funcionario, ItemFolhaPagamento, RegistroPonto,
+    ResumoPontoDiario,
+)
+from apps.funcionarios.services import ConsolidacaoPontoService, FolhaPagamentoService
+from apps.funcionarios.utils import funcionario_tem_turno_aberto
+
+
+class FuncionariosTestMixin:
+    """Empresa, loja, cargo e departamento comuns aos testes de RH"""
+
+    @classmethod
+    def criar_estrutura(cls, nif):
+        cls.empresa = Empresa.objects.create(
+            nome='Farmácia RH', nif=nif, endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email=f'rh{nif}@exemplo.ao',
+        )
+        cls.loja = Loja.objects.create(
+            empresa=cls.empresa, nome='Loja', codigo='L1', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', postal='0000', provincia='Luanda',
+        )
+        cls.cargo = Cargo.objects.create(empresa=cls.empresa, nome=f'Farmacêutico {nif}', codigo=f'FARM{nif}')
+        cls.departamento = Departamento.objects.create(nome='Atendimento', codigo=f'ATD{nif}', loja=cls.loja)
+
+    @classmethod
+    def criar_funcionario(cls, indice, salario):
+        return Funcionario.objects.create(
+            empresa=cls.empresa, nome_completo=f'Funcionário {indice}', bi=f'{cls.empresa.nif}{indice:04d}',
+            data_nascimento=date(1990, 1, 1), sexo='M', endereco='Rua 1', numero='1', bairro='Centro',
+            cidade='Luanda', postal='0000', cargo=cls.cargo, departamento=cls.departamento,
+            loja_principal=cls.loja, data_admissao=date(2024, 1, 1), salario_atual=Decimal(salario),
+        )
+
+
+class FolhaPagamentoServiceTest(FuncionariosTestMixin, TestCase):
+    """Cálculo da folha em lote igual ao cálculo item a item"""
+
+    CAMPOS = FolhaPagamentoService.CAMPOS_CALCULADOS[:-1]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.criar_estrutura('5000000060')
+        cls.usuario = get_user_model().objects.create(username='folha', empresa=cls.empresa)
+
+    def setUp(self):
+        self.folha = FolhaPagamento.objects.create(
+            empresa=self.empresa, mes=1, ano=2026, descricao='Folha Janeiro 2026', elaborada_por=self.usuario,
+        )
+        # Salários nas várias faixas de INSS/IRRF, proporcional e com horas extras
+        linhas = [
+            ('1200.00', {}),
+            ('2500.00', {'dias_trabalhados': 20}),
+            ('3900.00', {'horas_extras': Decimal('10'), 'valor_hora_extra': Decimal('25.50')}),
+            ('6000.00', {'bonus': Decimal('300'), 'vale_transporte': Decimal('120'), 'plano_saude': Decimal('80')}),
+            ('9000.00', {'faltas': Decimal('150.25'), 'vale_refeicao': Decimal('200')}),
+        ]
+        for indice, (salario, campos) in enumerate(linhas, start=1):
+            ItemFolhaPagamento.objects.create(
+                folha=self.folha, funcionario=self.criar_funcionario(indice, salario),
+                salario_base=Decimal(salario), **campos,
+            )
+
+    def _valores(self):
+        return {
+            item.pk: tuple(getattr(item, campo) for campo in self.CAMPOS)
+            for item in ItemFolhaPagamento.objects.filter(folha=self.folha)
+        }
+
+    def test_lote_igual_ao_calculo_item_a_item(self):
+        for item in ItemFolhaPagamento.objects.filter(folha=self.folha):
+            item.calcular()
+        esperado = self._valores()
+        ItemFolhaPagamento.objects.filter(folha=self.folha).update(**{campo: 0 for campo in self.CAMPOS})
+
+        progresso = []
+        FolhaPagamentoService(self.folha, tamanho_lote=2, callback_progresso=lambda *args: progresso.append(args)).calcular()
+
+        self.assertEqual(self._valores(), esperado)
+        self.assertEqual(progresso, [(0, 5), (2, 5), (4, 5), (5, 5)])
+
+        self.folha.refresh_from_db()
+        self.assertEqual((self.folha.status, self.folha.total_funcionarios), ('calculada', 5))
+        # Totais somados antes do arredondamento de cada item
+        self.assertAlmostEqual(
+            self.folha.total_liquido, sum(valores[7] for valores in esperado.values()), delta=Decimal('0.05')
+        )
+
+    def test_folha_fechada_nao_e_recalculada(self):
+        FolhaPagamento.objects.filter(pk=self.folha.pk).update(status='fechada')
+        self.folha.refresh_from_db()
+
+        with self.assertRaises(ValidationError):
+            self.folha.calcular_folha()
+
+
+class ConsolidacaoPontoServiceTest(FuncionariosTestMixin, TestCase):
+    """Resumo diário do ponto: turnos, horas extra, atraso e turno aberto"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.criar_estrutura('5000000061')
+        cls.funcionario = cls.criar_funcionario(1, '2000.00')
+
+    def _marcar(self, hora, tipo, dia=None):
+        return RegistroPonto.objects.create(
+            funcionario=self.funcionario, data_registro=dia or date.today(), hora_registro=hora,
+            tipo_registro=tipo, loja=self.loja,
+        )
+
+    def test_calcular_dia_com_almoco_extra_e_atraso(self):
+        marcacoes = [
+            (time(8, 10), 'entrada'), (time(12, 0), 'saida_almoco'),
+            (time(13, 0), 'volta_almoco'), (time(17, 30), 'saida'),
+        ]
+
+        totais = ConsolidacaoPontoService.calcular_dia(marcacoes, {'entrada': time(8, 0), 'minutos': 480})
+
+        self.assertEqual(
+            (totais['minutos_trabalhados'], totais['minutos_extra'], totais['minutos_atraso']), (500, 20, 10)
+        )
+        self.assertEqual((totais['primeira_entrada'], totais['ultima_saida']), (time(8, 10), time(17, 30)))
+        self.assertFalse(totais['turno_aberto'])
+
+    def test_marcacoes_mantem_resumo_e_turno_aberto(self):
+        self._marcar(time(8, 0), 'entrada')
+        self.assertTrue(funcionario_tem_turno_aberto(self.funcionario))
+
+        self._marcar(time(16, 0), 'saida')
+        self.assertFalse(funcionario_tem_turno_aberto(self.funcionario))
+        resumo = ResumoPontoDiario.objects.get(funcionario=self.funcionario, data=date.today())
+        self.assertEqual((resumo.total_marcacoes, resumo.minutos_trabalhados), (2, 480))
+
+        # Dia sem marcações deixa de ter resumo
+        RegistroPonto.objects.filter(funcionario=self.funcionario).delete()
+        self.assertFalse(ResumoPontoDiario.objects.filter(funcionario=self.funcionario).exists())
+
+    def test_escala_do_dia_define_o_previsto(self):
+        dia = date(2026, 3, 2)
+        EscalaTrabalho.objects.create(
+            funcionario=self.funcionario, data_trabalho=dia, turno='manha', horario_entrada=time(9, 0),
+            horario_saida=time(13, 0), loja=self.loja, criada_por=self.funcionario,
+        )
+        self._marcar(time(9, 30), 'entrada', dia)
+        self._marcar(time(14, 0), 'saida', dia)
+
+        self.assertEqual(ConsolidacaoPontoService(self.empresa).consolidar_periodo(dia, dia), 1)
+
+        resumo = ResumoPontoDiario.objects.get(funcionario=self.funcionario, data=dia)
+        self.assertEqual(
+            (resumo.minutos_previstos, resumo.minutos_trabalhados, resumo.minutos_extra, resumo.minutos_atraso),
+            (240, 270, 30, 30),
+        )
@@ -83,6 +83,7 @@ urlpatterns = [
     # =====================================
     path('folha/', views.FolhaPagamentoView.as_view(), name='folha_pagamento'),
     path('folha/calcular/', views.CalcularFolhaView.as_view(), name='calcular_folha'),
+    path('folha/calcular/<str:task_id>/progresso/', views.ProgressoCalculoFolhaView.as_view(), name='progresso_calculo_folha'),
     path('folha/<int:mes>/<int:ano>/', views.FolhaMensalView.as_view(), name='folha_mensal'),
     path('<int:pk>/holerite/<int:mes>/<int:ano>/', views.HoleriteView.as_view(), name='holerite'),
     path('<int:pk>/salario/', views.SalarioFuncionarioView.as_view(), name='salario'),
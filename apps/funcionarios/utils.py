@@ -1,16 +1,13 @@
 from datetime import date
-from apps.funcionarios.models import RegistroPonto
+from apps.funcionarios.models import ResumoPontoDiario
 
 def funcionario_tem_turno_aberto(funcionario):
     """Retorna True se o funcionário tem turno aberto (entrada sem saída)."""
 
-    ultimo = RegistroPonto.objects.filter(
+    # O resumo do dia é mantido pelo ConsolidacaoPontoService a cada marcação;
+    # turno_aberto é True quando a última marcação do dia é uma entrada.
+    return ResumoPontoDiario.objects.filter(
         funcionario=funcionario,
-        data_registro=date.today()
-    ).order_by('-data_registro', '-hora_registro').first()
-
-    if not ultimo:
-        return False
-
-    # Se o último registro for ENTRADA → turno aberto
-    return ultimo.tipo_registro in ['entrada', 'volta_almoco', 'entrada_extra']
+        data=date.today(),
+        turno_aberto=True
+    ).exists()
@@ -24,6 +24,10 @@ from .models import (
     HistoricoSalarial
 )
 from django.contrib.auth.mixins import AccessMixin
+from django.views import View
+from celery.result import AsyncResult
+
+from .tasks import calcular_folha_task
 
 
 # =====================================
@@ -593,16 +597,16 @@ class RegistrarPontoView(LoginRequiredMixin, TemplateView):
             # Lógica de marcação sequencial
             if not ponto.entrada_manha:
                 ponto.entrada_manha = agora
-                tipo_registro = 'Entrada'
+                codigo_registro, tipo_registro = 'entrada', 'Entrada'
             elif not ponto.saida_almoco:
                 ponto.saida_almoco = agora
-                tipo_registro = 'Saída para Almoço'
+                codigo_registro, tipo_registro = 'saida_almoco', 'Saída para Almoço'
             elif not ponto.entrada_tarde:
                 ponto.entrada_tarde = agora
-                tipo_registro = 'Volta do Almoço'
+                codigo_registro, tipo_registro = 'volta_almoco', 'Volta do Almoço'
             elif not ponto.saida:
                 ponto.saida = agora
-                tipo_registro = 'Saída'
+                codigo_registro, tipo_registro = 'saida', 'Saída'
             else:
                 return JsonResponse({
                     'success': False,
@@ -616,7 +620,7 @@ class RegistrarPontoView(LoginRequiredMixin, TemplateView):
                 funcionario=funcionario,
                 data_registro=hoje,
                 hora_registro=agora,
-                tipo_registro=tipo_registro.lower().replace(' ', '_'),
+                tipo_registro=codigo_registro,
                 loja=funcionario.loja_principal,
                 ip_registro=request.META.get('REMOTE_ADDR')
             )
@@ -641,7 +645,7 @@ from django.shortcuts import get_object_or_404
 from django.db.models import Q, Sum, Count, Avg
 from django.utils import timezone
 from datetime import datetime, timedelta, date
-from .models import PontoEletronico, Funcionario
+from .models import PontoEletronico, Funcionario, ResumoPontoDiario
 
 class HistoricoPontoView(ListView):
     model = PontoEletronico
@@ -699,6 +703,21 @@ class HistoricoPontoView(ListView):
             
         return queryset
 
+    def _minutos_presentes(self, pontos):
+        """
+        Minutos trabalhados por dia presente: do ResumoPontoDiario ou, nos
+        dias sem resumo (histórico ainda não consolidado, ponto sem marcações
+        em RegistroPonto), calculados a partir do próprio PontoEletronico.
+        """
+        presentes = pontos.filter(status='presente').order_by()
+        resumos = ResumoPontoDiario.objects.filter(funcionario=self.funcionario)
+        minutos = dict(
+            resumos.filter(data__in=presentes.values('data')).values_list('data', 'minutos_trabalhados')
+        )
+        for ponto in presentes.exclude(data__in=resumos.values('data')):
+            minutos[ponto.data] = int(ponto.horas_trabalhadas_dia.total_seconds() // 60)
+        return minutos
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
@@ -717,27 +736,23 @@ class HistoricoPontoView(ListView):
             'ano': self.request.GET.get('ano'),
         }
         
-        # Estatísticas do período filtrado
+        # Estatísticas do período filtrado (contagens numa única query)
         pontos_periodo = self.get_queryset()
+        contagens = pontos_periodo.aggregate(
+            total_pontos=Count('id'),
+            total_presencas=Count('id', filter=Q(status='presente')),
+            total_faltas=Count('id', filter=Q(status='falta')),
+            total_faltas_justificadas=Count('id', filter=Q(status='falta_justificada')),
+            total_ferias=Count('id', filter=Q(status='ferias')),
+            total_feriados=Count('id', filter=Q(status='feriado')),
+        )
+        total_pontos = contagens['total_pontos']
+        total_presencas = contagens['total_presencas']
+
+        # Horas trabalhadas: do resumo diário consolidado, com recurso ao ponto do dia
+        minutos_periodo = sum(self._minutos_presentes(pontos_periodo).values())
         
-        # Contadores por status
-        total_pontos = pontos_periodo.count()
-        total_presencas = pontos_periodo.filter(status='presente').count()
-        total_faltas = pontos_periodo.filter(status='falta').count()
-        total_faltas_justificadas = pontos_periodo.filter(status='falta_justificada').count()
-        total_ferias = pontos_periodo.filter(status='ferias').count()
-        total_feriados = pontos_periodo.filter(status='feriado').count()
-        
-        # Calcular total de horas trabalhadas
-        total_segundos_trabalhados = 0
-        pontos_trabalhados = pontos_periodo.filter(status='presente')
-        
-        for ponto in pontos_trabalhados:
-            horas_dia = ponto.horas_trabalhadas_dia
-            if horas_dia and horas_dia.total_seconds() > 0:
-                total_segundos_trabalhados += horas_dia.total_seconds()
-        
-        total_horas_trabalhadas = total_segundos_trabalhados / 3600
+        total_horas_trabalhadas = minutos_periodo / 60
         
         # Calcular médias
         media_horas_dia = total_horas_trabalhadas / total_presencas if total_presencas > 0 else 0
@@ -746,10 +761,10 @@ class HistoricoPontoView(ListView):
         context['estatisticas'] = {
             'total_pontos': total_pontos,
             'total_presencas': total_presencas,
-            'total_faltas': total_faltas,
-            'total_faltas_justificadas': total_faltas_justificadas,
-            'total_ferias': total_ferias,
-            'total_feriados': total_feriados,
+            'total_faltas': contagens['total_faltas'],
+            'total_faltas_justificadas': contagens['total_faltas_justificadas'],
+            'total_ferias': contagens['total_ferias'],
+            'total_feriados': contagens['total_feriados'],
             'total_horas_trabalhadas': round(total_horas_trabalhadas, 2),
             'media_horas_dia': round(media_horas_dia, 2),
             'percentual_presenca': round(percentual_presenca, 1),
@@ -773,70 +788,62 @@ class HistoricoPontoView(ListView):
         if not context['anos']:
             context['anos'] = [timezone.now().year]
         
-        # Dados para gráfico de horas por semana (últimas 8 semanas)
+        # Gráfico semanal (últimas 8 semanas) e resumo mensal (últimos 6 meses):
+        # carrega estados e minutos do intervalo inteiro de uma vez e agrupa em memória
         hoje = timezone.now().date()
-        horas_por_semana = []
+        meses_ref = [hoje.replace(day=1)]
+        for _ in range(5):
+            meses_ref.append((meses_ref[-1] - timedelta(days=1)).replace(day=1))
+        inicio_semanas = hoje - timedelta(days=hoje.weekday() + 7 * 7)
+        inicio_intervalo = min(meses_ref[-1], inicio_semanas)
+        
+        status_por_dia = dict(
+            PontoEletronico.objects.filter(
+                funcionario=self.funcionario, data__gte=inicio_intervalo
+            ).values_list('data', 'status')
+        )
+        minutos_por_dia = self._minutos_presentes(
+            PontoEletronico.objects.filter(funcionario=self.funcionario, data__gte=inicio_intervalo)
+        )
+        
+        def horas_presentes(inicio, fim):
+            return sum(
+                minutos_por_dia.get(dia, 0)
+                for dia, status in status_por_dia.items()
+                if status == 'presente' and inicio <= dia <= fim
+            ) / 60
         
+        horas_por_semana = []
         for i in range(8):
             inicio_semana = hoje - timedelta(days=hoje.weekday() + (i * 7))
             fim_semana = inicio_semana + timedelta(days=6)
-            
-            pontos_semana = PontoEletronico.objects.filter(
-                funcionario=self.funcionario,
-                data__range=[inicio_semana, fim_semana],
-                status='presente'
-            )
-            
-            total_horas_semana = 0
-            for ponto in pontos_semana:
-                horas = ponto.horas_trabalhadas_dia
-                if horas:
-                    total_horas_semana += horas.total_seconds() / 3600
-            
             horas_por_semana.append({
                 'semana': f"{inicio_semana.strftime('%d/%m')} - {fim_semana.strftime('%d/%m')}",
-                'horas': round(total_horas_semana, 1)
+                'horas': round(horas_presentes(inicio_semana, fim_semana), 1)
             })
         
         context['horas_por_semana'] = list(reversed(horas_por_semana))
         
-        # Resumo mensal (últimos 6 meses)
         resumo_mensal = []
-        for i in range(6):
-            if i == 0:
-                mes_ref = hoje.replace(day=1)
-            else:
-                mes_anterior = resumo_mensal[-1]['data'] - timedelta(days=1)
-                mes_ref = mes_anterior.replace(day=1)
-            
-            pontos_mes = PontoEletronico.objects.filter(
-                funcionario=self.funcionario,
-                data__year=mes_ref.year,
-                data__month=mes_ref.month
-            )
-            
-            presencas_mes = pontos_mes.filter(status='presente').count()
-            faltas_mes = pontos_mes.filter(status='falta').count()
-            
-            total_horas_mes = 0
-            for ponto in pontos_mes.filter(status='presente'):
-                horas = ponto.horas_trabalhadas_dia
-                if horas:
-                    total_horas_mes += horas.total_seconds() / 3600
-            
+        for mes_ref in meses_ref:
+            dias_mes = [
+                status for dia, status in status_por_dia.items()
+                if (dia.year, dia.month) == (mes_ref.year, mes_ref.month)
+            ]
+            fim_mes = (mes_ref + timedelta(days=32)).replace(day=1) - timedelta(days=1)
             resumo_mensal.append({
                 'data': mes_ref,
                 'mes_nome': mes_ref.strftime('%B'),
                 'ano': mes_ref.year,
-                'presencas': presencas_mes,
-                'faltas': faltas_mes,
-                'horas_trabalhadas': round(total_horas_mes, 1)
+                'presencas': dias_mes.count('presente'),
+                'faltas': dias_mes.count('falta'),
+                'horas_trabalhadas': round(horas_presentes(mes_ref, fim_mes), 1)
             })
-            # Converter horas trabalhadas em decimal por registro
-            for p in context['pontos']:
-                horas = p.horas_trabalhadas_dia
-                p.horas_decimal = horas.total_seconds() / 3600 if horas else 0
-
+        
+        # Converter horas trabalhadas em decimal por registro
+        for p in context['pontos']:
+            horas = p.horas_trabalhadas_dia
+            p.horas_decimal = horas.total_seconds() / 3600 if horas else 0
         
         context['resumo_mensal'] = resumo_mensal
         
@@ -844,12 +851,7 @@ class HistoricoPontoView(ListView):
         alertas = []
         
         # Verificar faltas excessivas no mês atual
-        faltas_mes_atual = PontoEletronico.objects.filter(
-            funcionario=self.funcionario,
-            data__year=hoje.year,
-            data__month=hoje.month,
-            status='falta'
-        ).count()
+        faltas_mes_atual = resumo_mensal[0]['faltas']
         
         if faltas_mes_atual >= 3:
             alertas.append({
@@ -919,26 +921,52 @@ class CalcularFolhaView(LoginRequiredMixin, PermissaoAcaoMixin, TemplateView):
         )
         
         if folha.pode_editar:
-            # Criar itens para todos os funcionários ativos
-            funcionarios = Funcionario.objects.filter(ativo=True)
-            for funcionario in funcionarios:
-                item, created = ItemFolhaPagamento.objects.get_or_create(
-                    folha=folha,
-                    funcionario=funcionario,
-                    defaults={
-                        'salario_base': funcionario.salario_atual,
-                        'vale_alimentacao': funcionario.vale_alimentacao,
-                        'vale_transporte': funcionario.vale_transporte
-                    }
-                )
-            
+            # Criar itens em falta para todos os funcionários ativos (uma query)
+            funcionarios = Funcionario.objects.filter(
+                empresa=request.user.empresa, ativo=True
+            ).only('id', 'salario_atual', 'vale_transporte')
+            ItemFolhaPagamento.objects.bulk_create(
+                [
+                    ItemFolhaPagamento(
+                        folha=folha,
+                        funcionario=funcionario,
+                        salario_base=funcionario.salario_atual,
+                        vale_transporte=funcionario.vale_transporte,
+                    )
+                    for funcionario in funcionarios
+                ],
+                ignore_conflicts=True,
+            )
+
+            if request.POST.get('assincrono'):
+                task = calcular_folha_task.delay(folha.id)
+                return JsonResponse({'success': True, 'folha_id': folha.id, 'task_id': task.id})
+
             folha.calcular_folha()
             messages.success(request, 'Folha calculada com sucesso!')
         else:
+            if request.POST.get('assincrono'):
+                return JsonResponse({'success': False, 'error': 'Esta folha não pode ser recalculada!'}, status=400)
             messages.error(request, 'Esta folha não pode ser recalculada!')
         
         return redirect('funcionarios:folha_mensal', mes=mes, ano=ano)
 
+class ProgressoCalculoFolhaView(LoginRequiredMixin, PermissaoAcaoMixin, View):
+    """Estado da task de cálculo da folha (para polling do progresso)"""
+    acao_requerida = 'acessar_rh'
+
+    def get(self, request, task_id):
+        resultado = AsyncResult(task_id)
+        info = resultado.info if isinstance(resultado.info, dict) else {}
+        return JsonResponse({
+            'task_id': task_id,
+            'estado': resultado.state,
+            'processados': info.get('processados'),
+            'total': info.get('total'),
+            'concluido': resultado.ready(),
+            'erro': str(resultado.result) if resultado.failed() else None,
+        })
+
 class FolhaMensalView(LoginRequiredMixin, PermissaoAcaoMixin, DetailView):
     acao_requerida = 'acessar_rh'
     model = FolhaPagamento
@@ -6,7 +6,7 @@ from django.utils.safestring import mark_safe
 from django.db.models import Count, Sum, Avg
 from .models import (
     Fabricante, Produto, 
-    Lote, HistoricoPreco
+    Lote, AlocacaoLote, RiscoValidadeLote, HistoricoPreco, ImportacaoProdutos
 )
 from apps.core.models import Categoria
 
@@ -45,7 +45,7 @@ class LoteInline(admin.TabularInline):
 @admin.register(Lote)
 class LoteAdmin(admin.ModelAdmin):
     list_display = ['produto', 'numero_lote', 'data_validade', 'quantidade_atual']
-    list_filter = ['data_validade', 'produto__empresa']
+    list_filter = ['data_validade', 'empresa']
     search_fields = ['numero_lote', 'nome_produto']
     list_editable = ['quantidade_atual']
     date_hierarchy = 'data_validade'
@@ -53,6 +53,27 @@ class LoteAdmin(admin.ModelAdmin):
 
     search_fields = ['numero_lote', 'nome_produto']
 
+
+@admin.register(AlocacaoLote)
+class AlocacaoLoteAdmin(admin.ModelAdmin):
+    list_display = ['lote', 'produto', 'item_venda', 'quantidade', 'quantidade_devolvida', 'created_at']
+    list_filter = ['empresa', 'created_at']
+    search_fields = ['lote__numero_lote', 'produto__nome_produto']
+    list_select_related = ['lote', 'produto']
+    raw_id_fields = ['lote', 'produto', 'item_venda']
+    date_hierarchy = 'created_at'
+
+@admin.register(RiscoValidadeLote)
+class RiscoValidadeLoteAdmin(admin.ModelAdmin):
+    list_display = [
+        'lote', 'produto', 'data_validade', 'dias_restantes', 'quantidade_atual', 'vendas_diarias',
+        'quantidade_em_risco', 'valor_em_risco', 'nivel', 'calculado_em',
+    ]
+    list_filter = ['nivel', 'empresa']
+    search_fields = ['lote__numero_lote', 'produto__nome_produto']
+    list_select_related = ['lote', 'produto']
+    date_hierarchy = 'data_validade'
+
 @admin.register(Produto)
 class ProdutoAdmin(admin.ModelAdmin):
     list_display = ['nome_produto', 'empresa', 'categoria', 'preco_venda_display', 'estoque_atual', 'ativo']
@@ -126,3 +147,17 @@ class HistoricoPrecoAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(ImportacaoProdutos)
+class ImportacaoProdutosAdmin(admin.ModelAdmin):
+    list_display = [
+        'nome_arquivo', 'empresa', 'estado', 'linhas_processadas', 'total_linhas',
+        'importados', 'atualizados', 'total_erros', 'created_at'
+    ]
+    list_filter = ['estado', 'validar_apenas', 'empresa']
+    search_fields = ['nome_arquivo']
+    readonly_fields = [
+        'estado', 'total_linhas', 'linhas_processadas', 'validos', 'importados', 'atualizados',
+        'ignorados', 'total_erros', 'erros', 'mensagem_erro', 'iniciado_em', 'concluido_em'
+    ]
+    ordering = ['-created_at']
+
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_numeracao_blocos'),
+        ('produtos', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportacaoProdutos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('arquivo', models.FileField(upload_to='importacoes/produtos/%Y/%m/')),
+                ('nome_arquivo', models.CharField(blank=True, max_length=255)),
+                ('atualizar_existentes', models.BooleanField(default=True)),
+                ('validar_apenas', models.BooleanField(default=False)),
+                ('estado', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluida', 'Concluída'), ('falhou', 'Falhou')], default='pendente', max_length=15)),
+                ('total_linhas', models.PositiveIntegerField(default=0, help_text='Estimativa, lida antes do processamento')),
+                ('linhas_processadas', models.PositiveIntegerField(default=0)),
+                ('validos', models.PositiveIntegerField(default=0)),
+                ('importados', models.PositiveIntegerField(default=0)),
+                ('atualizados', models.PositiveIntegerField(default=0)),
+                ('ignorados', models.PositiveIntegerField(default=0)),
+                ('total_erros', models.PositiveIntegerField(default=0)),
+                ('erros', models.JSONField(blank=True, default=list, help_text="[{'linha': n, 'erro': '...'}] (limitado)")),
+                ('mensagem_erro', models.TextField(blank=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='importacoes_produtos', to='core.empresa')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Importação de Produtos',
+                'verbose_name_plural': 'Importações de Produtos',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_numeracao_blocos'),
+        ('fiscal', '0002_initial'),
+        ('fornecedores', '0002_initial'),
+        ('produtos', '0002_importacao_produtos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProdutoRemovidoCatalogo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('produto_id', models.BigIntegerField()),
+                ('versao', models.PositiveBigIntegerField()),
+                ('removido_em', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Produto Removido do Catálogo',
+                'verbose_name_plural': 'Produtos Removidos do Catálogo',
+            },
+        ),
+        migrations.CreateModel(
+            name='VersaoCatalogo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('versao', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Versão do Catálogo',
+                'verbose_name_plural': 'Versões do Catálogo',
+            },
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='versao_catalogo',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['empresa', 'versao_catalogo'], name='idx_produto_versao_catalogo'),
+        ),
+        migrations.AddField(
+            model_name='produtoremovidocatalogo',
+            name='empresa',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.empresa'),
+        ),
+        migrations.AddField(
+            model_name='versaocatalogo',
+            name='empresa',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='versao_catalogo', to='core.empresa'),
+        ),
+        migrations.AddIndex(
+            model_name='produtoremovidocatalogo',
+            index=models.Index(fields=['empresa', 'versao'], name='idx_produto_removido_versao'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.1.5 on 2026-10-19 13:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def preencher_empresa_lotes(apps, schema_editor):
+    Lote = apps.get_model('produtos', 'Lote')
+    Produto = apps.get_model('produtos', 'Produto')
+    Lote.objects.filter(empresa__isnull=True).update(
+        empresa_id=Subquery(Produto.objects.filter(pk=OuterRef('produto_id')).values('empresa_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_numeracao_blocos'),
+        ('produtos', '0003_catalogo_pdv_versionado'),
+        ('vendas', '0007_metas_realizado_execucao_comissao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlocacaoLote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('quantidade', models.PositiveIntegerField()),
+                ('quantidade_devolvida', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Alocação de Lote',
+                'verbose_name_plural': 'Alocações de Lotes',
+                'ordering': ['item_venda', 'lote__data_validade'],
+            },
+        ),
+        migrations.AddField(
+            model_name='lote',
+            name='empresa',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='lotes', to='core.empresa'),
+        ),
+        migrations.RunPython(preencher_empresa_lotes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='lote',
+            index=models.Index(fields=['empresa', 'data_validade'], name='idx_lote_empresa_validade'),
+        ),
+        migrations.AddIndex(
+            model_name='lote',
+            index=models.Index(condition=models.Q(('quantidade_atual__gt', 0)), fields=['produto', 'data_validade'], name='idx_lote_fefo'),
+        ),
+        migrations.AddField(
+            model_name='alocacaolote',
+            name='empresa',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alocacoes_lote', to='core.empresa'),
+        ),
+        migrations.AddField(
+            model_name='alocacaolote',
+            name='item_venda',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alocacoes_lote', to='vendas.itemvenda'),
+        ),
+        migrations.AddField(
+            model_name='alocacaolote',
+            name='lote',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='alocacoes', to='produtos.lote'),
+        ),
+        migrations.AddField(
+            model_name='alocacaolote',
+            name='produto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alocacoes_lote', to='produtos.produto'),
+        ),
+        migrations.AddIndex(
+            model_name='alocacaolote',
+            index=models.Index(fields=['lote', 'created_at'], name='idx_alocacao_lote'),
+        ),
+    ]
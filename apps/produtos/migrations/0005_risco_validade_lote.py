@@ -0,0 +1,38 @@
+# Generated by Django 5.1.5 on 2026-10-19 13:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_numeracao_blocos'),
+        ('produtos', '0004_alocacao_lotes_fefo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiscoValidadeLote',
+            fields=[
+                ('lote', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='risco_validade', serialize=False, to='produtos.lote')),
+                ('data_validade', models.DateField()),
+                ('dias_restantes', models.IntegerField()),
+                ('quantidade_atual', models.IntegerField()),
+                ('vendas_diarias', models.DecimalField(decimal_places=4, help_text='Ritmo de vendas recente do produto', max_digits=12)),
+                ('quantidade_prevista_venda', models.IntegerField(help_text='Vendida deste lote até à validade')),
+                ('quantidade_em_risco', models.IntegerField(help_text='Por vender na data de validade')),
+                ('valor_em_risco', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('nivel', models.CharField(choices=[('baixo', 'Baixo'), ('medio', 'Médio'), ('alto', 'Alto'), ('vencido', 'Vencido')], max_length=10)),
+                ('calculado_em', models.DateTimeField()),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='riscos_validade', to='core.empresa')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='riscos_validade', to='produtos.produto')),
+            ],
+            options={
+                'verbose_name': 'Risco de Validade do Lote',
+                'verbose_name_plural': 'Riscos de Validade dos Lotes',
+                'ordering': ['-valor_em_risco'],
+                'indexes': [models.Index(fields=['empresa', '-valor_em_risco'], name='idx_risco_validade_valor'), models.Index(fields=['empresa', 'data_validade'], name='idx_risco_validade_data')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0005_risco_validade_lote'),
+        ('vendas', '0009_itemdevolucao_item_venda_original'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='alocacaolote',
+            name='item_venda',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alocacoes_lote', to='vendas.itemvenda'),
+        ),
+        migrations.AddField(
+            model_name='alocacaolote',
+            name='item_fatura',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alocacoes_lote', to='vendas.itemfatura'),
+        ),
+    ]
@@ -81,21 +81,31 @@ class Produto(TimeStampedModel):
     # Status
     ativo = models.BooleanField(default=True)
 
-    def save(self, *args, **kwargs):
+    # Versão da última alteração no catálogo do PDV (ver VersaoCatalogo)
+    versao_catalogo = models.BigIntegerField(default=0, editable=False)
+
+    def aplicar_margem_lucro(self):
+        """Recalcula o preço de venda a partir do custo e da margem (também usado na importação em lote)"""
         # Converte a margem de lucro de percentual para decimal
-        if self.margem_lucro is not None and self.preco_custo is not None:
+        # (sem custo não há margem a aplicar: mantém-se o preço de venda indicado)
+        if self.margem_lucro is not None and self.preco_custo:
             margem_decimal = self.margem_lucro / Decimal('100.00')
             
             # Recalcula o preço de venda e a margem de lucro
             self.preco_venda = self.preco_custo + (self.preco_custo * margem_decimal)
             self.margem_lucro = (self.preco_venda - self.preco_custo) / self.preco_custo * Decimal('100.00')
 
+    def save(self, *args, **kwargs):
+        self.aplicar_margem_lucro()
         super().save(*args, **kwargs)
     
     class Meta:
         verbose_name = 'Produto'
         verbose_name_plural = 'Produtos'
         unique_together = ['empresa', 'codigo_interno']
+        indexes = [
+            models.Index(fields=['empresa', 'versao_catalogo'], name='idx_produto_versao_catalogo'),
+        ]
         
     def __str__(self):
         return self.nome_produto
@@ -137,12 +147,19 @@ class Produto(TimeStampedModel):
 class Lote(TimeStampedModel):
     """Lote de produtos"""
     produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='lotes')
+    # Desnormalizado do produto: painéis de validade filtram por (empresa, data_validade)
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='lotes', null=True, editable=False)
     numero_lote = models.CharField(max_length=50)
     data_validade = models.DateField()
     quantidade_inicial = models.IntegerField()
     quantidade_atual = models.IntegerField()
     preco_custo_lote = models.DecimalField(max_digits=10, decimal_places=2)
     
+    def save(self, *args, **kwargs):
+        if self.produto_id and not self.empresa_id:
+            self.empresa_id = Produto.objects.filter(pk=self.produto_id).values_list('empresa_id', flat=True).first()
+        super().save(*args, **kwargs)
+    
     def esta_vencido(self):
         return self.data_validade < timezone.now().date()
 
@@ -156,11 +173,102 @@ class Lote(TimeStampedModel):
         verbose_name = 'Lote'
         verbose_name_plural = 'Lotes'
         unique_together = ['produto', 'numero_lote']
+        indexes = [
+            models.Index(fields=['empresa', 'data_validade'], name='idx_lote_empresa_validade'),
+            # Seleção FEFO: lotes com saldo do produto por validade
+            models.Index(
+                fields=['produto', 'data_validade'],
+                name='idx_lote_fefo',
+                condition=models.Q(quantidade_atual__gt=0),
+            ),
+        ]
         
     def __str__(self):
         return f"{self.produto.nome_comercial} - Lote {self.numero_lote}"
 
 
+class AlocacaoLote(TimeStampedModel):
+    """
+    Quantidade de um item de venda (ou de fatura a crédito) retirada de um
+    lote (FEFO). Permite saber que lotes foram vendidos a quem e devolver ao
+    mesmo lote nas devoluções e notas de crédito.
+    """
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='alocacoes_lote')
+    lote = models.ForeignKey(Lote, on_delete=models.PROTECT, related_name='alocacoes')
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='alocacoes_lote')
+    item_venda = models.ForeignKey(
+        'vendas.ItemVenda', on_delete=models.CASCADE, null=True, blank=True, related_name='alocacoes_lote'
+    )
+    item_fatura = models.ForeignKey(
+        'vendas.ItemFatura', on_delete=models.CASCADE, null=True, blank=True, related_name='alocacoes_lote'
+    )
+    quantidade = models.PositiveIntegerField()
+    quantidade_devolvida = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Alocação de Lote'
+        verbose_name_plural = 'Alocações de Lotes'
+        ordering = ['item_venda', 'lote__data_validade']
+        indexes = [
+            models.Index(fields=['lote', 'created_at'], name='idx_alocacao_lote'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantidade} x Lote {self.lote_id} (item {self.item_venda_id or self.item_fatura_id})"
+
+    @property
+    def quantidade_liquida(self):
+        return self.quantidade - self.quantidade_devolvida
+
+
+class RiscoValidadeLote(models.Model):
+    """
+    Previsão (RiscoValidadeService, noturna) da quantidade do lote que
+    ficará por vender na data de validade, ao ritmo de vendas recente do
+    produto e com os lotes consumidos por ordem de validade. Só os lotes
+    com quantidade em risco são guardados.
+    """
+    NIVEL_CHOICES = [
+        ('baixo', 'Baixo'),
+        ('medio', 'Médio'),
+        ('alto', 'Alto'),
+        ('vencido', 'Vencido'),
+    ]
+
+    lote = models.OneToOneField(Lote, on_delete=models.CASCADE, primary_key=True, related_name='risco_validade')
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='riscos_validade')
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='riscos_validade')
+
+    data_validade = models.DateField()
+    dias_restantes = models.IntegerField()
+    quantidade_atual = models.IntegerField()
+    vendas_diarias = models.DecimalField(max_digits=12, decimal_places=4, help_text="Ritmo de vendas recente do produto")
+    quantidade_prevista_venda = models.IntegerField(help_text="Vendida deste lote até à validade")
+    quantidade_em_risco = models.IntegerField(help_text="Por vender na data de validade")
+    valor_em_risco = models.DecimalField(max_digits=14, decimal_places=2)
+    nivel = models.CharField(max_length=10, choices=NIVEL_CHOICES)
+
+    calculado_em = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Risco de Validade do Lote'
+        verbose_name_plural = 'Riscos de Validade dos Lotes'
+        ordering = ['-valor_em_risco']
+        indexes = [
+            models.Index(fields=['empresa', '-valor_em_risco'], name='idx_risco_validade_valor'),
+            models.Index(fields=['empresa', 'data_validade'], name='idx_risco_validade_data'),
+        ]
+
+    def __str__(self):
+        return f"Lote {self.lote_id}: {self.quantidade_em_risco} em risco ({self.valor_em_risco})"
+
+    @property
+    def percentual_em_risco(self):
+        if self.quantidade_atual:
+            return Decimal(self.quantidade_em_risco) * 100 / self.quantidade_atual
+        return Decimal('0')
+
+
 class ControleVencimento(TimeStampedModel):
     lote = models.ForeignKey(Lote, on_delete=models.CASCADE, related_name="controles_vencimento")
     dias_para_alerta = models.IntegerField(default=30)
@@ -243,4 +351,89 @@ class AlertaProdutoExpiracao(TimeStampedModel):
         dias_restantes = (self.lote.data_validade - timezone.now().date()).days
         return dias_restantes <= self.dias_alerta
 
-  
\ No newline at end of file
+  
+
+
+class ImportacaoProdutos(TimeStampedModel):
+    """Job de importação de catálogo de produtos (CSV/XLSX) processado em segundo plano"""
+    ESTADO_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('concluida', 'Concluída'),
+        ('falhou', 'Falhou'),
+    ]
+
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='importacoes_produtos')
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    arquivo = models.FileField(upload_to='importacoes/produtos/%Y/%m/')
+    nome_arquivo = models.CharField(max_length=255, blank=True)
+    atualizar_existentes = models.BooleanField(default=True)
+    validar_apenas = models.BooleanField(default=False)
+
+    estado = models.CharField(max_length=15, choices=ESTADO_CHOICES, default='pendente')
+    total_linhas = models.PositiveIntegerField(default=0, help_text="Estimativa, lida antes do processamento")
+    linhas_processadas = models.PositiveIntegerField(default=0)
+    validos = models.PositiveIntegerField(default=0)
+    importados = models.PositiveIntegerField(default=0)
+    atualizados = models.PositiveIntegerField(default=0)
+    ignorados = models.PositiveIntegerField(default=0)
+    total_erros = models.PositiveIntegerField(default=0)
+    erros = models.JSONField(default=list, blank=True, help_text="[{'linha': n, 'erro': '...'}] (limitado)")
+    mensagem_erro = models.TextField(blank=True)
+
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Importação de Produtos'
+        verbose_name_plural = 'Importações de Produtos'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.nome_arquivo or self.arquivo.name} ({self.get_estado_display()})"
+
+    @property
+    def em_andamento(self):
+        return self.estado in ('pendente', 'processando')
+
+    @property
+    def percentual(self):
+        if not self.total_linhas:
+            return 100 if self.estado == 'concluida' else 0
+        return min(100, round(self.linhas_processadas * 100 / self.total_linhas))
+
+
+class VersaoCatalogo(models.Model):
+    """
+    Contador monotónico das alterações ao catálogo de cada empresa.
+    Cada produto guarda a versão da sua última alteração, permitindo aos
+    PDVs pedir apenas o que mudou desde a última sincronização.
+    """
+    empresa = models.OneToOneField(Empresa, on_delete=models.CASCADE, related_name='versao_catalogo')
+    versao = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Versão do Catálogo'
+        verbose_name_plural = 'Versões do Catálogo'
+
+    def __str__(self):
+        return f"{self.empresa} v{self.versao}"
+
+
+class ProdutoRemovidoCatalogo(models.Model):
+    """Registo de produtos apagados, para que os PDVs os retirem na sincronização"""
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE)
+    produto_id = models.BigIntegerField()
+    versao = models.PositiveBigIntegerField()
+    removido_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Produto Removido do Catálogo'
+        verbose_name_plural = 'Produtos Removidos do Catálogo'
+        indexes = [
+            models.Index(fields=['empresa', 'versao'], name='idx_produto_removido_versao'),
+        ]
+
+    def __str__(self):
+        return f"Produto {self.produto_id} removido (v{self.versao})"
+
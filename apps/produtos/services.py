@@ -0,0 +1,916 @@
+# apps/produtos/services.py
+import codecs
+import csv
+import io
+import json
+import logging
+import unicodedata
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db import models
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Lower
+from django.utils import timezone
+
+from apps.core.models import Categoria
+from apps.fornecedores.models import Fornecedor
+from .models import (
+    AlocacaoLote, Fabricante, Lote, Produto, ProdutoRemovidoCatalogo, RiscoValidadeLote, VersaoCatalogo,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ImportacaoProdutosService:
+    """
+    Importação de catálogos de produtos em blocos.
+
+    O ficheiro é lido em streaming (openpyxl em modo read-only / pandas com
+    ``chunksize``). Para cada bloco, categorias, fabricantes e fornecedores
+    referenciados são resolvidos com uma consulta por tipo (as categorias e
+    fabricantes em falta são criados em lote) e os produtos são gravados com
+    um único ``bulk_create(update_conflicts=True)``. O progresso e os erros
+    por linha ficam no registo ``ImportacaoProdutos``.
+    """
+
+    TAMANHO_BLOCO = 1000
+    MAX_ERROS_GUARDADOS = 1000
+
+    COLUNAS = {
+        'nome_produto': 'nome', 'produto': 'nome', 'nome': 'nome',
+        'descricao': 'nome', 'descrição': 'nome',
+        'preco': 'preco_venda', 'preço': 'preco_venda', 'valor': 'preco_venda',
+        'preco_custo': 'preco_custo', 'preco_venda': 'preco_venda',
+        'categoria': 'categoria', 'grupo': 'categoria',
+        'fornecedor': 'fornecedor', 'fabricante': 'fabricante',
+        'codigo_barras': 'codigo_barras', 'codigo_interno': 'codigo_interno',
+        'nome_comercial': 'nome_comercial',
+        'estoque_atual': 'estoque_atual', 'estoque_minimo': 'estoque_minimo',
+        'estoque_maximo': 'estoque_maximo', 'margem_lucro': 'margem_lucro',
+        'desconto_percentual': 'desconto_percentual',
+        'observacoes': 'observacoes', 'ativo': 'ativo',
+    }
+
+    CAMPOS_ATUALIZADOS = [
+        'codigo_interno', 'nome_produto', 'nome_comercial', 'categoria', 'fornecedor', 'fabricante',
+        'preco_custo', 'preco_venda', 'estoque_atual', 'estoque_minimo', 'estoque_maximo',
+        'margem_lucro', 'desconto_percentual', 'observacoes', 'ativo', 'updated_at',
+    ]
+
+    def __init__(self, importacao):
+        self.importacao = importacao
+        self.empresa = importacao.empresa
+        self.nome_arquivo = (importacao.nome_arquivo or importacao.arquivo.name).lower()
+        # nome normalizado -> instância (partilhado entre blocos)
+        self._categorias = {}
+        self._fabricantes = {}
+        self._fornecedores = {}
+
+    # ------------------------------
+    # Leitura do ficheiro
+    # ------------------------------
+    @staticmethod
+    def limpar_texto(valor):
+        if valor is None:
+            return ''
+        if isinstance(valor, float):
+            if pd.isna(valor):
+                return ''
+            if valor.is_integer():
+                # Códigos numéricos lidos do Excel (ex.: 5601234567890.0)
+                valor = int(valor)
+        return unicodedata.normalize('NFKC', str(valor)).strip()
+
+    def _normalizar_cabecalho(self, cabecalho):
+        colunas = []
+        for coluna in cabecalho:
+            nome = str(coluna).strip().lower() if coluna is not None else ''
+            nome = self.COLUNAS.get(nome, nome)
+            # Colunas duplicadas: mantém a primeira
+            colunas.append(nome if nome not in colunas else '')
+        return colunas
+
+    def _detetar_csv(self, arquivo):
+        amostra = arquivo.read(64 * 1024)
+        arquivo.seek(0)
+        try:
+            amostra.decode('utf-8')
+            encoding = 'utf-8-sig' if amostra.startswith(codecs.BOM_UTF8) else 'utf-8'
+        except UnicodeDecodeError:
+            encoding = 'latin1'
+        texto = amostra.decode(encoding, errors='ignore')
+        try:
+            sep = csv.Sniffer().sniff(texto.splitlines()[0]).delimiter
+        except Exception:
+            sep = ';' if texto.count(';') > texto.count(',') else ','
+        return encoding, sep
+
+    def contar_linhas(self):
+        """Estimativa do número de linhas de dados (para o progresso)"""
+        with self.importacao.arquivo.open('rb') as arquivo:
+            if self.nome_arquivo.endswith('.xlsx'):
+                folha = openpyxl.load_workbook(arquivo, read_only=True).active
+                return max((folha.max_row or 1) - 1, 0)
+            if self.nome_arquivo.endswith('.xls'):
+                return 0
+            linhas = sum(bloco.count(b'\n') for bloco in iter(lambda: arquivo.read(1024 * 1024), b''))
+            return max(linhas - 1, 0)
+
+    def ler_blocos(self):
+        """Devolve blocos de ``[(numero_linha, {coluna: valor})]`` sem carregar o ficheiro inteiro"""
+        with self.importacao.arquivo.open('rb') as arquivo:
+            if self.nome_arquivo.endswith('.xlsx'):
+                yield from self._blocos_xlsx(arquivo)
+            elif self.nome_arquivo.endswith('.xls'):
+                # Formato antigo: não há leitor em streaming, lê-se com pandas
+                yield from self._blocos_dataframe([pd.read_excel(arquivo, dtype=str)])
+            else:
+                encoding, sep = self._detetar_csv(arquivo)
+                leitor = pd.read_csv(
+                    io.TextIOWrapper(arquivo, encoding=encoding, errors='ignore', newline=''),
+                    sep=sep, dtype=str, keep_default_na=False, on_bad_lines='skip',
+                    chunksize=self.TAMANHO_BLOCO,
+                )
+                yield from self._blocos_dataframe(leitor)
+
+    def _blocos_xlsx(self, arquivo):
+        livro = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            linhas = livro.active.iter_rows(values_only=True)
+            cabecalho = next(linhas, None)
+            if cabecalho is None:
+                return
+            colunas = self._normalizar_cabecalho(cabecalho)
+            bloco = []
+            for numero, valores in enumerate(linhas, start=2):
+                if not any(v not in (None, '') for v in valores):
+                    continue
+                bloco.append((numero, dict(zip(colunas, valores))))
+                if len(bloco) >= self.TAMANHO_BLOCO:
+                    yield bloco
+                    bloco = []
+            if bloco:
+                yield bloco
+        finally:
+            livro.close()
+
+    def _blocos_dataframe(self, dataframes):
+        numero = 2
+        for df in dataframes:
+            colunas = self._normalizar_cabecalho(df.columns)
+            bloco = []
+            for valores in df.itertuples(index=False, name=None):
+                bloco.append((numero, dict(zip(colunas, valores))))
+                numero += 1
+            for inicio in range(0, len(bloco), self.TAMANHO_BLOCO):
+                yield bloco[inicio:inicio + self.TAMANHO_BLOCO]
+
+    # ------------------------------
+    # Validação de linhas
+    # ------------------------------
+    def _decimal(self, valor, padrao):
+        texto = self.limpar_texto(valor)
+        if not texto:
+            return Decimal(padrao)
+        if ',' in texto and '.' not in texto:
+            texto = texto.replace(',', '.')
+        try:
+            return Decimal(texto)
+        except InvalidOperation:
+            raise ValueError(f"Valor numérico inválido: {texto}")
+
+    def normalizar_linha(self, dados):
+        """Converte a linha lida nos valores do produto; ``None`` se a linha não tem nome"""
+        nome = self.limpar_texto(dados.get('nome'))
+        if not nome:
+            return None
+
+        ativo = self.limpar_texto(dados.get('ativo'))
+        return {
+            'nome_produto': nome,
+            'nome_comercial': self.limpar_texto(dados.get('nome_comercial')) or nome,
+            'codigo_barras': self.limpar_texto(dados.get('codigo_barras')),
+            'codigo_interno': self.limpar_texto(dados.get('codigo_interno')),
+            'categoria': self.limpar_texto(dados.get('categoria')),
+            'fabricante': self.limpar_texto(dados.get('fabricante')),
+            'fornecedor': self.limpar_texto(dados.get('fornecedor')),
+            'preco_custo': self._decimal(dados.get('preco_custo'), 0),
+            'preco_venda': self._decimal(dados.get('preco_venda'), 0),
+            'estoque_atual': self._decimal(dados.get('estoque_atual'), 0),
+            'estoque_minimo': self._decimal(dados.get('estoque_minimo'), 1),
+            'estoque_maximo': self._decimal(dados.get('estoque_maximo'), 100),
+            'margem_lucro': self._decimal(dados.get('margem_lucro'), 0),
+            'desconto_percentual': self._decimal(dados.get('desconto_percentual'), 0),
+            'observacoes': self.limpar_texto(dados.get('observacoes')),
+            'ativo': ativo.lower() in ['1', 'true', 'sim', 'yes'] if ativo else True,
+        }
+
+    # ------------------------------
+    # Resolução de referências (uma consulta por tipo e bloco)
+    # ------------------------------
+    def _resolver_por_nome(self, modelo, cache, nomes, criar):
+        chaves = {nome.lower(): nome for nome in nomes if nome and nome.lower() not in cache}
+        if not chaves:
+            return
+
+        def carregar():
+            existentes = modelo.objects.filter(empresa=self.empresa).annotate(
+                nome_normalizado=Lower('nome')
+            ).filter(nome_normalizado__in=list(chaves))
+            for obj in existentes:
+                cache[obj.nome_normalizado] = obj
+
+        carregar()
+        em_falta = [nome for chave, nome in chaves.items() if chave not in cache]
+        if em_falta and criar:
+            modelo.objects.bulk_create(
+                [modelo(empresa=self.empresa, nome=nome) for nome in em_falta],
+                ignore_conflicts=True,
+            )
+            carregar()
+
+    def _resolver_fornecedores(self, nomes):
+        chaves = {nome.lower() for nome in nomes if nome and nome.lower() not in self._fornecedores}
+        if not chaves:
+            return
+        fornecedores = Fornecedor.objects.filter(empresa=self.empresa).annotate(
+            fantasia_normalizada=Lower('nome_fantasia'),
+            razao_normalizada=Lower('razao_social'),
+        ).filter(Q(fantasia_normalizada__in=chaves) | Q(razao_normalizada__in=chaves)).order_by('pk')
+        for fornecedor in fornecedores:
+            for chave in (fornecedor.fantasia_normalizada, fornecedor.razao_normalizada):
+                if chave in chaves:
+                    self._fornecedores.setdefault(chave, fornecedor)
+        # Não encontrados ficam em cache como None (fornecedores não são criados automaticamente)
+        for chave in chaves:
+            self._fornecedores.setdefault(chave, None)
+
+    def resolver_referencias(self, linhas):
+        criar = not self.importacao.validar_apenas
+        self._resolver_por_nome(Categoria, self._categorias, {l['categoria'] for l in linhas}, criar)
+        self._resolver_por_nome(Fabricante, self._fabricantes, {l['fabricante'] for l in linhas}, criar)
+        self._resolver_fornecedores({l['fornecedor'] for l in linhas})
+
+    # ------------------------------
+    # Processamento
+    # ------------------------------
+    @staticmethod
+    def _codigo_sem_barras(linha, internos_usados, por_nome):
+        """
+        Código de barras de uma linha que não o traz: o do produto existente
+        com o mesmo código interno (ou, sem este, com o mesmo nome); só um
+        produto novo recebe um código gerado.
+        """
+        if linha['codigo_interno']:
+            codigo = internos_usados.get(linha['codigo_interno'])
+        else:
+            candidatos = por_nome.get(linha['nome_produto'].lower(), set())
+            if len(candidatos) > 1:
+                raise ValueError(
+                    f"Nome {linha['nome_produto']} corresponde a vários produtos; indique o código de barras ou interno"
+                )
+            codigo = next(iter(candidatos), None)
+        return codigo or f"AUTO-{uuid.uuid4().hex[:10]}"
+
+    def processar_bloco(self, bloco, resultado):
+        validas = []
+        for numero, dados in bloco:
+            try:
+                linha = self.normalizar_linha(dados)
+            except ValueError as e:
+                resultado['erros'].append((numero, str(e)))
+                continue
+            if linha is not None:
+                validas.append((numero, linha))
+
+        self.resolver_referencias([linha for _, linha in validas])
+
+        # Conflitos com produtos existentes (código de barras é único globalmente)
+        codigos = [l['codigo_barras'] for _, l in validas if l['codigo_barras']]
+        existentes = {
+            codigo: (empresa_id, interno)
+            for codigo, empresa_id, interno in Produto.objects.filter(codigo_barras__in=codigos).values_list(
+                'codigo_barras', 'empresa_id', 'codigo_interno'
+            )
+        }
+        internos = [l['codigo_interno'] for _, l in validas if l['codigo_interno']]
+        internos_usados = dict(
+            Produto.objects.filter(empresa=self.empresa, codigo_interno__in=internos).values_list(
+                'codigo_interno', 'codigo_barras'
+            )
+        )
+        # Linhas sem código de barras: o produto já existente é o do mesmo
+        # código interno ou, sem este, o do mesmo nome na empresa
+        for interno, codigo in internos_usados.items():
+            existentes.setdefault(codigo, (self.empresa.pk, interno))
+        nomes = {
+            l['nome_produto'].lower() for _, l in validas
+            if not l['codigo_barras'] and not l['codigo_interno']
+        }
+        por_nome = defaultdict(set)
+        if nomes:
+            for nome, codigo, interno in Produto.objects.filter(empresa=self.empresa).annotate(
+                nome_normalizado=Lower('nome_produto')
+            ).filter(nome_normalizado__in=nomes).values_list('nome_normalizado', 'codigo_barras', 'codigo_interno'):
+                por_nome[nome].add(codigo)
+                existentes.setdefault(codigo, (self.empresa.pk, interno))
+
+        produtos = {}
+        for numero, linha in validas:
+            try:
+                codigo = linha['codigo_barras'] or self._codigo_sem_barras(linha, internos_usados, por_nome)
+            except ValueError as e:
+                resultado['erros'].append((numero, str(e)))
+                continue
+            existente = existentes.get(codigo)
+            if existente and existente[0] != self.empresa.pk:
+                resultado['erros'].append((numero, f"Código de barras {codigo} pertence a outra empresa"))
+                continue
+            if existente and not self.importacao.atualizar_existentes:
+                resultado['ignorados'] += 1
+                continue
+
+            interno = linha['codigo_interno'] or (existente[1] if existente else f"INT-{uuid.uuid4().hex[:8]}")
+            dono = internos_usados.get(interno)
+            if dono is not None and dono != codigo:
+                resultado['erros'].append((numero, f"Código interno {interno} já usado pelo produto {dono}"))
+                continue
+
+            produto = Produto(
+                empresa=self.empresa,
+                codigo_barras=codigo,
+                codigo_interno=interno,
+                nome_produto=linha['nome_produto'],
+                nome_comercial=linha['nome_comercial'],
+                categoria=self._categorias.get(linha['categoria'].lower()),
+                fabricante=self._fabricantes.get(linha['fabricante'].lower()),
+                fornecedor=self._fornecedores.get(linha['fornecedor'].lower()),
+                preco_custo=linha['preco_custo'],
+                preco_venda=linha['preco_venda'],
+                estoque_atual=linha['estoque_atual'],
+                estoque_minimo=linha['estoque_minimo'],
+                estoque_maximo=linha['estoque_maximo'],
+                margem_lucro=linha['margem_lucro'],
+                desconto_percentual=linha['desconto_percentual'],
+                observacoes=linha['observacoes'],
+                ativo=linha['ativo'],
+            )
+            try:
+                produto.aplicar_margem_lucro()
+            except (InvalidOperation, ArithmeticError):
+                resultado['erros'].append((numero, "Preço de custo ou margem de lucro inválidos"))
+                continue
+
+            # Repetido no ficheiro: prevalece a última linha
+            anterior = produtos.pop(codigo, None)
+            if anterior:
+                internos_usados.pop(anterior.codigo_interno, None)
+            internos_usados[interno] = codigo
+            if not linha['codigo_barras'] and not linha['codigo_interno']:
+                por_nome[linha['nome_produto'].lower()] = {codigo}
+            produtos[codigo] = produto
+
+        resultado['validos'] += len(produtos)
+        if not produtos or self.importacao.validar_apenas:
+            return
+
+        agora = timezone.now()
+        for produto in produtos.values():
+            produto.created_at = produto.updated_at = agora
+        Produto.objects.bulk_create(
+            list(produtos.values()),
+            update_conflicts=True,
+            unique_fields=['codigo_barras'],
+            update_fields=self.CAMPOS_ATUALIZADOS,
+        )
+        CatalogoPDVService.registrar_alteracao(self.empresa.pk, filtro=Q(codigo_barras__in=list(produtos)))
+        atualizados = sum(1 for codigo in produtos if codigo in existentes)
+        resultado['atualizados'] += atualizados
+        resultado['importados'] += len(produtos) - atualizados
+
+    def _gravar_progresso(self, linhas_processadas, resultado, **extra):
+        importacao = self.importacao
+        novos_erros = [{'linha': n, 'erro': e} for n, e in resultado['erros']]
+        importacao.total_erros += len(novos_erros)
+        espaco = self.MAX_ERROS_GUARDADOS - len(importacao.erros)
+        if espaco > 0:
+            importacao.erros.extend(novos_erros[:espaco])
+        resultado['erros'] = []
+
+        importacao.linhas_processadas = linhas_processadas
+        for campo in ('validos', 'importados', 'atualizados', 'ignorados'):
+            setattr(importacao, campo, resultado[campo])
+        for campo, valor in extra.items():
+            setattr(importacao, campo, valor)
+        importacao.save(update_fields=[
+            'linhas_processadas', 'validos', 'importados', 'atualizados', 'ignorados',
+            'total_erros', 'erros', 'updated_at', *extra,
+        ])
+
+    def executar(self):
+        importacao = self.importacao
+        importacao.estado = 'processando'
+        importacao.iniciado_em = timezone.now()
+        importacao.total_linhas = self.contar_linhas()
+        importacao.save(update_fields=['estado', 'iniciado_em', 'total_linhas', 'updated_at'])
+
+        resultado = {'validos': 0, 'importados': 0, 'atualizados': 0, 'ignorados': 0, 'erros': []}
+        processadas = 0
+        try:
+            for bloco in self.ler_blocos():
+                with transaction.atomic():
+                    self.processar_bloco(bloco, resultado)
+                processadas += len(bloco)
+                self._gravar_progresso(processadas, resultado)
+        except Exception as e:
+            logger.exception(f"Erro na importação de produtos {importacao.pk}: {e}")
+            self._gravar_progresso(
+                processadas, resultado,
+                estado='falhou', mensagem_erro=str(e), concluido_em=timezone.now(),
+            )
+            raise
+
+        self._gravar_progresso(
+            processadas, resultado,
+            estado='concluida', concluido_em=timezone.now(),
+            total_linhas=max(importacao.total_linhas, processadas),
+        )
+        logger.info(
+            f"Importação {importacao.pk}: {resultado['importados']} criados, "
+            f"{resultado['atualizados']} atualizados, {importacao.total_erros} erros"
+        )
+        return importacao
+
+
+class CatalogoPDVService:
+    """
+    Catálogo vendável da empresa para os PDVs, versionado.
+
+    Cada alteração de produtos incrementa ``VersaoCatalogo`` e carimba os
+    produtos alterados com a nova versão. O carimbo é feito depois do
+    commit, numa transação curta que bloqueia o contador: as versões ficam
+    pela ordem de commit e um PDV que sincronizou até à versão N nunca
+    perde alterações com versão <= N.
+
+    O payload é compacto (colunas + linhas) e fica em cache por versão.
+    """
+
+    COLUNAS = [
+        'id', 'codigo_barras', 'codigo_interno', 'nome_produto', 'categoria_id', 'categoria',
+        'preco_venda', 'iva_percentual', 'desconto_percentual', 'estoque_atual', 'estoque_minimo',
+        'foto_url', 'ativo',
+    ]
+    CACHE_TIMEOUT = 60 * 60
+
+    def __init__(self, empresa):
+        self.empresa = empresa
+
+    # ------------------------------
+    # Versões
+    # ------------------------------
+    @staticmethod
+    def registrar_alteracao(empresa_id, produto_ids=None, filtro=None, removidos=()):
+        """
+        Marca produtos como alterados (ids e/ou filtro Q) e regista remoções.
+        Executado após o commit da transação corrente.
+        """
+        produto_ids = list(produto_ids or [])
+        removidos = list(removidos)
+
+        def carimbar():
+            with transaction.atomic():
+                contador = VersaoCatalogo.objects.filter(empresa_id=empresa_id)
+                if not contador.update(versao=F('versao') + 1):
+                    VersaoCatalogo.objects.get_or_create(empresa_id=empresa_id)
+                    contador.update(versao=F('versao') + 1)
+                versao = contador.values_list('versao', flat=True).get()
+
+                condicao = Q(pk__in=produto_ids) if produto_ids else Q()
+                if filtro is not None:
+                    condicao = condicao | filtro if produto_ids else filtro
+                if produto_ids or filtro is not None:
+                    Produto.objects.filter(condicao, empresa_id=empresa_id).update(versao_catalogo=versao)
+                if removidos:
+                    ProdutoRemovidoCatalogo.objects.bulk_create([
+                        ProdutoRemovidoCatalogo(empresa_id=empresa_id, produto_id=pk, versao=versao)
+                        for pk in removidos
+                    ])
+
+        # robust: uma falha no carimbo não deve afetar quem gravou o produto
+        transaction.on_commit(carimbar, robust=True)
+
+    @staticmethod
+    def normalizar_desde(desde, versao):
+        """``desde`` efetivo: 0 (snapshot completo) se ausente, inválido ou fora de ]0, versão]"""
+        try:
+            desde = int(desde or 0)
+        except (TypeError, ValueError):
+            return 0
+        return desde if 0 < desde <= versao else 0
+
+    def versao_atual(self):
+        return VersaoCatalogo.objects.filter(empresa=self.empresa).values_list('versao', flat=True).first() or 0
+
+    # ------------------------------
+    # Payload
+    # ------------------------------
+    def _linha(self, produto):
+        return [
+            produto.id,
+            produto.codigo_barras,
+            produto.codigo_interno,
+            produto.nome_produto,
+            produto.categoria_id,
+            produto.categoria.nome if produto.categoria else '',
+            float(produto.preco_venda),
+            float(produto.iva_percentual),
+            float(produto.desconto_percentual),
+            float(produto.estoque_atual),
+            float(produto.estoque_minimo),
+            produto.foto.url if produto.foto else None,
+            produto.ativo,
+        ]
+
+    def dados(self, desde=None, versao=None):
+        """
+        Snapshot completo (só produtos ativos) ou, com ``desde``, os produtos
+        alterados e removidos depois dessa versão (incluindo inativados).
+        """
+        versao = self.versao_atual() if versao is None else versao
+        desde = self.normalizar_desde(desde, versao)
+        completo = not desde
+
+        produtos = Produto.objects.filter(empresa=self.empresa).select_related('categoria', 'taxa_iva')
+        removidos = []
+        if completo:
+            produtos = produtos.filter(ativo=True, versao_catalogo__lte=versao)
+        else:
+            produtos = produtos.filter(versao_catalogo__gt=desde, versao_catalogo__lte=versao)
+            removidos = list(ProdutoRemovidoCatalogo.objects.filter(
+                empresa=self.empresa, versao__gt=desde, versao__lte=versao
+            ).values_list('produto_id', flat=True))
+
+        return {
+            'versao': versao,
+            'desde': None if completo else desde,
+            'completo': completo,
+            'colunas': self.COLUNAS,
+            'produtos': [self._linha(produto) for produto in produtos.order_by('nome_produto')],
+            'removidos': removidos,
+        }
+
+    def payload(self, desde=None, versao=None):
+        """
+        JSON serializado, em cache por (empresa, desde, versão). ``desde`` é
+        normalizado: qualquer valor fora de ]0, versão] partilha a entrada do
+        snapshot completo, pelo que há no máximo versão + 1 entradas.
+        """
+        versao = self.versao_atual() if versao is None else versao
+        desde = self.normalizar_desde(desde, versao)
+        chave = f"catalogo_pdv:{self.empresa.pk}:{desde}:{versao}"
+        conteudo = cache.get(chave)
+        if conteudo is None:
+            conteudo = json.dumps(self.dados(desde, versao), cls=DjangoJSONEncoder, separators=(',', ':'))
+            cache.set(chave, conteudo, self.CACHE_TIMEOUT)
+        return conteudo
+
+
+
+class AlocacaoLoteService:
+    """
+    Alocação FEFO (first-expired-first-out) das vendas aos lotes.
+
+    Os lotes com saldo de todos os produtos do cesto são bloqueados numa
+    única consulta, ordenados por validade; as quantidades são distribuídas
+    em memória e gravadas com um UPDATE dos lotes (CASE por lote), um
+    ``bulk_create`` das alocações e um UPDATE do ``estoque_atual`` dos
+    produtos. O número de queries não depende do número de linhas.
+
+    Lotes vencidos não são vendidos. A quantidade sem lote disponível
+    (produto sem lotes ou lotes esgotados) é descontada diretamente do
+    ``estoque_atual`` dos produtos sem lotes; nos restantes o estoque é a
+    soma dos lotes, como no signal do Lote.
+
+    Os lotes contam unidades inteiras: quantidades fracionadas só são
+    aceites em produtos sem lotes (ValueError nos restantes).
+    """
+
+    @staticmethod
+    def _movimentar_lotes(deltas):
+        """Soma ``deltas`` {lote_id: quantidade} aos lotes num único UPDATE"""
+        deltas = {pk: delta for pk, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        Lote.objects.filter(pk__in=deltas).update(
+            quantidade_atual=F('quantidade_atual') + Case(
+                *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+                default=Value(0),
+                output_field=models.IntegerField(),
+            ),
+            updated_at=timezone.now(),
+        )
+
+    @staticmethod
+    def _validar_quantidades(quantidades):
+        """Rejeita quantidades não inteiras ``[(produto_id, quantidade), ...]`` de produtos com lotes"""
+        fracionadas = {produto_id for produto_id, quantidade in quantidades if Decimal(quantidade) % 1}
+        if not fracionadas:
+            return
+        com_lotes = set(Lote.objects.filter(produto_id__in=fracionadas).values_list('produto_id', flat=True))
+        if com_lotes:
+            nomes = ', '.join(Produto.objects.filter(pk__in=com_lotes).order_by('pk').values_list('nome_produto', flat=True))
+            raise ValueError(f"Produtos controlados por lotes só aceitam quantidades inteiras: {nomes}")
+
+    @staticmethod
+    def _atualizar_estoque(produto_ids, sem_lote):
+        """
+        ``estoque_atual`` = soma dos lotes; produtos sem lotes descontam
+        ``sem_lote`` {produto_id: quantidade} (negativo repõe).
+        """
+        if not produto_ids:
+            return
+        decimal = models.DecimalField(max_digits=10, decimal_places=2)
+        soma_lotes = (
+            Lote.objects.filter(produto=OuterRef('pk'))
+            .values('produto')
+            .annotate(total=Sum('quantidade_atual'))
+            .values('total')
+        )
+        desconto = Case(
+            *[When(pk=pk, then=Value(Decimal(quantidade))) for pk, quantidade in sem_lote.items() if quantidade],
+            default=Value(Decimal('0')),
+            output_field=decimal,
+        )
+        produtos = Produto.objects.filter(pk__in=produto_ids)
+        produtos.update(
+            estoque_atual=Coalesce(Subquery(soma_lotes, output_field=decimal), F('estoque_atual') - desconto),
+            updated_at=timezone.now(),
+        )
+        for empresa_id in set(produtos.values_list('empresa_id', flat=True)):
+            CatalogoPDVService.registrar_alteracao(empresa_id, produto_ids=produto_ids)
+
+    @classmethod
+    @transaction.atomic
+    def alocar(cls, itens):
+        """
+        Retira dos lotes as quantidades dos itens (ItemVenda ou ItemFatura
+        já gravados) e regista as alocações. Devolve as alocações criadas.
+        """
+        from apps.vendas.models import ItemFatura
+
+        itens = [item for item in itens if item.produto_id and item.quantidade > 0]
+        if not itens:
+            return []
+        cls._validar_quantidades([(item.produto_id, item.quantidade) for item in itens])
+        produto_ids = sorted({item.produto_id for item in itens})
+
+        lotes = defaultdict(list)
+        disponiveis = (
+            Lote.objects.select_for_update()
+            .filter(produto_id__in=produto_ids, quantidade_atual__gt=0, data_validade__gte=timezone.localdate())
+            .order_by('produto_id', 'data_validade', 'id')
+            .only('id', 'produto_id', 'quantidade_atual', 'data_validade')
+        )
+        for lote in disponiveis:
+            lotes[lote.produto_id].append(lote)
+
+        alocacoes = []
+        retirado = defaultdict(int)
+        sem_lote = defaultdict(Decimal)
+        for item in itens:
+            if isinstance(item, ItemFatura):
+                origem = {'empresa_id': item.fatura.empresa_id, 'item_fatura': item}
+            else:
+                origem = {'empresa_id': item.venda.empresa_id, 'item_venda': item}
+            # Inteiro nos produtos com lotes (validado acima)
+            restante = Decimal(item.quantidade)
+            for lote in lotes.get(item.produto_id, ()):
+                disponivel = lote.quantidade_atual - retirado[lote.pk]
+                if disponivel <= 0:
+                    continue
+                quantidade = int(min(disponivel, restante))
+                retirado[lote.pk] += quantidade
+                restante -= quantidade
+                alocacoes.append(AlocacaoLote(
+                    lote=lote,
+                    produto_id=item.produto_id,
+                    quantidade=quantidade,
+                    **origem,
+                ))
+                if not restante:
+                    break
+            if restante:
+                sem_lote[item.produto_id] += restante
+
+        cls._movimentar_lotes({pk: -quantidade for pk, quantidade in retirado.items()})
+        AlocacaoLote.objects.bulk_create(alocacoes)
+        cls._atualizar_estoque(produto_ids, sem_lote)
+        if sem_lote:
+            logger.info(f"Itens vendidos sem lote disponível (produto: quantidade): {dict(sem_lote)}")
+        return alocacoes
+
+    @classmethod
+    @transaction.atomic
+    def reverter(cls, devolucoes):
+        """
+        Devolve aos lotes de origem as quantidades devolvidas
+        ``[(item_venda_id, quantidade), ...]`` (devoluções e notas de
+        crédito). Repõe primeiro nos lotes de validade mais longa; o que
+        exceder o alocado (vendas sem alocação) repõe o estoque do produto.
+        Como em ``alocar``, produtos com lotes só aceitam quantidades
+        inteiras.
+        """
+        from apps.vendas.models import ItemVenda
+
+        pedidos = defaultdict(Decimal)
+        for item_venda_id, quantidade in devolucoes:
+            if item_venda_id and quantidade and quantidade > 0:
+                pedidos[item_venda_id] += Decimal(quantidade)
+        if not pedidos:
+            return 0
+        produtos = dict(ItemVenda.objects.filter(pk__in=pedidos, produto__isnull=False).values_list('pk', 'produto_id'))
+        cls._validar_quantidades(
+            [(produtos[item_venda_id], quantidade) for item_venda_id, quantidade in pedidos.items() if item_venda_id in produtos]
+        )
+
+        alocacoes = (
+            AlocacaoLote.objects.select_for_update(of=('self',))
+            .filter(item_venda_id__in=pedidos, quantidade__gt=F('quantidade_devolvida'))
+            .order_by('item_venda_id', '-lote__data_validade', '-id')
+        )
+        repor = defaultdict(int)
+        alteradas = []
+        for alocacao in alocacoes:
+            restante = pedidos[alocacao.item_venda_id]
+            if not restante:
+                continue
+            quantidade = int(min(alocacao.quantidade - alocacao.quantidade_devolvida, restante))
+            alocacao.quantidade_devolvida += quantidade
+            alocacao.updated_at = timezone.now()
+            pedidos[alocacao.item_venda_id] -= quantidade
+            repor[alocacao.lote_id] += quantidade
+            alteradas.append(alocacao)
+
+        sem_lote = defaultdict(Decimal)
+        for item_venda_id, restante in pedidos.items():
+            if restante and item_venda_id in produtos:
+                sem_lote[produtos[item_venda_id]] -= restante
+
+        cls._movimentar_lotes(repor)
+        AlocacaoLote.objects.bulk_update(alteradas, ['quantidade_devolvida', 'updated_at'])
+        cls._atualizar_estoque(sorted(set(produtos.values())), sem_lote)
+        return sum(repor.values())
+
+
+class RiscoValidadeService:
+    """
+    Previsão do stock que chegará à validade por vender (RiscoValidadeLote).
+
+    Os lotes com saldo da empresa são lidos numa consulta e as vendas de
+    cada produto nos últimos ``DIAS_VENDAS`` dias noutra. Com os lotes
+    ordenados por produto e validade e consumidos por FEFO, o vendido
+    acumulado até ao lote i é
+
+        S_i = min(S_(i-1) + q_i, r·d_i) = Q_i + min(0, min_(j<=i) (r·d_j - Q_j))
+
+    (Q = quantidade acumulada dos lotes do produto, d = dias até à validade,
+    r = vendas diárias): uma soma e um mínimo acumulados por produto, pelo
+    que o cálculo é vetorizado para todos os lotes. Os lotes em risco são
+    gravados por upsert em blocos; os que deixaram de estar em risco são
+    removidos.
+    """
+
+    DIAS_VENDAS = 28
+    TAMANHO_BLOCO = 5000
+    STATUS_VENDA = ('finalizada', 'entregue')
+    CAMPOS = [
+        'empresa', 'produto', 'data_validade', 'dias_restantes', 'quantidade_atual', 'vendas_diarias',
+        'quantidade_prevista_venda', 'quantidade_em_risco', 'valor_em_risco', 'nivel', 'calculado_em',
+    ]
+
+    def __init__(self, empresa):
+        self.empresa = empresa
+
+    def _lotes(self):
+        colunas = ['lote_id', 'produto_id', 'data_validade', 'quantidade', 'custo_lote', 'custo_produto']
+        linhas = (
+            Lote.objects.filter(empresa=self.empresa, quantidade_atual__gt=0)
+            .order_by('produto_id', 'data_validade', 'id')
+            .values_list('id', 'produto_id', 'data_validade', 'quantidade_atual', 'preco_custo_lote',
+                         'produto__preco_custo')
+        )
+        return pd.DataFrame.from_records(list(linhas), columns=colunas)
+
+    def _vendas_diarias(self):
+        from apps.vendas.models import ItemVenda
+
+        vendas = (
+            ItemVenda.objects.filter(
+                venda__empresa=self.empresa,
+                venda__status__in=self.STATUS_VENDA,
+                venda__data_venda__gte=timezone.now() - timedelta(days=self.DIAS_VENDAS),
+                produto__isnull=False,
+            )
+            .values('produto_id')
+            .annotate(quantidade=Sum('quantidade'))
+            .values_list('produto_id', 'quantidade')
+            .order_by()
+        )
+        return pd.Series(dict(vendas), dtype='float64') / self.DIAS_VENDAS
+
+    def prever(self, hoje=None):
+        """DataFrame com a previsão de todos os lotes com saldo (um por linha)"""
+        hoje = hoje or timezone.localdate()
+        df = self._lotes()
+        if df.empty:
+            return df
+
+        produto = df['produto_id']
+        quantidade = df['quantidade'].astype('float64')
+        df['dias_restantes'] = (pd.to_datetime(df['data_validade']) - pd.Timestamp(hoje)).dt.days
+        df['vendas_diarias'] = produto.map(self._vendas_diarias()).fillna(0.0)
+
+        procura = df['vendas_diarias'] * df['dias_restantes'].clip(lower=0)
+        acumulada = quantidade.groupby(produto).cumsum()
+        vendido_acumulado = acumulada + (procura - acumulada).groupby(produto).cummin().clip(upper=0)
+        vendido = vendido_acumulado - vendido_acumulado.groupby(produto).shift(fill_value=0)
+
+        df['quantidade_prevista_venda'] = np.floor(vendido.clip(lower=0) + 1e-9).astype('int64')
+        df['quantidade_em_risco'] = df['quantidade'] - df['quantidade_prevista_venda']
+        custo = df['custo_lote'].where(df['custo_lote'].fillna(0) > 0, df['custo_produto']).fillna(0).astype('float64')
+        df['valor_em_risco'] = (df['quantidade_em_risco'] * custo).round(2)
+
+        percentual = df['quantidade_em_risco'] / df['quantidade']
+        df['nivel'] = np.select(
+            [df['dias_restantes'] < 0, percentual >= 0.5, percentual >= 0.2],
+            ['vencido', 'alto', 'medio'],
+            default='baixo',
+        )
+        return df
+
+    @transaction.atomic
+    def executar(self):
+        """Recalcula e grava os riscos da empresa. Devolve o número de lotes em risco"""
+        agora = timezone.now()
+        df = self.prever(timezone.localdate(agora))
+        if not df.empty:
+            df = df[df['quantidade_em_risco'] > 0]
+
+        registros = [
+            RiscoValidadeLote(
+                lote_id=lote_id,
+                empresa=self.empresa,
+                produto_id=produto_id,
+                data_validade=data_validade,
+                dias_restantes=dias,
+                quantidade_atual=quantidade,
+                vendas_diarias=Decimal(str(round(taxa, 4))),
+                quantidade_prevista_venda=prevista,
+                quantidade_em_risco=em_risco,
+                valor_em_risco=Decimal(str(valor)).quantize(Decimal('0.01')),
+                nivel=nivel,
+                calculado_em=agora,
+            )
+            for lote_id, produto_id, data_validade, dias, quantidade, taxa, prevista, em_risco, valor, nivel in zip(
+                *(df[coluna].tolist() for coluna in (
+                    'lote_id', 'produto_id', 'data_validade', 'dias_restantes', 'quantidade', 'vendas_diarias',
+                    'quantidade_prevista_venda', 'quantidade_em_risco', 'valor_em_risco', 'nivel',
+                ))
+            )
+        ] if not df.empty else []
+
+        for inicio in range(0, len(registros), self.TAMANHO_BLOCO):
+            RiscoValidadeLote.objects.bulk_create(
+                registros[inicio:inicio + self.TAMANHO_BLOCO],
+                update_conflicts=True,
+                unique_fields=['lote'],
+                update_fields=self.CAMPOS,
+            )
+        RiscoValidadeLote.objects.filter(empresa=self.empresa, calculado_em__lt=agora).delete()
+        logger.info(f"Risco de validade da empresa {self.empresa.pk}: {len(registros)} lotes em risco")
+        return len(registros)
+
+    @staticmethod
+    def resumo(empresa):
+        """Totais por nível para o painel"""
+        por_nivel = {
+            linha['nivel']: linha
+            for linha in RiscoValidadeLote.objects.filter(empresa=empresa)
+            .values('nivel')
+            .annotate(lotes=Count('lote'), quantidade=Sum('quantidade_em_risco'), valor=Sum('valor_em_risco'))
+            .order_by()
+        }
+        return {
+            'por_nivel': por_nivel,
+            'lotes': sum(linha['lotes'] for linha in por_nivel.values()),
+            'valor_total': sum((linha['valor'] for linha in por_nivel.values()), Decimal('0.00')),
+        }
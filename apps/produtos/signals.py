@@ -1,8 +1,10 @@
 # apps/produtos/signals.py
 
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from django.db.models import Sum
+from django.db.models import Q, Sum
+from apps.core.models import Categoria
+from apps.fiscal.models import TaxaIVAAGT
 from .models import Lote, Produto 
 
 @receiver(post_save, sender=Lote)
@@ -22,3 +24,52 @@ def atualizar_estoque_produto(sender, instance, **kwargs):
             produto.save(update_fields=['estoque_atual'])
 
 
+@receiver(post_save, sender=Produto)
+def versionar_produto_catalogo(sender, instance, raw=False, **kwargs):
+    """Qualquer gravação do produto (preço, IVA, estoque...) gera uma nova versão do catálogo do PDV"""
+    if raw:
+        return
+    from .services import CatalogoPDVService
+    CatalogoPDVService.registrar_alteracao(instance.empresa_id, produto_ids=[instance.pk])
+
+
+@receiver(post_delete, sender=Produto)
+def versionar_remocao_catalogo(sender, instance, **kwargs):
+    from .services import CatalogoPDVService
+    CatalogoPDVService.registrar_alteracao(instance.empresa_id, removidos=[instance.pk])
+
+
+def _versionar_produtos(filtro, apagado=False):
+    """
+    Nova versão do catálogo para os produtos de ``filtro``, por empresa. Num
+    delete o SET_NULL muda o filtro antes do carimbo: vão os ids.
+    """
+    from .services import CatalogoPDVService
+    produtos = Produto.objects.filter(filtro)
+    if apagado:
+        por_empresa = {}
+        for pk, empresa_id in produtos.values_list('pk', 'empresa_id'):
+            por_empresa.setdefault(empresa_id, []).append(pk)
+        for empresa_id, produto_ids in por_empresa.items():
+            CatalogoPDVService.registrar_alteracao(empresa_id, produto_ids=produto_ids)
+        return
+    for empresa_id in produtos.values_list('empresa_id', flat=True).distinct().order_by():
+        CatalogoPDVService.registrar_alteracao(empresa_id, filtro=filtro)
+
+
+@receiver(post_save, sender=Categoria)
+@receiver(pre_delete, sender=Categoria)
+def versionar_categoria_catalogo(sender, instance, created=False, raw=False, **kwargs):
+    """O catálogo do PDV inclui o nome da categoria: alterá-la altera os seus produtos"""
+    if raw or created:
+        return
+    _versionar_produtos(Q(categoria_id=instance.pk), apagado=kwargs.get('signal') is pre_delete)
+
+
+@receiver(post_save, sender=TaxaIVAAGT)
+@receiver(pre_delete, sender=TaxaIVAAGT)
+def versionar_taxa_iva_catalogo(sender, instance, created=False, raw=False, **kwargs):
+    """O catálogo do PDV inclui a percentagem de IVA: alterar a taxa altera os seus produtos"""
+    if raw or created:
+        return
+    _versionar_produtos(Q(taxa_iva_id=instance.pk), apagado=kwargs.get('signal') is pre_delete)
@@ -1,16 +1,67 @@
 # apps/produtos/tasks.py
-from apps.produtos.models import Lote, AlertaProdutoExpiracao
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from apps.produtos.models import Lote, AlertaProdutoExpiracao, ImportacaoProdutos
 from django.utils import timezone
 
+logger = logging.getLogger(__name__)
+
 def gerar_alertas_produtos():
     hoje = timezone.now().date()
-    lotes = Lote.objects.filter(data_validade__gte=hoje)
-    for lote in lotes:
-        dias_para_vencer = (lote.data_validade - hoje).days
-        if dias_para_vencer <= 30:
-            alerta, created = AlertaProdutoExpiracao.objects.get_or_create(
-                lote=lote,
-                empresa=lote.produto.empresa,
-                defaults={'dias_alerta': 30}
-            )
+    # Só lotes com saldo: as vendas descontam os lotes (FEFO), a quantidade está atualizada
+    lotes = Lote.objects.filter(
+        empresa__isnull=False,
+        data_validade__gte=hoje,
+        data_validade__lte=hoje + timedelta(days=30),
+        quantidade_atual__gt=0,
+    ).exclude(alertas_expiracao__isnull=False)
+    AlertaProdutoExpiracao.objects.bulk_create([
+        AlertaProdutoExpiracao(lote_id=lote_id, empresa_id=empresa_id, dias_alerta=30)
+        for lote_id, empresa_id in lotes.values_list('id', 'empresa_id')
+    ])
+
+
+@shared_task
+def importar_produtos_task(importacao_id):
+    """Processa um ficheiro de catálogo (CSV/XLSX) registado em ImportacaoProdutos"""
+    from .services import ImportacaoProdutosService
+
+    importacao = ImportacaoProdutos.objects.select_related('empresa').get(pk=importacao_id)
+    if importacao.estado != 'pendente':
+        logger.warning(f'Importação {importacao_id} já processada ({importacao.estado})')
+        return importacao.estado
+
+    importacao = ImportacaoProdutosService(importacao).executar()
+    return {
+        'importacao_id': importacao.pk,
+        'importados': importacao.importados,
+        'atualizados': importacao.atualizados,
+        'erros': importacao.total_erros,
+    }
+
+
+
+@shared_task
+def calcular_risco_validade_task(empresa_id=None):
+    """
+    Previsão noturna do stock que chegará à validade por vender, por
+    empresa, seguida dos alertas de estoque/vencimento.
+    """
+    from apps.core.models import Empresa
+    from apps.estoque.models import AlertaEstoque
+    from .services import RiscoValidadeService
 
+    empresas = Empresa.objects.filter(ativa=True)
+    if empresa_id:
+        empresas = empresas.filter(pk=empresa_id)
+    total = 0
+    for empresa in empresas:
+        try:
+            total += RiscoValidadeService(empresa).executar()
+            AlertaEstoque.gerar_alertas_automaticos(empresa)
+        except Exception as e:
+            logger.error(f'Erro ao calcular o risco de validade da empresa {empresa.id}: {e}')
+    logger.info(f'Risco de validade calculado: {total} lotes em risco')
+    return total
@@ -1,3 +1,395 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+
+from apps.clientes.models import Cliente
+from apps.core.models import Categoria, Empresa, Loja
+from apps.fiscal.models import TaxaIVAAGT
+from apps.produtos.models import AlocacaoLote, ImportacaoProdutos, Lote, Produto, RiscoValidadeLote
+from apps.produtos.services import (
+    AlocacaoLoteService, CatalogoPDVService, ImportacaoProdutosService, RiscoValidadeService,
+)
+from apps.vendas.models import (
+    DevolucaoVenda, FaturaCredito, FormaPagamento, ItemDevolucao, ItemFatura, ItemVenda, Venda,
+)
+
+
+class AlocacaoLoteServiceTest(TestCase):
+    """Baixa FEFO das vendas nos lotes e reposição das devoluções"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            nome='Farmácia Teste', nif='5000000001', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email='teste@exemplo.ao',
+        )
+        cls.loja = Loja.objects.create(
+            empresa=cls.empresa, nome='Loja', codigo='L1', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', postal='0000', provincia='Luanda',
+        )
+        # Produto.taxa_iva aponta por omissão para a taxa 1
+        TaxaIVAAGT.objects.create(
+            pk=1, empresa=cls.empresa, nome='IVA 14%', tax_type='IVA', tax_code='NOR', tax_percentage=Decimal('14'),
+        )
+        cls.forma_pagamento = FormaPagamento.objects.create(empresa=cls.empresa, nome='Dinheiro')
+        cls.hoje = timezone.localdate()
+
+    def setUp(self):
+        self.numero_venda = 0
+
+    def _produto(self, codigo, estoque=0):
+        return Produto.objects.create(
+            empresa=self.empresa, codigo_interno=codigo, codigo_barras=f'560000{codigo}',
+            nome_produto=f'Produto {codigo}', nome_comercial=f'Produto {codigo}',
+            preco_custo=Decimal('10'), preco_venda=Decimal('12'), margem_lucro=Decimal('20'),
+            estoque_atual=Decimal(estoque),
+        )
+
+    def _lote(self, produto, numero, dias, quantidade):
+        return Lote.objects.create(
+            produto=produto, numero_lote=numero, data_validade=self.hoje + timedelta(days=dias),
+            quantidade_inicial=quantidade, quantidade_atual=quantidade, preco_custo_lote=Decimal('8'),
+        )
+
+    def _venda(self, *linhas):
+        self.numero_venda += 1
+        venda = Venda.objects.create(
+            empresa=self.empresa, loja=self.loja, forma_pagamento=self.forma_pagamento,
+            numero_documento=f'FR TESTE/{self.numero_venda}', subtotal=Decimal('0'), total=Decimal('0'),
+        )
+        return [
+            ItemVenda.objects.create(
+                venda=venda, produto=produto, nome_produto=produto.nome_produto, quantidade=quantidade,
+                preco_unitario=Decimal('12'), total=Decimal('12') * quantidade,
+            )
+            for produto, quantidade in linhas
+        ]
+
+    def _quantidades(self, *lotes):
+        return [Lote.objects.get(pk=lote.pk).quantidade_atual for lote in lotes]
+
+    def test_alocar_consome_lotes_por_validade_e_ignora_vencidos(self):
+        produto = self._produto('A')
+        vencido = self._lote(produto, 'V', -1, 5)
+        curto = self._lote(produto, 'C', 10, 10)
+        longo = self._lote(produto, 'L', 30, 20)
+
+        item, = self._venda((produto, 12))
+        alocacoes = AlocacaoLoteService.alocar([item])
+
+        self.assertEqual([(a.lote_id, a.quantidade) for a in alocacoes], [(curto.pk, 10), (longo.pk, 2)])
+        self.assertEqual(self._quantidades(vencido, curto, longo), [5, 0, 18])
+        produto.refresh_from_db()
+        self.assertEqual(produto.estoque_atual, Decimal('23'))
+
+    def test_alocar_produto_sem_lotes_desconta_estoque(self):
+        produto = self._produto('B', estoque=10)
+
+        item, = self._venda((produto, 3))
+        self.assertEqual(AlocacaoLoteService.alocar([item]), [])
+
+        produto.refresh_from_db()
+        self.assertEqual(produto.estoque_atual, Decimal('7'))
+
+    def test_alocar_cesto_com_varias_linhas_do_mesmo_produto(self):
+        produto = self._produto('C')
+        curto = self._lote(produto, 'C', 10, 4)
+        longo = self._lote(produto, 'L', 30, 10)
+
+        itens = self._venda((produto, 3), (produto, 3))
+        AlocacaoLoteService.alocar(itens)
+
+        self.assertEqual(self._quantidades(curto, longo), [0, 8])
+        self.assertEqual(
+            sorted(AlocacaoLote.objects.filter(item_venda=itens[1]).values_list('lote_id', 'quantidade')),
+            sorted([(curto.pk, 1), (longo.pk, 2)]),
+        )
+
+    def test_alocar_rejeita_fracao_em_produto_com_lotes(self):
+        produto = self._produto('H')
+        lote = self._lote(produto, 'L', 30, 10)
+
+        item, = self._venda((produto, Decimal('1.5')))
+        with self.assertRaises(ValueError):
+            AlocacaoLoteService.alocar([item])
+
+        self.assertEqual(self._quantidades(lote), [10])
+        self.assertFalse(AlocacaoLote.objects.filter(item_venda=item).exists())
+
+    def test_alocar_fracao_em_produto_sem_lotes_desconta_exato(self):
+        produto = self._produto('I', estoque=10)
+
+        item, = self._venda((produto, Decimal('2.5')))
+        AlocacaoLoteService.alocar([item])
+
+        produto.refresh_from_db()
+        self.assertEqual(produto.estoque_atual, Decimal('7.5'))
+
+    def test_alocar_itens_de_fatura_credito(self):
+        produto = self._produto('J')
+        lote = self._lote(produto, 'L', 30, 10)
+        fatura = FaturaCredito.objects.create(
+            empresa=self.empresa, forma_pagamento=self.forma_pagamento, numero_documento='FT TESTE/1',
+            data_vencimento=self.hoje + timedelta(days=30),
+        )
+        item = ItemFatura.objects.create(
+            fatura=fatura, produto=produto, nome_item=produto.nome_produto, quantidade=Decimal('4'),
+            preco_unitario=Decimal('12'),
+        )
+
+        alocacao, = AlocacaoLoteService.alocar([item])
+
+        self.assertEqual((alocacao.item_fatura_id, alocacao.item_venda_id, alocacao.quantidade), (item.pk, None, 4))
+        self.assertEqual(alocacao.empresa_id, self.empresa.pk)
+        self.assertEqual(self._quantidades(lote), [6])
+
+    def test_reverter_repoe_primeiro_lotes_de_validade_mais_longa(self):
+        produto = self._produto('D')
+        curto = self._lote(produto, 'C', 10, 10)
+        longo = self._lote(produto, 'L', 30, 20)
+        item, = self._venda((produto, 12))
+        AlocacaoLoteService.alocar([item])
+
+        self.assertEqual(AlocacaoLoteService.reverter([(item.pk, 5)]), 5)
+
+        self.assertEqual(self._quantidades(curto, longo), [3, 20])
+        self.assertEqual(
+            dict(AlocacaoLote.objects.filter(item_venda=item).values_list('lote_id', 'quantidade_devolvida')),
+            {curto.pk: 3, longo.pk: 2},
+        )
+
+        # O que já foi devolvido não volta a ser reposto nos lotes
+        AlocacaoLoteService.reverter([(item.pk, 7)])
+        self.assertEqual(self._quantidades(curto, longo), [10, 20])
+
+    def test_reverter_quantidade_fracionaria_sem_truncar(self):
+        produto = self._produto('E', estoque=10)
+        item, = self._venda((produto, 3))
+        AlocacaoLoteService.alocar([item])
+
+        AlocacaoLoteService.reverter([(item.pk, Decimal('1.5'))])
+
+        produto.refresh_from_db()
+        self.assertEqual(produto.estoque_atual, Decimal('8.5'))
+
+    def test_devolucao_repoe_lotes_do_item_devolvido(self):
+        outro = self._produto('F')
+        produto = self._produto('G')
+        lote_outro = self._lote(outro, 'O', 20, 10)
+        lote = self._lote(produto, 'P', 20, 10)
+        item_outro, item = self._venda((outro, 4), (produto, 4))
+        AlocacaoLoteService.alocar([item_outro, item])
+
+        cliente = Cliente.objects.create(empresa=self.empresa, nome_completo='Cliente Teste')
+        usuario = get_user_model().objects.create(username='devolucao', empresa=self.empresa)
+        devolucao = DevolucaoVenda.objects.create(
+            numero_devolucao='DEV-1', venda_original=item.venda, motivo='produto_danificado',
+            valor_devolvido=Decimal('36'), cliente=cliente, solicitante=usuario,
+        )
+        ItemDevolucao.objects.create(
+            devolucao=devolucao, item_venda_original=item,
+            quantidade_devolvida=Decimal('3'), valor_restituido=Decimal('36'),
+        )
+
+        self.assertEqual(self._quantidades(lote_outro, lote), [6, 9])
+
+
+class CatalogoPDVServiceTest(TestCase):
+    """Versões do catálogo do PDV: alterações de categoria e IVA, chave de cache"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            nome='Farmácia Catálogo', nif='5000000003', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email='catalogo@exemplo.ao',
+        )
+        cls.taxa = TaxaIVAAGT.objects.create(
+            pk=1, empresa=cls.empresa, nome='IVA 14%', tax_type='IVA', tax_code='NOR', tax_percentage=Decimal('14'),
+        )
+        cls.categoria = Categoria.objects.create(empresa=cls.empresa, nome='Analgésicos')
+
+    def setUp(self):
+        self.service = CatalogoPDVService(self.empresa)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produto = self._produto('K1', categoria=self.categoria)
+            self.outro = self._produto('K2')
+        self.versao = self.service.versao_atual()
+
+    def _produto(self, codigo, **campos):
+        return Produto.objects.create(
+            empresa=self.empresa, codigo_interno=codigo, codigo_barras=f'561000{codigo}',
+            nome_produto=f'Produto {codigo}', nome_comercial=f'Produto {codigo}',
+            preco_custo=Decimal('10'), preco_venda=Decimal('12'), margem_lucro=Decimal('20'), **campos,
+        )
+
+    def _alterados(self):
+        return {linha[0] for linha in self.service.dados(desde=self.versao)['produtos']}
+
+    def test_alterar_categoria_gera_versao_para_os_seus_produtos(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.categoria.nome = 'Analgésicos e antipiréticos'
+            self.categoria.save()
+
+        self.assertGreater(self.service.versao_atual(), self.versao)
+        self.assertEqual(self._alterados(), {self.produto.pk})
+
+    def test_apagar_categoria_gera_versao_para_os_seus_produtos(self):
+        categoria = Categoria.objects.create(empresa=self.empresa, nome='Temporária')
+        Produto.objects.filter(pk=self.outro.pk).update(categoria=categoria)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            categoria.delete()
+
+        self.assertEqual(self._alterados(), {self.outro.pk})
+
+    def test_alterar_taxa_iva_gera_versao_para_os_seus_produtos(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.taxa.tax_percentage = Decimal('7')
+            self.taxa.save()
+
+        self.assertEqual(self._alterados(), {self.produto.pk, self.outro.pk})
+        self.assertEqual(self.service.dados()['produtos'][0][7], 7.0)
+
+    def test_desde_fora_das_versoes_partilha_o_snapshot(self):
+        self.assertEqual(
+            [CatalogoPDVService.normalizar_desde(desde, 5) for desde in (None, 'x', -3, 0, 2, 5, 6, 10 ** 9)],
+            [0, 0, 0, 0, 2, 5, 0, 0],
+        )
+        with mock.patch('apps.produtos.services.cache') as cache:
+            cache.get.return_value = None
+            for desde in (0, -1, self.versao + 1, 10 ** 9):
+                self.service.payload(desde, versao=self.versao)
+
+        self.assertEqual({chamada.args[0] for chamada in cache.get.call_args_list}, {
+            f'catalogo_pdv:{self.empresa.pk}:0:{self.versao}',
+        })
+
+
+class ImportacaoProdutosServiceTest(TestCase):
+    """Reimportação de linhas sem código de barras"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            nome='Farmácia Importação', nif='5000000002', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email='import@exemplo.ao',
+        )
+        TaxaIVAAGT.objects.create(
+            pk=1, empresa=cls.empresa, nome='IVA 14%', tax_type='IVA', tax_code='NOR', tax_percentage=Decimal('14'),
+        )
+
+    def _importar(self, *linhas):
+        importacao = ImportacaoProdutos.objects.create(
+            empresa=self.empresa, arquivo='importacoes/catalogo.csv', nome_arquivo='catalogo.csv',
+        )
+        resultado = {'validos': 0, 'importados': 0, 'atualizados': 0, 'ignorados': 0, 'erros': []}
+        ImportacaoProdutosService(importacao).processar_bloco(list(enumerate(linhas, start=2)), resultado)
+        return resultado
+
+    def test_reimportar_sem_codigo_de_barras_atualiza_em_vez_de_duplicar(self):
+        linhas = (
+            {'nome': 'Paracetamol 500mg', 'codigo_interno': 'PARA500', 'preco_venda': '100'},
+            {'nome': 'Ibuprofeno 400mg', 'preco_venda': '200'},
+        )
+        self.assertEqual(self._importar(*linhas)['importados'], 2)
+        codigos = set(Produto.objects.filter(empresa=self.empresa).values_list('codigo_barras', flat=True))
+
+        resultado = self._importar(
+            {**linhas[0], 'preco_venda': '110'},
+            {**linhas[1], 'nome': 'IBUPROFENO 400MG', 'preco_venda': '210'},
+        )
+
+        self.assertEqual((resultado['importados'], resultado['atualizados']), (0, 2))
+        produtos = Produto.objects.filter(empresa=self.empresa)
+        self.assertEqual(set(produtos.values_list('codigo_barras', flat=True)), codigos)
+        self.assertEqual(produtos.get(codigo_interno='PARA500').preco_venda, Decimal('110'))
+
+
+class RiscoValidadeServiceTest(TestCase):
+    """Quantidade dos lotes que chega à validade por vender, com consumo FEFO"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            nome='Farmácia Validades', nif='5000000004', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email='validades@exemplo.ao',
+        )
+        loja = Loja.objects.create(
+            empresa=cls.empresa, nome='Loja', codigo='L1', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', postal='0000', provincia='Luanda',
+        )
+        TaxaIVAAGT.objects.create(
+            pk=1, empresa=cls.empresa, nome='IVA 14%', tax_type='IVA', tax_code='NOR', tax_percentage=Decimal('14'),
+        )
+        cls.hoje = timezone.localdate()
+        cls.vendido, cls.parado = [
+            Produto.objects.create(
+                empresa=cls.empresa, codigo_interno=codigo, codigo_barras=f'560004{codigo}',
+                nome_produto=f'Produto {codigo}', nome_comercial=f'Produto {codigo}',
+                preco_custo=Decimal('10'), preco_venda=Decimal('12'), margem_lucro=Decimal('20'),
+            )
+            for codigo in ('VENDIDO', 'PARADO')
+        ]
+
+        # 28 unidades nos últimos 28 dias: 1 por dia
+        forma_pagamento = FormaPagamento.objects.create(empresa=cls.empresa, nome='Dinheiro')
+        venda = Venda.objects.create(
+            empresa=cls.empresa, loja=loja, forma_pagamento=forma_pagamento,
+            numero_documento='FR VALIDADE/1', subtotal=Decimal('336'), total=Decimal('336'),
+        )
+        ItemVenda.objects.create(
+            venda=venda, produto=cls.vendido, nome_produto=cls.vendido.nome_produto, quantidade=28,
+            preco_unitario=Decimal('12'), total=Decimal('336'),
+        )
+
+    def setUp(self):
+        self.vencido = self._lote(self.vendido, 'V', -2, 3)
+        self.curto = self._lote(self.vendido, 'C', 10, 5)
+        self.longo = self._lote(self.vendido, 'L', 20, 20)
+        self.sem_vendas = self._lote(self.parado, 'P', 30, 4, custo='0')
+
+    def _lote(self, produto, numero, dias, quantidade, custo='8'):
+        return Lote.objects.create(
+            produto=produto, numero_lote=numero, data_validade=self.hoje + timedelta(days=dias),
+            quantidade_inicial=quantidade, quantidade_atual=quantidade, preco_custo_lote=Decimal(custo),
+        )
+
+    def _riscos(self):
+        return {
+            risco.lote_id: (risco.quantidade_em_risco, risco.valor_em_risco, risco.nivel)
+            for risco in RiscoValidadeLote.objects.filter(empresa=self.empresa)
+        }
+
+    def test_prever_consome_lotes_por_validade(self):
+        previsao = RiscoValidadeService(self.empresa).prever(self.hoje).set_index('lote_id')
+
+        # Até ao dia 10 vendem-se 10 (só há 5 no lote curto); até ao dia 20, mais 15 do longo
+        self.assertEqual(
+            previsao.loc[[self.vencido.pk, self.curto.pk, self.longo.pk, self.sem_vendas.pk],
+                         'quantidade_prevista_venda'].tolist(),
+            [0, 5, 15, 0],
+        )
+        self.assertEqual(previsao.loc[self.longo.pk, 'vendas_diarias'], 1.0)
+
+    def test_executar_grava_so_lotes_em_risco(self):
+        self.assertEqual(RiscoValidadeService(self.empresa).executar(), 3)
+
+        # Sem custo no lote usa o custo do produto
+        self.assertEqual(self._riscos(), {
+            self.vencido.pk: (3, Decimal('24.00'), 'vencido'),
+            self.longo.pk: (5, Decimal('40.00'), 'medio'),
+            self.sem_vendas.pk: (4, Decimal('40.00'), 'alto'),
+        })
+
+    def test_lote_que_sai_de_risco_e_removido(self):
+        service = RiscoValidadeService(self.empresa)
+        service.executar()
+        Lote.objects.filter(pk=self.longo.pk).update(quantidade_atual=15)
+
+        self.assertEqual(service.executar(), 2)
 
-# Create your tests here.
+        self.assertEqual(set(self._riscos()), {self.vencido.pk, self.sem_vendas.pk})
@@ -36,10 +36,12 @@ urlpatterns = [
     
     # --- IMPORTAÇÃO E TEMPLATES ---
     path('importar/', views.ImportarProdutosView.as_view(), name='importar'),
+    path('importar/<int:importacao_pk>/', views.ImportarProdutosView.as_view(), name='importacao_detail'),
     path('template/', views.TemplateProdutosView.as_view(), name='template'),
 
 
     path('api/buscar/', views.buscar_produtos_api, name='buscar_produtos_api'),
+    path('api/catalogo/', views.catalogo_pdv_api, name='catalogo_pdv'),
 
 
     path('api/categorias/', views.listar_categorias_api, name='listar_categorias_api'),
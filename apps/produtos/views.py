@@ -19,13 +19,12 @@ import json
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from openpyxl import Workbook
-import pandas as pd
 from apps.analytics import models
 from apps.core.views import BaseMPAView
 from apps.servicos.models import Servico
 from .models import (
     Categoria, Fabricante,
-    Produto, Lote, HistoricoPreco
+    Produto, Lote, HistoricoPreco, ImportacaoProdutos
 )
 from django.db.models import Q
 from .forms import ImportarProdutosForm, LoteForm, ProdutoForm
@@ -50,11 +49,9 @@ from apps.produtos.models import Produto
 from apps.core.models import Empresa
 from django.contrib.auth.mixins import AccessMixin
 import logging
-import pandas as pd
-from decimal import Decimal, InvalidOperation
+from django.db import transaction
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from apps.fornecedores.models import Fornecedor
 import openpyxl
 from openpyxl import Workbook
 from apps.core.models import Categoria
@@ -94,23 +91,29 @@ def dashboard_view(request):
     hoje = date.today()
     data_limite = hoje + timedelta(days=30)
     
-    # Lotes vencendo
+    # Lotes vencendo (com saldo)
     lotes_vencendo = Lote.objects.filter(
-        validade__gte=hoje,
-        validade__lte=data_limite
-    ).select_related('produto').order_by('validade')
+        empresa=getattr(request.user, 'empresa', None),
+        data_validade__gte=hoje,
+        data_validade__lte=data_limite,
+        quantidade_atual__gt=0,
+    ).select_related('produto').order_by('data_validade')
     
     # Produtos com estoque baixo
-    produtos_ativos = Produto.objects.filter(ativo=True)
-    produtos_estoque_baixo = [p for p in produtos_ativos if p.estoque_baixo]
+    produtos_estoque_baixo = Produto.objects.filter(
+        empresa=getattr(request.user, 'empresa', None),
+        ativo=True,
+        estoque_minimo__gt=0,
+        estoque_atual__lte=F('estoque_minimo'),
+    )
     
     # Construir notificações
     lista_notificacoes = []
     
     for lote in lotes_vencendo:
         lista_notificacoes.append({
-            'mensagem': f"Lote {lote.numero_lote} de {lote.produto.nome_produto} vence em {lote.validade.strftime('%d/%m/%Y')}",
-            'detalhe': f"{lote.quantidade} unidades restantes",
+            'mensagem': f"Lote {lote.numero_lote} de {lote.produto.nome_produto} vence em {lote.data_validade.strftime('%d/%m/%Y')}",
+            'detalhe': f"{lote.quantidade_atual} unidades restantes",
             'css_class': 'bg-yellow-400'
         })
 
@@ -135,11 +138,59 @@ from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.db.models import Q
 from .models import Produto
+from .services import CatalogoPDVService
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
 import json
 
 
 
 
+def _empresa_catalogo(request):
+    funcionario = getattr(request.user, 'funcionario', None)
+    return funcionario.empresa if funcionario else None
+
+
+def _desde_catalogo(request):
+    try:
+        return int(request.GET.get('desde') or 0)
+    except ValueError:
+        return 0
+
+
+def _etag_catalogo(request):
+    empresa = _empresa_catalogo(request)
+    if not empresa:
+        return None
+    # A mesma versão é usada pela view, para o ETag corresponder ao conteúdo
+    versao = request._versao_catalogo = CatalogoPDVService(empresa).versao_atual()
+    desde = CatalogoPDVService.normalizar_desde(_desde_catalogo(request), versao)
+    return f'"catalogo-{empresa.pk}-{desde}-{versao}"'
+
+
+@gzip_page
+@login_required
+@require_http_methods(["GET"])
+@condition(etag_func=_etag_catalogo)
+def catalogo_pdv_api(request):
+    """
+    Catálogo vendável para o PDV (snapshot ou delta com ``?desde=<versão>``).
+
+    Resposta compacta: ``colunas`` + ``produtos`` (linhas), ``removidos`` e a
+    ``versao`` a usar no próximo pedido. Com ETag (304 se nada mudou) e gzip.
+    """
+    empresa = _empresa_catalogo(request)
+    if not empresa:
+        return JsonResponse({'success': False, 'message': 'Empresa não encontrada'}, status=400)
+
+    conteudo = CatalogoPDVService(empresa).payload(
+        _desde_catalogo(request), versao=getattr(request, '_versao_catalogo', None)
+    )
+    response = HttpResponse(conteudo, content_type='application/json')
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @login_required
 @require_http_methods(["GET"])
 def buscar_produtos_api(request):
@@ -163,7 +214,7 @@ def buscar_produtos_api(request):
         produtos = Produto.objects.filter(
             empresa=empresa,
             ativo=True
-        ).select_related('categoria', 'fornecedor', 'fabricante')
+        ).select_related('categoria', 'fornecedor', 'fabricante', 'taxa_iva')
         
         # Filtrar por categoria se especificado
         if categoria_id and categoria_id != 'todos':
@@ -797,11 +848,13 @@ class LotesVencimentoView(LoginRequiredMixin, ListView):
         dias = int(self.request.GET.get('dias', 30))
         data_limite = hoje + timedelta(days=dias)
         
+        empresa = getattr(self.request.user, 'empresa', None)
         return Lote.objects.filter(
-            validade__gte=hoje,
-            validade__lte=data_limite,
-            quantidade__gt=0
-        ).select_related('produto').order_by('validade')
+            empresa=empresa,
+            data_validade__gte=hoje,
+            data_validade__lte=data_limite,
+            quantidade_atual__gt=0
+        ).select_related('produto').order_by('data_validade')
 
 class ProdutosEstoqueBaixoView(LoginRequiredMixin, ListView):
     model = Produto
@@ -809,14 +862,13 @@ class ProdutosEstoqueBaixoView(LoginRequiredMixin, ListView):
     context_object_name = "produtos"
 
     def get_queryset(self):
-        produtos = Produto.objects.filter(ativo=True, estoque_minimo__gt=0)
-        produtos_baixo = []
-        
-        for produto in produtos:
-            if produto.estoque_baixo:
-                produtos_baixo.append(produto)
-        
-        return produtos_baixo
+        user = self.request.user
+        empresa = getattr(getattr(user, 'funcionario', None), 'empresa', None) or getattr(user, 'empresa', None)
+        if not empresa:
+            return Produto.objects.none()
+        return Produto.objects.filter(
+            empresa=empresa, ativo=True, estoque_minimo__gt=0, estoque_atual__lte=F('estoque_minimo'),
+        ).select_related('fornecedor').order_by('estoque_atual')
 
 
 # ===============================
@@ -1064,19 +1116,13 @@ logger = logging.getLogger(__name__)
 
    # apps/produtos/views.py
 import io
-import csv
-import uuid
 import logging
-import unicodedata
-import pandas as pd
-from decimal import Decimal
 from django.db.models import Q
 from django.contrib import messages
 from django.views.generic.edit import FormView
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin
 from apps.core.models import Categoria
-from apps.fornecedores.models import Fornecedor
 from .models import Produto, Fabricante
 from .forms import ImportarProdutosForm
 
@@ -1084,9 +1130,12 @@ logger = logging.getLogger(__name__)
 
 
 class ImportarProdutosView(LoginRequiredMixin, FormView):
+    """
+    Recebe o ficheiro e agenda a importação em segundo plano
+    (``importar_produtos_task``); o progresso fica em ``ImportacaoProdutos``.
+    """
     template_name = 'produtos/importar_produtos.html'
     form_class = ImportarProdutosForm
-    success_url = reverse_lazy('produtos:produto_list')
     acao_requerida = 'editar_produtos'
 
     # ------------------------------
@@ -1098,172 +1147,21 @@ class ImportarProdutosView(LoginRequiredMixin, FormView):
             return user.funcionario.empresa
         return None
 
-    def sanitize_text(self, text):
-        if not text:
-            return ''
-        try:
-            text = str(text)
-            text = unicodedata.normalize('NFKC', text)
-            return text.strip()
-        except Exception:
-            return str(text).strip()
-
-    def obter_categoria(self, nome, empresa):
-        nome_limpo = self.sanitize_text(nome)
-        if not nome_limpo:
-            return None
-        categoria, _ = Categoria.objects.get_or_create(
-            empresa=empresa,
-            nome__iexact=nome_limpo,
-            defaults={'nome': nome_limpo, 'empresa': empresa}
-        )
-        return categoria
-
-    def obter_fornecedor(self, nome, empresa):
-        nome_limpo = self.sanitize_text(nome)
-        if not nome_limpo:
-            return None
-        return Fornecedor.objects.filter(
-            Q(nome_fantasia__iexact=nome_limpo) | Q(razao_social__iexact=nome_limpo),
-            empresa=empresa
-        ).first()
-
-    def obter_fabricante(self, nome, empresa):
-        nome_limpo = self.sanitize_text(nome)
-        if not nome_limpo:
-            return None
-        fabricante, _ = Fabricante.objects.get_or_create(
-            empresa=empresa,
-            nome__iexact=nome_limpo,
-            defaults={'nome': nome_limpo, 'empresa': empresa}
-        )
-        return fabricante
-
-    # ------------------------------
-    # Processamento principal
-    # ------------------------------
-    def processar_arquivo(self, arquivo, empresa):
-        registros_criados, registros_atualizados = 0, 0
-
-        def get_val(row, col, default=None):
-            val = row.get(col, default)
-            if isinstance(val, (pd.Series, list)):
-                val = val.iloc[0] if hasattr(val, 'iloc') else (val[0] if val else default)
-            return val if pd.notna(val) else default
-
-        try:
-            conteudo = arquivo.read()
-            nome_ext = arquivo.name.lower()
-
-            # --- Detecta e lê ---
-            if nome_ext.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(io.BytesIO(conteudo))
-            else:
-                try:
-                    texto = conteudo.decode('utf-8')
-                except UnicodeDecodeError:
-                    texto = conteudo.decode('latin1', errors='ignore')
-
-                try:
-                    sniffer = csv.Sniffer()
-                    sep = sniffer.sniff(texto.splitlines()[0]).delimiter
-                except Exception:
-                    sep = ';' if texto.count(';') > texto.count(',') else ','
-                df = pd.read_csv(io.StringIO(texto), sep=sep, on_bad_lines='skip')
-
-            if df.empty:
-                logger.warning("O arquivo foi lido mas não contém dados!")
-                return 0, 0
-
-            # --- Normaliza colunas ---
-            df.columns = [str(c).strip().lower() for c in df.columns]
-            df = df.loc[:, ~df.columns.duplicated()]
-
-            col_map = {
-                'nome_produto': 'nome', 'produto': 'nome', 'nome': 'nome',
-                'descricao': 'nome', 'descrição': 'nome',
-                'preco': 'preco_venda', 'preço': 'preco_venda', 'valor': 'preco_venda',
-                'preco_custo': 'preco_custo', 'preco_venda': 'preco_venda',
-                'categoria': 'categoria', 'grupo': 'categoria',
-                'fornecedor': 'fornecedor', 'fabricante': 'fabricante',
-                'codigo_barras': 'codigo_barras', 'codigo_interno': 'codigo_interno',
-                'nome_comercial': 'nome_comercial',
-                'estoque_atual': 'estoque_atual', 'estoque_minimo': 'estoque_minimo',
-                'estoque_maximo': 'estoque_maximo', 'margem_lucro': 'margem_lucro',
-                'desconto_percentual': 'desconto_percentual',
-                'observacoes': 'observacoes', 'ativo': 'ativo',
-            }
-            df.rename(columns=lambda x: col_map.get(x, x), inplace=True)
-
-            logger.info(f"Colunas mapeadas: {list(df.columns)}")
-            logger.info(f"Amostra: {df.head(3).to_dict(orient='records')}")
-
-            # --- Processa cada linha ---
-            for _, row in df.iterrows():
-                try:
-                    nome = self.sanitize_text(get_val(row, 'nome'))
-                    if not nome:
-                        continue
-
-                    categoria = self.obter_categoria(get_val(row, 'categoria'), empresa)
-                    fornecedor = self.obter_fornecedor(get_val(row, 'fornecedor'), empresa)
-                    fabricante = self.obter_fabricante(get_val(row, 'fabricante'), empresa)
-
-                    codigo_barras = self.sanitize_text(get_val(row, 'codigo_barras')) or f"AUTO-{uuid.uuid4().hex[:10]}"
-                    codigo_interno = self.sanitize_text(get_val(row, 'codigo_interno')) or f"INT-{uuid.uuid4().hex[:8]}"
-                    nome_comercial = self.sanitize_text(get_val(row, 'nome_comercial')) or nome
-
-                    preco_custo = Decimal(str(get_val(row, 'preco_custo', 0) or 0))
-                    preco_venda = Decimal(str(get_val(row, 'preco_venda', 0) or 0))
-                    estoque_atual = Decimal(str(get_val(row, 'estoque_atual', 0) or 0))
-                    estoque_minimo = Decimal(str(get_val(row, 'estoque_minimo', 1) or 1))
-                    estoque_maximo = Decimal(str(get_val(row, 'estoque_maximo', 100) or 100))
-                    margem_lucro = Decimal(str(get_val(row, 'margem_lucro', 0) or 0))
-                    desconto_percentual = Decimal(str(get_val(row, 'desconto_percentual', 0) or 0))
-                    observacoes = self.sanitize_text(get_val(row, 'observacoes'))
-                    ativo = get_val(row, 'ativo', 1)
-                    ativo = bool(str(ativo).lower() in ['1', 'true', 'sim', 'yes']) if ativo is not None else True
-
-                    produto, created = Produto.objects.update_or_create(
-                        empresa=empresa,
-                        codigo_barras=codigo_barras,
-                        defaults={
-                            'codigo_interno': codigo_interno,
-                            'nome_produto': nome,
-                            'nome_comercial': nome_comercial,
-                            'categoria': categoria,
-                            'fornecedor': fornecedor,
-                            'fabricante': fabricante,
-                            'preco_custo': preco_custo,
-                            'preco_venda': preco_venda,
-                            'estoque_atual': estoque_atual,
-                            'estoque_minimo': estoque_minimo,
-                            'estoque_maximo': estoque_maximo,
-                            'margem_lucro': margem_lucro,
-                            'desconto_percentual': desconto_percentual,
-                            'observacoes': observacoes,
-                            'ativo': ativo,
-                        }
-                    )
-
-                    if created:
-                        registros_criados += 1
-                    else:
-                        registros_atualizados += 1
-
-                except Exception as e:
-                    logger.error(f"Erro ao processar linha {row.to_dict()}: {e}")
-
-        except Exception as e:
-            logger.exception(f"Erro geral ao processar arquivo: {e}")
-            raise ValueError(f"Erro ao processar arquivo: {e}")
-
-        return registros_criados, registros_atualizados
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.setdefault('title', 'Importar Produtos')
+        importacao_id = self.kwargs.get('importacao_pk')
+        empresa = self.get_empresa()
+        if importacao_id and empresa:
+            context['resultado'] = get_object_or_404(ImportacaoProdutos, pk=importacao_id, empresa=empresa)
+        return context
 
     # ------------------------------
     # Execução do formulário
     # ------------------------------
     def form_valid(self, form):
+        from .tasks import importar_produtos_task
+
         empresa = self.get_empresa()
         if not empresa:
             messages.error(self.request, "Empresa não associada ao utilizador.")
@@ -1274,15 +1172,20 @@ class ImportarProdutosView(LoginRequiredMixin, FormView):
             messages.error(self.request, "Nenhum arquivo foi enviado.")
             return self.form_invalid(form)
 
-        try:
-            criados, atualizados = self.processar_arquivo(arquivo, empresa)
-            messages.success(
-                self.request,
-                f"Importação concluída: {criados} produtos criados e {atualizados} atualizados."
+        with transaction.atomic():
+            importacao = ImportacaoProdutos.objects.create(
+                empresa=empresa,
+                usuario=self.request.user,
+                arquivo=arquivo,
+                nome_arquivo=arquivo.name,
+                atualizar_existentes=form.cleaned_data.get('atualizar_existentes', False),
+                validar_apenas=form.cleaned_data.get('validar_apenas', False),
             )
-        except Exception as e:
-            logger.exception(f"Erro ao importar produtos: {e}")
-            messages.error(self.request, f"Erro ao importar produtos: {e}")
+            transaction.on_commit(lambda: importar_produtos_task.delay(importacao.pk))
 
-        return super().form_valid(form)
+        messages.success(
+            self.request,
+            f"Importação de {arquivo.name} agendada. O progresso é atualizado nesta página."
+        )
+        return redirect('produtos:importacao_detail', importacao_pk=importacao.pk)
 
@@ -891,7 +891,7 @@ class RelatorioAdmin(admin.ModelAdmin):
 @admin.register(AgendamentoRelatorio)
 class AgendamentoRelatorioAdmin(admin.ModelAdmin):
     list_display = [
-        'template', 'frequencia', 'horario', 'ativo',
+        'template', 'tipo_relatorio', 'frequencia', 'horario', 'ativo',
         'total_destinatarios'
     ]
     list_filter = ['frequencia', 'ativo']
@@ -899,7 +899,7 @@ class AgendamentoRelatorioAdmin(admin.ModelAdmin):
     
     fieldsets = (
         ('Configuração', {
-            'fields': ('template', 'frequencia', 'horario', 'ativo')
+            'fields': ('template', 'tipo_relatorio', 'frequencia', 'horario', 'ativo')
         }),
         ('Destinatários', {
             'fields': ('destinatarios',)
@@ -0,0 +1,34 @@
+# apps/relatorios/kpis.py
+from django.db.models import Avg, Count, F, Q, Sum
+
+from apps.clientes.models import Cliente
+from apps.core.services import KPI, PlaneadorKPIService
+from apps.financeiro.models import ContaReceber
+from apps.produtos.models import Produto
+from apps.relatorios.models import AgendamentoRelatorio, RelatorioGerado, TemplateRelatorio
+from apps.vendas.models import Venda
+
+
+@PlaneadorKPIService.registrar('relatorios')
+def kpis_relatorios(empresa, hoje):
+    """Estatísticas dos relatórios e KPIs em destaque do dashboard de relatórios"""
+    vendas_hoje = Q(status='finalizada', data_venda__date=hoje)
+    contas_vencidas = Q(status__in=['aberta', 'vencida'], data_vencimento__lt=hoje)
+    inicio_mes = hoje.replace(day=1)
+    return [
+        KPI('total_relatorios', RelatorioGerado, Count, 'id'),
+        KPI('relatorios_hoje', RelatorioGerado, Count, 'id', Q(data_solicitacao__date=hoje)),
+        KPI('relatorios_erro', RelatorioGerado, Count, 'id', Q(status='erro')),
+        KPI('tempo_medio_geracao', RelatorioGerado, Avg, 'tempo_processamento',
+            Q(status='concluido', tempo_processamento__isnull=False), padrao=None),
+        KPI('templates_ativos', TemplateRelatorio, Count, 'id', Q(ativo=True)),
+        KPI('agendamentos_ativos', AgendamentoRelatorio, Count, 'id', Q(ativo=True),
+            campo_empresa='template__empresa'),
+        KPI('vendas_hoje_total', Venda, Sum, 'total', vendas_hoje, padrao=None),
+        KPI('vendas_hoje_quantidade', Venda, Count, 'id', vendas_hoje),
+        KPI('produtos_estoque_baixo', Produto, Count, 'id',
+            Q(ativo=True, estoque_atual__lte=F('estoque_minimo'))),
+        KPI('contas_vencidas_total', ContaReceber, Sum, 'valor_saldo', contas_vencidas),
+        KPI('contas_vencidas_qtd', ContaReceber, Count, 'id', contas_vencidas),
+        KPI('novos_clientes', Cliente, Count, 'id', Q(created_at__date__gte=inicio_mes)),
+    ]
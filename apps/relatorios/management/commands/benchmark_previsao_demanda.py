@@ -0,0 +1,99 @@
+# apps/relatorios/management/commands/benchmark_previsao_demanda.py
+
+import time
+import warnings
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.core.models import Empresa
+from apps.relatorios.services import PrevisaoDemandaService
+
+
+class Command(BaseCommand):
+    help = (
+        'Backtest da previsão de procura: ajusta sem os últimos dias, compara com o '
+        'observado e mede o tempo de ajuste e de atualização por 1000 séries. Usa as '
+        'vendas de uma empresa ou séries sintéticas; opcionalmente compara com o '
+        'ajuste série a série do statsmodels numa amostra.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID da empresa (por omissão a primeira)')
+        parser.add_argument('--serie', choices=['produto', 'loja'], default='produto')
+        parser.add_argument('--sinteticas', type=int, default=0, help='Número de séries sintéticas (ignora a empresa)')
+        parser.add_argument('--horizonte', type=int, default=28)
+        parser.add_argument('--statsmodels', type=int, default=0, help='Séries da amostra ajustadas com statsmodels')
+
+    def handle(self, *args, **options):
+        horizonte = options['horizonte']
+        dias = PrevisaoDemandaService.JANELA_DIAS + horizonte
+
+        if options['sinteticas']:
+            primeiro_dia = timezone.localdate() - timedelta(days=dias)
+            Y = self._sinteticas(options['sinteticas'], dias)
+            origem = f'{len(Y)} séries sintéticas'
+        else:
+            empresa = (
+                Empresa.objects.filter(pk=options['empresa']).first()
+                if options['empresa'] else Empresa.objects.first()
+            )
+            if not empresa:
+                raise CommandError('Nenhuma empresa encontrada')
+            fim = timezone.localdate() - timedelta(days=1)
+            primeiro_dia = fim - timedelta(days=dias - 1)
+            _, Y = PrevisaoDemandaService(empresa)._vendas(options['serie'], primeiro_dia, fim)
+            origem = f'empresa {empresa.pk}, {len(Y)} séries ({options["serie"]})'
+
+        if len(Y) == 0 or Y.shape[1] - horizonte < PrevisaoDemandaService.MIN_DIAS:
+            raise CommandError('Dados insuficientes para o backtest')
+
+        resultado = PrevisaoDemandaService.backtest(Y, primeiro_dia, horizonte)
+        self.stdout.write(f'{origem}: {resultado["dias_treino"]} dias de treino, horizonte {horizonte} dias')
+        self.stdout.write(
+            f'    ajuste vetorizado    {resultado["ajuste_s"]:>8.2f} s  ({resultado["ajuste_s_por_mil"]:.2f} s / 1000 séries)'
+        )
+        self.stdout.write(f'    atualização diária   {resultado["atualizacao_dia_ms_por_mil"]:>8.2f} ms / 1000 séries')
+        self.stdout.write(f'    MAE                  {resultado["mae"]:>8.3f}')
+        self.stdout.write(f'    WAPE                 {resultado["wape"]:>8.1%}  (ingénua sazonal {resultado["wape_ingenua"]:.1%})')
+        self.stdout.write(f'    viés                 {resultado["vies"]:>8.1%}')
+
+        if options['statsmodels']:
+            self._comparar_statsmodels(Y[:options['statsmodels']], primeiro_dia, horizonte)
+
+    def _sinteticas(self, n, dias):
+        """Procura Poisson com nível, tendência e padrão semanal aleatórios por série"""
+        gerador = np.random.default_rng(0)
+        t = np.arange(dias)
+        nivel = gerador.gamma(2, 3, (n, 1))
+        semana = gerador.uniform(-0.4, 0.4, (n, 7))
+        semana -= semana.mean(axis=1, keepdims=True)
+        tendencia = gerador.normal(0, 0.002, (n, 1))
+        media = np.clip(nivel * (1 + tendencia * t) * (1 + semana[:, t % 7]), 0, None)
+        return gerador.poisson(media).astype('float64')
+
+    def _comparar_statsmodels(self, Y, primeiro_dia, horizonte):
+        from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+        treino, teste = Y[:, :-horizonte], Y[:, -horizonte:]
+        previsto = np.zeros_like(teste)
+        inicio = time.perf_counter()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            for i, serie in enumerate(treino):
+                modelo = ExponentialSmoothing(
+                    serie, trend='add', damped_trend=True, seasonal='add', seasonal_periods=7,
+                    initialization_method='estimated',
+                ).fit()
+                previsto[i] = np.clip(modelo.forecast(horizonte), 0, None)
+        duracao = time.perf_counter() - inicio
+
+        amostra = PrevisaoDemandaService.backtest(Y, primeiro_dia, horizonte)
+        total = teste.sum() or 1.0
+        self.stdout.write(f'statsmodels, série a série ({len(Y)} séries):')
+        self.stdout.write(f'    ajuste               {duracao:>8.2f} s  ({duracao * 1000 / len(Y):.1f} s / 1000 séries)')
+        self.stdout.write(
+            f'    WAPE                 {np.abs(previsto - teste).sum() / total:>8.1%}  '
+            f'(vetorizado na mesma amostra {amostra["wape"]:.1%})'
+        )
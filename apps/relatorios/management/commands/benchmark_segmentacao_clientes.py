@@ -0,0 +1,111 @@
+# apps/relatorios/management/commands/benchmark_segmentacao_clientes.py
+
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.core.models import Empresa
+from apps.relatorios.services import SegmentacaoClientesService
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede a segmentação de clientes: ajuste completo com MiniBatchKMeans contra '
+        'KMeans(n_init=10), atualização incremental (passo de mini-lote) com os clientes '
+        'ativos num dia e reatribuição de todos. Usa clientes sintéticos ou as '
+        'estatísticas de uma empresa.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=500000, help='Clientes sintéticos')
+        parser.add_argument('--segmentos', type=int, default=SegmentacaoClientesService.N_CLUSTERS)
+        parser.add_argument('--ativos', type=float, default=0.02, help='Fração de clientes com compras no dia')
+        parser.add_argument('--empresa', type=int, help='Usa as estatísticas desta empresa em vez de sintéticos')
+        parser.add_argument('--sem-kmeans', action='store_true', help='Não compara com KMeans(n_init=10)')
+
+    def handle(self, *args, **options):
+        hoje = timezone.localdate()
+        n_clusters = options['segmentos']
+
+        if options['empresa']:
+            empresa = Empresa.objects.filter(pk=options['empresa']).first()
+            if not empresa:
+                raise CommandError('Empresa não encontrada')
+            df = SegmentacaoClientesService(empresa, n_clusters)._estatisticas()
+            origem = f'empresa {empresa.pk}'
+        else:
+            df = self._sinteticos(options['clientes'], hoje)
+            origem = 'sintéticos'
+
+        if len(df) < n_clusters:
+            raise CommandError('Clientes insuficientes para a segmentação')
+        self.stdout.write(f'{len(df)} clientes ({origem}), {n_clusters} segmentos')
+
+        inicio = time.perf_counter()
+        X = SegmentacaoClientesService.features(df['compras'], df['comprado'], df['primeira'], df['ultima'], hoje)
+        self.stdout.write(f'    features                  {time.perf_counter() - inicio:>8.2f} s')
+
+        inicio = time.perf_counter()
+        modelo = SegmentacaoClientesService.ajustar_matriz(X, n_clusters)
+        ajuste = time.perf_counter() - inicio
+        Z = SegmentacaoClientesService.padronizar(modelo, X)
+        rotulos = SegmentacaoClientesService.atribuir(modelo, X)
+        inercia = self._inercia(Z, modelo['centros'], rotulos)
+        self.stdout.write(f'    MiniBatchKMeans (ajuste)  {ajuste:>8.2f} s')
+
+        if not options['sem_kmeans']:
+            from sklearn.cluster import KMeans
+            from sklearn.metrics import adjusted_rand_score
+
+            inicio = time.perf_counter()
+            kmeans = KMeans(n_clusters=n_clusters, n_init=10, random_state=42).fit(Z)
+            duracao = time.perf_counter() - inicio
+            self.stdout.write(f'    KMeans(n_init=10)         {duracao:>8.2f} s')
+            self.stdout.write(f'    inércia relativa          {inercia / kmeans.inertia_:>8.3f}  (MiniBatch / KMeans)')
+            self.stdout.write(f'    concordância (ARI)        {adjusted_rand_score(kmeans.labels_, rotulos):>8.3f}')
+
+        # Um dia de atividade: os ativos compram mais uma vez
+        gerador = np.random.default_rng(1)
+        ativos = gerador.random(len(df)) < options['ativos']
+        novo = df.copy()
+        novo.loc[ativos, 'compras'] += 1
+        novo.loc[ativos, 'comprado'] += gerador.gamma(2, 2500, int(ativos.sum()))
+        novo.loc[ativos, 'ultima'] = np.datetime64(hoje, 'D')
+        X = SegmentacaoClientesService.features(
+            novo['compras'], novo['comprado'], novo['primeira'], novo['ultima'], hoje + timedelta(days=1)
+        )
+
+        inicio = time.perf_counter()
+        SegmentacaoClientesService.atualizar_matriz(modelo, X[ativos])
+        self.stdout.write(f'    mini-lote ({int(ativos.sum())} ativos)   {time.perf_counter() - inicio:>8.2f} s')
+
+        inicio = time.perf_counter()
+        atualizados = SegmentacaoClientesService.atribuir(modelo, X)
+        self.stdout.write(f'    reatribuição (todos)      {time.perf_counter() - inicio:>8.2f} s')
+        self.stdout.write(f'    atribuições alteradas     {int((atualizados != rotulos).sum()):>8d}')
+
+    def _sinteticos(self, n, hoje):
+        """Mistura de perfis (ocasionais, regulares, crónicos, inativos)"""
+        gerador = np.random.default_rng(0)
+        perfil = gerador.choice(4, n, p=[0.45, 0.3, 0.1, 0.15])
+        compras = 1 + gerador.poisson(np.array([1, 8, 40, 3])[perfil])
+        ticket = gerador.gamma(2, np.array([2500, 4000, 6000, 3000])[perfil])
+        antiguidade = gerador.integers(30, 1500, n)
+        recencia = np.minimum(
+            antiguidade, gerador.exponential(np.array([120, 30, 10, 500])[perfil]).astype('int64')
+        )
+        hoje = np.datetime64(hoje, 'D')
+        return pd.DataFrame({
+            'cliente_id': np.arange(1, n + 1),
+            'compras': compras,
+            'comprado': compras * ticket,
+            'primeira': hoje - antiguidade,
+            'ultima': hoje - recencia,
+        })
+
+    @staticmethod
+    def _inercia(Z, centros, rotulos):
+        return float(((Z - centros[rotulos]) ** 2).sum())
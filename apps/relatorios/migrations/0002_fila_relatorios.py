@@ -0,0 +1,45 @@
+# Generated by Django 5.1.5 on 2026-10-19 13:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_numeracao_blocos'),
+        ('funcionarios', '0003_resumopontodiario'),
+        ('relatorios', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='relatoriogerado',
+            name='impressao',
+            field=models.CharField(blank=True, help_text='Impressão de empresa, tipo, formato e parâmetros; identifica pedidos idênticos', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='relatoriogerado',
+            name='progresso',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Percentagem concluída (0-100)'),
+        ),
+        migrations.AddField(
+            model_name='relatoriogerado',
+            name='task_id',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='relatoriogerado',
+            name='status',
+            field=models.CharField(choices=[('pendente', 'Na fila'), ('processando', 'Processando'), ('concluido', 'Concluído'), ('erro', 'Erro'), ('cancelado', 'Cancelado')], default='processando', max_length=15),
+        ),
+        migrations.AddIndex(
+            model_name='relatoriogerado',
+            index=models.Index(fields=['empresa', 'impressao', 'status'], name='relatorios__empresa_a9bad0_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='relatoriogerado',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pendente', 'processando']), models.Q(('impressao', ''), _negated=True)), fields=('empresa', 'impressao'), name='relger_um_em_curso_por_impressao'),
+        ),
+    ]
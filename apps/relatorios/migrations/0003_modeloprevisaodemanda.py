@@ -0,0 +1,43 @@
+# Generated by Django 5.1.5 on 2026-10-19 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_numeracao_blocos'),
+        ('produtos', '0005_risco_validade_lote'),
+        ('relatorios', '0002_fila_relatorios'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModeloPrevisaoDemanda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('serie', models.CharField(choices=[('produto', 'Produto (unidades)'), ('loja', 'Loja (faturamento)')], max_length=10)),
+                ('alpha', models.FloatField()),
+                ('beta', models.FloatField()),
+                ('gamma', models.FloatField()),
+                ('nivel', models.FloatField()),
+                ('tendencia', models.FloatField()),
+                ('sazonalidade', models.JSONField(default=list, help_text='Fatores aditivos por dia da semana (0 = segunda)')),
+                ('ultimo_dia', models.DateField(help_text='Último dia de vendas incorporado no estado')),
+                ('observacoes', models.PositiveIntegerField(help_text='Dias de vendas processados')),
+                ('erro_medio', models.FloatField(help_text='Erro absoluto médio da previsão a um dia')),
+                ('ajustado_em', models.DateTimeField(help_text='Último ajuste completo (escolha de parâmetros)')),
+                ('atualizado_em', models.DateTimeField()),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='modelos_previsao', to='core.empresa')),
+                ('loja', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='modelos_previsao', to='core.loja')),
+                ('produto', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='modelos_previsao', to='produtos.produto')),
+            ],
+            options={
+                'verbose_name': 'Modelo de Previsão de Procura',
+                'verbose_name_plural': 'Modelos de Previsão de Procura',
+                'indexes': [models.Index(fields=['empresa', 'serie', 'ultimo_dia'], name='idx_modelo_previsao_dia')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('serie', 'produto')), fields=('empresa', 'produto'), name='uniq_modelo_previsao_produto'), models.UniqueConstraint(condition=models.Q(('serie', 'loja')), fields=('empresa', 'loja'), name='uniq_modelo_previsao_loja')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.5 on 2026-10-19 14:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0005_razao_fidelidade'),
+        ('core', '0003_numeracao_blocos'),
+        ('relatorios', '0003_modeloprevisaodemanda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModeloSegmentacaoClientes',
+            fields=[
+                ('empresa', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='modelo_segmentacao', serialize=False, to='core.empresa')),
+                ('n_clusters', models.PositiveSmallIntegerField()),
+                ('estimador', models.BinaryField(help_text='Escala e MiniBatchKMeans serializados (pickle)')),
+                ('resumo', models.JSONField(default=list, help_text='Métricas por segmento da última execução')),
+                ('total_clientes', models.PositiveIntegerField(default=0)),
+                ('atividade_ate', models.DateField(help_text='Último dia de compras incorporado nos centróides')),
+                ('ajustado_em', models.DateTimeField(help_text='Último ajuste completo (escala e centróides de raiz)')),
+                ('atualizado_em', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Modelo de Segmentação de Clientes',
+                'verbose_name_plural': 'Modelos de Segmentação de Clientes',
+            },
+        ),
+        migrations.CreateModel(
+            name='SegmentoCliente',
+            fields=[
+                ('cliente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='segmento', serialize=False, to='clientes.cliente')),
+                ('cluster', models.PositiveSmallIntegerField()),
+                ('atualizado_em', models.DateTimeField()),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segmentos_clientes', to='core.empresa')),
+            ],
+            options={
+                'verbose_name': 'Segmento de Cliente',
+                'verbose_name_plural': 'Segmentos de Clientes',
+                'indexes': [models.Index(fields=['empresa', 'cluster'], name='idx_segmento_cliente_cluster')],
+            },
+        ),
+    ]
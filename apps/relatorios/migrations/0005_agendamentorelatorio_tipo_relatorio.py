@@ -0,0 +1,17 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relatorios', '0004_modelosegmentacaoclientes_segmentocliente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agendamentorelatorio',
+            name='tipo_relatorio',
+            field=models.ForeignKey(blank=True, help_text='Relatório enviado para a fila de geração em cada execução', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='agendamentos', to='relatorios.tiporelatorio'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relatorios', '0005_agendamentorelatorio_tipo_relatorio'),
+    ]
+
+    operations = [
+        # Os modelos gravados com pickle não são convertidos: sem parâmetros,
+        # a próxima execução faz um ajuste completo.
+        migrations.RemoveField(
+            model_name='modelosegmentacaoclientes',
+            name='estimador',
+        ),
+        migrations.AddField(
+            model_name='modelosegmentacaoclientes',
+            name='parametros',
+            field=models.JSONField(default=dict, help_text='Média e desvio da escala, centróides e contagens por centróide'),
+        ),
+    ]
@@ -88,6 +88,7 @@ class TipoRelatorio(TimeStampedModel):
 class RelatorioGerado(TimeStampedModel):
     """Relatórios gerados pelos usuários"""
     STATUS_CHOICES = [
+        ('pendente', 'Na fila'),
         ('processando', 'Processando'),
         ('concluido', 'Concluído'),
         ('erro', 'Erro'),
@@ -119,6 +120,12 @@ class RelatorioGerado(TimeStampedModel):
     # Processamento
     formato = models.CharField(max_length=10, choices=FORMATO_CHOICES, default='html')
     status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='processando')
+    progresso = models.PositiveSmallIntegerField(default=0, help_text="Percentagem concluída (0-100)")
+    impressao = models.CharField(
+        max_length=64, blank=True,
+        help_text="Impressão de empresa, tipo, formato e parâmetros; identifica pedidos idênticos"
+    )
+    task_id = models.CharField(max_length=50, blank=True)
     
     # Datas
     data_solicitacao = models.DateTimeField(auto_now_add=True)
@@ -153,6 +160,17 @@ class RelatorioGerado(TimeStampedModel):
         verbose_name = "Relatório Gerado"
         verbose_name_plural = "Relatórios Gerados"
         ordering = ['-data_solicitacao']
+        indexes = [
+            models.Index(fields=['empresa', 'impressao', 'status']),
+        ]
+        constraints = [
+            # Um único pedido em curso por impressão: pedidos idênticos juntam-se a ele
+            models.UniqueConstraint(
+                fields=['empresa', 'impressao'],
+                condition=models.Q(status__in=['pendente', 'processando']) & ~models.Q(impressao=''),
+                name='relger_um_em_curso_por_impressao',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.codigo_relatorio} - {self.tipo_relatorio.nome}"
@@ -648,6 +666,14 @@ class AgendamentoRelatorio(TimeStampedModel):
     ]
 
     template = models.ForeignKey(TemplateRelatorio, on_delete=models.CASCADE)
+    tipo_relatorio = models.ForeignKey(
+        TipoRelatorio,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='agendamentos',
+        help_text="Relatório enviado para a fila de geração em cada execução"
+    )
     frequencia = models.CharField("Frequência", max_length=10, choices=FREQUENCIA_CHOICES)
     horario = models.TimeField("Horário de Execução")
     destinatarios = models.TextField("Emails de Destinatários", help_text="Separados por vírgula.")
@@ -662,6 +688,106 @@ class AgendamentoRelatorio(TimeStampedModel):
         return f"Agendamento {self.get_frequencia_display()} de '{self.template.nome}'"
 
 
+class ModeloPrevisaoDemanda(models.Model):
+    """
+    Estado de um modelo de previsão diária ajustado em lote por
+    PrevisaoDemandaService (Holt-Winters aditivo, tendência amortecida,
+    sazonalidade semanal): por produto (unidades vendidas em todas as lojas)
+    ou por loja (faturamento). A previsão calcula-se a partir deste estado,
+    sem voltar às vendas.
+    """
+    SERIE_CHOICES = [
+        ('produto', 'Produto (unidades)'),
+        ('loja', 'Loja (faturamento)'),
+    ]
+
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='modelos_previsao')
+    serie = models.CharField(max_length=10, choices=SERIE_CHOICES)
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, null=True, blank=True, related_name='modelos_previsao')
+    loja = models.ForeignKey(Loja, on_delete=models.CASCADE, null=True, blank=True, related_name='modelos_previsao')
+
+    # Parâmetros escolhidos na grelha (revistos a cada reajuste completo)
+    alpha = models.FloatField()
+    beta = models.FloatField()
+    gamma = models.FloatField()
+
+    # Estado no fim de `ultimo_dia`
+    nivel = models.FloatField()
+    tendencia = models.FloatField()
+    sazonalidade = models.JSONField(default=list, help_text="Fatores aditivos por dia da semana (0 = segunda)")
+    ultimo_dia = models.DateField(help_text="Último dia de vendas incorporado no estado")
+
+    observacoes = models.PositiveIntegerField(help_text="Dias de vendas processados")
+    erro_medio = models.FloatField(help_text="Erro absoluto médio da previsão a um dia")
+    ajustado_em = models.DateTimeField(help_text="Último ajuste completo (escolha de parâmetros)")
+    atualizado_em = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Modelo de Previsão de Procura'
+        verbose_name_plural = 'Modelos de Previsão de Procura'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['empresa', 'produto'], condition=models.Q(serie='produto'),
+                name='uniq_modelo_previsao_produto'
+            ),
+            models.UniqueConstraint(
+                fields=['empresa', 'loja'], condition=models.Q(serie='loja'),
+                name='uniq_modelo_previsao_loja'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['empresa', 'serie', 'ultimo_dia'], name='idx_modelo_previsao_dia'),
+        ]
+
+    def __str__(self):
+        alvo = self.produto_id if self.serie == 'produto' else self.loja_id
+        return f"Previsão {self.get_serie_display()} {alvo} (até {self.ultimo_dia})"
+
+
+class ModeloSegmentacaoClientes(models.Model):
+    """
+    Segmentação de clientes de uma empresa (SegmentacaoClientesService):
+    escala das features e centróides gravados como arrays, atualizados com
+    a atividade nova em cada execução noturna; resumo por segmento para o
+    painel de data mining.
+    """
+    empresa = models.OneToOneField(Empresa, on_delete=models.CASCADE, primary_key=True, related_name='modelo_segmentacao')
+    n_clusters = models.PositiveSmallIntegerField()
+    parametros = models.JSONField(
+        default=dict, help_text="Média e desvio da escala, centróides e contagens por centróide"
+    )
+    resumo = models.JSONField(default=list, help_text="Métricas por segmento da última execução")
+    total_clientes = models.PositiveIntegerField(default=0)
+    atividade_ate = models.DateField(help_text="Último dia de compras incorporado nos centróides")
+    ajustado_em = models.DateTimeField(help_text="Último ajuste completo (escala e centróides de raiz)")
+    atualizado_em = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Modelo de Segmentação de Clientes'
+        verbose_name_plural = 'Modelos de Segmentação de Clientes'
+
+    def __str__(self):
+        return f"Segmentação da empresa {self.empresa_id}: {self.n_clusters} segmentos, {self.total_clientes} clientes"
+
+
+class SegmentoCliente(models.Model):
+    """Segmento atribuído a cada cliente na última execução da segmentação"""
+    cliente = models.OneToOneField(Cliente, on_delete=models.CASCADE, primary_key=True, related_name='segmento')
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='segmentos_clientes')
+    cluster = models.PositiveSmallIntegerField()
+    atualizado_em = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Segmento de Cliente'
+        verbose_name_plural = 'Segmentos de Clientes'
+        indexes = [
+            models.Index(fields=['empresa', 'cluster'], name='idx_segmento_cliente_cluster'),
+        ]
+
+    def __str__(self):
+        return f"Cliente {self.cliente_id}: segmento {self.cluster}"
+
+
 class LogRelatorio(models.Model):
     """
     Regista eventos importantes relacionados com relatórios para auditoria.
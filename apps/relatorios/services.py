@@ -0,0 +1,1075 @@
+# apps/relatorios/services.py
+import csv
+import hashlib
+import io
+import itertools
+import json
+import logging
+import re
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Min, QuerySet, Sum
+from django.db.models.functions import TruncDate
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, TableStyle
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.preprocessing import StandardScaler
+
+from .models import ModeloPrevisaoDemanda, ModeloSegmentacaoClientes, RelatorioGerado, SegmentoCliente
+
+logger = logging.getLogger(__name__)
+
+
+class FilaRelatoriosService:
+    """
+    Fila de geração de relatórios (RelatorioGerado) em tarefas Celery.
+
+    Cada pedido é identificado pela impressão dos seus parâmetros (empresa,
+    tipo, formato, período, filtros e parâmetros livres):
+    - um resultado concluído há menos de `ttl` segundos é reutilizado;
+    - um pedido idêntico ainda na fila ou em processamento é devolvido em
+      vez de se criar outro (garantido pela constraint parcial do modelo);
+    - caso contrário é criado um RelatorioGerado 'pendente' e a tarefa é
+      enviada, após o commit, para a fila do tipo de relatório.
+
+    O ficheiro fica em `arquivo_resultado`; `status` e `progresso` servem
+    para acompanhar o pedido (ver EstadoRelatorioView).
+    """
+
+    # Tipo de relatório -> (fila Celery, prioridade). Na Redis 0 é a mais
+    # prioritária; relatórios pesados têm fila própria para não atrasar os leves.
+    FILAS = {
+        'VENDAS_GERAL': ('relatorios', 2),
+        'VENDAS_MENSAL': ('relatorios', 6),
+        'ANALISE_ABC': ('relatorios_pesados', 4),
+        'SEGMENTACAO_RFM': ('relatorios_pesados', 5),
+    }
+    FILA_PADRAO = ('relatorios', 3)
+
+    FORMATOS = ('pdf', 'excel', 'csv', 'json')   # formatos com geração em ficheiro
+    EM_CURSO = ('pendente', 'processando')
+    TTL_RESULTADO = 15 * 60       # segundos em que um resultado concluído é reutilizado
+    TEMPO_MAXIMO = 60 * 60        # pedido em curso há mais tempo é dado como perdido
+    DIAS_AGENDAMENTO = 30         # período dos relatórios pedidos por agendamentos
+
+    def __init__(self, empresa):
+        self.empresa = empresa
+        self.ttl = getattr(settings, 'RELATORIOS_TTL_RESULTADO', self.TTL_RESULTADO)
+
+    def solicitar(self, tipo_relatorio, solicitante, formato: str = 'pdf', data_inicio=None, data_fim=None,
+                  parametros: Optional[Dict] = None, lojas=(), categorias=(), funcionarios=()) -> Tuple[RelatorioGerado, bool]:
+        """
+        Devolve (relatório, novo). `novo` é False quando o pedido foi servido
+        por um resultado recente ou se juntou a um pedido idêntico em curso.
+        """
+        parametros = parametros or {}
+        lojas, categorias, funcionarios = list(lojas), list(categorias), list(funcionarios)
+        impressao = self.impressao(
+            tipo_relatorio, formato, data_inicio, data_fim, parametros, lojas, categorias, funcionarios
+        )
+
+        existente = self._em_curso(impressao) or self._recente(impressao)
+        if existente:
+            return existente, False
+
+        try:
+            with transaction.atomic():
+                relatorio = RelatorioGerado.objects.create(
+                    tipo_relatorio=tipo_relatorio,
+                    formato=formato,
+                    data_inicio=data_inicio,
+                    data_fim=data_fim,
+                    parametros=parametros,
+                    status='pendente',
+                    impressao=impressao,
+                    solicitante=solicitante,
+                    empresa=self.empresa,
+                )
+                if lojas:
+                    relatorio.lojas.set(lojas)
+                if categorias:
+                    relatorio.categorias.set(categorias)
+                if funcionarios:
+                    relatorio.funcionarios.set(funcionarios)
+        except IntegrityError:
+            # Outro pedido idêntico entrou na fila entretanto
+            existente = self._em_curso(impressao)
+            if existente is None:
+                raise
+            return existente, False
+
+        self.enfileirar(relatorio)
+        return relatorio, True
+
+    def solicitar_como(self, relatorio: RelatorioGerado, formato: str, solicitante=None) -> Tuple[RelatorioGerado, bool]:
+        """Pede o mesmo relatório (tipo, período e filtros) noutro formato"""
+        return self.solicitar(
+            relatorio.tipo_relatorio, solicitante or relatorio.solicitante, formato,
+            relatorio.data_inicio, relatorio.data_fim, relatorio.parametros,
+            relatorio.lojas.all(), relatorio.categorias.all(), relatorio.funcionarios.all(),
+        )
+
+    def solicitar_agendamento(self, agendamento, solicitante) -> Tuple[RelatorioGerado, bool]:
+        """
+        Pede o relatório de um agendamento (PDF dos últimos
+        ``DIAS_AGENDAMENTO`` dias). Levanta ValueError se o agendamento não
+        tiver tipo de relatório.
+        """
+        if agendamento.tipo_relatorio_id is None:
+            raise ValueError(f"O agendamento '{agendamento}' não tem tipo de relatório definido.")
+        hoje = timezone.localdate()
+        return self.solicitar(
+            agendamento.tipo_relatorio, solicitante, 'pdf',
+            hoje - timedelta(days=self.DIAS_AGENDAMENTO), hoje,
+            {'agendamento': agendamento.pk},
+        )
+
+    @classmethod
+    def enfileirar(cls, relatorio: RelatorioGerado):
+        """Envia o relatório para a fila do seu tipo depois do commit"""
+        from .tasks import processar_relatorio_task
+
+        fila, prioridade = cls.FILAS.get(relatorio.tipo_relatorio.codigo, cls.FILA_PADRAO)
+
+        def enviar():
+            resultado = processar_relatorio_task.apply_async(
+                args=[relatorio.pk], queue=fila, priority=prioridade
+            )
+            RelatorioGerado.objects.filter(pk=relatorio.pk, task_id='').update(task_id=resultado.id or '')
+
+        transaction.on_commit(enviar)
+
+    @staticmethod
+    def estado(relatorio: RelatorioGerado) -> Dict:
+        """Estado do pedido para polling"""
+        dados = {
+            'relatorio_id': relatorio.pk,
+            'codigo': relatorio.codigo_relatorio,
+            'status': relatorio.status,
+            'progresso': relatorio.progresso,
+            'formato': relatorio.formato,
+        }
+        if relatorio.status == 'concluido' and relatorio.arquivo_resultado:
+            dados['arquivo'] = relatorio.arquivo_resultado.url
+        if relatorio.status == 'erro':
+            dados['mensagem_erro'] = relatorio.mensagem_erro
+        return dados
+
+    def impressao(self, tipo_relatorio, formato, data_inicio, data_fim, parametros, lojas, categorias, funcionarios) -> str:
+        ids = lambda objetos: sorted(getattr(o, 'pk', o) for o in objetos)
+        chave = json.dumps([
+            self.empresa.pk, tipo_relatorio.pk, formato,
+            data_inicio.isoformat() if data_inicio else None,
+            data_fim.isoformat() if data_fim else None,
+            parametros, ids(lojas), ids(categorias), ids(funcionarios),
+        ], sort_keys=True, default=str)
+        return hashlib.sha256(chave.encode('utf-8')).hexdigest()
+
+    def _em_curso(self, impressao: str) -> Optional[RelatorioGerado]:
+        relatorio = RelatorioGerado.objects.filter(
+            empresa=self.empresa, impressao=impressao, status__in=self.EM_CURSO
+        ).select_related('tipo_relatorio').first()
+        if relatorio is None:
+            return None
+
+        if relatorio.data_solicitacao < timezone.now() - timedelta(seconds=self.TEMPO_MAXIMO):
+            # Tarefa perdida (worker reiniciado, mensagem descartada): liberta a impressão
+            RelatorioGerado.objects.filter(pk=relatorio.pk, status__in=self.EM_CURSO).update(
+                status='erro', mensagem_erro='Tempo máximo de processamento excedido', data_conclusao=timezone.now()
+            )
+            logger.warning(f'Relatório {relatorio.codigo_relatorio} abandonado após {self.TEMPO_MAXIMO}s em curso')
+            return None
+        return relatorio
+
+    def _recente(self, impressao: str) -> Optional[RelatorioGerado]:
+        if self.ttl <= 0:
+            return None
+        return RelatorioGerado.objects.filter(
+            empresa=self.empresa, impressao=impressao, status='concluido',
+            data_conclusao__gte=timezone.now() - timedelta(seconds=self.ttl),
+            arquivo_resultado__isnull=False,
+        ).exclude(arquivo_resultado='').select_related('tipo_relatorio').order_by('-data_conclusao').first()
+
+
+class LimiteExportacaoExcedido(ValueError):
+    """Exportação recusada por exceder o limite de linhas do formato"""
+
+
+class ExportacaoStreamingService:
+    """
+    Exportação de linhas com memória constante, para downloads de qualquer
+    dimensão (milhões de linhas).
+
+    `linhas` é um QuerySet (lido com .iterator() em lotes) ou qualquer
+    iterável de dicts, sequências ou instâncias; `colunas` é a lista de
+    campos ou de pares (campo, título). Sequências (values_list) seguem a
+    ordem das colunas.
+
+    CSV e NDJSON são gerados em pedaços para StreamingHttpResponse; XLSX
+    (XlsxWriter em constant_memory) é escrito para ficheiro e servido com
+    FileResponse. O PDF (uma tabela por página) também, mas o reportlab
+    guarda as páginas em memória até ao save(): acima de MAX_LINHAS_PDF
+    linhas é recusado com LimiteExportacaoExcedido, nunca truncado.
+    """
+
+    TAMANHO_LOTE = 2000
+    LINHAS_POR_PEDACO = 500          # linhas CSV/NDJSON por pedaço enviado
+    LINHAS_POR_PAGINA_PDF = 35
+    MAX_LINHAS_PDF = 50000           # o reportlab guarda as páginas até ao save(); acima disto, CSV/Excel
+    MAX_LINHAS_FOLHA = 1048576       # limite do Excel, cabeçalho incluído
+
+    FORMATOS = {
+        'csv': ('csv', 'text/csv; charset=utf-8'),
+        'ndjson': ('ndjson', 'application/x-ndjson; charset=utf-8'),
+        'excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+        'pdf': ('pdf', 'application/pdf'),
+    }
+
+    def __init__(self, linhas: Iterable, colunas: List, titulo: str = ''):
+        self.linhas = linhas
+        self.colunas = [tuple(c) if isinstance(c, (list, tuple)) else (c, c) for c in colunas]
+        self.titulo = titulo
+
+    @property
+    def campos(self) -> List[str]:
+        return [campo for campo, _ in self.colunas]
+
+    @property
+    def cabecalho(self) -> List[str]:
+        return [str(titulo) for _, titulo in self.colunas]
+
+    def valores(self) -> Iterator[list]:
+        """Gera cada linha como lista de valores pela ordem das colunas"""
+        linhas = self.linhas
+        if isinstance(linhas, QuerySet):
+            linhas = linhas.iterator(chunk_size=self.TAMANHO_LOTE)
+        campos = self.campos
+        for linha in linhas:
+            if isinstance(linha, dict):
+                yield [linha.get(campo) for campo in campos]
+            elif isinstance(linha, (list, tuple)):
+                yield list(linha)
+            else:
+                yield [getattr(linha, campo, None) for campo in campos]
+
+    def total_linhas(self) -> Optional[int]:
+        """Número de linhas, se conhecido sem as ler (QuerySet ou sequência)"""
+        if isinstance(self.linhas, QuerySet):
+            return self.linhas.count()
+        if hasattr(self.linhas, '__len__'):
+            return len(self.linhas)
+        return None
+
+    def verificar_limite(self, formato: str):
+        """Levanta LimiteExportacaoExcedido antes de gerar um PDF grande demais"""
+        if formato == 'pdf':
+            total = self.total_linhas()
+            if total is not None and total > self.MAX_LINHAS_PDF:
+                raise self._limite_pdf(total)
+
+    def _limite_pdf(self, total=None) -> LimiteExportacaoExcedido:
+        linhas = f'{total} linhas' if total is not None else f'mais de {self.MAX_LINHAS_PDF} linhas'
+        return LimiteExportacaoExcedido(
+            f'A exportação tem {linhas}; o PDF está limitado a {self.MAX_LINHAS_PDF}. '
+            'Use CSV ou Excel para o conjunto completo.'
+        )
+
+    # ---- formatos em pedaços ----
+
+    def csv(self) -> Iterator[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.cabecalho)
+        for numero, linha in enumerate(self.valores(), 1):
+            writer.writerow(['' if valor is None else valor for valor in linha])
+            if numero % self.LINHAS_POR_PEDACO == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        yield buffer.getvalue()
+
+    def ndjson(self) -> Iterator[str]:
+        campos = self.campos
+        pedaco = []
+        for linha in self.valores():
+            pedaco.append(json.dumps(dict(zip(campos, linha)), ensure_ascii=False, default=str))
+            if len(pedaco) == self.LINHAS_POR_PEDACO:
+                yield '\n'.join(pedaco) + '\n'
+                pedaco = []
+        if pedaco:
+            yield '\n'.join(pedaco) + '\n'
+
+    # ---- formatos em ficheiro ----
+
+    def escrever(self, formato: str, destino):
+        """Escreve a exportação em `destino` (caminho ou ficheiro binário)"""
+        self.verificar_limite(formato)
+        if formato == 'excel':
+            self.escrever_xlsx(destino)
+        elif formato == 'pdf':
+            self.escrever_pdf(destino)
+        elif formato in ('csv', 'ndjson'):
+            pedacos = self.csv() if formato == 'csv' else self.ndjson()
+            if isinstance(destino, str):
+                with open(destino, 'wb') as ficheiro:
+                    for pedaco in pedacos:
+                        ficheiro.write(pedaco.encode('utf-8'))
+            else:
+                for pedaco in pedacos:
+                    destino.write(pedaco.encode('utf-8'))
+        else:
+            raise ValueError(f'Formato não suportado: {formato}')
+
+    def escrever_xlsx(self, destino):
+        workbook = xlsxwriter.Workbook(destino, {
+            'constant_memory': True,
+            'remove_timezone': True,
+            'default_date_format': 'yyyy-mm-dd',
+        })
+        self.escrever_folhas(workbook, self.titulo)
+        workbook.close()
+
+    def escrever_folhas(self, workbook, nome: str):
+        """
+        Escreve as linhas em folhas de um workbook XlsxWriter aberto em
+        constant_memory (linha a linha); abre uma folha nova a cada limite
+        de linhas do Excel.
+        """
+        negrito = workbook.add_format({'bold': True})
+        nome = self.nome_folha(nome)
+        folhas = 0
+        folha = None
+        linha_excel = self.MAX_LINHAS_FOLHA
+
+        for linha in self.valores():
+            if linha_excel >= self.MAX_LINHAS_FOLHA:
+                folhas += 1
+                folha = workbook.add_worksheet(nome if folhas == 1 else f'{nome[:27]} ({folhas})')
+                folha.write_row(0, 0, self.cabecalho, negrito)
+                linha_excel = 1
+            folha.write_row(linha_excel, 0, [self._celula(valor) for valor in linha])
+            linha_excel += 1
+
+        if folha is None:
+            workbook.add_worksheet(nome).write_row(0, 0, self.cabecalho, negrito)
+
+    def escrever_pdf(self, destino):
+        """Uma tabela por página, desenhada e libertada à medida que as linhas chegam"""
+        largura, altura = landscape(A4)
+        margem = 30
+        largura_util = largura - 2 * margem
+        largura_coluna = largura_util / max(len(self.colunas), 1)
+        caracteres = max(int(largura_coluna / 4), 4)   # ~4pt por carácter em Helvetica 7
+
+        estilo = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 7),
+            ('TOPPADDING', (0, 0), (-1, -1), 2),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.beige]),
+            ('GRID', (0, 0), (-1, -1), 0.25, colors.black),
+        ])
+        cabecalho = [self._texto(titulo, caracteres) for titulo in self.cabecalho]
+        pdf = canvas.Canvas(destino, pagesize=(largura, altura), pageCompression=1)
+        pdf.setTitle(self.titulo)
+
+        def desenhar_pagina(numero, bloco):
+            pdf.setFont('Helvetica-Bold', 11)
+            pdf.drawString(margem, altura - margem, self.titulo)
+            pdf.setFont('Helvetica', 7)
+            pdf.drawRightString(largura - margem, margem / 2, f'Página {numero}')
+            tabela = Table([cabecalho] + bloco, colWidths=[largura_coluna] * len(cabecalho))
+            tabela.setStyle(estilo)
+            _, altura_tabela = tabela.wrapOn(pdf, largura_util, altura - 2 * margem)
+            tabela.drawOn(pdf, margem, altura - margem - 12 - altura_tabela)
+            pdf.showPage()
+
+        pagina = 0
+        bloco = []
+        for numero, linha in enumerate(self.valores(), 1):
+            if numero > self.MAX_LINHAS_PDF:
+                # Iterável sem tamanho conhecido: só aqui se sabe que excede
+                raise self._limite_pdf()
+            bloco.append([self._texto(valor, caracteres) for valor in linha])
+            if len(bloco) == self.LINHAS_POR_PAGINA_PDF:
+                pagina += 1
+                desenhar_pagina(pagina, bloco)
+                bloco = []
+        if bloco or pagina == 0:
+            pagina += 1
+            desenhar_pagina(pagina, bloco)
+        pdf.save()
+
+    # ---- resposta HTTP ----
+
+    def resposta(self, formato: str, nome: str):
+        """StreamingHttpResponse (CSV/NDJSON) ou FileResponse sobre ficheiro temporário (XLSX/PDF)"""
+        if formato not in self.FORMATOS:
+            raise ValueError(f'Formato não suportado: {formato}')
+        extensao, content_type = self.FORMATOS[formato]
+        nome_ficheiro = f'{nome}.{extensao}'
+
+        if formato in ('csv', 'ndjson'):
+            resposta = StreamingHttpResponse(
+                self.csv() if formato == 'csv' else self.ndjson(), content_type=content_type
+            )
+            resposta['Content-Disposition'] = f'attachment; filename="{nome_ficheiro}"'
+            return resposta
+
+        temporario = tempfile.TemporaryFile()
+        try:
+            self.escrever(formato, temporario)
+        except Exception:
+            temporario.close()
+            raise
+        temporario.seek(0)
+        return FileResponse(temporario, as_attachment=True, filename=nome_ficheiro, content_type=content_type)
+
+    @staticmethod
+    def nome_folha(nome: str) -> str:
+        """Nome válido para uma folha Excel (31 caracteres, sem []:*?/\\)"""
+        return re.sub(r'[\[\]:*?/\\]', ' ', nome or '').strip()[:31] or 'Dados'
+
+    @staticmethod
+    def _celula(valor):
+        if valor is None or isinstance(valor, (str, bool, int, float, Decimal, date, datetime)):
+            return valor
+        return str(valor)
+
+    @staticmethod
+    def _texto(valor, caracteres: int) -> str:
+        texto = '' if valor is None else str(valor)
+        return texto if len(texto) <= caracteres else texto[:caracteres - 1] + '…'
+
+
+class PrevisaoDemandaService:
+    """
+    Previsão diária da procura por produto (unidades, todas as lojas) e por
+    loja (faturamento), com os modelos gravados em ModeloPrevisaoDemanda.
+
+    Modelo: Holt-Winters aditivo com tendência amortecida e sazonalidade
+    semanal. As séries da empresa formam uma matriz (séries × dias) e a
+    recursão corre dia a dia para todas as séries e todas as combinações da
+    grelha de parâmetros ao mesmo tempo; cada série fica com a combinação de
+    menor erro a um dia. Do estado gravado (nível, tendência e os 7 fatores
+    sazonais):
+    - a atualização diária só processa os dias novos, com os parâmetros já
+      escolhidos; séries novas são ajustadas de raiz;
+    - a grelha é revista a cada REAJUSTE_DIAS;
+    - a previsão lê-se sem consultar as vendas.
+    """
+
+    JANELA_DIAS = 364
+    MIN_DIAS = 14
+    REAJUSTE_DIAS = 28
+    AMORTECIMENTO = 0.98
+    ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5)
+    BETAS = (0.0, 0.02, 0.1)
+    GAMMAS = (0.05, 0.15, 0.3)
+    TAMANHO_BLOCO = 2000
+    STATUS_VENDA = ('finalizada', 'entregue')
+    CAMPOS_ESTADO = ['nivel', 'tendencia', 'sazonalidade', 'ultimo_dia', 'observacoes', 'erro_medio', 'atualizado_em']
+
+    def __init__(self, empresa):
+        self.empresa = empresa
+
+    # ---- núcleo vetorizado (sem base de dados) ----
+
+    @classmethod
+    def ajustar_matriz(cls, Y, primeiro_dia: date) -> Dict[str, np.ndarray]:
+        """
+        Ajusta todas as séries de Y (séries × dias consecutivos a partir de
+        `primeiro_dia`). Devolve, por série: alpha, beta, gamma, nivel,
+        tendencia, sazonalidade (n × 7, por dia da semana), observacoes e
+        erro_medio.
+        """
+        Y = np.asarray(Y, dtype='float64')
+        if Y.shape[1] < cls.MIN_DIAS:
+            raise ValueError(f'São precisos pelo menos {cls.MIN_DIAS} dias de vendas')
+        blocos = [
+            cls._ajustar_bloco(Y[inicio:inicio + cls.TAMANHO_BLOCO], primeiro_dia)
+            for inicio in range(0, max(len(Y), 1), cls.TAMANHO_BLOCO)
+        ]
+        return {chave: np.concatenate([bloco[chave] for bloco in blocos]) for chave in blocos[0]}
+
+    @classmethod
+    def _ajustar_bloco(cls, Y, primeiro_dia: date) -> Dict[str, np.ndarray]:
+        grelha = np.array(list(itertools.product(cls.ALPHAS, cls.BETAS, cls.GAMMAS)))
+        alpha, beta, gamma = (grelha[:, i:i + 1] for i in range(3))      # (G, 1)
+        n, dias = Y.shape
+        phi = cls.AMORTECIMENTO
+        dia_semana = (primeiro_dia.weekday() + np.arange(dias)) % 7
+
+        # Estado inicial a partir da primeira semana, igual para toda a grelha
+        nivel_inicial = Y[:, :7].mean(axis=1)
+        nivel = np.repeat(nivel_inicial[None, :], len(grelha), axis=0)   # (G, n)
+        tendencia = np.zeros_like(nivel)
+        sazonalidade = np.zeros((7,) + nivel.shape)                      # (7, G, n)
+        sazonalidade[dia_semana[:7]] = (Y[:, :7] - nivel_inicial[:, None]).T[:, None, :]
+        erro = np.zeros_like(nivel)
+
+        for dia in range(7, dias):
+            y = Y[:, dia]
+            s = sazonalidade[dia_semana[dia]]
+            base = nivel + phi * tendencia
+            if dia >= cls.MIN_DIAS:
+                erro += np.abs(y - base - s)
+            novo_nivel = alpha * (y - s) + (1 - alpha) * base
+            tendencia = beta * (novo_nivel - nivel) + (1 - beta) * phi * tendencia
+            sazonalidade[dia_semana[dia]] = gamma * (y - novo_nivel) + (1 - gamma) * s
+            nivel = novo_nivel
+
+        melhor = erro.argmin(axis=0)
+        series = np.arange(n)
+        return {
+            'alpha': alpha[melhor, 0],
+            'beta': beta[melhor, 0],
+            'gamma': gamma[melhor, 0],
+            'nivel': nivel[melhor, series],
+            'tendencia': tendencia[melhor, series],
+            'sazonalidade': sazonalidade[:, melhor, series].T,
+            'observacoes': np.full(n, dias),
+            'erro_medio': erro[melhor, series] / (dias - cls.MIN_DIAS or 1),
+        }
+
+    @classmethod
+    def avancar_matriz(cls, estado: Dict[str, np.ndarray], Y, primeiro_dia: date) -> Dict[str, np.ndarray]:
+        """Avança o estado pelos dias de Y com os parâmetros de cada série (sem rever a grelha)"""
+        Y = np.asarray(Y, dtype='float64')
+        phi = cls.AMORTECIMENTO
+        alpha, beta, gamma = estado['alpha'], estado['beta'], estado['gamma']
+        nivel, tendencia = estado['nivel'].copy(), estado['tendencia'].copy()
+        sazonalidade = estado['sazonalidade'].T.copy()                   # (7, n)
+        erro = np.zeros(len(nivel))
+
+        for dia in range(Y.shape[1]):
+            y = Y[:, dia]
+            semana = (primeiro_dia.weekday() + dia) % 7
+            s = sazonalidade[semana]
+            base = nivel + phi * tendencia
+            erro += np.abs(y - base - s)
+            novo_nivel = alpha * (y - s) + (1 - alpha) * base
+            tendencia = beta * (novo_nivel - nivel) + (1 - beta) * phi * tendencia
+            sazonalidade[semana] = gamma * (y - novo_nivel) + (1 - gamma) * s
+            nivel = novo_nivel
+
+        observacoes = estado['observacoes'] + Y.shape[1]
+        return {
+            **estado,
+            'nivel': nivel,
+            'tendencia': tendencia,
+            'sazonalidade': sazonalidade.T,
+            'observacoes': observacoes,
+            'erro_medio': (estado['erro_medio'] * estado['observacoes'] + erro) / np.maximum(observacoes, 1),
+        }
+
+    @classmethod
+    def prever_matriz(cls, estado: Dict[str, np.ndarray], ultimos_dias, inicio: date, dias: int) -> np.ndarray:
+        """
+        Previsão (séries × dias) a partir de `inicio`; `ultimos_dias` é o
+        último dia incorporado no estado de cada série (data ou array).
+        """
+        ultimos = np.broadcast_to(np.asarray(ultimos_dias, dtype='datetime64[D]'), estado['nivel'].shape)
+        horizonte = (np.datetime64(inicio, 'D') - ultimos).astype('int64')[:, None] + np.arange(dias)   # >= 1
+        amortecimento = np.cumsum(cls.AMORTECIMENTO ** np.arange(1, horizonte.max() + 1)) if horizonte.size else np.zeros(0)
+        # 1970-01-01 foi uma quinta-feira (weekday 3)
+        semana = (ultimos.astype('int64')[:, None] + horizonte + 3) % 7
+        previsao = (
+            estado['nivel'][:, None]
+            + estado['tendencia'][:, None] * amortecimento[horizonte - 1]
+            + np.take_along_axis(estado['sazonalidade'], semana, axis=1)
+        )
+        return np.clip(previsao, 0, None)
+
+    @classmethod
+    def backtest(cls, Y, primeiro_dia: date, horizonte: int = 28) -> Dict[str, float]:
+        """
+        Ajusta em Y sem os últimos `horizonte` dias e compara a previsão com o
+        observado. Devolve tempos de ajuste e de atualização por 1000 séries,
+        MAE, WAPE e o WAPE da referência ingénua sazonal (última semana
+        repetida).
+        """
+        Y = np.asarray(Y, dtype='float64')
+        treino, teste = Y[:, :-horizonte], Y[:, -horizonte:]
+        ultimo = primeiro_dia + timedelta(days=treino.shape[1] - 1)
+        por_mil = 1000 / max(len(Y), 1)
+
+        inicio = time.perf_counter()
+        estado = cls.ajustar_matriz(treino, primeiro_dia)
+        ajuste = time.perf_counter() - inicio
+
+        previsto = cls.prever_matriz(estado, ultimo, ultimo + timedelta(days=1), horizonte)
+        ingenua = np.tile(treino[:, -7:], -(-horizonte // 7))[:, :horizonte]
+
+        inicio = time.perf_counter()
+        cls.avancar_matriz(estado, teste[:, :1], ultimo + timedelta(days=1))
+        atualizacao = time.perf_counter() - inicio
+
+        total = teste.sum() or 1.0
+        return {
+            'series': len(Y),
+            'dias_treino': treino.shape[1],
+            'horizonte': horizonte,
+            'ajuste_s': ajuste,
+            'ajuste_s_por_mil': ajuste * por_mil,
+            'atualizacao_dia_ms_por_mil': atualizacao * 1000 * por_mil,
+            'mae': float(np.abs(previsto - teste).mean()),
+            'wape': float(np.abs(previsto - teste).sum() / total),
+            'wape_ingenua': float(np.abs(ingenua - teste).sum() / total),
+            'vies': float((previsto - teste).sum() / total),
+        }
+
+    # ---- vendas e modelos gravados ----
+
+    @staticmethod
+    def _campo(serie: str) -> str:
+        if serie not in ('produto', 'loja'):
+            raise ValueError(f'Série desconhecida: {serie}')
+        return f'{serie}_id'
+
+    def _vendas(self, serie: str, inicio: date, fim: date, chaves=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (chaves, matriz séries × dias) com as vendas diárias de [inicio, fim]
+        numa consulta agregada. Com `chaves`, as linhas seguem essa ordem.
+        """
+        from apps.vendas.models import ItemVenda, Venda
+
+        desde = timezone.make_aware(datetime.combine(inicio, datetime.min.time()))
+        ate = timezone.make_aware(datetime.combine(fim + timedelta(days=1), datetime.min.time()))
+        if serie == 'produto':
+            linhas = ItemVenda.objects.filter(
+                venda__empresa=self.empresa, venda__status__in=self.STATUS_VENDA, produto__isnull=False,
+                venda__data_venda__gte=desde, venda__data_venda__lt=ate,
+            ).annotate(dia=TruncDate('venda__data_venda')).values('produto_id', 'dia').annotate(valor=Sum('quantidade'))
+        else:
+            linhas = Venda.objects.filter(
+                empresa=self.empresa, status__in=self.STATUS_VENDA, loja__isnull=False,
+                data_venda__gte=desde, data_venda__lt=ate,
+            ).annotate(dia=TruncDate('data_venda')).values('loja_id', 'dia').annotate(valor=Sum('total'))
+        campo = self._campo(serie)
+        if chaves is not None:
+            linhas = linhas.filter(**{f'{campo}__in': list(chaves)})
+
+        df = pd.DataFrame.from_records(
+            list(linhas.values_list(campo, 'dia', 'valor').order_by()), columns=['chave', 'dia', 'valor']
+        )
+        dias = (fim - inicio).days + 1
+        if chaves is None:
+            chaves = np.sort(df['chave'].unique()) if not df.empty else np.zeros(0, dtype='int64')
+        chaves = np.asarray(list(chaves), dtype='int64')
+
+        Y = np.zeros((len(chaves), dias))
+        if not df.empty:
+            posicao = pd.Series(np.arange(len(chaves)), index=chaves)
+            linha = posicao.reindex(df['chave']).to_numpy()
+            coluna = (pd.to_datetime(df['dia']) - pd.Timestamp(inicio)).dt.days.to_numpy()
+            valido = ~np.isnan(linha)
+            np.add.at(Y, (linha[valido].astype('int64'), coluna[valido]), df['valor'].astype('float64').to_numpy()[valido])
+        return chaves, Y
+
+    @staticmethod
+    def _estado(modelos) -> Dict[str, np.ndarray]:
+        return {
+            campo: np.array([getattr(modelo, campo) for modelo in modelos], dtype='float64')
+            for campo in ('alpha', 'beta', 'gamma', 'nivel', 'tendencia', 'observacoes', 'erro_medio')
+        } | {'sazonalidade': np.array([modelo.sazonalidade for modelo in modelos], dtype='float64').reshape(-1, 7)}
+
+    @staticmethod
+    def _aplicar(modelo, estado: Dict[str, np.ndarray], i: int):
+        for campo in ('alpha', 'beta', 'gamma', 'nivel', 'tendencia', 'erro_medio'):
+            setattr(modelo, campo, round(float(estado[campo][i]), 6))
+        modelo.observacoes = int(estado['observacoes'][i])
+        modelo.sazonalidade = [round(float(v), 6) for v in estado['sazonalidade'][i]]
+
+    def _ajustar_janela(self, serie: str, fim: date, chaves=None, agora=None,
+                        inicio: Optional[date] = None) -> List[ModeloPrevisaoDemanda]:
+        """
+        Modelos (não gravados) ajustados de raiz na janela que termina em
+        `fim`. Sem `inicio`, as séries começam no primeiro dia com vendas.
+        """
+        agora = agora or timezone.now()
+        janela = fim - timedelta(days=self.JANELA_DIAS - 1)
+        chaves, Y = self._vendas(serie, max(inicio or janela, janela), fim, chaves)
+        com_vendas = np.flatnonzero(Y.any(axis=0))
+        if not len(chaves) or not len(com_vendas):
+            return []
+        primeiro = 0 if inicio else int(com_vendas[0])
+        inicio = fim - timedelta(days=Y.shape[1] - 1)
+        Y = Y[:, primeiro:]
+        if Y.shape[1] < self.MIN_DIAS:
+            return []
+
+        estado = self.ajustar_matriz(Y, inicio + timedelta(days=primeiro))
+        campo = self._campo(serie)
+        modelos = []
+        for i, chave in enumerate(chaves.tolist()):
+            modelo = ModeloPrevisaoDemanda(
+                empresa=self.empresa, serie=serie, ultimo_dia=fim, ajustado_em=agora, atualizado_em=agora,
+                **{campo: chave},
+            )
+            self._aplicar(modelo, estado, i)
+            modelos.append(modelo)
+        return modelos
+
+    @transaction.atomic
+    def ajustar(self, serie: str, fim: Optional[date] = None) -> int:
+        """Ajuste completo (grelha de parâmetros) de todas as séries. Devolve o número de modelos"""
+        fim = fim or timezone.localdate() - timedelta(days=1)
+        modelos = self._ajustar_janela(serie, fim)
+        ModeloPrevisaoDemanda.objects.filter(empresa=self.empresa, serie=serie).delete()
+        ModeloPrevisaoDemanda.objects.bulk_create(modelos, batch_size=self.TAMANHO_BLOCO)
+        logger.info(f'Previsão ({serie}) da empresa {self.empresa.pk}: {len(modelos)} modelos ajustados')
+        return len(modelos)
+
+    def atualizar(self, serie: str, fim: Optional[date] = None) -> int:
+        """
+        Atualização diária: os modelos existentes avançam pelos dias novos,
+        as séries que começaram a vender são ajustadas de raiz e, passados
+        REAJUSTE_DIAS desde o último ajuste, tudo é reajustado.
+        Devolve o número de modelos atualizados ou criados.
+        """
+        fim = fim or timezone.localdate() - timedelta(days=1)
+        agora = timezone.now()
+        modelos = ModeloPrevisaoDemanda.objects.filter(empresa=self.empresa, serie=serie)
+        resumo = modelos.aggregate(total=Count('pk'), ajustado=Min('ajustado_em'))
+        if not resumo['total'] or resumo['ajustado'] < agora - timedelta(days=self.REAJUSTE_DIAS):
+            return self.ajustar(serie, fim)
+
+        campo = self._campo(serie)
+        with transaction.atomic():
+            existentes = list(modelos.select_for_update().order_by('ultimo_dia', 'pk'))
+            pendentes = [modelo for modelo in existentes if modelo.ultimo_dia < fim]
+            if not pendentes:
+                return 0
+
+            inicio = pendentes[0].ultimo_dia + timedelta(days=1)
+            chaves, Y = self._vendas(serie, inicio, fim)
+            Y = np.vstack([Y, np.zeros((1, Y.shape[1]))])       # linha de zeros para séries sem vendas
+            linha = {chave: i for i, chave in enumerate(chaves.tolist())}
+
+            for ultimo_dia, grupo in itertools.groupby(pendentes, key=lambda modelo: modelo.ultimo_dia):
+                grupo = list(grupo)
+                desvio = (ultimo_dia - inicio).days + 1
+                indices = [linha.get(getattr(modelo, campo), len(chaves)) for modelo in grupo]
+                estado = self.avancar_matriz(self._estado(grupo), Y[indices, desvio:], ultimo_dia + timedelta(days=1))
+                for i, modelo in enumerate(grupo):
+                    self._aplicar(modelo, estado, i)
+                    modelo.ultimo_dia = fim
+                    modelo.atualizado_em = agora
+            ModeloPrevisaoDemanda.objects.bulk_update(
+                pendentes, self.CAMPOS_ESTADO + ['alpha', 'beta', 'gamma'], batch_size=self.TAMANHO_BLOCO
+            )
+
+            conhecidas = {getattr(modelo, campo) for modelo in existentes}
+            novas = [chave for chave in chaves.tolist() if chave not in conhecidas]
+            # Séries novas começam com as restantes, com zeros antes da primeira venda
+            inicio_series = min(fim - timedelta(days=modelo.observacoes - 1) for modelo in existentes)
+            criados = self._ajustar_janela(serie, fim, novas, agora, inicio_series) if novas else []
+            ModeloPrevisaoDemanda.objects.bulk_create(criados, batch_size=self.TAMANHO_BLOCO)
+
+        logger.info(
+            f'Previsão ({serie}) da empresa {self.empresa.pk}: {len(pendentes)} modelos atualizados, '
+            f'{len(criados)} novos'
+        )
+        return len(pendentes) + len(criados)
+
+    def previsoes(self, serie: str, dias: int = 28, chaves=None, inicio: Optional[date] = None) -> pd.DataFrame:
+        """
+        Previsão diária a partir dos modelos gravados, sem consultar as
+        vendas: DataFrame com uma linha por produto/loja e uma coluna por dia.
+        """
+        campo = self._campo(serie)
+        modelos = ModeloPrevisaoDemanda.objects.filter(empresa=self.empresa, serie=serie)
+        if chaves is not None:
+            modelos = modelos.filter(**{f'{campo}__in': list(chaves)})
+        linhas = list(modelos.values_list(campo, 'nivel', 'tendencia', 'sazonalidade', 'ultimo_dia'))
+        if not linhas:
+            return pd.DataFrame()
+
+        ids, nivel, tendencia, sazonalidade, ultimos = zip(*linhas)
+        inicio = inicio or max(ultimos) + timedelta(days=1)
+        estado = {
+            'nivel': np.array(nivel, dtype='float64'),
+            'tendencia': np.array(tendencia, dtype='float64'),
+            'sazonalidade': np.array(sazonalidade, dtype='float64').reshape(-1, 7),
+        }
+        previsao = self.prever_matriz(estado, np.array(ultimos, dtype='datetime64[D]'), inicio, dias)
+        return pd.DataFrame(
+            previsao, index=pd.Index(ids, name=campo),
+            columns=[inicio + timedelta(days=d) for d in range(dias)],
+        )
+
+
+class SegmentacaoClientesService:
+    """
+    Segmentação de clientes com MiniBatchKMeans sobre as estatísticas
+    desnormalizadas (EstatisticaCliente), sem junções com as vendas.
+
+    Features (log1p, padronizadas): frequência, valor comprado, ticket
+    médio, recência e antiguidade. O modelo fica em
+    ModeloSegmentacaoClientes como arrays JSON (média e desvio da escala,
+    centróides e contagens por centróide), sem pickle:
+    - a execução noturna faz um passo de mini-batch k-means só com os
+      clientes que compraram desde a última execução e reatribui todos os
+      clientes (a recência muda todos os dias), gravando apenas as
+      atribuições que mudaram;
+    - o ajuste completo corre na primeira execução, quando muda o número de
+      segmentos, a cada REAJUSTE_DIAS e se os parâmetros gravados forem
+      ilegíveis.
+    """
+
+    N_CLUSTERS = 4
+    REAJUSTE_DIAS = 30
+    TAMANHO_LOTE = 4096          # mini-lote do MiniBatchKMeans
+    AMOSTRA_INICIAL = 20000      # amostra para os centróides iniciais
+    TAMANHO_BLOCO = 5000         # gravação das atribuições
+    FEATURES = ['frequencia', 'valor', 'ticket_medio', 'recencia', 'antiguidade']
+    PARAMETROS = ['media', 'escala', 'centros', 'contagens']
+
+    def __init__(self, empresa, n_clusters: Optional[int] = None):
+        self.empresa = empresa
+        self.n_clusters = n_clusters or self.N_CLUSTERS
+
+    # ---- núcleo (arrays, sem base de dados) ----
+
+    @staticmethod
+    def features(compras, comprado, primeira, ultima, hoje: date) -> np.ndarray:
+        """Matriz (clientes × FEATURES) a partir das colunas de EstatisticaCliente"""
+        compras = np.asarray(compras, dtype='float64')
+        comprado = np.asarray(comprado, dtype='float64')
+        hoje = np.datetime64(hoje, 'D')
+        recencia = (hoje - np.asarray(ultima, dtype='datetime64[D]')).astype('float64')
+        antiguidade = (hoje - np.asarray(primeira, dtype='datetime64[D]')).astype('float64')
+        ticket = comprado / np.maximum(compras, 1)
+        return np.log1p(np.clip(np.column_stack([compras, comprado, ticket, recencia, antiguidade]), 0, None))
+
+    @classmethod
+    def ajustar_matriz(cls, X, n_clusters: int) -> Dict:
+        """
+        Escala e centróides de raiz. Os centróides iniciais vêm de um KMeans
+        completo numa amostra: o MiniBatchKMeans só com k-means++ cai com
+        frequência em mínimos locais diferentes consoante a semente.
+        """
+        escala = StandardScaler().fit(X)
+        Z = escala.transform(X)
+        amostra = Z
+        if len(Z) > cls.AMOSTRA_INICIAL:
+            amostra = Z[np.random.default_rng(42).choice(len(Z), cls.AMOSTRA_INICIAL, replace=False)]
+        centros = KMeans(n_clusters=n_clusters, n_init=10, random_state=42).fit(amostra).cluster_centers_
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_clusters, init=centros, n_init=1, batch_size=cls.TAMANHO_LOTE, random_state=42
+        )
+        kmeans.fit(Z)
+        return {
+            'media': escala.mean_,
+            'escala': escala.scale_,
+            'centros': kmeans.cluster_centers_,
+            # Peso de cada centróide nas atualizações seguintes: clientes atribuídos
+            'contagens': np.bincount(kmeans.labels_, minlength=n_clusters).astype('float64'),
+        }
+
+    @staticmethod
+    def padronizar(modelo: Dict, X) -> np.ndarray:
+        return (np.asarray(X, dtype='float64') - modelo['media']) / modelo['escala']
+
+    @staticmethod
+    def _mais_proximo(centros, Z) -> np.ndarray:
+        distancias = (Z ** 2).sum(axis=1)[:, None] - 2 * Z @ centros.T + (centros ** 2).sum(axis=1)[None, :]
+        return distancias.argmin(axis=1)
+
+    @classmethod
+    def atualizar_matriz(cls, modelo: Dict, X) -> Dict:
+        """
+        Passo do mini-batch k-means, em mini-lotes, com as linhas de X (escala
+        mantida): cada centróide passa à média ponderada entre ele (peso =
+        contagem acumulada) e os pontos que lhe foram atribuídos.
+        """
+        Z = cls.padronizar(modelo, X)
+        centros, contagens = modelo['centros'], modelo['contagens']
+        for inicio in range(0, len(Z), cls.TAMANHO_LOTE):
+            lote = Z[inicio:inicio + cls.TAMANHO_LOTE]
+            rotulos = cls._mais_proximo(centros, lote)
+            novos = np.bincount(rotulos, minlength=len(centros)).astype('float64')
+            somas = np.zeros_like(centros)
+            np.add.at(somas, rotulos, lote)
+            com_pontos = novos > 0
+            centros[com_pontos] = (
+                (centros[com_pontos] * contagens[com_pontos, None] + somas[com_pontos])
+                / (contagens[com_pontos] + novos[com_pontos])[:, None]
+            )
+            contagens += novos
+        return modelo
+
+    @classmethod
+    def atribuir(cls, modelo: Dict, X) -> np.ndarray:
+        return cls._mais_proximo(modelo['centros'], cls.padronizar(modelo, X))
+
+    @classmethod
+    def serializar(cls, modelo: Dict) -> Dict:
+        return {chave: np.asarray(modelo[chave], dtype='float64').tolist() for chave in cls.PARAMETROS}
+
+    @classmethod
+    def carregar(cls, parametros, n_clusters: int) -> Dict:
+        """Modelo a partir dos arrays gravados; ValueError se incompletos ou com outras dimensões"""
+        try:
+            modelo = {chave: np.array(parametros[chave], dtype='float64') for chave in cls.PARAMETROS}
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f'parâmetros incompletos ({e!r})') from e
+        n = len(cls.FEATURES)
+        formas = {'media': (n,), 'escala': (n,), 'centros': (n_clusters, n), 'contagens': (n_clusters,)}
+        for chave, forma in formas.items():
+            if modelo[chave].shape != forma:
+                raise ValueError(f'{chave} com dimensões {modelo[chave].shape}, esperado {forma}')
+        if not np.all(modelo['escala'] > 0):
+            raise ValueError('escala com desvios nulos')
+        return modelo
+
+    @classmethod
+    def resumir(cls, df: pd.DataFrame, rotulos, n_clusters: int, hoje: date) -> List[Dict]:
+        """Métricas por segmento (ordenado por faturamento médio, decrescente)"""
+        dados = pd.DataFrame({
+            'cluster': rotulos,
+            'compras': df['compras'].to_numpy(dtype='float64'),
+            'comprado': df['comprado'].to_numpy(dtype='float64'),
+            'recencia': (np.datetime64(hoje, 'D') - df['ultima'].to_numpy(dtype='datetime64[D]')).astype('float64'),
+        })
+        grupos = dados.groupby('cluster').agg(
+            clientes=('compras', 'size'), compras=('compras', 'sum'), comprado=('comprado', 'sum'),
+            recencia=('recencia', 'mean'),
+        ).reindex(range(n_clusters), fill_value=0)
+        grupos['faturamento_medio'] = grupos['comprado'] / grupos['clientes'].clip(lower=1)
+        grupos = grupos.sort_values('faturamento_medio', ascending=False)
+
+        return [
+            {
+                'cluster': int(cluster),
+                'nome': f'Segmento {ordem}',
+                'clientes': int(linha['clientes']),
+                'faturamento_total': round(float(linha['comprado']), 2),
+                'faturamento_medio': round(float(linha['faturamento_medio']), 2),
+                'frequencia_media': round(float(linha['compras'] / max(linha['clientes'], 1)), 2),
+                'ticket_medio': round(float(linha['comprado'] / max(linha['compras'], 1)), 2),
+                'recencia_media_dias': round(float(linha['recencia']), 1),
+            }
+            for ordem, (cluster, linha) in enumerate(grupos.iterrows(), 1)
+        ]
+
+    # ---- estatísticas e modelo gravado ----
+
+    def _estatisticas(self) -> pd.DataFrame:
+        from apps.clientes.models import EstatisticaCliente
+
+        linhas = EstatisticaCliente.objects.filter(
+            empresa=self.empresa, total_compras__gt=0,
+            primeira_compra__isnull=False, ultima_compra__isnull=False,
+        ).values_list('cliente_id', 'total_compras', 'total_comprado', 'primeira_compra', 'ultima_compra')
+        df = pd.DataFrame.from_records(
+            list(linhas.iterator(chunk_size=self.TAMANHO_BLOCO)),
+            columns=['cliente_id', 'compras', 'comprado', 'primeira', 'ultima'],
+        )
+        df['comprado'] = df['comprado'].astype('float64')
+        return df
+
+    def _matriz(self, df: pd.DataFrame, hoje: date) -> np.ndarray:
+        return self.features(df['compras'], df['comprado'], df['primeira'], df['ultima'], hoje)
+
+    def ajustar(self, hoje: Optional[date] = None) -> int:
+        """Ajuste completo. Devolve o número de atribuições gravadas"""
+        hoje = hoje or timezone.localdate()
+        df = self._estatisticas()
+        if len(df) < self.n_clusters:
+            logger.info(f'Segmentação da empresa {self.empresa.pk}: clientes insuficientes ({len(df)})')
+            return 0
+        X = self._matriz(df, hoje)
+        modelo = self.ajustar_matriz(X, self.n_clusters)
+        return self._gravar(df, X, modelo, hoje, ajuste=True)
+
+    def atualizar(self, hoje: Optional[date] = None) -> int:
+        """
+        Execução noturna: centróides atualizados com os clientes que
+        compraram desde a última execução (dias completos) e reatribuição
+        de todos. Devolve o número de atribuições gravadas.
+        """
+        hoje = hoje or timezone.localdate()
+        registo = ModeloSegmentacaoClientes.objects.filter(empresa=self.empresa).first()
+        if (
+            registo is None or registo.n_clusters != self.n_clusters
+            or registo.ajustado_em < timezone.now() - timedelta(days=self.REAJUSTE_DIAS)
+        ):
+            return self.ajustar(hoje)
+        try:
+            modelo = self.carregar(registo.parametros, self.n_clusters)
+        except ValueError as e:
+            logger.warning(f'Segmentação da empresa {self.empresa.pk}: modelo gravado ilegível ({e}), ajuste completo')
+            return self.ajustar(hoje)
+
+        df = self._estatisticas()
+        if len(df) < self.n_clusters:
+            return 0
+        X = self._matriz(df, hoje)
+        ontem = hoje - timedelta(days=1)
+        ultima = df['ultima'].to_numpy(dtype='datetime64[D]')
+        ativos = (ultima > np.datetime64(registo.atividade_ate, 'D')) & (ultima <= np.datetime64(ontem, 'D'))
+        if ativos.any():
+            self.atualizar_matriz(modelo, X[ativos])
+        logger.info(f'Segmentação da empresa {self.empresa.pk}: {int(ativos.sum())} clientes com atividade nova')
+        return self._gravar(df, X, modelo, hoje, ajuste=False)
+
+    @transaction.atomic
+    def _gravar(self, df: pd.DataFrame, X, modelo: Dict, hoje: date, ajuste: bool) -> int:
+        agora = timezone.now()
+        rotulos = self.atribuir(modelo, X)
+        ids = df['cliente_id'].to_numpy()
+
+        # Só as atribuições novas ou alteradas são gravadas
+        atuais = pd.Series(dict(
+            SegmentoCliente.objects.filter(empresa=self.empresa).values_list('cliente_id', 'cluster').iterator(
+                chunk_size=self.TAMANHO_BLOCO
+            )
+        ), dtype='float64')
+        anterior = atuais.reindex(ids).to_numpy()
+        mudou = anterior != rotulos
+        registros = [
+            SegmentoCliente(cliente_id=cliente_id, empresa=self.empresa, cluster=cluster, atualizado_em=agora)
+            for cliente_id, cluster in zip(ids[mudou].tolist(), rotulos[mudou].tolist())
+        ]
+        SegmentoCliente.objects.bulk_create(
+            registros, batch_size=self.TAMANHO_BLOCO,
+            update_conflicts=True, unique_fields=['cliente'], update_fields=['empresa', 'cluster', 'atualizado_em'],
+        )
+        removidos = atuais.index.difference(ids).tolist()
+        for inicio in range(0, len(removidos), self.TAMANHO_BLOCO):
+            SegmentoCliente.objects.filter(cliente_id__in=removidos[inicio:inicio + self.TAMANHO_BLOCO]).delete()
+
+        defaults = {
+            'n_clusters': self.n_clusters,
+            'parametros': self.serializar(modelo),
+            'resumo': self.resumir(df, rotulos, self.n_clusters, hoje),
+            'total_clientes': len(df),
+            'atividade_ate': hoje - timedelta(days=1),
+            'atualizado_em': agora,
+        }
+        if ajuste:
+            defaults['ajustado_em'] = agora
+        ModeloSegmentacaoClientes.objects.update_or_create(empresa=self.empresa, defaults=defaults)
+
+        logger.info(
+            f'Segmentação da empresa {self.empresa.pk}: {len(df)} clientes, {len(registros)} atribuições '
+            f'gravadas, {len(removidos)} removidas'
+        )
+        return len(registros)
@@ -14,15 +14,17 @@ from .utils import (
     processar_relatorio_assincrono, criar_kpi_automatico,
     detectar_alertas_automaticos
 )
+from .services import FilaRelatoriosService, PrevisaoDemandaService, SegmentacaoClientesService
 from apps.core.models import Empresa
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task
+@shared_task(acks_late=True)
 def processar_relatorio_task(relatorio_id):
     """
-    Task para processar relatório de forma assíncrona
+    Task para processar relatório de forma assíncrona.
+    Enviada por FilaRelatoriosService para a fila do tipo de relatório.
     """
     try:
         processar_relatorio_assincrono(relatorio_id)
@@ -60,20 +62,17 @@ def executar_agendamentos_relatorios():
                 deve_executar = agora.day == 1
             
             if deve_executar:
-                # Gerar relatório
-                relatorio = RelatorioGerado.objects.create(
-                    tipo_relatorio=agendamento.template,
-                    formato='pdf',  # Formato padrão para agendamentos
-                    empresa=agendamento.template.empresa,
-                    solicitante=agendamento.template.empresa.usuario_set.first(),  # Usuário padrão
-                    data_inicio=date.today() - timedelta(days=30),
-                    data_fim=date.today()
-                )
-                
-                # Processar assincronamente
-                processar_relatorio_task.delay(relatorio.id)
-                
-                logger.info(f'Agendamento {agendamento.id} executado - Relatório {relatorio.id} criado')
+                # Gerar relatório (fila e prioridade do tipo de relatório)
+                empresa = agendamento.template.empresa
+                try:
+                    relatorio, _ = FilaRelatoriosService(empresa).solicitar_agendamento(
+                        agendamento, empresa.usuario_set.first()  # Usuário padrão
+                    )
+                except ValueError as e:
+                    logger.warning(str(e))
+                    continue
+
+                logger.info(f'Agendamento {agendamento.id} executado - Relatório {relatorio.id} na fila')
         
     except Exception as e:
         logger.error(f'Erro ao executar agendamentos: {e}')
@@ -132,6 +131,47 @@ def detectar_alertas_task():
         logger.error(f'Erro ao detectar alertas: {e}')
 
 
+@shared_task
+def atualizar_previsoes_demanda_task(empresa_id=None):
+    """
+    Atualização noturna dos modelos de previsão da procura (por produto e
+    por loja): dias novos incorporados no estado gravado, reajuste completo
+    periódico.
+    """
+    empresas = Empresa.objects.filter(ativa=True)
+    if empresa_id:
+        empresas = empresas.filter(pk=empresa_id)
+    total = 0
+    for empresa in empresas:
+        service = PrevisaoDemandaService(empresa)
+        for serie in ('produto', 'loja'):
+            try:
+                total += service.atualizar(serie)
+            except Exception as e:
+                logger.error(f'Erro ao atualizar a previsão ({serie}) da empresa {empresa.id}: {e}')
+    logger.info(f'Previsões de procura atualizadas: {total} modelos')
+    return total
+
+
+@shared_task
+def atualizar_segmentacao_clientes_task(empresa_id=None):
+    """
+    Atualização noturna da segmentação de clientes: centróides ajustados
+    com a atividade do dia anterior e atribuições alteradas gravadas.
+    """
+    empresas = Empresa.objects.filter(ativa=True)
+    if empresa_id:
+        empresas = empresas.filter(pk=empresa_id)
+    total = 0
+    for empresa in empresas:
+        try:
+            total += SegmentacaoClientesService(empresa).atualizar()
+        except Exception as e:
+            logger.error(f'Erro ao atualizar a segmentação de clientes da empresa {empresa.id}: {e}')
+    logger.info(f'Segmentação de clientes atualizada: {total} atribuições gravadas')
+    return total
+
+
 @shared_task
 def limpar_relatorios_antigos():
     """
@@ -182,18 +222,18 @@ def gerar_relatorio_mensal():
         
         for empresa in Empresa.objects.filter(ativa=True):
             # Relatório de vendas mensais
-            relatorio = RelatorioGerado.objects.create(
-                tipo_relatorio=empresa.tipos_relatorio.filter(codigo='VENDAS_MENSAL').first(),
+            tipo_relatorio = empresa.tipos_relatorio.filter(codigo='VENDAS_MENSAL').first()
+            if not tipo_relatorio:
+                continue
+
+            FilaRelatoriosService(empresa).solicitar(
+                tipo_relatorio,
+                empresa.usuario_set.first(),
                 formato='pdf',
-                empresa=empresa,
-                solicitante=empresa.usuario_set.first(),
                 data_inicio=primeiro_dia_mes_anterior,
                 data_fim=ultimo_dia_mes_anterior
             )
-            
-            if relatorio.tipo_relatorio:
-                processar_relatorio_task.delay(relatorio.id)
-                logger.info(f'Relatório mensal criado para empresa {empresa.nome}')
+            logger.info(f'Relatório mensal criado para empresa {empresa.nome}')
         
     except Exception as e:
         logger.error(f'Erro ao gerar relatórios mensais: {e}')
@@ -1,3 +1,363 @@
+import io
+import json
+import zipfile
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
 from django.test import TestCase
+from django.utils import timezone
+
+from apps.clientes.models import Cliente, EstatisticaCliente
+from apps.core.models import Empresa, Loja
+from apps.relatorios import tasks
+from apps.relatorios.models import (
+    AgendamentoRelatorio, ModeloPrevisaoDemanda, ModeloSegmentacaoClientes, RelatorioGerado, SegmentoCliente,
+    TemplateRelatorio, TipoRelatorio,
+)
+from apps.relatorios.services import (
+    ExportacaoStreamingService, FilaRelatoriosService, LimiteExportacaoExcedido, PrevisaoDemandaService,
+    SegmentacaoClientesService,
+)
+from apps.vendas.models import FormaPagamento, Venda
+
+
+class SegmentacaoClientesServiceTest(TestCase):
+    """Segmentação de clientes com o modelo gravado como arrays JSON"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            nome='Farmácia Segmentos', nif='5000000050', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email='segmentos@exemplo.ao',
+        )
+        cls.hoje = timezone.localdate()
+        for indice in range(12):
+            cliente = Cliente.objects.create(empresa=cls.empresa, nome_completo=f'Cliente {indice}')
+            # Estatística criada pelo post_save do cliente
+            EstatisticaCliente.objects.filter(cliente=cliente).update(
+                total_compras=1 + indice * 3,
+                total_comprado=Decimal(1000 + indice * 2500),
+                primeira_compra=cls.hoje - timedelta(days=400 - indice * 10),
+                ultima_compra=cls.hoje - timedelta(days=2 + (11 - indice) * 20),
+            )
+
+    def setUp(self):
+        self.service = SegmentacaoClientesService(self.empresa, n_clusters=3)
+
+    def _registo(self):
+        return ModeloSegmentacaoClientes.objects.get(empresa=self.empresa)
+
+    def test_ajuste_grava_arrays_e_atualizacao_os_recarrega(self):
+        self.assertEqual(self.service.ajustar(self.hoje), 12)
+
+        registo = self._registo()
+        self.assertEqual(set(registo.parametros), set(SegmentacaoClientesService.PARAMETROS))
+        self.assertEqual(np.array(registo.parametros['centros']).shape, (3, 5))
+        self.assertEqual(sum(registo.parametros['contagens']), 12)
+
+        self.service.atualizar(self.hoje + timedelta(days=1))
+
+        # Sem reajuste: o modelo gravado foi carregado e atualizado
+        self.assertEqual(self._registo().ajustado_em, registo.ajustado_em)
+        self.assertEqual(SegmentoCliente.objects.filter(empresa=self.empresa).count(), 12)
+
+    def test_parametros_ilegiveis_fazem_ajuste_completo(self):
+        self.service.ajustar(self.hoje)
+        registo = self._registo()
+        ModeloSegmentacaoClientes.objects.filter(pk=registo.pk).update(parametros={'centros': 'corrompido'})
+
+        with self.assertLogs('apps.relatorios.services', 'WARNING'):
+            self.service.atualizar(self.hoje)
+
+        novo = self._registo()
+        self.assertGreater(novo.ajustado_em, registo.ajustado_em)
+        SegmentacaoClientesService.carregar(novo.parametros, 3)
+
+    def test_carregar_rejeita_dimensoes_inesperadas(self):
+        parametros = {'media': [0] * 5, 'escala': [1] * 5, 'centros': [[0] * 5] * 2, 'contagens': [1, 1]}
+
+        with self.assertRaises(ValueError):
+            SegmentacaoClientesService.carregar(parametros, 3)
+        self.assertEqual(SegmentacaoClientesService.carregar(parametros, 2)['centros'].shape, (2, 5))
+
+    def test_mini_lote_pondera_centroide_pela_contagem(self):
+        modelo = {
+            'media': np.zeros(2), 'escala': np.ones(2),
+            'centros': np.array([[0.0, 0.0], [10.0, 10.0]]), 'contagens': np.array([3.0, 1.0]),
+        }
+
+        SegmentacaoClientesService.atualizar_matriz(modelo, np.array([[4.0, 0.0], [12.0, 10.0]]))
+
+        np.testing.assert_allclose(modelo['centros'], [[1.0, 0.0], [11.0, 10.0]])
+        np.testing.assert_allclose(modelo['contagens'], [4.0, 2.0])
+
+
+class FilaRelatoriosServiceTest(TestCase):
+    """Fila de geração com deduplicação, reutilização e agendamentos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            nome='Farmácia Fila', nif='5000000051', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email='fila@exemplo.ao',
+        )
+        cls.usuario = get_user_model().objects.create(username='fila_relatorios', empresa=cls.empresa)
+        cls.tipo = TipoRelatorio.objects.create(
+            codigo='ANALISE_ABC', nome='Análise ABC', descricao='Curva ABC', categoria='produtos',
+        )
+        cls.hoje = timezone.localdate()
+
+    def setUp(self):
+        patcher = mock.patch.object(tasks.processar_relatorio_task, 'apply_async')
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.apply_async.return_value.id = 'tarefa-1'
+        self.service = FilaRelatoriosService(self.empresa)
+
+    def _solicitar(self, formato='pdf'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.service.solicitar(
+                self.tipo, self.usuario, formato, self.hoje - timedelta(days=7), self.hoje, {'top': 10},
+            )
+
+    def test_pedido_novo_enviado_para_a_fila_do_tipo(self):
+        relatorio, novo = self._solicitar()
+
+        self.assertTrue(novo)
+        self.assertEqual(relatorio.status, 'pendente')
+        self.apply_async.assert_called_once_with(args=[relatorio.pk], queue='relatorios_pesados', priority=4)
+        self.assertEqual(RelatorioGerado.objects.get(pk=relatorio.pk).task_id, 'tarefa-1')
+
+    def test_pedido_identico_em_curso_e_reutilizado(self):
+        relatorio, _ = self._solicitar()
+
+        repetido, novo = self._solicitar()
+        self.assertEqual((repetido.pk, novo), (relatorio.pk, False))
+        self.apply_async.assert_called_once()
+
+        # Outro formato é outro pedido
+        excel, novo = self._solicitar('excel')
+        self.assertTrue(novo)
+        self.assertNotEqual(excel.pk, relatorio.pk)
+
+    def test_resultado_concluido_reutilizado_dentro_do_ttl(self):
+        relatorio, _ = self._solicitar()
+        concluidos = RelatorioGerado.objects.filter(pk=relatorio.pk)
+        concluidos.update(status='concluido', arquivo_resultado='relatorios/gerados/abc.pdf', data_conclusao=timezone.now())
+
+        self.assertEqual(self._solicitar(), (relatorio, False))
+
+        concluidos.update(data_conclusao=timezone.now() - timedelta(seconds=self.service.ttl + 1))
+        _, novo = self._solicitar()
+        self.assertTrue(novo)
+
+    def test_pedido_abandonado_liberta_a_impressao(self):
+        relatorio, _ = self._solicitar()
+        RelatorioGerado.objects.filter(pk=relatorio.pk).update(
+            data_solicitacao=timezone.now() - timedelta(seconds=FilaRelatoriosService.TEMPO_MAXIMO + 1)
+        )
+
+        with self.assertLogs('apps.relatorios.services', 'WARNING'):
+            novo_relatorio, novo = self._solicitar()
+
+        self.assertTrue(novo)
+        self.assertEqual(RelatorioGerado.objects.get(pk=relatorio.pk).status, 'erro')
+        self.assertEqual(novo_relatorio.status, 'pendente')
+
+    def test_solicitar_agendamento(self):
+        template = TemplateRelatorio.objects.create(
+            nome='Vendas', empresa=self.empresa, modelo_base=ContentType.objects.get_for_model(Venda),
+        )
+        agendamento = AgendamentoRelatorio.objects.create(
+            template=template, frequencia='diario', horario=time(8), destinatarios='gestor@exemplo.ao',
+        )
+
+        with self.assertRaises(ValueError):
+            self.service.solicitar_agendamento(agendamento, self.usuario)
+
+        agendamento.tipo_relatorio = self.tipo
+        with self.captureOnCommitCallbacks(execute=True):
+            relatorio, novo = self.service.solicitar_agendamento(agendamento, self.usuario)
+
+        self.assertTrue(novo)
+        self.assertEqual((relatorio.formato, relatorio.parametros), ('pdf', {'agendamento': agendamento.pk}))
+        self.assertEqual(
+            (relatorio.data_inicio, relatorio.data_fim),
+            (self.hoje - timedelta(days=FilaRelatoriosService.DIAS_AGENDAMENTO), self.hoje),
+        )
+        self.apply_async.assert_called_once_with(args=[relatorio.pk], queue='relatorios_pesados', priority=4)
+
+
+class ExportacaoStreamingServiceTest(TestCase):
+    """Exportação de linhas em pedaços e em ficheiro, com limite no PDF"""
+
+    COLUNAS = [('codigo', 'Código'), ('valor', 'Valor'), ('data', 'Data')]
+
+    @classmethod
+    def setUpTestData(cls):
+        for indice in range(3):
+            Empresa.objects.create(
+                nome=f'Farmácia Exportação {indice}', nif=f'500000005{indice + 2}', endereco='Rua 1',
+                bairro='Centro', cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000',
+                email=f'exportacao{indice}@exemplo.ao',
+            )
+
+    def _linhas(self, quantidade):
+        return ({'codigo': f'P{numero}', 'valor': Decimal('1.50'), 'data': date(2026, 1, 1)}
+                for numero in range(quantidade))
+
+    def _service(self, linhas, **limites):
+        service = ExportacaoStreamingService(linhas, self.COLUNAS, titulo='Linhas')
+        for nome, valor in limites.items():
+            setattr(service, nome, valor)
+        return service
+
+    def test_csv_em_pedacos(self):
+        # Dicts, sequências e instâncias seguem a ordem das colunas
+        instancia = mock.Mock(codigo='P3', valor=None, data=date(2026, 1, 2))
+        linhas = [*self._linhas(2), ('P2', Decimal('2'), date(2026, 1, 1)), instancia]
+
+        pedacos = list(self._service(linhas, LINHAS_POR_PEDACO=2).csv())
+
+        self.assertEqual(len(pedacos), 3)
+        self.assertEqual(''.join(pedacos).splitlines(), [
+            'Código,Valor,Data', 'P0,1.50,2026-01-01', 'P1,1.50,2026-01-01', 'P2,2,2026-01-01', 'P3,,2026-01-02',
+        ])
+
+    def test_ndjson_em_pedacos(self):
+        pedacos = list(self._service(self._linhas(3), LINHAS_POR_PEDACO=2).ndjson())
+
+        self.assertEqual(len(pedacos), 2)
+        registos = [json.loads(linha) for linha in ''.join(pedacos).splitlines()]
+        self.assertEqual(registos[0], {'codigo': 'P0', 'valor': '1.50', 'data': '2026-01-01'})
+        self.assertEqual(len(registos), 3)
+
+    def test_queryset_lido_em_lotes(self):
+        empresas = Empresa.objects.filter(nome__startswith='Farmácia Exportação').order_by('nif').values('nif', 'nome')
+        service = ExportacaoStreamingService(empresas, [('nif', 'NIF'), ('nome', 'Nome')])
+
+        self.assertEqual(service.total_linhas(), 3)
+        self.assertEqual(list(service.valores())[0], ['5000000052', 'Farmácia Exportação 0'])
+
+    def test_xlsx_abre_folha_nova_no_limite(self):
+        destino = io.BytesIO()
+
+        self._service(self._linhas(5), MAX_LINHAS_FOLHA=3).escrever('excel', destino)
+
+        with zipfile.ZipFile(destino) as xlsx:
+            folhas = [nome for nome in xlsx.namelist() if nome.startswith('xl/worksheets/sheet')]
+        # Cabeçalho + 2 linhas por folha
+        self.assertEqual(len(folhas), 3)
+
+    def test_pdf_dentro_do_limite(self):
+        destino = io.BytesIO()
+
+        self._service(list(self._linhas(5)), LINHAS_POR_PAGINA_PDF=2).escrever('pdf', destino)
+
+        self.assertTrue(destino.getvalue().startswith(b'%PDF'))
+
+    def test_pdf_acima_do_limite_e_recusado(self):
+        # Total conhecido: recusado antes de gerar
+        with self.assertRaisesMessage(LimiteExportacaoExcedido, 'A exportação tem 3 linhas'):
+            self._service(list(self._linhas(3)), MAX_LINHAS_PDF=2).escrever('pdf', io.BytesIO())
+
+        # Gerador: recusado ao ultrapassar o limite, nunca truncado
+        with self.assertRaisesMessage(LimiteExportacaoExcedido, 'mais de 2 linhas'):
+            self._service(self._linhas(3), MAX_LINHAS_PDF=2).escrever('pdf', io.BytesIO())
+
+    def test_resposta_por_formato(self):
+        resposta = self._service(self._linhas(1)).resposta('csv', 'vendas')
+        self.assertEqual(resposta['Content-Disposition'], 'attachment; filename="vendas.csv"')
+        self.assertTrue(resposta.streaming)
+
+        with self.assertRaises(ValueError):
+            self._service(self._linhas(1)).resposta('xml', 'vendas')
+
+
+class PrevisaoDemandaServiceTest(TestCase):
+    """Previsão vetorizada a partir dos modelos gravados"""
+
+    # Faturamento por dia da semana (segunda a domingo)
+    PADRAO = [10, 10, 10, 10, 10, 20, 30]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            nome='Farmácia Previsão', nif='5000000055', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email='previsao@exemplo.ao',
+        )
+        cls.lojas = [
+            Loja.objects.create(
+                empresa=cls.empresa, nome=f'Loja {indice}', codigo=f'L{indice}', endereco='Rua 1', bairro='Centro',
+                cidade='Luanda', postal='0000', provincia='Luanda',
+            )
+            for indice in range(2)
+        ]
+        cls.forma_pagamento = FormaPagamento.objects.create(empresa=cls.empresa, nome='Dinheiro')
+        cls.fim = timezone.localdate() - timedelta(days=1)
+        cls.numero_venda = 0
+        for desvio in range(21):
+            dia = cls.fim - timedelta(days=desvio)
+            cls._venda(cls.lojas[0], dia, cls.PADRAO[dia.weekday()])
+
+    @classmethod
+    def _venda(cls, loja, dia, total):
+        cls.numero_venda += 1
+        venda = Venda.objects.create(
+            empresa=cls.empresa, loja=loja, forma_pagamento=cls.forma_pagamento,
+            numero_documento=f'FR PREV/{cls.numero_venda}', subtotal=Decimal(total), total=Decimal(total),
+        )
+        # data_venda é auto_now_add
+        Venda.objects.filter(pk=venda.pk).update(data_venda=timezone.make_aware(datetime.combine(dia, time(12))))
+
+    def _esperado(self, inicio, dias):
+        return [self.PADRAO[(inicio + timedelta(days=d)).weekday()] for d in range(dias)]
+
+    def test_ajustar_matriz_recupera_a_sazonalidade_semanal(self):
+        segunda = date(2026, 1, 5)
+        Y = np.tile(self.PADRAO, (2, 4))
+
+        estado = PrevisaoDemandaService.ajustar_matriz(Y, segunda)
+
+        np.testing.assert_allclose(estado['sazonalidade'][0], np.array(self.PADRAO) - 100 / 7, atol=1e-9)
+        np.testing.assert_allclose(estado['erro_medio'], 0, atol=1e-9)
+        previsao = PrevisaoDemandaService.prever_matriz(estado, date(2026, 2, 1), date(2026, 2, 2), 7)
+        np.testing.assert_allclose(previsao, [self.PADRAO] * 2, atol=1e-9)
+
+        with self.assertRaises(ValueError):
+            PrevisaoDemandaService.ajustar_matriz(Y[:, :PrevisaoDemandaService.MIN_DIAS - 1], segunda)
+
+    def test_previsoes_lidas_dos_modelos_gravados(self):
+        service = PrevisaoDemandaService(self.empresa)
+        self.assertEqual(service.ajustar('loja', self.fim), 1)
+
+        with self.assertNumQueries(1):
+            previsao = service.previsoes('loja', dias=7)
+
+        self.assertEqual(list(previsao.index), [self.lojas[0].pk])
+        self.assertEqual(previsao.columns[0], self.fim + timedelta(days=1))
+        np.testing.assert_allclose(previsao.iloc[0], self._esperado(self.fim + timedelta(days=1), 7), atol=1e-6)
+
+    def test_atualizar_avanca_os_modelos_e_ajusta_series_novas(self):
+        service = PrevisaoDemandaService(self.empresa)
+        service.ajustar('loja', self.fim)
+        amanha = self.fim + timedelta(days=1)
+        self._venda(self.lojas[0], amanha, self.PADRAO[amanha.weekday()])
+        self._venda(self.lojas[1], amanha, 50)
+
+        self.assertEqual(service.atualizar('loja', amanha), 2)
+
+        modelos = {
+            modelo.loja_id: modelo for modelo in ModeloPrevisaoDemanda.objects.filter(empresa=self.empresa)
+        }
+        self.assertEqual((modelos[self.lojas[0].pk].ultimo_dia, modelos[self.lojas[0].pk].observacoes), (amanha, 22))
+        self.assertEqual(modelos[self.lojas[1].pk].observacoes, 22)
+        previsao = service.previsoes('loja', dias=7, chaves=[self.lojas[0].pk])
+        np.testing.assert_allclose(previsao.iloc[0], self._esperado(amanha + timedelta(days=1), 7), atol=1e-6)
 
-# Create your tests here.
+        # Sem dias novos não há nada a atualizar
+        self.assertEqual(service.atualizar('loja', amanha), 0)
@@ -156,6 +156,7 @@ urlpatterns = [
     path('<int:pk>/csv/', views.ExportarCSVView.as_view(), name='exportar_csv'),
     path('<int:pk>/xml/', views.ExportarXMLView.as_view(), name='exportar_xml'),
     path('<int:pk>/json/', views.ExportarJSONView.as_view(), name='exportar_json'),
+    path('<int:pk>/linhas/<str:formato>/', views.ExportarLinhasRelatorioView.as_view(), name='exportar_linhas'),
     
 
 
@@ -172,6 +173,7 @@ urlpatterns = [
     # AJAX E UTILITÁRIOS
     # =====================================
     path('ajax/gerar/', views.GerarRelatorioAjaxView.as_view(), name='gerar_ajax'),
+    path('ajax/estado/<int:pk>/', views.EstadoRelatorioView.as_view(), name='estado_ajax'),
     path('ajax/preview/', views.PreviewRelatorioView.as_view(), name='preview'),
     path('ajax/validar-campos/', views.ValidarCamposView.as_view(), name='validar_campos'),
     path('ajax/buscar-dados/', views.BuscarDadosView.as_view(), name='buscar_dados'),
@@ -8,7 +8,7 @@ from typing import Dict, List, Any, Optional
 from django.db.models import Q, Sum, Count, Avg, Max, Min, F
 from django.utils import timezone
 from django.conf import settings
-from django.core.files.base import ContentFile
+from django.core.files.base import File
 from django.template.loader import render_to_string
 from django.http import HttpResponse
 import pandas as pd
@@ -16,23 +16,24 @@ import openpyxl
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+from reportlab.platypus import SimpleDocTemplate, LongTable, TableStyle, Paragraph
 from reportlab.lib.styles import getSampleStyleSheet
 import csv
 import io
+import tempfile
+import xlsxwriter
 
 from .models import (
     RelatorioGerado, MetricaKPI, AnaliseVendas, AnaliseEstoque, 
-    AnaliseClientes, AlertaGerencial
+    AnaliseClientes, AlertaGerencial, ModeloSegmentacaoClientes
 )
+from .services import ExportacaoStreamingService, SegmentacaoClientesService
 from apps.vendas.models import Venda, ItemVenda
 from apps.produtos.models import Produto
 from apps.clientes.models import Cliente
 from apps.funcionarios.models import Funcionario
 from statsmodels.tsa.api import Holt
 from statsmodels.tsa.seasonal import seasonal_decompose
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
 from django.db.models.functions import TruncMonth
 
 
@@ -368,12 +369,15 @@ def calcular_segmentacao_rfm_clientes(empresa, data_inicio: date, data_fim: date
         return {}
 
 
-def gerar_relatorio_pdf(dados: Dict[str, Any], titulo: str, template_name: str = None) -> bytes:
+def gerar_relatorio_pdf(dados: Dict[str, Any], titulo: str, template_name: str = None, destino=None) -> bytes:
     """
-    Gerar relatório em formato PDF
+    Gerar relatório em formato PDF.
+
+    Com `destino` (caminho ou ficheiro binário) o PDF é escrito lá e os
+    erros propagam-se; sem destino devolve os bytes.
     """
     try:
-        buffer = io.BytesIO()
+        buffer = destino if destino is not None else io.BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=A4)
         story = []
         
@@ -404,12 +408,12 @@ def gerar_relatorio_pdf(dados: Dict[str, Any], titulo: str, template_name: str =
                     headers = list(tabela_dados[0].keys())
                     table_data = [headers]
                     
-                    # Dados
-                    for row in tabela_dados[:20]:  # Limitar a 20 linhas
+                    # Dados (tabela completa: a geração corre na fila de relatórios, fora do pedido HTTP)
+                    for row in tabela_dados:
                         table_data.append([str(row.get(header, '')) for header in headers])
                     
-                    # Criar tabela
-                    table = Table(table_data)
+                    # Criar tabela; LongTable divide por páginas e repete o cabeçalho
+                    table = LongTable(table_data, repeatRows=1)
                     table.setStyle(TableStyle([
                         ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
                         ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
@@ -426,96 +430,154 @@ def gerar_relatorio_pdf(dados: Dict[str, Any], titulo: str, template_name: str =
         
         # Construir PDF
         doc.build(story)
-        buffer.seek(0)
-        return buffer.getvalue()
+        return b'' if destino is not None else buffer.getvalue()
         
     except Exception as e:
         logger.error(f'Erro ao gerar PDF: {e}')
+        if destino is not None:
+            raise
         return b''
 
 
-def gerar_relatorio_excel(dados: Dict[str, Any], titulo: str) -> bytes:
+def gerar_relatorio_excel(dados: Dict[str, Any], titulo: str, destino=None) -> bytes:
     """
-    Gerar relatório em formato Excel
+    Gerar relatório em formato Excel.
+
+    Escrito com XlsxWriter em constant_memory, linha a linha. Com `destino`
+    (caminho ou ficheiro binário) o conteúdo é escrito lá e os erros
+    propagam-se; sem destino devolve os bytes.
     """
     try:
-        buffer = io.BytesIO()
-        
-        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-            # Resumo
-            if 'resumo' in dados:
-                resumo_df = pd.DataFrame(list(dados['resumo'].items()), 
-                                       columns=['Métrica', 'Valor'])
-                resumo_df.to_excel(writer, sheet_name='Resumo', index=False)
-            
-            # Tabelas de dados
-            if 'tabelas' in dados:
-                for nome, tabela_dados in dados['tabelas'].items():
-                    if tabela_dados:
-                        df = pd.DataFrame(tabela_dados)
-                        # Limitar nome da aba (Excel tem limite de 31 caracteres)
-                        sheet_name = nome[:31]
-                        df.to_excel(writer, sheet_name=sheet_name, index=False)
-            
-            # Dados detalhados
-            if 'dados_detalhados' in dados and isinstance(dados['dados_detalhados'], list):
-                df_detalhes = pd.DataFrame(dados['dados_detalhados'])
-                df_detalhes.to_excel(writer, sheet_name='Dados Detalhados', index=False)
+        buffer = destino if destino is not None else io.BytesIO()
+        workbook = xlsxwriter.Workbook(buffer, {'constant_memory': True, 'remove_timezone': True})
         
-        buffer.seek(0)
-        return buffer.getvalue()
+        # Resumo
+        if 'resumo' in dados:
+            ExportacaoStreamingService(
+                dados['resumo'].items(), ['Métrica', 'Valor']
+            ).escrever_folhas(workbook, 'Resumo')
+        
+        # Tabelas de dados
+        for nome, tabela_dados in (dados.get('tabelas') or {}).items():
+            if tabela_dados:
+                ExportacaoStreamingService(tabela_dados, list(tabela_dados[0].keys())).escrever_folhas(workbook, nome)
+        
+        # Dados detalhados
+        if isinstance(dados.get('dados_detalhados'), list) and dados['dados_detalhados']:
+            detalhes = dados['dados_detalhados']
+            ExportacaoStreamingService(detalhes, list(detalhes[0].keys())).escrever_folhas(workbook, 'Dados Detalhados')
+        
+        workbook.close()
+        return b'' if destino is not None else buffer.getvalue()
         
     except Exception as e:
         logger.error(f'Erro ao gerar Excel: {e}')
+        if destino is not None:
+            raise
         return b''
 
 
-def gerar_relatorio_csv(dados: Dict[str, Any], titulo: str) -> str:
+def gerar_relatorio_csv(dados: Dict[str, Any], titulo: str, destino=None) -> str:
     """
-    Gerar relatório em formato CSV
+    Gerar relatório em formato CSV.
+
+    Com `destino` (ficheiro binário) as linhas são escritas em pedaços
+    UTF-8 e os erros propagam-se; sem destino devolve o texto.
     """
     try:
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Título
-        writer.writerow([titulo])
-        writer.writerow([])  # Linha vazia
-        
-        # Resumo
-        if 'resumo' in dados:
-            writer.writerow(['RESUMO'])
-            for key, value in dados['resumo'].items():
-                writer.writerow([key, value])
-            writer.writerow([])  # Linha vazia
-        
-        # Dados principais
-        if 'dados_principais' in dados and isinstance(dados['dados_principais'], list):
-            if dados['dados_principais']:
-                # Cabeçalhos
-                headers = list(dados['dados_principais'][0].keys())
-                writer.writerow(headers)
-                
-                # Dados
-                for row in dados['dados_principais']:
-                    writer.writerow([row.get(header, '') for header in headers])
-        
-        return output.getvalue()
+        if destino is None:
+            return ''.join(_pedacos_csv_relatorio(dados, titulo))
+        for pedaco in _pedacos_csv_relatorio(dados, titulo):
+            destino.write(pedaco.encode('utf-8'))
+        return ''
         
     except Exception as e:
         logger.error(f'Erro ao gerar CSV: {e}')
+        if destino is not None:
+            raise
         return ''
 
 
+def _pedacos_csv_relatorio(dados: Dict[str, Any], titulo: str):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    
+    # Título
+    writer.writerow([titulo])
+    writer.writerow([])  # Linha vazia
+    
+    # Resumo
+    if 'resumo' in dados:
+        writer.writerow(['RESUMO'])
+        for key, value in dados['resumo'].items():
+            writer.writerow([key, value])
+        writer.writerow([])  # Linha vazia
+    yield output.getvalue()
+    
+    # Dados principais e tabelas, cada uma em pedaços
+    tabelas = dict(dados.get('tabelas') or {})
+    if isinstance(dados.get('dados_principais'), list):
+        tabelas = {None: dados['dados_principais'], **tabelas}
+    for nome, linhas in tabelas.items():
+        if not linhas:
+            continue
+        if nome is not None:
+            yield f'{nome.upper()}\r\n'
+        pedacos = ExportacaoStreamingService(linhas, list(linhas[0].keys())).csv()
+        yield from pedacos
+        yield '\r\n'
+
+
+def linhas_relatorio(relatorio: RelatorioGerado):
+    """
+    Linhas detalhadas por detrás de um relatório gerado, como (colunas,
+    queryset), para exportação em streaming. None se o tipo de relatório
+    não tiver detalhe por linha.
+    """
+    codigo = relatorio.tipo_relatorio.codigo
+    lojas = list(relatorio.lojas.values_list('pk', flat=True))
+    
+    vendas = Venda.objects.filter(empresa=relatorio.empresa, status='finalizada')
+    if relatorio.data_inicio:
+        vendas = vendas.filter(data_venda__date__gte=relatorio.data_inicio)
+    if relatorio.data_fim:
+        vendas = vendas.filter(data_venda__date__lte=relatorio.data_fim)
+    if lojas:
+        vendas = vendas.filter(loja__in=lojas)
+    
+    if codigo in ('VENDAS_GERAL', 'VENDAS_MENSAL'):
+        colunas = [
+            ('numero_documento', 'Documento'), ('data_venda', 'Data'), ('loja__nome', 'Loja'),
+            ('cliente__nome_completo', 'Cliente'), ('subtotal', 'Subtotal'),
+            ('desconto_valor', 'Desconto'), ('iva_valor', 'IVA'), ('total', 'Total'),
+        ]
+        linhas = vendas.order_by('data_venda', 'pk')
+    elif codigo == 'ANALISE_ABC':
+        colunas = [
+            ('venda__numero_documento', 'Documento'), ('venda__data_venda', 'Data'),
+            ('produto__codigo_interno', 'Código'), ('nome_produto', 'Produto'),
+            ('quantidade', 'Quantidade'), ('preco_unitario', 'Preço Unitário'), ('total', 'Total'),
+        ]
+        linhas = ItemVenda.objects.filter(venda__in=vendas).order_by('venda__data_venda', 'venda_id', 'pk')
+    else:
+        return None
+    
+    return colunas, linhas.values(*[campo for campo, _ in colunas])
+
+
 def processar_relatorio_assincrono(relatorio_id: int):
     """
     Processar relatório de forma assíncrona
     """
     try:
-        relatorio = RelatorioGerado.objects.get(id=relatorio_id)
-        relatorio.status = 'processando'
-        relatorio.data_inicio_processamento = timezone.now()
-        relatorio.save()
+        # Só o primeiro worker a apanhar o pedido o processa (entregas repetidas são ignoradas)
+        if not RelatorioGerado.objects.filter(id=relatorio_id, status__in=['pendente', 'processando']).update(
+            status='processando', progresso=5, data_inicio_processamento=timezone.now()
+        ):
+            logger.info(f'Relatório {relatorio_id} já não está em curso; nada a processar')
+            return
+
+        relatorio = RelatorioGerado.objects.select_related('tipo_relatorio').get(id=relatorio_id)
         
         # Determinar tipo de processamento baseado no tipo de relatório
         tipo_codigo = relatorio.tipo_relatorio.codigo
@@ -531,36 +593,36 @@ def processar_relatorio_assincrono(relatorio_id: int):
             dados = processar_relatorio_generico(relatorio)
         
         if dados:
-            # Gerar arquivo no formato solicitado
-            if relatorio.formato == 'pdf':
-                conteudo = gerar_relatorio_pdf(dados, relatorio.tipo_relatorio.nome)
-                nome_arquivo = f'{relatorio.codigo_relatorio}.pdf'
-            elif relatorio.formato == 'excel':
-                conteudo = gerar_relatorio_excel(dados, relatorio.tipo_relatorio.nome)
-                nome_arquivo = f'{relatorio.codigo_relatorio}.xlsx'
-            elif relatorio.formato == 'csv':
-                conteudo = gerar_relatorio_csv(dados, relatorio.tipo_relatorio.nome)
-                nome_arquivo = f'{relatorio.codigo_relatorio}.csv'
-            elif relatorio.formato == 'json':
-                conteudo = json.dumps(dados, indent=2, ensure_ascii=False, default=str).encode('utf-8')
-                nome_arquivo = f'{relatorio.codigo_relatorio}.json'
-            else:
+            _atualizar_progresso(relatorio_id, 60)
+
+            # Gerar arquivo no formato solicitado, directamente num ficheiro temporário
+            extensoes = {'pdf': 'pdf', 'excel': 'xlsx', 'csv': 'csv', 'json': 'json'}
+            if relatorio.formato not in extensoes:
                 raise ValueError(f'Formato não suportado: {relatorio.formato}')
+            nome_arquivo = f'{relatorio.codigo_relatorio}.{extensoes[relatorio.formato]}'
             
-            # Salvar arquivo
-            if isinstance(conteudo, str):
-                conteudo = conteudo.encode('utf-8')
-            
-            relatorio.arquivo_resultado.save(
-                nome_arquivo,
-                ContentFile(conteudo),
-                save=False
-            )
+            with tempfile.TemporaryFile() as temporario:
+                if relatorio.formato == 'pdf':
+                    gerar_relatorio_pdf(dados, relatorio.tipo_relatorio.nome, destino=temporario)
+                elif relatorio.formato == 'excel':
+                    gerar_relatorio_excel(dados, relatorio.tipo_relatorio.nome, destino=temporario)
+                elif relatorio.formato == 'csv':
+                    gerar_relatorio_csv(dados, relatorio.tipo_relatorio.nome, destino=temporario)
+                else:
+                    texto = io.TextIOWrapper(temporario, encoding='utf-8')
+                    json.dump(dados, texto, indent=2, ensure_ascii=False, default=str)
+                    texto.detach()
+                _atualizar_progresso(relatorio_id, 90)
+                
+                # Salvar arquivo
+                temporario.seek(0)
+                relatorio.arquivo_resultado.save(nome_arquivo, File(temporario), save=False)
             
             # Salvar dados do resultado
             relatorio.dados_resultado = dados
             relatorio.total_registros = dados.get('total_registros', 0)
             relatorio.status = 'concluido'
+            relatorio.progresso = 100
         else:
             relatorio.status = 'erro'
             relatorio.mensagem_erro = 'Erro ao processar dados do relatório'
@@ -586,6 +648,11 @@ def processar_relatorio_assincrono(relatorio_id: int):
             pass
 
 
+def _atualizar_progresso(relatorio_id: int, progresso: int):
+    """Atualiza só o progresso, para o polling do estado do pedido"""
+    RelatorioGerado.objects.filter(id=relatorio_id).update(progresso=progresso)
+
+
 def processar_relatorio_vendas(relatorio: RelatorioGerado) -> Dict[str, Any]:
     """
     Processar relatório específico de vendas
@@ -1131,49 +1198,28 @@ def gerar_cubo_olap(empresa, data_inicio: date, data_fim: date, dimensoes: List[
         return {}
 
 
-def executar_data_mining(empresa, data_inicio: date, data_fim: date, n_clusters: int = 4) -> Dict[str, Any]:
+def executar_data_mining(empresa, data_inicio: date = None, data_fim: date = None, n_clusters: int = 4) -> Dict[str, Any]:
     """
-    Executar data mining para segmentação de clientes usando K-Means.
+    Segmentação de clientes (SegmentacaoClientesService). Devolve o resumo
+    por segmento do modelo gravado, ajustando-o se ainda não existir ou se
+    o número de segmentos for outro. As features cobrem todo o histórico
+    do cliente, pelo que data_inicio/data_fim já não se aplicam; os
+    clientes de cada segmento consultam-se em SegmentoCliente (paginados).
     """
     try:
-        dados_clientes = Cliente.objects.filter(
-            empresa=empresa,
-            venda__data_venda__range=(data_inicio, data_fim)
-        ).annotate(
-            faturamento_total=Sum('venda__total'),
-            frequencia=Count('venda__id'),
-            ticket_medio=Avg('venda__total')
-        ).values('id', 'nome', 'faturamento_total', 'frequencia', 'ticket_medio')
+        modelo = ModeloSegmentacaoClientes.objects.filter(empresa=empresa).defer('parametros').first()
+        if modelo is None or modelo.n_clusters != n_clusters:
+            SegmentacaoClientesService(empresa, n_clusters).ajustar()
+            modelo = ModeloSegmentacaoClientes.objects.filter(empresa=empresa).defer('parametros').first()
 
-        if len(dados_clientes) < n_clusters:
+        if modelo is None:
             return {'erro': 'Dados insuficientes para clusterização.'}
 
-        df = pd.DataFrame(list(dados_clientes)).dropna()
-        
-        # Preparar dados para o modelo
-        features = df[['faturamento_total', 'frequencia', 'ticket_medio']]
-        scaler = StandardScaler()
-        features_scaled = scaler.fit_transform(features)
-        
-        # Treinar modelo K-Means
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        df['segmento'] = kmeans.fit_predict(features_scaled)
-        
-        # Agrupar resultados
-        segmentos = {}
-        for i in range(n_clusters):
-            cluster_data = df[df['segmento'] == i]
-            segmentos[f'Segmento {i+1}'] = {
-                'total_clientes': len(cluster_data),
-                'faturamento_medio': cluster_data['faturamento_total'].mean(),
-                'frequencia_media': cluster_data['frequencia'].mean(),
-                'clientes': cluster_data.to_dict('records')
-            }
-            
         return {
-            'total_clientes_analisados': len(df),
-            'numero_segmentos': n_clusters,
-            'segmentos': segmentos
+            'total_clientes_analisados': modelo.total_clientes,
+            'numero_segmentos': modelo.n_clusters,
+            'atualizado_em': modelo.atualizado_em,
+            'segmentos': {segmento['nome']: segmento for segmento in modelo.resumo},
         }
 
     except Exception as e:
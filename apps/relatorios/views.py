@@ -8,11 +8,13 @@ from django.http import JsonResponse, HttpResponse, Http404, HttpResponseForbidd
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.contrib import messages
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.db import transaction, connection
 from django.db.models import Q, Sum, Count, F, Avg, Max, Min, Case, When, Value, Variance, StdDev
 from django.db.models.functions import TruncDate, TruncHour, TruncMonth, TruncYear, TruncWeek, Cast
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.core.exceptions import ValidationError
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.models import User, Group, Permission
 from django.core.mail import send_mail, EmailMessage
@@ -23,12 +25,12 @@ from datetime import datetime, timedelta, date, time
 from decimal import Decimal
 import json
 import logging
-import csv
 import io
 import os
 import subprocess
 import calendar
 import statistics
+from collections import Counter
 import pandas as pd
 import numpy as np
 from django.core.paginator import Paginator
@@ -49,11 +51,8 @@ import xml.etree.ElementTree as ET
 from django.core.serializers import serialize
 import xlsxwriter
 from celery import shared_task
-import csv
 import json
 import io
-from openpyxl import Workbook
-from weasyprint import HTML
 from django.db.models import Sum, Count, Avg, F
 from django.db.models.functions import ExtractHour
 from django.contrib import messages
@@ -69,11 +68,9 @@ from django.db.models import Sum, Count, Avg, F
 from django.db.models.functions import ExtractHour
 
 from apps.analytics import models
-from apps.compras.models import Compra, ItemCompra
+from apps.compras.models import Compra
 from apps.vendas.api.serializers import VendaSerializer
 import pandas as pd
-from sklearn.cluster import KMeans
-from statsmodels.tsa.api import SimpleExpSmoothing
 from django.http import JsonResponse
 from django.views.generic import TemplateView, View
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -84,7 +81,8 @@ from rest_framework.permissions import IsAuthenticated
 from .models import (
     LogAtividade, TipoRelatorio, RelatorioGerado, MetricaKPI, DashboardConfig,
     AnaliseVendas, AnaliseEstoque, AnaliseClientes, AlertaGerencial,
-    TemplateRelatorio, Relatorio, AgendamentoRelatorio, LogRelatorio
+    TemplateRelatorio, Relatorio, AgendamentoRelatorio, LogRelatorio,
+    ModeloSegmentacaoClientes, SegmentoCliente
 )
 from .forms import (
     TipoRelatorioForm, RelatorioGeradoForm, MetricaKPIForm,
@@ -98,27 +96,33 @@ from .utils import (
     calcular_segmentacao_rfm_clientes, gerar_relatorio_pdf,
     gerar_relatorio_excel, gerar_relatorio_csv, processar_relatorio_assincrono,
     calcular_previsao_vendas, analisar_sazonalidade, calcular_tendencias,
-    gerar_cubo_olap, executar_data_mining, calcular_correlacoes
+    gerar_cubo_olap, executar_data_mining, calcular_correlacoes, linhas_relatorio
 )
 from .tasks import processar_relatorio_task, enviar_relatorio_email_task
+from .services import FilaRelatoriosService, ExportacaoStreamingService, LimiteExportacaoExcedido, PrevisaoDemandaService
 from apps.core.mixins import BaseViewMixin
+from apps.core.models import Loja
+from apps.core.services import PlaneadorKPIService
 from apps.vendas.models import Venda, ItemVenda, Orcamento
-from apps.produtos.models import ControleVencimento, Produto, Categoria
+from apps.produtos.models import Lote, Produto, Categoria, RiscoValidadeLote
+from apps.produtos.services import RiscoValidadeService
 from apps.clientes.models import Cliente, GrupoCliente
 from apps.funcionarios.models import (
-    AvaliacaoDesempenho, Capacitacao, Cargo, Departamento, FolhaPagamento, Funcionario, RegistroPonto, Ferias,
+    AvaliacaoDesempenho, Capacitacao, Cargo, Departamento, FolhaPagamento, Funcionario, ResumoPontoDiario, Ferias,
     Capacitacao, AvaliacaoDesempenho, Departamento
 )
 from apps.fornecedores.models import (
     Fornecedor, AvaliacaoFornecedor
 )
+from apps.fornecedores.services import ScorecardFornecedorService
 from apps.financeiro.models import (
-    ContaReceber, ContaPagar, LancamentoFinanceiro, MovimentacaoFinanceira, CentroCusto,
+    ContaReceber, ContaPagar, MovimentacaoFinanceira, CentroCusto,
     PlanoContas
 )
+from apps.financeiro.services import SaldoContabilService
 from apps.estoque.models import MovimentacaoEstoque, Inventario, AlertaEstoque
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Sum, Count, F, Q, Case, When, Value, DecimalField
+from django.db.models import Sum, Count, F, Q, Case, When, Value
 from django.db.models.functions import TruncMonth, TruncDay
 from django.views.generic import TemplateView
 from datetime import datetime, date, timedelta
@@ -186,21 +190,15 @@ class RelatoriosDashboardView(BaseViewMixin, TemplateView):
             solicitante=usuario
         ).select_related('tipo_relatorio').order_by('-data_solicitacao')[:5]
         
-        # Estatísticas gerais
+        # Estatísticas gerais e KPIs em destaque: uma consulta por tabela
+        # (apps/relatorios/kpis.py)
         hoje = timezone.now().date()
+        kpis = PlaneadorKPIService(empresa).executar('relatorios', hoje=hoje)
         stats = {
-            'total_relatorios': RelatorioGerado.objects.filter(empresa=empresa).count(),
-            'relatorios_hoje': RelatorioGerado.objects.filter(
-                empresa=empresa,
-                data_solicitacao__date=hoje
-            ).count(),
-            'templates_ativos': TipoRelatorio.objects.filter(ativo=True).count(),
-            'agendamentos_ativos': AgendamentoRelatorio.objects.filter(ativo=True).count(),
-            'templates_ativos': TemplateRelatorio.objects.filter(ativo=True).count(),
-            'relatorios_erro': RelatorioGerado.objects.filter(
-                empresa=empresa,
-                status='erro'
-            ).count()
+            nome: kpis[nome] for nome in (
+                'total_relatorios', 'relatorios_hoje', 'templates_ativos',
+                'agendamentos_ativos', 'relatorios_erro',
+            )
         }
         
         # Relatórios por categoria (últimos 30 dias)
@@ -214,7 +212,7 @@ class RelatoriosDashboardView(BaseViewMixin, TemplateView):
         ).order_by('-total')
         
         # KPIs em destaque (métricas importantes)
-        kpis_destaque = self._obter_kpis_destaque(empresa)
+        kpis_destaque = self._obter_kpis_destaque(kpis)
         
         # Alertas ativos
         alertas_ativos = AlertaGerencial.objects.filter(
@@ -237,11 +235,7 @@ class RelatoriosDashboardView(BaseViewMixin, TemplateView):
         ).order_by('-timestamp')[:10]
         
         # Tempo médio de geração de relatórios
-        tempo_medio_geracao = RelatorioGerado.objects.filter(
-            empresa=empresa,
-            status='concluido',
-            tempo_processamento__isnull=False
-        ).aggregate(Avg('tempo_processamento'))['tempo_processamento__avg']
+        tempo_medio_geracao = kpis['tempo_medio_geracao']
         
         # Formatos mais utilizados
         formatos_populares = RelatorioGerado.objects.filter(
@@ -266,55 +260,13 @@ class RelatoriosDashboardView(BaseViewMixin, TemplateView):
         
         return context
     
-    def _obter_kpis_destaque(self, empresa):
-        hoje = timezone.now().date()
-        
-        # Vendas hoje
-        vendas_hoje = Venda.objects.filter(
-            empresa=empresa,
-            data_venda__date=hoje,
-            status='finalizada'
-        ).aggregate(
-            total=Sum('total'),
-            quantidade=Count('id')
-        )
-        
-        # Produtos em estoque baixo
-        produtos_estoque_baixo = Produto.objects.filter(
-            empresa=empresa,
-            ativo=True,
-            estoque_atual__lte=F('estoque_minimo')
-        ).count()
-        
-        # Contas vencidas (somando valor_saldo)
-        # Contas vencidas: total e quantidade
-        contas_vencidas_qs = ContaReceber.objects.filter(
-            empresa=empresa,
-            status__in=['aberta', 'vencida'],
-            data_vencimento__lt=hoje
-        )
-        contas_vencidas_total = contas_vencidas_qs.aggregate(Sum('valor_saldo'))['valor_saldo__sum'] or 0
-        contas_vencidas_qtd = contas_vencidas_qs.count()
-
-
-        contas_vencidas = contas_vencidas_qs.aggregate(
-            total=Sum('valor_saldo'),
-            quantidade=Count('id')
-        )
-        
-        # Novos clientes este mês
-        novos_clientes = Cliente.objects.filter(
-            empresa=empresa,
-            created_at__month=hoje.month,
-            created_at__year=hoje.year
-        ).count()
-        
+    def _obter_kpis_destaque(self, kpis):
         return {
-            'vendas_hoje': vendas_hoje,
-            'produtos_estoque_baixo': produtos_estoque_baixo,
-            'contas_vencidas_total': contas_vencidas_total,
-            'contas_vencidas_qtd': contas_vencidas_qtd,
-            'novos_clientes': novos_clientes
+            'vendas_hoje': {'total': kpis['vendas_hoje_total'], 'quantidade': kpis['vendas_hoje_quantidade']},
+            'produtos_estoque_baixo': kpis['produtos_estoque_baixo'],
+            'contas_vencidas_total': kpis['contas_vencidas_total'],
+            'contas_vencidas_qtd': kpis['contas_vencidas_qtd'],
+            'novos_clientes': kpis['novos_clientes']
         }
 
     
@@ -3165,35 +3117,36 @@ class RelatorioVencimentosView(BaseViewMixin, TemplateView):
         hoje = timezone.now().date()
         data_limite = hoje + timedelta(days=dias_vencimento)
         
-        # Query base
-        controles_vencimento = ControleVencimento.objects.filter(
-            produto__empresa=empresa,
+        # Query base: lotes com saldo (quantidade atualizada pelas vendas FEFO), índice (empresa, data_validade)
+        lotes = Lote.objects.filter(
+            empresa=empresa,
+            quantidade_atual__gt=0,
             produto__ativo=True
-        ).select_related('produto')
+        ).select_related('produto', 'produto__categoria')
         
         if categoria_id:
-            controles_vencimento = controles_vencimento.filter(
+            lotes = lotes.filter(
                 produto__categoria_id=categoria_id
             )
         
         # Filtrar por situação
         if situacao == 'vencidos':
-            controles_vencimento = controles_vencimento.filter(data_vencimento__lt=hoje)
+            lotes = lotes.filter(data_validade__lt=hoje)
         elif situacao == 'vencendo':
-            controles_vencimento = controles_vencimento.filter(
-                data_vencimento__gte=hoje,
-                data_vencimento__lte=data_limite
+            lotes = lotes.filter(
+                data_validade__gte=hoje,
+                data_validade__lte=data_limite
             )
         elif situacao == 'validos':
-            controles_vencimento = controles_vencimento.filter(data_vencimento__gt=data_limite)
+            lotes = lotes.filter(data_validade__gt=data_limite)
         
-        controles_vencimento = controles_vencimento.order_by('data_vencimento')
+        lotes = lotes.order_by('data_validade')
         
         # Classificar e calcular informações
         produtos_vencimento = []
         
-        for controle in controles_vencimento:
-            dias_para_vencer = (controle.data_vencimento - hoje).days
+        for lote in lotes:
+            dias_para_vencer = (lote.data_validade - hoje).days
             
             # Determinar situação
             if dias_para_vencer < 0:
@@ -3218,10 +3171,10 @@ class RelatorioVencimentosView(BaseViewMixin, TemplateView):
                 prioridade = 5
             
             # Valor do lote
-            valor_lote = controle.quantidade * (controle.produto.preco_custo or 0)
+            valor_lote = lote.quantidade_atual * (lote.preco_custo_lote or lote.produto.preco_custo or 0)
             
             produtos_vencimento.append({
-                'controle': controle,
+                'lote': lote,
                 'dias_para_vencer': dias_para_vencer,
                 'situacao_item': situacao_item,
                 'cor_situacao': cor_situacao,
@@ -3246,17 +3199,17 @@ class RelatorioVencimentosView(BaseViewMixin, TemplateView):
         produtos_criticos = {}
         for item in produtos_vencimento:
             if item['prioridade'] <= 3:  # Vencidos ou vencendo em até 30 dias
-                produto_id = item['controle'].produto.id
+                produto_id = item['lote'].produto_id
                 if produto_id not in produtos_criticos:
                     produtos_criticos[produto_id] = {
-                        'produto': item['controle'].produto,
+                        'produto': item['lote'].produto,
                         'lotes_criticos': 0,
                         'quantidade_critica': 0,
                         'valor_critico': 0
                     }
                 
                 produtos_criticos[produto_id]['lotes_criticos'] += 1
-                produtos_criticos[produto_id]['quantidade_critica'] += item['controle'].quantidade
+                produtos_criticos[produto_id]['quantidade_critica'] += item['lote'].quantidade_atual
                 produtos_criticos[produto_id]['valor_critico'] += item['valor_lote']
         
         produtos_criticos = sorted(
@@ -3268,7 +3221,7 @@ class RelatorioVencimentosView(BaseViewMixin, TemplateView):
         # Vencimentos por categoria
         vencimentos_categoria = {}
         for item in produtos_vencimento:
-            categoria = item['controle'].produto.categoria
+            categoria = item['lote'].produto.categoria
             categoria_nome = categoria.nome if categoria else 'Sem Categoria'
             
             if categoria_nome not in vencimentos_categoria:
@@ -3288,25 +3241,25 @@ class RelatorioVencimentosView(BaseViewMixin, TemplateView):
                 vencimentos_categoria[categoria_nome]['lotes_vencendo'] += 1
         
         # Evolução dos vencimentos (próximos 90 dias)
-        evolucao_vencimentos = []
-        for i in range(90):
-            data_check = hoje + timedelta(days=i)
-            lotes_dia = len([
-                p for p in produtos_vencimento 
-                if p['controle'].data_vencimento == data_check
-            ])
-            
-            if lotes_dia > 0:
-                evolucao_vencimentos.append({
-                    'data': data_check,
-                    'lotes': lotes_dia
-                })
+        lotes_por_dia = Counter(
+            p['lote'].data_validade for p in produtos_vencimento
+            if 0 <= p['dias_para_vencer'] < 90
+        )
+        evolucao_vencimentos = [
+            {'data': data_check, 'lotes': lotes_dia}
+            for data_check, lotes_dia in sorted(lotes_por_dia.items())
+        ]
         
         # Paginação
         paginator = Paginator(produtos_vencimento, 50)
         page_number = self.request.GET.get('page')
         page_obj = paginator.get_page(page_number)
         
+        # Risco de validade (previsão noturna): lotes por valor que ficará por vender
+        lotes_em_risco = RiscoValidadeLote.objects.filter(empresa=empresa).select_related('lote', 'produto')
+        if categoria_id:
+            lotes_em_risco = lotes_em_risco.filter(produto__categoria_id=categoria_id)
+        
         # Categorias para filtro
         categorias = Categoria.objects.filter(empresa=empresa, ativa=True).order_by('nome')
         
@@ -3316,6 +3269,8 @@ class RelatorioVencimentosView(BaseViewMixin, TemplateView):
             'produtos_criticos': produtos_criticos,
             'vencimentos_categoria': vencimentos_categoria,
             'evolucao_vencimentos': evolucao_vencimentos,
+            'lotes_em_risco': lotes_em_risco.order_by('-valor_em_risco')[:50],
+            'resumo_risco': RiscoValidadeService.resumo(empresa),
             'categorias': categorias,
             'filtros': {
                 'situacao': situacao,
@@ -5171,19 +5126,18 @@ class RelatorioDREView(BaseRelatorioView):
         context = super().get_context_data(**kwargs)
         data_inicio, data_fim = self.get_datas_filtro()
         
-        # Lógica para DRE (exemplo com um modelo 'LancamentoContabil')
-        # Esta é uma simplificação. Um DRE real depende de um plano de contas estruturado.
-        receita_bruta = LancamentoFinanceiro.objects.filter(
-            conta__natureza='receita', data__range=(data_inicio, data_fim)
-        ).aggregate(total=Sum('valor'))['total'] or 0
-
-        custos = LancamentoFinanceiro.objects.filter(
-            conta__natureza='custo', data__range=(data_inicio, data_fim)
-        ).aggregate(total=Sum('valor'))['total'] or 0
-
-        despesas = LancamentoFinanceiro.objects.filter(
-            conta__natureza='despesa', data__range=(data_inicio, data_fim)
-        ).aggregate(total=Sum('valor'))['total'] or 0
+        hoje = date.today()
+        data_inicio = data_inicio or hoje.replace(day=1)
+        data_fim = data_fim or hoje
+        
+        # Movimento por conta a partir dos fechos mensais + delta do período
+        service = SaldoContabilService(self.get_empresa())
+        contas = service.totais_por_tipo(service.movimento_periodo(data_inicio, data_fim))
+        
+        receita_bruta = sum((c['total'] for c in contas.get('receita', [])), Decimal('0.00'))
+        # O plano de contas não separa custos de despesas (tipo 'despesa')
+        custos = Decimal('0.00')
+        despesas = sum((c['total'] for c in contas.get('despesa', [])), Decimal('0.00'))
 
         lucro_bruto = receita_bruta - custos
         lucro_liquido = lucro_bruto - despesas
@@ -5210,10 +5164,11 @@ class RelatorioBalancoView(BaseRelatorioView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Lógica para Balanço Patrimonial (altamente dependente do plano de contas)
-        # Exemplo simplificado:
-        ativos = LancamentoFinanceiro.objects.filter(conta__grupo='ativo').aggregate(total=Sum('valor'))['total'] or 0
-        passivos = LancamentoFinanceiro.objects.filter(conta__grupo='passivo').aggregate(total=Sum('valor'))['total'] or 0
+        # Saldos até hoje a partir do último fecho mensal
+        service = SaldoContabilService(self.get_empresa())
+        contas = service.totais_por_tipo(service.saldos_ate(date.today() + timedelta(days=1)))
+        ativos = sum((c['total'] for c in contas.get('ativo', [])), Decimal('0.00'))
+        passivos = sum((c['total'] for c in contas.get('passivo', [])), Decimal('0.00'))
         patrimonio_liquido = ativos - passivos
 
         context['balanco_data'] = {
@@ -5425,11 +5380,21 @@ class RelatorioPontoView(BaseRelatorioView):
         context = super().get_context_data(**kwargs)
         data_inicio, data_fim = self.get_datas_filtro()
         
-        registos = RegistroPonto.objects.filter(
+        # Totais diários consolidados (ResumoPontoDiario) em vez das marcações brutas
+        resumos = ResumoPontoDiario.objects.filter(
+            funcionario__empresa=self.get_empresa(),
             data__range=(data_inicio, data_fim)
         ).select_related('funcionario').order_by('funcionario', 'data')
         
-        context['registos_ponto'] = registos
+        context['registos_ponto'] = resumos
+        context['totais_funcionario'] = resumos.order_by().values(
+            'funcionario_id', 'funcionario__nome_completo'
+        ).annotate(
+            dias=Count('id'),
+            minutos_trabalhados=Sum('minutos_trabalhados'),
+            minutos_extra=Sum('minutos_extra'),
+            minutos_atraso=Sum('minutos_atraso'),
+        ).order_by('funcionario__nome_completo')
         context['titulo'] = 'Relatório de Ponto'
         return context
 
@@ -5513,7 +5478,7 @@ class RelatorioPerformanceView(BaseRelatorioView):
         context['titulo'] = 'Avaliações de Performance'
         return context
 
-from django.db.models import Avg, StdDev, Min, Max, ExpressionWrapper, DurationField
+from django.db.models import Avg, StdDev, Min, Max
 from django.utils import timezone
 
 
@@ -5560,6 +5525,7 @@ class RelatorioComprasView(BaseRelatorioView):
 class RelatorioPerformanceFornecedorView(BaseRelatorioView):
     """
     Análise da performance geral dos fornecedores, combinando múltiplos indicadores.
+    Lê os scorecards mensais materializados (ScorecardFornecedor).
     """
     def get_empresa(self):
         return getattr(self.request.user, "empresa", None)
@@ -5570,35 +5536,12 @@ class RelatorioPerformanceFornecedorView(BaseRelatorioView):
         context = super().get_context_data(**kwargs)
         data_inicio, data_fim = self.get_datas_filtro()
 
-        # Calcula o tempo de entrega médio
-        delivery_times = Compra.objects.filter(
-            data_pedido__range=(data_inicio, data_fim),
-            data_entrega_real__isnull=False
-        ).annotate(
-            tempo_entrega=ExpressionWrapper(F('data_entrega_real') - F('data_pedido'), output_field=DurationField())
-        ).values('fornecedor__nome').annotate(
-            tempo_medio=Avg('tempo_entrega')
-        )
-        
-        # Calcula a taxa de defeitos
-        quality_rates = ItemCompra.objects.filter(
-            compra__data_pedido__range=(data_inicio, data_fim)
-        ).values('compra__fornecedor__nome').annotate(
-            total_recebido=Sum('quantidade_recebida'),
-            total_defeituoso=Sum('quantidade_defeituosa')
-        ).annotate(
-            taxa_defeito=Case(
-                When(total_recebido__gt=0, then=(F('total_defeituoso') * 100.0 / F('total_recebido'))),
-                default=Value(0),
-                output_field=DecimalField()
-            )
-        )
-        
-        # Pode-se combinar estes dados num único objeto no Python para exibir no template.
+        resumo = ScorecardFornecedorService.resumo(self.get_empresa(), data_inicio, data_fim)
         context['performance_data'] = {
-            'prazos': list(delivery_times),
-            'qualidade': list(quality_rates)
+            'prazos': [linha for linha in resumo if linha['entregas']],
+            'qualidade': [linha for linha in resumo if linha['quantidade_recebida']],
         }
+        context['fornecedores'] = resumo
         context['titulo'] = 'Performance de Fornecedores'
         return context
 
@@ -5615,16 +5558,11 @@ class RelatorioPrazosEntregaView(BaseRelatorioView):
         context = super().get_context_data(**kwargs)
         data_inicio, data_fim = self.get_datas_filtro()
         
-        prazos = Compra.objects.filter(
-            data_pedido__range=(data_inicio, data_fim),
-            data_entrega_real__isnull=False
-        ).annotate(
-            dias_atraso=ExpressionWrapper(F('data_entrega_real') - F('data_entrega_prevista'), output_field=DurationField())
-        ).values(
-            'fornecedor__nome'
-        ).annotate(
-            atraso_medio=Avg('dias_atraso')
-        ).order_by('atraso_medio')
+        prazos = [
+            linha for linha in ScorecardFornecedorService.resumo(self.get_empresa(), data_inicio, data_fim)
+            if linha['entregas']
+        ]
+        prazos.sort(key=lambda linha: linha['atraso_medio'])
         
         context['prazos_entrega'] = prazos
         context['titulo'] = 'Análise de Prazos de Entrega'
@@ -5643,18 +5581,11 @@ class RelatorioQualidadeFornecedorView(BaseRelatorioView):
         context = super().get_context_data(**kwargs)
         data_inicio, data_fim = self.get_datas_filtro()
         
-        qualidade = ItemCompra.objects.filter(
-            compra__data_pedido__range=(data_inicio, data_fim)
-        ).values('compra__fornecedor__nome').annotate(
-            total_recebido=Sum('quantidade_recebida'),
-            total_defeituoso=Sum('quantidade_defeituosa')
-        ).annotate(
-            taxa_defeito_percentual=Case(
-                When(total_recebido__gt=0, then=(F('total_defeituoso') * 100.0 / F('total_recebido'))),
-                default=Value(0),
-                output_field=DecimalField()
-            )
-        ).order_by('taxa_defeito_percentual')
+        qualidade = [
+            linha for linha in ScorecardFornecedorService.resumo(self.get_empresa(), data_inicio, data_fim)
+            if linha['quantidade_recebida']
+        ]
+        qualidade.sort(key=lambda linha: linha['percentual_defeitos'])
         
         context['relatorio_qualidade'] = qualidade
         context['titulo'] = 'Qualidade de Produtos por Fornecedor'
@@ -5853,16 +5784,28 @@ class AgendamentoDetailView(LoginRequiredMixin, DetailView):
 
 class ExecutarAgendamentoView(LoginRequiredMixin, View):
     """
-    Dispara a execução imediata de um relatório agendado como uma tarefa em background.
+    Envia o relatório de um agendamento para a fila de geração
+    (FilaRelatoriosService), com a fila e a prioridade do tipo de relatório.
     """
     def post(self, request, *args, **kwargs):
-        agendamento = get_object_or_404(AgendamentoRelatorio, pk=kwargs['pk'])
-        
-        # Dispara a tarefa Celery em background
-        # executar_relatorio_agendado_task.delay(agendamento.id)
-        
-        messages.info(request, f"A execução do relatório '{agendamento.nome_relatorio}' foi iniciada em segundo plano.")
-        return redirect('agendamento_lista')
+        agendamento = get_object_or_404(
+            AgendamentoRelatorio.objects.select_related('tipo_relatorio'),
+            pk=kwargs['pk'], template__empresa=getattr(request.user, 'empresa', None),
+        )
+
+        try:
+            relatorio, novo = FilaRelatoriosService(agendamento.template.empresa).solicitar_agendamento(
+                agendamento, request.user
+            )
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect('relatorios:agendamento_lista')
+
+        if novo:
+            messages.info(request, f"O relatório '{agendamento}' foi colocado na fila de geração ({relatorio.codigo_relatorio}).")
+        else:
+            messages.info(request, f"O relatório '{agendamento}' já está na fila ou foi gerado há pouco ({relatorio.codigo_relatorio}).")
+        return redirect('relatorios:agendamento_lista')
 
 class AtivarAgendamentoView(LoginRequiredMixin, View):
     """
@@ -5965,13 +5908,33 @@ class LogAcessoRelatoriosView(LoginRequiredMixin, ListView):
 
 class BaseExportView(LoginRequiredMixin, View):
     """
-    View base para exportação. Obtém os dados do relatório.
+    View base para exportação de um RelatorioGerado.
+
+    O ficheiro é produzido pela fila de relatórios: se o relatório ainda não
+    existe no formato pedido, é enfileirado (ou reutilizado um resultado
+    recente) e a resposta 202 indica onde acompanhar o estado.
     """
+    formato = None
+
+    def get(self, request, *args, **kwargs):
+        relatorio = get_object_or_404(
+            RelatorioGerado.objects.select_related('tipo_relatorio'),
+            pk=kwargs['pk'], empresa=getattr(request.user, 'empresa', None)
+        )
+        if relatorio.formato != self.formato or relatorio.status in ('erro', 'cancelado'):
+            relatorio, _ = FilaRelatoriosService(relatorio.empresa).solicitar_como(
+                relatorio, self.formato, request.user
+            )
+
+        if relatorio.status == 'concluido' and relatorio.arquivo_resultado:
+            return FileResponse(
+                relatorio.arquivo_resultado.open('rb'), as_attachment=True,
+                filename=os.path.basename(relatorio.arquivo_resultado.name)
+            )
+        return JsonResponse(_estado_pedido_relatorio(relatorio), status=202)
+
     def get_dados(self, pk):
-        # Lógica para obter os dados do relatório com base no PK.
-        # Isto é um placeholder. Substitua pela sua lógica real.
-        # relatorio = get_object_or_404(RelatorioGerado, pk=pk)
-        # return relatorio.get_dados_como_lista_de_dicionarios()
+        # Placeholder usado apenas pelos formatos sem geração na fila (XML)
         return [
             {'ID': 1, 'Produto': 'Laptop', 'Vendas': 150, 'Região': 'Norte'},
             {'ID': 2, 'Produto': 'Monitor', 'Vendas': 300, 'Região': 'Sul'},
@@ -5979,55 +5942,37 @@ class BaseExportView(LoginRequiredMixin, View):
         ]
 
 class ExportarPDFView(BaseExportView):
-    def get(self, request, *args, **kwargs):
-        pk = kwargs['pk']
-        dados = self.get_dados(pk)
-        
-        html_string = render_to_string('export/template.html', {'dados': dados})
-        html = HTML(string=html_string)
-        pdf = html.write_pdf()
-
-        response = HttpResponse(pdf, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="relatorio_{pk}.pdf"'
-        return response
+    formato = 'pdf'
 
 class ExportarExcelView(BaseExportView):
-    def get(self, request, *args, **kwargs):
-        pk = kwargs['pk']
-        dados = self.get_dados(pk)
-        
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = f'attachment; filename="relatorio_{pk}.xlsx"'
-        
-        workbook = Workbook()
-        sheet = workbook.active
-        sheet.title = 'Relatório'
-
-        headers = list(dados[0].keys())
-        sheet.append(headers)
-
-        for item in dados:
-            sheet.append(list(item.values()))
-
-        workbook.save(response)
-        return response
+    formato = 'excel'
 
 class ExportarCSVView(BaseExportView):
-    def get(self, request, *args, **kwargs):
-        pk = kwargs['pk']
-        dados = self.get_dados(pk)
-
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="relatorio_{pk}.csv"'
+    formato = 'csv'
 
-        writer = csv.writer(response)
-        if dados:
-            headers = dados[0].keys()
-            writer.writerow(headers)
-            for item in dados:
-                writer.writerow(item.values())
+class ExportarLinhasRelatorioView(LoginRequiredMixin, View):
+    """
+    Exporta as linhas detalhadas de um relatório (vendas, itens vendidos)
+    com memória constante: CSV e NDJSON começam a ser enviados de imediato,
+    XLSX e PDF são escritos para ficheiro temporário e servidos em blocos.
+    """
+    def get(self, request, pk, formato, *args, **kwargs):
+        if formato not in ExportacaoStreamingService.FORMATOS:
+            raise Http404('Formato de exportação não suportado')
+        relatorio = get_object_or_404(
+            RelatorioGerado.objects.select_related('tipo_relatorio'),
+            pk=pk, empresa=getattr(request.user, 'empresa', None)
+        )
+        origem = linhas_relatorio(relatorio)
+        if origem is None:
+            raise Http404('Este tipo de relatório não tem linhas detalhadas')
         
-        return response
+        colunas, linhas = origem
+        exportacao = ExportacaoStreamingService(linhas, colunas, relatorio.tipo_relatorio.nome)
+        try:
+            return exportacao.resposta(formato, f'{relatorio.codigo_relatorio}_linhas')
+        except LimiteExportacaoExcedido as e:
+            return HttpResponse(str(e), status=413, content_type='text/plain; charset=utf-8')
 
 class ExportarXMLView(BaseExportView):
     def get(self, request, *args, **kwargs):
@@ -6042,11 +5987,7 @@ class ExportarXMLView(BaseExportView):
         return response
 
 class ExportarJSONView(BaseExportView):
-    def get(self, request, *args, **kwargs):
-        pk = kwargs['pk']
-        dados = self.get_dados(pk)
-        
-        return JsonResponse(dados, safe=False, json_dumps_params={'indent': 2})
+    formato = 'json'
 
 
 class BusinessIntelligenceView(LoginRequiredMixin, TemplateView):
@@ -6082,53 +6023,77 @@ class CubosOLAPView(LoginRequiredMixin, TemplateView):
 
 class DataMiningView(LoginRequiredMixin, TemplateView):
     """
-    Aplica um algoritmo de clusterização (K-Means) para segmentar clientes.
+    Segmentação de clientes gravada pela execução noturna
+    (SegmentacaoClientesService): resumo por segmento e, com ?segmento=,
+    os clientes do segmento paginados.
     """
     template_name = 'bi/data_mining.html'
+    paginate_by = 50
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Exemplo: Segmentação de clientes com base no valor gasto e frequência
-        dados_clientes = Cliente.objects.annotate(
-            total=Sum('venda__total'),
-            frequencia=Count('venda')
-        ).values('id', 'nome', 'total', 'frequencia')
-        
-        df = pd.DataFrame(list(dados_clientes)).dropna()
-
-        if len(df) > 3: # K-Means precisa de um número mínimo de amostras
-            kmeans = KMeans(n_clusters=3, random_state=0, n_init=10)
-            df['cluster'] = kmeans.fit_predict(df[['total', 'frequencia']])
-            context['clientes_clusterizados'] = df.to_dict('records')
-        else:
-            context['clientes_clusterizados'] = None
+        empresa = getattr(self.request.user, 'empresa', None)
+        modelo = ModeloSegmentacaoClientes.objects.filter(empresa=empresa).defer('parametros').first()
+
+        context['modelo_segmentacao'] = modelo
+        context['segmentos'] = modelo.resumo if modelo else []
+        context['segmento_selecionado'] = None
+        context['membros'] = None
+
+        segmento = self.request.GET.get('segmento')
+        if modelo and segmento and segmento.isdigit():
+            cluster = int(segmento)
+            context['segmento_selecionado'] = next(
+                (s for s in modelo.resumo if s['cluster'] == cluster), None
+            )
+            membros = SegmentoCliente.objects.filter(
+                empresa=empresa, cluster=cluster
+            ).select_related('cliente', 'cliente__estatistica').order_by(
+                '-cliente__estatistica__total_comprado', 'cliente_id'
+            )
+            context['membros'] = Paginator(membros, self.paginate_by).get_page(self.request.GET.get('page'))
 
         context['titulo'] = 'Data Mining: Segmentação de Clientes'
         return context
 
 class PrevisoesView(LoginRequiredMixin, TemplateView):
     """
-    Utiliza modelos estatísticos para prever vendas futuras.
+    Previsão da procura para os próximos dias, lida dos modelos gravados
+    pela atualização noturna (PrevisaoDemandaService).
     """
     template_name = 'bi/previsoes.html'
+    dias_previsao = 28
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Previsão de vendas mensais
-        vendas_mensais = Venda.objects.annotate(mes=TruncMonth('data')).values('mes').annotate(total=Sum('total')).order_by('mes')
-        
-        df = pd.DataFrame(list(vendas_mensais), columns=['mes', 'total']).set_index('mes')
-        
-        if len(df) > 2:
-            # Modelo de Suavização Exponencial Simples
-            model = SimpleExpSmoothing(df['total'], initialization_method="estimated").fit()
-            previsao = model.forecast(3) # Prever os próximos 3 meses
-            context['dados_historicos'] = df.reset_index().to_dict('records')
-            context['previsao'] = previsao.to_dict()
+        service = PrevisaoDemandaService(getattr(self.request.user, 'empresa', None))
+
+        # Faturamento previsto: soma das previsões das lojas, por dia
+        lojas = service.previsoes('loja', self.dias_previsao)
+        if not lojas.empty:
+            context['previsao'] = {dia.isoformat(): round(valor, 2) for dia, valor in lojas.sum().items()}
+            nomes = dict(Loja.objects.filter(pk__in=lojas.index.tolist()).values_list('pk', 'nome'))
+            context['previsao_lojas'] = [
+                {'loja': nomes.get(loja_id), 'faturamento': round(valor, 2)}
+                for loja_id, valor in lojas.sum(axis=1).sort_values(ascending=False).items()
+            ]
         else:
-            context['dados_historicos'] = None
             context['previsao'] = None
+            context['previsao_lojas'] = []
+
+        # Produtos com maior procura prevista
+        produtos = service.previsoes('produto', self.dias_previsao)
+        if not produtos.empty:
+            top = produtos.sum(axis=1).nlargest(10)
+            nomes = dict(Produto.objects.filter(pk__in=top.index.tolist()).values_list('pk', 'nome_produto'))
+            context['previsao_produtos'] = [
+                {'produto': nomes.get(produto_id), 'quantidade': round(valor, 1)}
+                for produto_id, valor in top.items()
+            ]
+        else:
+            context['previsao_produtos'] = []
 
+        context['dias_previsao'] = self.dias_previsao
         context['titulo'] = 'Previsão de Vendas'
         return context
 
@@ -6136,15 +6101,73 @@ class PrevisoesView(LoginRequiredMixin, TemplateView):
 # AJAX E UTILITÁRIOS
 # =====================================
 
+def _solicitar_relatorio(request, dados):
+    """
+    Enfileira um RelatorioGerado a partir dos dados de um pedido AJAX ou API.
+    Levanta ValidationError se os parâmetros forem inválidos.
+    """
+    empresa = getattr(request.user, 'empresa', None)
+    if empresa is None:
+        raise ValidationError('Utilizador sem empresa associada.')
+
+    tipo = str(dados.get('tipo_relatorio') or '')
+    filtro_tipo = Q(pk=tipo) if tipo.isdigit() else Q(codigo=tipo)
+    tipo_relatorio = TipoRelatorio.objects.filter(filtro_tipo, ativo=True).first()
+    if tipo_relatorio is None:
+        raise ValidationError('Tipo de relatório inválido.')
+
+    formato = dados.get('formato') or 'pdf'
+    if formato not in FilaRelatoriosService.FORMATOS:
+        raise ValidationError(f'Formato não suportado: {formato}.')
+
+    try:
+        data_inicio = parse_date(dados.get('data_inicio') or '')
+        data_fim = parse_date(dados.get('data_fim') or '')
+    except ValueError:
+        raise ValidationError('Data inválida.')
+
+    parametros = dados.get('parametros') or {}
+    if isinstance(parametros, str):
+        try:
+            parametros = json.loads(parametros)
+        except ValueError:
+            raise ValidationError('Parâmetros inválidos.')
+
+    lojas = dados.getlist('lojas') if hasattr(dados, 'getlist') else dados.get('lojas') or []
+    lojas = Loja.objects.filter(empresa=empresa, pk__in=[l for l in lojas if str(l).isdigit()])
+
+    return FilaRelatoriosService(empresa).solicitar(
+        tipo_relatorio, request.user, formato, data_inicio, data_fim, parametros, lojas
+    )
+
+
+def _estado_pedido_relatorio(relatorio, novo=None):
+    dados = FilaRelatoriosService.estado(relatorio)
+    dados['url_estado'] = reverse('relatorios:estado_ajax', args=[relatorio.pk])
+    if novo is not None:
+        dados['reutilizado'] = not novo
+    return dados
+
+
 class GerarRelatorioAjaxView(LoginRequiredMixin, View):
     """
-    Inicia a geração de um relatório via AJAX e retorna um ID de tarefa.
+    Enfileira a geração de um relatório via AJAX. Devolve o estado do pedido
+    e o URL para acompanhar o progresso.
     """
     def post(self, request, *args, **kwargs):
-        # ...lógica para obter parâmetros do request.POST...
-        # task = gerar_relatorio_task.delay(parametros)
-        # return JsonResponse({'status': 'iniciado', 'task_id': task.id})
-        return JsonResponse({'status': 'simulado', 'task_id': 'xyz-123'})
+        try:
+            relatorio, novo = _solicitar_relatorio(request, request.POST)
+        except ValidationError as e:
+            return JsonResponse({'status': 'erro', 'mensagem': ' '.join(e.messages)}, status=400)
+        return JsonResponse(_estado_pedido_relatorio(relatorio, novo), status=202)
+
+class EstadoRelatorioView(LoginRequiredMixin, View):
+    """
+    Estado de um relatório na fila (status, progresso e ficheiro quando concluído).
+    """
+    def get(self, request, pk, *args, **kwargs):
+        relatorio = get_object_or_404(RelatorioGerado, pk=pk, empresa=getattr(request.user, 'empresa', None))
+        return JsonResponse(_estado_pedido_relatorio(relatorio))
 
 class PreviewRelatorioView(LoginRequiredMixin, View):
     """
@@ -6219,9 +6242,11 @@ class GerarRelatorioAPIView(APIView):
     permission_classes = [IsAuthenticated] # Usar TokenAuthentication na configuração do DRF
 
     def post(self, request, format=None):
-        parametros = request.data
-        
-        return Response({'status': 'simulado', 'task_id': 'xyz-123'}, status=status.HTTP_202_ACCEPTED)
+        try:
+            relatorio, novo = _solicitar_relatorio(request, request.data)
+        except ValidationError as e:
+            return Response({'status': 'erro', 'mensagem': ' '.join(e.messages)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(_estado_pedido_relatorio(relatorio, novo), status=status.HTTP_202_ACCEPTED)
 
 class DadosGraficoAPIView(APIView):
     """
@@ -1,8 +1,9 @@
 # apps/saft/services/contabilidade_service.py
-from typing import List, Dict
+from typing import List, Dict, Optional
 from apps.financeiro.models import PlanoContas, LancamentoFinanceiro # 🚨 Alterado para usar LancamentoFinanceiro
+from apps.financeiro.services import SaldoContabilService
 from apps.core.models import Empresa 
-from datetime import datetime, date, timedelta
+from datetime import datetime, date
 from decimal import Decimal
 
 class SaftContabilidadeService:
@@ -13,10 +14,12 @@ class SaftContabilidadeService:
     
     def __init__(self, empresa: Empresa):
         self.empresa = empresa
+        self.saldos_service = SaldoContabilService(empresa)
 
-    def get_contas_para_saft(self) -> List[Dict]:
+    def get_contas_para_saft(self, data_inicio: Optional[date] = None, data_fim: Optional[date] = None) -> List[Dict]:
         """
         Retorna a lista de Contas-Folha do Plano de Contas para o bloco <GeneralLedger>.
+        Saldos de abertura (e de fecho, se ``data_fim``) a partir dos fechos mensais.
         """
         # Apenas contas da empresa, ativas e que aceitam lançamentos
         contas_folha = PlanoContas.objects.filter(
@@ -25,34 +28,41 @@ class SaftContabilidadeService:
             aceita_lancamento=True 
         ).order_by('codigo')
 
+        # Por omissão, abertura no início do exercício corrente
+        data_inicio = data_inicio or date.today().replace(month=1, day=1)
+        if data_fim:
+            abertura, fecho = self.saldos_service.saldos_periodo(data_inicio, data_fim)
+        else:
+            abertura, fecho = self.saldos_service.saldos_ate(data_inicio), None
+
         saft_accounts = []
         for conta in contas_folha:
-            # 🚨 Lógica de Saldos Iniciais: Altamente complexa e geralmente requer 
-            # o saldo do dia anterior ao período. Para produção, DEVE ser calculada
-            # com base em lançamentos passados.
-            
-            # Placeholder: Assume 0 no início do período para a primeira iteração, 
-            # mas o sistema DEVE calcular o saldo real.
-            opening_balance = self._calcular_saldo_inicial(conta, date.today() - timedelta(days=365)) 
+            debito, credito = abertura.get(conta.pk, (Decimal('0.00'), Decimal('0.00')))
+            opening_balance = debito - credito
 
-            saft_accounts.append({
+            account = {
                 'AccountID': conta.codigo, 
                 'AccountDescription': conta.nome,
-                # Saldo inicial: Assume que a conta tem natureza (D/C)
+                # Saldo positivo -> devedor, negativo -> credor
                 'OpeningDebitBalance': float(opening_balance) if opening_balance >= 0 else 0.00,
                 'OpeningCreditBalance': float(abs(opening_balance)) if opening_balance < 0 else 0.00,
-            })
+            }
+            if fecho is not None:
+                debito, credito = fecho.get(conta.pk, (Decimal('0.00'), Decimal('0.00')))
+                closing_balance = debito - credito
+                account['ClosingDebitBalance'] = float(closing_balance) if closing_balance >= 0 else 0.00
+                account['ClosingCreditBalance'] = float(abs(closing_balance)) if closing_balance < 0 else 0.00
+
+            saft_accounts.append(account)
             
         return saft_accounts
     
     def _calcular_saldo_inicial(self, conta: PlanoContas, data_corte: date) -> Decimal:
         """
-        Método mockado. Em produção, este método deve somar todos os 
-        LancamentoFinanceiro até a data de corte, respeitando D/C.
+        Saldo da conta antes de ``data_corte``: Sum(Débitos) - Sum(Créditos).
+        Se positivo -> Débito, se negativo -> Crédito.
         """
-        # Logica: Sum(Debitos antes da data) - Sum(Creditos antes da data)
-        # Se positivo -> Débito, se negativo -> Crédito
-        return Decimal('0.00') # 🚨 Implementação REAL exigida em produção
+        return self.saldos_service.saldo_inicial(conta, data_corte)
 
     def get_general_ledger_entries(self, data_inicio: datetime, data_fim: datetime) -> List[Dict]:
         """
@@ -83,7 +83,9 @@ class SaftXmlGeneratorService:
         """
         
         # --- BLOC 1: Master Files ---
-        ledger_accounts = self.contabilidade_service.get_contas_para_saft()
+        ledger_accounts = self.contabilidade_service.get_contas_para_saft(
+            self.data_inicio.date(), self.data_fim.date()
+        )
         withholding_tax_entries = self.retencao_service.get_withholding_tax_entries(
              self.data_inicio, self.data_fim
         )
@@ -1,3 +1,182 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+from lxml import etree
+
+from apps.saft.utils import saft_validator
+from apps.saft.utils.saft_validator import (
+    SAFT_NAMESPACE, SAFT_VERSAO_PADRAO, SaftValidator, ValidadorSAFTStreaming, obter_schema,
+)
+
+# XSD reduzido com a estrutura que o validador percorre
+XSD_TESTE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" targetNamespace="{SAFT_NAMESPACE}"
+           xmlns="{SAFT_NAMESPACE}" elementFormDefault="qualified">
+  <xs:complexType name="Qualquer">
+    <xs:sequence>
+      <xs:any namespace="##targetNamespace" processContents="skip" minOccurs="0" maxOccurs="unbounded"/>
+    </xs:sequence>
+  </xs:complexType>
+  <xs:element name="AuditFile">
+    <xs:complexType><xs:sequence>
+      <xs:element name="Header" type="Qualquer"/>
+      <xs:element name="MasterFiles"><xs:complexType><xs:sequence>
+        <xs:element name="TaxTable"><xs:complexType><xs:sequence>
+          <xs:element name="TaxTableEntry" type="Qualquer" minOccurs="0" maxOccurs="unbounded"/>
+        </xs:sequence></xs:complexType></xs:element>
+      </xs:sequence></xs:complexType></xs:element>
+      <xs:element name="SourceDocuments"><xs:complexType><xs:sequence>
+        <xs:element name="SalesInvoices"><xs:complexType><xs:sequence>
+          <xs:element name="NumberOfEntries" type="xs:integer"/>
+          <xs:element name="TotalDebit" type="xs:decimal"/>
+          <xs:element name="TotalCredit" type="xs:decimal"/>
+          <xs:element name="Invoice" maxOccurs="unbounded"><xs:complexType><xs:sequence>
+            <xs:element name="InvoiceNo" type="xs:string"/>
+            <xs:element name="DocumentStatus"><xs:complexType><xs:sequence>
+              <xs:element name="InvoiceStatus" type="xs:string"/>
+            </xs:sequence></xs:complexType></xs:element>
+            <xs:element name="Line" maxOccurs="unbounded"><xs:complexType><xs:sequence>
+              <xs:element name="CreditAmount" type="xs:decimal"/>
+            </xs:sequence></xs:complexType></xs:element>
+            <xs:element name="DocumentTotals"><xs:complexType><xs:sequence>
+              <xs:element name="GrossTotal" type="xs:decimal"/>
+            </xs:sequence></xs:complexType></xs:element>
+          </xs:sequence></xs:complexType></xs:element>
+        </xs:sequence></xs:complexType></xs:element>
+      </xs:sequence></xs:complexType></xs:element>
+    </xs:sequence></xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+HEADER = {
+    'AuditFileVersion': SAFT_VERSAO_PADRAO, 'CompanyID': '5000000090', 'TaxRegistrationNumber': '5000000090',
+    'TaxAccountingBasis': 'F', 'CompanyName': 'Farmácia SAF-T', 'FiscalYear': '2026', 'StartDate': '2026-01-01',
+    'EndDate': '2026-01-31', 'CurrencyCode': 'AOA', 'DateCreated': '2026-02-01', 'TimeCreated': '10:00:00',
+    'ProductID': 'PharmaSys/Teste', 'ProductVersion': '1.0',
+}
+
+
+def documento_saft(numero_entradas=2, total_credito='100.00', valor_linha='50.00'):
+    """SAF-T mínimo: uma fatura normal (2 linhas) e uma anulada"""
+    linhas = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<AuditFile xmlns="{SAFT_NAMESPACE}">',
+        '<Header>',
+        *(f'<{campo}>{valor}</{campo}>' for campo, valor in HEADER.items()),
+        '</Header>',
+        '<MasterFiles><TaxTable>',
+        '<TaxTableEntry><TaxPercentage>14</TaxPercentage></TaxTableEntry>',
+        '</TaxTable></MasterFiles>',
+        '<SourceDocuments><SalesInvoices>',
+        f'<NumberOfEntries>{numero_entradas}</NumberOfEntries>',
+        '<TotalDebit>0.00</TotalDebit>',
+        f'<TotalCredit>{total_credito}</TotalCredit>',
+        '<Invoice><InvoiceNo>FT A/1</InvoiceNo>',
+        '<DocumentStatus><InvoiceStatus>N</InvoiceStatus></DocumentStatus>',
+        f'<Line><CreditAmount>{valor_linha}</CreditAmount></Line>',
+        '<Line><CreditAmount>50.00</CreditAmount></Line>',
+        '<DocumentTotals><GrossTotal>114.00</GrossTotal></DocumentTotals>',
+        '</Invoice>',
+        '<Invoice><InvoiceNo>FT A/2</InvoiceNo>',
+        '<DocumentStatus><InvoiceStatus>A</InvoiceStatus></DocumentStatus>',
+        '<Line><CreditAmount>10.00</CreditAmount></Line>',
+        '<DocumentTotals><GrossTotal>11.40</GrossTotal></DocumentTotals>',
+        '</Invoice>',
+        '</SalesInvoices></SourceDocuments>',
+        '</AuditFile>',
+    ]
+    return '\n'.join(linhas)
+
+
+class ValidadorSAFTTest(SimpleTestCase):
+    """XSD compilado uma vez por processo e validação SAF-T em streaming"""
+
+    def setUp(self):
+        diretorio = tempfile.mkdtemp(prefix='xsd_teste_')
+        self.addCleanup(shutil.rmtree, diretorio, ignore_errors=True)
+        caminho = os.path.join(diretorio, 'saft_teste.xsd')
+        with open(caminho, 'w', encoding='utf-8') as ficheiro:
+            ficheiro.write(XSD_TESTE)
+
+        for patcher in (
+            mock.patch.dict(saft_validator.SAFT_SCHEMAS, {SAFT_VERSAO_PADRAO: caminho}),
+            mock.patch.dict(saft_validator._schemas_compilados, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _validar(self, xml, tamanho_bloco=None):
+        validador = ValidadorSAFTStreaming()
+        if tamanho_bloco:
+            validador.TAMANHO_BLOCO = tamanho_bloco
+        return validador.validar(io.BytesIO(xml.encode('utf-8')))
+
+    def test_schema_compilado_uma_vez(self):
+        with mock.patch.object(saft_validator.etree, 'XMLSchema', wraps=etree.XMLSchema) as compilar:
+            schema = obter_schema()
+            self.assertIs(SaftValidator().xmlschema, schema)
+            self.assertIs(ValidadorSAFTStreaming().schema, schema)
+
+        compilar.assert_called_once()
+        with self.assertRaises(ValueError):
+            obter_schema('0.00_00')
+
+    def test_documento_valido(self):
+        self.assertIsNone(SaftValidator().validate_xml_string(documento_saft()))
+
+        resultado = self._validar(documento_saft())
+
+        self.assertTrue(resultado['valido'])
+        self.assertEqual((resultado['erros'], resultado['avisos']), ([], []))
+        estatisticas = resultado['estatisticas']
+        self.assertEqual((estatisticas['taxas'], estatisticas['faturas'], estatisticas['faturas_anuladas']), (1, 2, 1))
+        self.assertEqual(estatisticas['total_faturado'], '114.00')
+        self.assertEqual(estatisticas['seccoes']['SalesInvoices']['linhas'], 2)
+
+    def test_blocos_pequenos_dao_o_mesmo_resultado(self):
+        resultado = self._validar(documento_saft())
+        resultado_blocos = self._validar(documento_saft(), tamanho_bloco=64)
+
+        self.assertEqual(resultado_blocos['estatisticas'], resultado['estatisticas'])
+        self.assertTrue(resultado_blocos['valido'])
+
+    def test_totais_de_controlo_divergentes_sao_avisos(self):
+        resultado = self._validar(documento_saft(numero_entradas=3, total_credito='90.00'))
+
+        self.assertTrue(resultado['valido'])
+        self.assertEqual(sorted(resultado['avisos']), [
+            'SalesInvoices/NumberOfEntries: declarado 3, calculado 2',
+            'SalesInvoices/TotalCredit: declarado 90.00, calculado 100.00',
+        ])
+
+    def test_erro_de_schema_indica_a_linha_do_elemento(self):
+        xml = documento_saft(valor_linha='abc')
+        linha = xml.splitlines().index('<Line><CreditAmount>abc</CreditAmount></Line>') + 1
+
+        resultado = self._validar(xml)
+
+        self.assertFalse(resultado['valido'])
+        self.assertEqual(resultado['total_erros'], 1)
+        self.assertEqual(resultado['erros'][0]['linha'], linha)
+        self.assertIn('CreditAmount', resultado['erros'][0]['mensagem'])
+
+    def test_header_incompleto(self):
+        xml = documento_saft().replace('<CurrencyCode>AOA</CurrencyCode>', '<CurrencyCode>EUR</CurrencyCode>')
+
+        resultado = self._validar(xml)
+
+        self.assertFalse(resultado['valido'])
+        self.assertEqual(
+            [erro['mensagem'] for erro in resultado['erros']], ['Moeda inválida: EUR. Esperado: AOA (Kwanza Angolano)'],
+        )
+
+    def test_xml_malformado(self):
+        resultado = self._validar(documento_saft()[:-len('</AuditFile>')])
+
+        self.assertFalse(resultado['valido'])
+        self.assertTrue(any('XML malformado' in erro['mensagem'] for erro in resultado['erros']))
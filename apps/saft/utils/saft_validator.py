@@ -1,33 +1,88 @@
 # apps/saft/utils/saft_validator.py
 
+import logging
 import os
+import re
+import threading
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional
+
+from django.conf import settings
 from lxml import etree
-from typing import Optional, List
 
-# 🚨 Configuração de Produção: 
-# Ajuste o caminho para o XSD conforme a versão mais recente da AGT.
-SAFT_XSD_PATH = os.path.join(os.path.dirname(__file__), '..', 'SAFT_AO_1.04_01.xsd')
+logger = logging.getLogger(__name__)
+
+SAFT_NAMESPACE = "urn:OECD:StandardAuditFile-Tax:AO_1.01_01"
+SAFT_VERSAO_PADRAO = '1.01_01'
+
+# Schemas oficiais conhecidos, por versão do AuditFileVersion.
+SAFT_SCHEMAS = {
+    '1.01_01': os.path.join(settings.BASE_DIR, 'apps', 'fiscal', 'schemas', 'SAFTAO1.01_01.xsd'),
+}
+
+# Registo de schemas compilados, partilhado por todo o processo.
+_schemas_compilados: Dict[str, etree.XMLSchema] = {}
+_lock_registo = threading.Lock()
+# O error_log de um XMLSchema pertence ao objecto; validações em memória
+# com o mesmo schema não podem correr em simultâneo.
+_lock_validacao = threading.Lock()
+
+
+def obter_schema(versao: str = SAFT_VERSAO_PADRAO) -> etree.XMLSchema:
+    """
+    Devolve o XSD compilado da versão pedida.
+    O ficheiro é lido e compilado uma única vez por processo.
+    """
+    schema = _schemas_compilados.get(versao)
+    if schema is not None:
+        return schema
+
+    with _lock_registo:
+        schema = _schemas_compilados.get(versao)
+        if schema is None:
+            caminho = SAFT_SCHEMAS.get(versao)
+            if caminho is None:
+                raise ValueError(f"Versão SAF-T sem schema registado: {versao}")
+            if not os.path.exists(caminho):
+                raise FileNotFoundError(
+                    f"ERRO: Ficheiro XSD não encontrado em {caminho}. "
+                    "Obtenha o schema oficial da AGT e coloque-o neste caminho."
+                )
+            logger.info("Compilando XSD SAF-T %s de %s", versao, caminho)
+            schema = etree.XMLSchema(etree.parse(caminho))
+            _schemas_compilados[versao] = schema
+    return schema
+
+
+def validar_documento(xml_doc, versao: str = SAFT_VERSAO_PADRAO) -> None:
+    """Valida uma árvore lxml já carregada; levanta etree.DocumentInvalid."""
+    schema = obter_schema(versao)
+    with _lock_validacao:
+        schema.assertValid(xml_doc)
+
+
+def validar_ficheiro(caminho: str, versao: str = SAFT_VERSAO_PADRAO) -> None:
+    """
+    Valida um ficheiro contra o XSD sem carregar a árvore completa;
+    levanta etree.XMLSyntaxError no primeiro erro de schema ou de sintaxe.
+    """
+    schema = obter_schema(versao)
+    with _lock_validacao:
+        for _, elemento in etree.iterparse(caminho, events=('end',), schema=schema, huge_tree=True):
+            elemento.clear()
+            while elemento.getprevious() is not None:
+                del elemento.getparent()[0]
+
 
 class SaftValidator:
     """
     Serviço de Validação do XML SAF-T contra o XSD oficial.
     Crucial para garantir a aceitação do ficheiro pela AGT.
     """
-    
-    def __init__(self):
-        if not os.path.exists(SAFT_XSD_PATH):
-            raise FileNotFoundError(
-                f"ERRO: Ficheiro XSD não encontrado em {SAFT_XSD_PATH}. "
-                "Obtenha o schema oficial da AGT e coloque-o neste caminho."
-            )
-        self.xmlschema: etree.XMLSchema = self._load_xsd()
-
-    def _load_xsd(self) -> etree.XMLSchema:
-        """ Carrega o schema XSD (Definition) para uso futuro. """
-        print(f"Carregando XSD de: {SAFT_XSD_PATH}...")
-        with open(SAFT_XSD_PATH, 'rb') as f:
-            xmlschema_doc = etree.parse(f)
-        return etree.XMLSchema(xmlschema_doc)
+
+    def __init__(self, versao: str = SAFT_VERSAO_PADRAO):
+        self.versao = versao
+        self.xmlschema: etree.XMLSchema = obter_schema(versao)
 
     def validate_xml_string(self, xml_content: str) -> Optional[List[str]]:
         """
@@ -37,27 +92,385 @@ class SaftValidator:
         try:
             # 1. Parsear a string XML gerada
             xml_doc = etree.fromstring(xml_content.encode('utf-8'))
-            
+
             # 2. Executar a validação
-            self.xmlschema.assertValid(xml_doc)
-            
-            # 3. Sucesso na validação
-            print("✅ VALIDAÇÃO BEM-SUCEDIDA: O ficheiro SAF-T está em conformidade com o XSD.")
-            return None 
+            with _lock_validacao:
+                if self.xmlschema.validate(xml_doc):
+                    # 3. Sucesso na validação
+                    logger.info("Validação XSD SAF-T concluída: o ficheiro está em conformidade com o schema.")
+                    return None
+                errors = [f"Linha {log.line}: {log.message}" for log in self.xmlschema.error_log]
+
+            # Erros de schema (falha ao aderir ao XSD)
+            logger.warning(f"SAF-T falhou na validação do schema XSD ({len(errors)} erros).")
+            return errors
 
         except etree.XMLSyntaxError as e:
             # Erros de sintaxe XML básico
-            print(f"❌ ERRO DE SINTAXE XML: {e}")
+            logger.warning(f"Erro de sintaxe XML no SAF-T: {e}")
             return [str(e)]
 
-        except etree.DocumentInvalid as e:
-            # Erros de schema (falha ao aderir ao XSD)
-            print("❌ ERRO DE CONFORMIDADE XSD: O ficheiro falhou na validação do schema.")
-            errors = [log.message for log in self.xmlschema.error_log]
-            return errors
-        
         except Exception as e:
             # Outros erros
-            print(f"❌ ERRO INESPERADO: {e}")
+            logger.exception(f"Erro inesperado na validação SAF-T: {e}")
             return [str(e)]
 
+
+class ValidadorSAFTStreaming:
+    """
+    Validação SAF-T em memória limitada.
+
+    O ficheiro é lido em blocos e entregue a um XMLPullParser com o XSD
+    compilado: a validação de schema acontece durante o parsing e cada
+    registo (cliente, produto, fatura, lançamento...) é limpo assim que
+    termina, pelo que a memória não cresce com o tamanho do ficheiro.
+    Na mesma passagem são verificados os campos obrigatórios do Header,
+    recolhidas as estatísticas estruturais e conferidos os totais de
+    controlo de cada secção.
+
+    O libxml2 não indica a linha dos erros de schema em modo streaming;
+    cada erro é associado, por ordem, aos elementos com o mesmo nome dos
+    registos fechados no bloco onde foi detectado.
+    """
+
+    TAMANHO_BLOCO = 64 * 1024
+    MAX_ERROS = 500
+
+    CAMPOS_HEADER = (
+        'AuditFileVersion', 'CompanyID', 'TaxRegistrationNumber', 'TaxAccountingBasis',
+        'CompanyName', 'FiscalYear', 'StartDate', 'EndDate', 'CurrencyCode',
+        'DateCreated', 'TimeCreated', 'ProductID', 'ProductVersion',
+    )
+    TABELAS_MASTER = ('GeneralLedgerAccounts', 'Customers', 'Suppliers', 'TaxTable', 'Products')
+
+    # Registos das tabelas mestre: elemento -> chave da estatística.
+    REGISTOS = {
+        'Account': 'contas',
+        'Customer': 'clientes',
+        'Supplier': 'fornecedores',
+        'Product': 'produtos',
+        'TaxTableEntry': 'taxas',
+    }
+    # Documentos: elemento -> (secção, campo de estado).
+    DOCUMENTOS = {
+        'Invoice': ('SalesInvoices', 'InvoiceStatus'),
+        'StockMovement': ('MovementOfGoods', 'MovementStatus'),
+        'WorkDocument': ('WorkingDocuments', 'WorkStatus'),
+        'Payment': ('Payments', 'PaymentStatus'),
+        'Transaction': ('GeneralLedgerEntries', None),
+    }
+    CONTROLOS = ('NumberOfEntries', 'TotalDebit', 'TotalCredit', 'NumberOfMovementLines', 'TotalQuantityIssued')
+
+    _RE_ELEMENTO = re.compile(r"^Element '(?:\{[^}]*\})?([^']+)'")
+
+    def __init__(self, versao: str = SAFT_VERSAO_PADRAO):
+        self.versao = versao
+        self.schema = obter_schema(versao)
+        self.ns = ns = '{%s}' % SAFT_NAMESPACE
+
+        # Só estes elementos geram eventos Python; o resto do documento é
+        # percorrido e validado inteiramente pelo libxml2.
+        nomes = (
+            'Header', 'MasterFiles', 'Journal', *self.TABELAS_MASTER,
+            *self.CONTROLOS, *self.REGISTOS, *self.DOCUMENTOS,
+        )
+        self._nomes = {ns + nome: nome for nome in nomes}
+        self._filtro = [*self._nomes, '{*}AuditFile']
+
+        self._xp_estado = {
+            campo: etree.ETXPath(f'string(.//{ns}{campo})')
+            for _, campo in self.DOCUMENTOS.values() if campo
+        }
+        self._xp_linhas = etree.ETXPath(f'count({ns}Line)')
+        self._xp_debito = etree.ETXPath(f'.//{ns}DebitAmount/text()')
+        self._xp_credito = etree.ETXPath(f'.//{ns}CreditAmount/text()')
+        self._xp_quantidade = etree.ETXPath(f'{ns}Line/{ns}Quantity/text()')
+        self._xp_bruto = etree.ETXPath(f'string({ns}DocumentTotals/{ns}GrossTotal)')
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+
+    def validar(self, origem) -> Dict:
+        """
+        Valida um ficheiro SAF-T. `origem` pode ser um caminho ou qualquer
+        objecto com read() (incluindo UploadedFile do Django).
+        """
+        if isinstance(origem, (str, os.PathLike)):
+            with open(origem, 'rb') as ficheiro:
+                return self._validar_stream(ficheiro)
+        return self._validar_stream(origem)
+
+    # ------------------------------------------------------------------
+    # Passagem única
+    # ------------------------------------------------------------------
+
+    def _validar_stream(self, ficheiro) -> Dict:
+        self._erros: List[Dict] = []
+        self._total_erros = 0
+        self._avisos: List[str] = []
+        self._contagens = {chave: 0 for chave in self.REGISTOS.values()}
+        self._seccoes: Dict[str, Dict] = {}
+        self._declarados: Dict[str, Dict[str, str]] = {}
+        self._vistos = set()
+        self._erros_lidos = 0
+        self._pendentes: List[tuple] = []
+
+        parser = etree.XMLPullParser(
+            events=('end',),
+            tag=self._filtro,
+            schema=self.schema,
+            huge_tree=True,
+            no_network=True,
+        )
+        total_bytes = 0
+        interrompida = False
+        sintaxe_ok = True
+
+        try:
+            while True:
+                bloco = ficheiro.read(self.TAMANHO_BLOCO)
+                if not bloco:
+                    break
+                total_bytes += len(bloco)
+                parser.feed(bloco)
+                eventos = [elemento for _, elemento in parser.read_events()]
+                self._recolher_erros_schema(parser, eventos)
+                self._processar_eventos(eventos)
+                if self._erros_lidos >= self.MAX_ERROS:
+                    # O libxml2 guarda todos os erros em memória: a partir
+                    # daqui o ficheiro tem de ser corrigido de qualquer forma.
+                    interrompida = True
+                    break
+            if not interrompida:
+                try:
+                    parser.close()
+                except etree.XMLSyntaxError:
+                    # O fecho levanta tanto os erros de schema acumulados como
+                    # os de sintaxe (ficheiro truncado, conteúdo extra...).
+                    registo = parser.feed_error_log
+                    if not len(registo):
+                        raise
+                    sintaxe_ok = not any(erro.domain == etree.ErrorDomains.PARSER for erro in registo)
+            self._recolher_erros_schema(parser, [], final=True)
+        except etree.XMLSyntaxError as e:
+            # O parser parou: os erros já acumulados explicam a paragem;
+            # sem nenhum, trata-se de XML malformado.
+            sintaxe_ok = False
+            antes = self._total_erros
+            eventos = [elemento for _, elemento in parser.read_events()]
+            self._recolher_erros_schema(parser, eventos, final=True)
+            if self._total_erros == antes:
+                self._registar_erro(e.lineno or None, f"XML malformado: {e.msg}")
+
+        if sintaxe_ok and not interrompida:
+            self._verificar_estrutura()
+            self._conferir_controlos()
+
+        return {
+            'valido': self._total_erros == 0,
+            'versao': self.versao,
+            'interrompida': interrompida,
+            'erros': self._erros,
+            'total_erros': self._total_erros,
+            'avisos': self._avisos,
+            'estatisticas': self._estatisticas(total_bytes),
+        }
+
+    def _processar_eventos(self, eventos) -> None:
+        for elemento in eventos:
+            nome = self._nomes.get(elemento.tag)
+            if nome is None:
+                # Só a raiz chega aqui, através do filtro '{*}AuditFile'.
+                if elemento.tag != f"{self.ns}AuditFile":
+                    self._registar_erro(elemento.sourceline, f"Namespace inválido. Esperado: {SAFT_NAMESPACE}")
+                continue
+
+            self._vistos.add(nome)
+            if nome == 'Header':
+                self._validar_header(elemento)
+            elif nome in self.CONTROLOS:
+                pai = elemento.getparent()
+                if pai is not None:
+                    seccao = etree.QName(pai).localname
+                    self._declarados.setdefault(seccao, {})[nome] = (elemento.text or '').strip()
+            elif nome in self.REGISTOS:
+                self._contagens[self.REGISTOS[nome]] += 1
+                self._libertar(elemento)
+            elif nome in self.DOCUMENTOS:
+                self._acumular_documento(nome, elemento)
+                self._libertar(elemento)
+            elif nome == 'Journal':
+                self._libertar(elemento)
+
+    def _acumular_documento(self, nome: str, elemento) -> None:
+        seccao, campo_estado = self.DOCUMENTOS[nome]
+        dados = self._seccoes.get(seccao)
+        if dados is None:
+            dados = self._seccoes[seccao] = {
+                'documentos': 0, 'anulados': 0, 'linhas': 0,
+                'total_debito': Decimal('0'), 'total_credito': Decimal('0'),
+                'total_bruto': Decimal('0'), 'quantidade': Decimal('0'),
+            }
+        dados['documentos'] += 1
+
+        if campo_estado and self._xp_estado[campo_estado](elemento).strip() == 'A':
+            dados['anulados'] += 1
+            return
+
+        dados['linhas'] += int(self._xp_linhas(elemento))
+        dados['total_debito'] += sum(map(self._decimal, self._xp_debito(elemento)), Decimal('0'))
+        dados['total_credito'] += sum(map(self._decimal, self._xp_credito(elemento)), Decimal('0'))
+        if nome == 'StockMovement':
+            dados['quantidade'] += sum(map(self._decimal, self._xp_quantidade(elemento)), Decimal('0'))
+        dados['total_bruto'] += self._decimal(self._xp_bruto(elemento))
+
+    @staticmethod
+    def _libertar(elemento) -> None:
+        """Liberta o registo já processado e os irmãos anteriores."""
+        elemento.clear(keep_tail=True)
+        pai = elemento.getparent()
+        if pai is not None:
+            while elemento.getprevious() is not None:
+                del pai[0]
+
+    # ------------------------------------------------------------------
+    # Regras estruturais
+    # ------------------------------------------------------------------
+
+    def _validar_header(self, header) -> None:
+        ns = self.ns
+        linha = header.sourceline
+        for campo in self.CAMPOS_HEADER:
+            if not (header.findtext(f'{ns}{campo}') or '').strip():
+                self._registar_erro(linha, f'Campo obrigatório ausente no Header: {campo}')
+
+        versao = header.findtext(f'{ns}AuditFileVersion')
+        if versao and versao != self.versao:
+            self._registar_erro(linha, f'Versão SAF-T inválida: {versao}. Esperado: {self.versao}')
+
+        moeda = header.findtext(f'{ns}CurrencyCode')
+        if moeda and moeda != 'AOA':
+            self._registar_erro(linha, f'Moeda inválida: {moeda}. Esperado: AOA (Kwanza Angolano)')
+
+        pais = header.findtext(f'.//{ns}Country')
+        if pais and pais != 'AO':
+            self._registar_erro(linha, f'País deve ser AO (Angola). Encontrado: {pais}')
+
+    def _verificar_estrutura(self) -> None:
+        for seccao in ('Header', 'MasterFiles'):
+            if seccao not in self._vistos:
+                self._registar_erro(None, f"Seção obrigatória ausente: {seccao}")
+
+        if 'MasterFiles' in self._vistos:
+            if not any(tabela in self._vistos for tabela in self.TABELAS_MASTER):
+                self._registar_erro(
+                    None, 'MasterFiles deve conter pelo menos uma das tabelas: ' + ', '.join(self.TABELAS_MASTER)
+                )
+            if 'TaxTable' in self._vistos and not self._contagens['taxas']:
+                self._registar_erro(None, 'TaxTable presente mas sem entradas')
+
+    def _conferir_controlos(self) -> None:
+        """Compara os totais de controlo declarados com os calculados (avisos)."""
+        for seccao, declarados in self._declarados.items():
+            calculado = self._seccoes.get(seccao)
+            if calculado is None:
+                calculado = {'documentos': 0, 'anulados': 0, 'linhas': 0, 'total_debito': Decimal('0'),
+                             'total_credito': Decimal('0'), 'quantidade': Decimal('0')}
+            comparacoes = {
+                'NumberOfEntries': Decimal(calculado['documentos']),
+                'TotalDebit': calculado['total_debito'],
+                'TotalCredit': calculado['total_credito'],
+                'NumberOfMovementLines': Decimal(calculado['linhas']),
+                'TotalQuantityIssued': calculado['quantidade'],
+            }
+            for campo, texto in declarados.items():
+                declarado = self._decimal(texto)
+                if declarado != comparacoes[campo]:
+                    self._avisos.append(
+                        f'{seccao}/{campo}: declarado {declarado}, calculado {comparacoes[campo]}'
+                    )
+
+    # ------------------------------------------------------------------
+    # Erros
+    # ------------------------------------------------------------------
+
+    def _recolher_erros_schema(self, parser, eventos, final: bool = False) -> None:
+        """
+        Regista os erros de schema novos, com a linha do elemento a que se
+        referem. Os erros cujo elemento ainda não fechou neste bloco ficam
+        pendentes para o bloco seguinte.
+        """
+        novos = []
+        if len(parser.feed_error_log) > self._erros_lidos:
+            registo = list(parser.feed_error_log)
+            for erro in registo[self._erros_lidos:]:
+                if erro.domain == etree.ErrorDomains.PARSER:
+                    novos.append((erro.line or None, f"XML malformado: {erro.message}"))
+                else:
+                    novos.append((erro.line or None, erro.message))
+            self._erros_lidos = len(registo)
+
+        anteriores = len(self._pendentes)
+        mensagens = self._pendentes + novos
+        self._pendentes = []
+        if not mensagens:
+            return
+
+        candidatos = {}
+        for indice, (linha, mensagem) in enumerate(mensagens):
+            encontrado = self._RE_ELEMENTO.match(mensagem or '')
+            if encontrado and eventos and not linha:
+                nome = encontrado.group(1)
+                if nome not in candidatos:
+                    candidatos[nome] = self._elementos_do_bloco(eventos, self.ns + nome)
+                elemento = next(candidatos[nome], None)
+                if elemento is not None:
+                    linha = elemento.sourceline
+            if linha is None and not final and indice >= anteriores:
+                self._pendentes.append((linha, mensagem))
+                continue
+            self._registar_erro(linha, mensagem)
+
+    @staticmethod
+    def _elementos_do_bloco(eventos, tag):
+        """Percorre, por ordem e sem repetições, os elementos `tag` do bloco."""
+        vistos = set()
+        for raiz in eventos:
+            for elemento in raiz.iter(tag):
+                if elemento not in vistos:
+                    vistos.add(elemento)
+                    yield elemento
+
+    def _registar_erro(self, linha: Optional[int], mensagem: str) -> None:
+        self._total_erros += 1
+        if len(self._erros) < self.MAX_ERROS:
+            self._erros.append({'linha': linha, 'mensagem': mensagem})
+
+    # ------------------------------------------------------------------
+    # Auxiliares
+    # ------------------------------------------------------------------
+
+    def _estatisticas(self, total_bytes: int) -> Dict:
+        seccoes = {}
+        for seccao, dados in self._seccoes.items():
+            seccoes[seccao] = {
+                chave: (str(valor) if isinstance(valor, Decimal) else valor)
+                for chave, valor in dados.items()
+            }
+        faturas = self._seccoes.get('SalesInvoices', {})
+        return {
+            'bytes': total_bytes,
+            **self._contagens,
+            'faturas': faturas.get('documentos', 0),
+            'faturas_anuladas': faturas.get('anulados', 0),
+            'total_faturado': str(faturas.get('total_bruto', Decimal('0'))),
+            'seccoes': seccoes,
+        }
+
+    @staticmethod
+    def _decimal(texto) -> Decimal:
+        try:
+            return Decimal((texto or '0').strip() or '0')
+        except InvalidOperation:
+            return Decimal('0')
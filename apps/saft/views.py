@@ -21,7 +21,7 @@ from django.conf import settings
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 from datetime import datetime, date, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, Optional
 from apps.fiscal.models import TaxaIVAAGT
 from apps.fiscal.services import SAFTExportService
 from apps.core.models import Empresa
@@ -32,6 +32,7 @@ from django.urls import reverse_lazy
 from django.contrib import messages
 from django.urls import reverse
 from apps.saft.services.saft_xml_generator_service import SaftXmlGeneratorService
+from apps.saft.utils.saft_validator import ValidadorSAFTStreaming
 
 
 
@@ -373,7 +374,7 @@ class SaftValidarView(LoginRequiredMixin, PermissaoAcaoMixin, PermissionRequired
     
     template_name = 'saft/saft_validar.html'
     permission_required = 'saft.validate_saftfile'
-    max_file_size = 50 * 1024 * 1024  # 50MB
+    max_file_size = 2 * 1024 * 1024 * 1024  # 2GB (validação em streaming)
     
     def get(self, request):
         """Renderiza formulário de validação."""
@@ -407,16 +408,8 @@ class SaftValidarView(LoginRequiredMixin, PermissaoAcaoMixin, PermissionRequired
                     'error': validation_result['error']
                 })
             
-            # 3. Ler e validar conteúdo XML
-            try:
-                xml_content = uploaded_file.read().decode('utf-8')
-                validation_result = self._validar_xml_saft(xml_content)
-                
-            except UnicodeDecodeError:
-                return JsonResponse({
-                    'success': False,
-                    'error': 'Arquivo deve estar codificado em UTF-8.'
-                })
+            # 3. Validar conteúdo XML em streaming (sem carregar o ficheiro)
+            validation_result = self._validar_xml_saft(uploaded_file)
             
             # 4. Log da validação
             logger.info(
@@ -467,68 +460,14 @@ class SaftValidarView(LoginRequiredMixin, PermissaoAcaoMixin, PermissionRequired
         
         return {'valid': True}
     
-    def _validar_xml_saft(self, xml_content: str) -> Dict:
-        """Validação específica do XML SAF-T."""
-        
-        errors = []
-        warnings = []
+    def _validar_xml_saft(self, uploaded_file) -> Dict:
+        """
+        Validação do XML SAF-T contra o XSD e as regras estruturais da AGT,
+        numa única passagem em memória limitada.
+        """
         
         try:
-            # 1. Verificar se é XML válido
-            try:
-                root = ET.fromstring(xml_content)
-            except ET.ParseError as e:
-                return {
-                    'success': False,
-                    'valid': False,
-                    'error': f'XML malformado: {str(e)}',
-                    'errors': [f'Erro de parsing XML: {str(e)}']
-                }
-            
-            # 2. Verificar namespace SAF-T
-            expected_namespace = "urn:OECD:StandardAuditFile-Tax:AO_1.01_01"
-            if root.tag != f"{{{expected_namespace}}}AuditFile":
-                errors.append(f"Namespace inválido. Esperado: {expected_namespace}")
-            
-            # 3. Validar estrutura básica SAF-T
-            required_sections = ['Header', 'MasterFiles']
-            for section in required_sections:
-                if root.find(f'.//{{{expected_namespace}}}{section}') is None:
-                    errors.append(f"Seção obrigatória ausente: {section}")
-            
-            # 4. Validar Header
-            header_errors = self._validar_header_saft(root, expected_namespace)
-            errors.extend(header_errors)
-            
-            # 5. Validar MasterFiles
-            masterfiles_errors = self._validar_masterfiles_saft(root, expected_namespace)
-            errors.extend(masterfiles_errors)
-            
-            # 6. Validações específicas de Angola
-            angola_errors = self._validar_especificidades_angola(root, expected_namespace)
-            errors.extend(angola_errors)
-            
-            # 7. Determinar se é válido
-            is_valid = len(errors) == 0
-            
-            # 8. Preparar resultado
-            result = {
-                'success': True,
-                'valid': is_valid,
-                'title': 'Arquivo SAF-T Válido' if is_valid else 'Arquivo SAF-T Inválido',
-                'message': self._gerar_mensagem_resultado(is_valid, len(errors), len(warnings)),
-                'errors': errors,
-                'warnings': warnings,
-                'details': {
-                    'total_errors': len(errors),
-                    'total_warnings': len(warnings),
-                    'file_size': len(xml_content),
-                    'validation_date': timezone.now().isoformat()
-                }
-            }
-            
-            return result
-            
+            resultado = ValidadorSAFTStreaming().validar(uploaded_file)
         except Exception as e:
             return {
                 'success': False,
@@ -536,92 +475,34 @@ class SaftValidarView(LoginRequiredMixin, PermissaoAcaoMixin, PermissionRequired
                 'error': f'Erro na validação: {str(e)}',
                 'errors': [f'Erro interno: {str(e)}']
             }
-    
-    def _validar_header_saft(self, root: ET.Element, namespace: str) -> List[str]:
-        """Valida seção Header do SAF-T."""
-        
-        errors = []
-        header = root.find(f'.//{{{namespace}}}Header')
-        
-        if header is None:
-            return ['Header ausente']
-        
-        # Campos obrigatórios no Header
-        required_fields = [
-            'AuditFileVersion',
-            'CompanyID',
-            'TaxRegistrationNumber',
-            'TaxAccountingBasis',
-            'CompanyName',
-            'FiscalYear',
-            'StartDate',
-            'EndDate',
-            'CurrencyCode',
-            'DateCreated',
-            'TimeCreated',
-            'ProductID',
-            'ProductVersion'
-        ]
-        
-        for field in required_fields:
-            element = header.find(f'.//{{{namespace}}}{field}')
-            if element is None or not element.text:
-                errors.append(f'Campo obrigatório ausente no Header: {field}')
-        
-        # Validações específicas
-        version = header.find(f'.//{{{namespace}}}AuditFileVersion')
-        if version is not None and version.text != '1.01_01':
-            errors.append(f'Versão SAF-T inválida: {version.text}. Esperado: 1.01_01')
-        
-        currency = header.find(f'.//{{{namespace}}}CurrencyCode')
-        if currency is not None and currency.text != 'AOA':
-            errors.append(f'Moeda inválida: {currency.text}. Esperado: AOA (Kwanza Angolano)')
         
-        return errors
-    
-    def _validar_masterfiles_saft(self, root: ET.Element, namespace: str) -> List[str]:
-        """Valida seção MasterFiles do SAF-T."""
-        
-        errors = []
-        masterfiles = root.find(f'.//{{{namespace}}}MasterFiles')
-        
-        if masterfiles is None:
-            return ['MasterFiles ausente']
-        
-        # Verificar presença de pelo menos uma tabela
-        tables = ['GeneralLedgerAccounts', 'Customers', 'Suppliers', 'TaxTable', 'Products']
-        has_any_table = False
-        
-        for table in tables:
-            if masterfiles.find(f'.//{{{namespace}}}{table}') is not None:
-                has_any_table = True
-                break
-        
-        if not has_any_table:
-            errors.append('MasterFiles deve conter pelo menos uma das tabelas: ' + ', '.join(tables))
-        
-        # Validar TaxTable se presente
-        tax_table = masterfiles.find(f'.//{{{namespace}}}TaxTable')
-        if tax_table is not None:
-            tax_entries = tax_table.findall(f'.//{{{namespace}}}TaxTableEntry')
-            if len(tax_entries) == 0:
-                errors.append('TaxTable presente mas sem entradas')
-        
-        return errors
-    
-    def _validar_especificidades_angola(self, root: ET.Element, namespace: str) -> List[str]:
-        """Validações específicas para Angola."""
-        
-        errors = []
-        
-        # Verificar se CompanyAddress contém Country = AO
-        header = root.find(f'.//{{{namespace}}}Header')
-        if header is not None:
-            country = header.find(f'.//{{{namespace}}}Country')
-            if country is not None and country.text != 'AO':
-                errors.append(f'País deve ser AO (Angola). Encontrado: {country.text}')
+        errors = [
+            f"Linha {erro['linha']}: {erro['mensagem']}" if erro['linha'] else erro['mensagem']
+            for erro in resultado['erros']
+        ]
+        warnings = resultado['avisos']
+        total_errors = resultado['total_erros']
+        if resultado['interrompida']:
+            warnings = warnings + [
+                f'Validação interrompida após {total_errors} erros. Corrija-os e valide novamente.'
+            ]
+        is_valid = resultado['valido']
         
-        return errors
+        return {
+            'success': True,
+            'valid': is_valid,
+            'title': 'Arquivo SAF-T Válido' if is_valid else 'Arquivo SAF-T Inválido',
+            'message': self._gerar_mensagem_resultado(is_valid, total_errors, len(warnings)),
+            'errors': errors,
+            'warnings': warnings,
+            'details': {
+                'total_errors': total_errors,
+                'total_warnings': len(warnings),
+                'file_size': resultado['estatisticas']['bytes'],
+                'statistics': resultado['estatisticas'],
+                'validation_date': timezone.now().isoformat()
+            }
+        }
     
     def _gerar_mensagem_resultado(self, is_valid: bool, num_errors: int, num_warnings: int) -> str:
         """Gera mensagem descritiva do resultado da validação."""
@@ -7,7 +7,7 @@ from django.db.models import Sum, Count, Avg
 from django.contrib import messages
 from django.utils import timezone
 from .models import (
-     Comissao, DevolucaoVenda, HistoricoVenda, PagamentoVenda, Venda, ItemVenda
+     Comissao, DevolucaoVenda, ExecucaoComissao, HistoricoVenda, PagamentoVenda, Venda, ItemVenda
 )
 from .models import FormaPagamento
 
@@ -224,6 +224,22 @@ class ComissaoAdmin(admin.ModelAdmin):
     list_per_page = 25
 
 
+@admin.register(ExecucaoComissao)
+class ExecucaoComissaoAdmin(admin.ModelAdmin):
+    list_display = (
+        'empresa',
+        'modo',
+        'iniciado_em',
+        'concluido_em',
+        'vendas_processadas',
+        'metas_recalculadas',
+        'comissoes_geradas'
+    )
+    list_filter = ('modo', 'empresa')
+    date_hierarchy = 'iniciado_em'
+    readonly_fields = [f.name for f in ExecucaoComissao._meta.fields]
+
+
 # Adicionar ao arquivo apps/vendas/admin.py
 
 from django.contrib import admin
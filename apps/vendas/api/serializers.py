@@ -20,6 +20,7 @@ class ItemVendaSerializer(serializers.ModelSerializer):
         model = ItemVenda
         fields = '__all__'
         read_only_fields = ['subtotal_sem_iva', 'iva_valor', 'total']
+        relacionados = {'produto_nome': 'produto'}
     
     def validate_produto_id(self, value):
         try:
@@ -84,6 +85,12 @@ class VendaSerializer(serializers.ModelSerializer):
         model = Venda
         fields = '__all__'
         read_only_fields = ['numero_documento', 'created_at', 'updated_at', 'subtotal_sem_iva', 'iva_valor', 'total']
+        relacionados = {
+            'cliente_nome': 'cliente',
+            'vendedor_nome': 'vendedor',
+            'itens': 'itens__produto',
+            'pagamentos': 'pagamentos',
+        }
     
     def validate(self, data):
         """Validações de negócio e pré-cálculo dos totais da fatura."""
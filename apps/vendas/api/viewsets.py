@@ -3,16 +3,21 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from apps.core.mixins import APIOtimizadaMixin
 from ..models import Venda, ItemVenda, PagamentoVenda, DevolucaoVenda
 from .serializers import VendaSerializer, ItemVendaSerializer, PagamentoSerializer, DevolucaoSerializer
 
 
-class VendaViewSet(viewsets.ModelViewSet):
+class VendaViewSet(APIOtimizadaMixin, viewsets.ModelViewSet):
     queryset = Venda.objects.all()
     serializer_class = VendaSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['status', 'cliente', 'vendedor', 'data_venda']
+    campos_cursor = ('data_venda',)
+
+    def get_queryset(self):
+        return Venda.objects.filter(empresa=self.request.user.empresa)
     
     @action(detail=True, methods=['post'])
     def finalizar(self, request, pk=None):
@@ -28,15 +33,21 @@ class VendaViewSet(viewsets.ModelViewSet):
         venda.save()
         return Response({'status': 'venda cancelada'})
 
-class ItemVendaViewSet(viewsets.ModelViewSet):
+class ItemVendaViewSet(APIOtimizadaMixin, viewsets.ModelViewSet):
     queryset = ItemVenda.objects.all()
     serializer_class = ItemVendaSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class PagamentoViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        return ItemVenda.objects.filter(venda__empresa=self.request.user.empresa)
+
+class PagamentoViewSet(APIOtimizadaMixin, viewsets.ModelViewSet):
     queryset = PagamentoVenda.objects.all() #queryset = Pagamento.objects.all()
     serializer_class = PagamentoSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        return PagamentoVenda.objects.filter(venda__empresa=self.request.user.empresa)
+
 
 
@@ -200,9 +200,9 @@ class ItemDevolucaoForm(forms.ModelForm):
     
     class Meta:
         model = ItemDevolucao
-        fields = ['produto', 'quantidade_devolvida', 'motivo']
+        fields = ['item_venda_original', 'quantidade_devolvida', 'motivo']
         widgets = {
-            'quantidade': forms.NumberInput(attrs={'min': '1', 'step': '1'}),
+            'quantidade_devolvida': forms.NumberInput(attrs={'min': '1', 'step': '1'}),
         }
     
     def __init__(self, *args, **kwargs):
@@ -210,9 +210,8 @@ class ItemDevolucaoForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         
         if self.venda:
-            # Filtrar apenas produtos da venda
-            produtos_venda = self.venda.itens.values_list('produto', flat=True)
-            self.fields['produto'].queryset = Produto.objects.filter(id__in=produtos_venda)
+            # Apenas os itens da venda original
+            self.fields['item_venda_original'].queryset = self.venda.itens.all()
 
 
 class DevolucaoForm(BaseVendaForm):
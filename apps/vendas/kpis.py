@@ -0,0 +1,18 @@
+# apps/vendas/kpis.py
+from django.db.models import Count, Q, Sum
+
+from apps.core.services import KPI, PlaneadorKPIService
+from apps.vendas.models import Venda
+
+
+@PlaneadorKPIService.registrar('vendas')
+def kpis_vendas(empresa, hoje):
+    """Totais de vendas finalizadas do dia e do mês (dashboard de vendas)"""
+    vendas_hoje = Q(status='finalizada', data_venda__date=hoje)
+    vendas_mes = Q(status='finalizada', data_venda__date__gte=hoje.replace(day=1))
+    return [
+        KPI('vendas_hoje_total', Venda, Sum, 'total', vendas_hoje, padrao=None),
+        KPI('vendas_hoje_quantidade', Venda, Count, 'id', vendas_hoje),
+        KPI('vendas_mes_total', Venda, Sum, 'total', vendas_mes, padrao=None),
+        KPI('vendas_mes_quantidade', Venda, Count, 'id', vendas_mes),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Count, IntegerField, Value, When
+
+
+def remover_comissoes_duplicadas(apps, schema_editor):
+    """
+    Antes da restrição única (venda, vendedor): mantém uma comissão por par,
+    a paga se existir, depois a pendente, e a mais antiga entre iguais.
+    """
+    Comissao = apps.get_model('vendas', 'Comissao')
+
+    duplicados = (
+        Comissao.objects.values('venda_id', 'vendedor_id')
+        .annotate(total=Count('id'))
+        .filter(total__gt=1)
+        .values_list('venda_id', 'vendedor_id')
+    )
+    prioridade = Case(
+        When(status='paga', then=Value(0)),
+        When(status='pendente', then=Value(1)),
+        default=Value(2),
+        output_field=IntegerField(),
+    )
+    for venda_id, vendedor_id in list(duplicados):
+        ids = list(
+            Comissao.objects.filter(venda_id=venda_id, vendedor_id=vendedor_id)
+            .order_by(prioridade, 'id')
+            .values_list('id', flat=True)
+        )
+        Comissao.objects.filter(pk__in=ids[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_empresa_codigo_validacao'),
+        ('vendas', '0006_itemproforma_subtotal'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExecucaoComissao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modo', models.CharField(choices=[('completo', 'Completo'), ('incremental', 'Incremental')], default='completo', max_length=20)),
+                ('data_inicio', models.DateField(blank=True, null=True)),
+                ('data_fim', models.DateField(blank=True, null=True)),
+                ('iniciado_em', models.DateTimeField()),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('vendas_processadas', models.PositiveIntegerField(default=0)),
+                ('metas_recalculadas', models.PositiveIntegerField(default=0)),
+                ('comissoes_geradas', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Execução de Comissões',
+                'verbose_name_plural': 'Execuções de Comissões',
+                'ordering': ['-iniciado_em'],
+            },
+        ),
+        migrations.AddField(
+            model_name='metavenda',
+            name='faturamento_realizado',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Faturamento Realizado (AKZ)'),
+        ),
+        migrations.AddField(
+            model_name='metavenda',
+            name='novos_clientes_realizados',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='metavenda',
+            name='percentual_atingido',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=8),
+        ),
+        migrations.AddField(
+            model_name='metavenda',
+            name='quantidade_produtos_realizada',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='metavenda',
+            name='quantidade_vendas_realizada',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='metavenda',
+            name='realizado_atualizado_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='metavenda',
+            name='ticket_medio_realizado',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(remover_comissoes_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='comissao',
+            constraint=models.UniqueConstraint(fields=('venda', 'vendedor'), name='unique_comissao_venda_vendedor'),
+        ),
+        migrations.AddField(
+            model_name='execucaocomissao',
+            name='empresa',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='execucoes_comissao', to='core.empresa'),
+        ),
+        migrations.AddIndex(
+            model_name='execucaocomissao',
+            index=models.Index(fields=['empresa', 'concluido_em'], name='vendas_exec_empresa_d83046_idx'),
+        ),
+    ]
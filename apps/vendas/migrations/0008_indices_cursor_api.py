@@ -0,0 +1,24 @@
+# Generated by Django 5.1.5 on 2026-10-19 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0005_razao_fidelidade'),
+        ('core', '0003_numeracao_blocos'),
+        ('funcionarios', '0003_resumopontodiario'),
+        ('vendas', '0007_metas_realizado_execucao_comissao'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['empresa', '-id'], name='idx_venda_empresa_id'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['empresa', '-data_venda'], name='idx_venda_empresa_data'),
+        ),
+    ]
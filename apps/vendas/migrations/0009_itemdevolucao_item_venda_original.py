@@ -0,0 +1,22 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0008_indices_cursor_api'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='itemdevolucao',
+            old_name='produto',
+            new_name='item_venda_original',
+        ),
+        migrations.AlterField(
+            model_name='itemdevolucao',
+            name='item_venda_original',
+            field=models.ForeignKey(help_text='O item exato da venda original que está a ser devolvido.', on_delete=django.db.models.deletion.PROTECT, related_name='itens_devolucao', to='vendas.itemvenda', verbose_name='Item da Venda Original'),
+        ),
+    ]
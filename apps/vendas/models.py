@@ -87,6 +87,9 @@ class FormaPagamento(models.Model):
     def __str__(self):
         return self.nome
 
+CAMPOS_ESTATISTICA_CLIENTE = {'cliente_id', 'status', 'total', 'valor_pago'}
+
+
 class Venda(TimeStampedModel):
     """Venda realizada"""
     TIPO_VENDA_CHOICES = [
@@ -148,6 +151,18 @@ class Venda(TimeStampedModel):
     tem_fatura_proforma = models.BooleanField(default=False)
 
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Estado carregado, usado para aplicar deltas às estatísticas do cliente
+        if CAMPOS_ESTATISTICA_CLIENTE.issubset(field_names):
+            instance._estado_estatistica = instance.estado_estatistica()
+        return instance
+
+    def estado_estatistica(self):
+        """(cliente_id, status, total, valor_pago) que afetam EstatisticaCliente"""
+        return (self.cliente_id, self.status, self.total, self.valor_pago)
+
     def gerar_documento_fiscal(self, usuario):
         """
         Gera número, hash e ATCUD da venda.
@@ -189,6 +204,11 @@ class Venda(TimeStampedModel):
     class Meta:
         verbose_name = 'Venda'
         verbose_name_plural = 'Vendas'
+        indexes = [
+            # Paginação por cursor da API (apps/core/api/pagination.py)
+            models.Index(fields=['empresa', '-id'], name='idx_venda_empresa_id'),
+            models.Index(fields=['empresa', '-data_venda'], name='idx_venda_empresa_data'),
+        ]
     
     def desconto_percentual(self):
         if self.subtotal > Decimal('0.00'):
@@ -413,9 +433,11 @@ class ItemDevolucao(models.Model):
     Representa um item de produto específico que está a ser devolvido.
     """
     devolucao = models.ForeignKey('DevolucaoVenda', on_delete=models.CASCADE, related_name='itens')
-    produto = models.ForeignKey(
+    item_venda_original = models.ForeignKey(
         'ItemVenda', 
         on_delete=models.PROTECT,
+        related_name='itens_devolucao',
+        verbose_name="Item da Venda Original",
         help_text="O item exato da venda original que está a ser devolvido."
     )
     quantidade_devolvida = models.DecimalField("Quantidade Devolvida", max_digits=10, decimal_places=3)
@@ -427,7 +449,7 @@ class ItemDevolucao(models.Model):
         verbose_name_plural = "Itens de Devolução"
 
     def __str__(self):
-        return f"{self.quantidade_devolvida} x {self.item_venda_original.produto.nome} na Devolução #{self.devolucao.id}"
+        return f"{self.quantidade_devolvida} x {self.item_venda_original.nome_produto} na Devolução #{self.devolucao.id}"
 
 class HistoricoVenda(models.Model):
     venda = models.ForeignKey(Venda, on_delete=models.CASCADE, related_name='historico')
@@ -605,6 +627,9 @@ class Comissao(models.Model):
         verbose_name = "Comissão"
         verbose_name_plural = "Comissões"
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['venda', 'vendedor'], name='unique_comissao_venda_vendedor')
+        ]
 
     def __str__(self):
         return f"Comissão de {self.valor_comissao} Kz para {self.vendedor.username} na Venda #{self.venda.id}"
@@ -873,6 +898,20 @@ class MetaVenda(models.Model):
         verbose_name='Aprovado Por'
     )
     
+    # Realizado (mantido pelo MetaVendaService)
+    faturamento_realizado = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name='Faturamento Realizado (AKZ)'
+    )
+    quantidade_vendas_realizada = models.PositiveIntegerField(default=0)
+    quantidade_produtos_realizada = models.PositiveIntegerField(default=0)
+    novos_clientes_realizados = models.PositiveIntegerField(default=0)
+    ticket_medio_realizado = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    percentual_atingido = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    realizado_atualizado_em = models.DateTimeField(null=True, blank=True)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -943,59 +982,18 @@ class MetaVenda(models.Model):
     
     def calcular_realizado(self):
         """Calcular valores realizados no período"""
-        vendas = Venda.objects.filter(
-            empresa=self.empresa,
-            data_venda__gte=self.data_inicio,
-            data_venda__lte=self.data_fim,
-            status='finalizada'
-        )
-        
-        if self.vendedor:
-            vendas = vendas.filter(vendedor=self.vendedor)
-        
-        # Agregar dados
-        resultado = vendas.aggregate(
-            faturamento_realizado=models.Sum('total'),
-            quantidade_vendas_realizada=models.Count('id'),
-            quantidade_produtos_realizada=models.Sum('itens__quantidade'),
-            ticket_medio_realizado=models.Avg('total')
-        )
-        
-        # Novos clientes
-        clientes_periodo = vendas.filter(
-            cliente__isnull=False
-        ).values('cliente').distinct()
-        
-        # Clientes que fizeram primeira compra no período
-        novos_clientes = 0
-        for cliente_data in clientes_periodo:
-            primeira_compra = Venda.objects.filter(
-                empresa=self.empresa,
-                cliente_id=cliente_data['cliente'],
-                status='finalizada'
-            ).order_by('data_venda').first()
-            
-            if (primeira_compra and 
-                self.data_inicio <= primeira_compra.data_venda.date() <= self.data_fim):
-                novos_clientes += 1
-        
-        resultado['novos_clientes_realizados'] = novos_clientes
-        
-        # Tratar valores None
-        for key, value in resultado.items():
-            if value is None:
-                resultado[key] = 0
-        
-        return resultado
+        from apps.vendas.services import MetaVendaService
+
+        return MetaVendaService(self.empresa).calcular_realizado([self])[self.pk]
     
-    def calcular_percentual_atingimento(self):
+    def calcular_percentual_atingimento(self, realizado=None):
         """Calcular percentual de atingimento da meta"""
-        realizado = self.calcular_realizado()
+        realizado = realizado or self.calcular_realizado()
         percentuais = {}
         
         if self.meta_faturamento and self.meta_faturamento > 0:
             percentuais['faturamento'] = (
-                realizado['faturamento_realizado'] / float(self.meta_faturamento) * 100
+                float(realizado['faturamento_realizado']) / float(self.meta_faturamento) * 100
             )
         
         if self.meta_quantidade_vendas and self.meta_quantidade_vendas > 0:
@@ -1015,14 +1013,14 @@ class MetaVenda(models.Model):
         
         if self.meta_ticket_medio and self.meta_ticket_medio > 0:
             percentuais['ticket_medio'] = (
-                realizado['ticket_medio_realizado'] / float(self.meta_ticket_medio) * 100
+                float(realizado['ticket_medio_realizado']) / float(self.meta_ticket_medio) * 100
             )
         
         return percentuais
     
-    def calcular_percentual_geral(self):
+    def calcular_percentual_geral(self, realizado=None):
         """Calcular percentual geral baseado no tipo de meta"""
-        percentuais = self.calcular_percentual_atingimento()
+        percentuais = self.calcular_percentual_atingimento(realizado)
         
         if self.tipo_meta == 'mista':
             # Meta mista: calcular média ponderada
@@ -1055,17 +1053,18 @@ class MetaVenda(models.Model):
             key = tipo_map.get(self.tipo_meta)
             return percentuais.get(key, 0)
     
-    def meta_atingida(self):
+    def meta_atingida(self, realizado=None):
         """Verificar se a meta foi atingida"""
-        percentual = self.calcular_percentual_geral()
+        percentual = self.calcular_percentual_geral(realizado)
         return percentual >= float(self.meta_minima_percentual)
     
-    def calcular_bonus(self):
+    def calcular_bonus(self, realizado=None):
         """Calcular bônus baseado no atingimento"""
-        if not self.meta_atingida():
+        realizado = realizado or self.calcular_realizado()
+        if not self.meta_atingida(realizado):
             return 0
         
-        percentual = self.calcular_percentual_geral()
+        percentual = self.calcular_percentual_geral(realizado)
         bonus_total = float(self.bonus_monetario)
         
         # Bônus por superação
@@ -1076,32 +1075,43 @@ class MetaVenda(models.Model):
         
         return bonus_total
     
-    def calcular_comissao_extra(self):
+    def calcular_comissao_extra(self, realizado=None):
         """Calcular comissão extra baseada no atingimento"""
-        if not self.meta_atingida():
+        realizado = realizado or self.calcular_realizado()
+        if not self.meta_atingida(realizado):
             return 0
         
-        realizado = self.calcular_realizado()
-        faturamento = realizado['faturamento_realizado']
+        faturamento = float(realizado['faturamento_realizado'])
         
         comissao_extra = faturamento * float(self.comissao_extra_percentual) / 100
         
         return comissao_extra
     
-    def gerar_relatorio_atingimento(self):
+    @property
+    def realizado_armazenado(self):
+        """Último realizado gravado pelo MetaVendaService (sem queries)"""
+        return {
+            'faturamento_realizado': self.faturamento_realizado,
+            'quantidade_vendas_realizada': self.quantidade_vendas_realizada,
+            'quantidade_produtos_realizada': self.quantidade_produtos_realizada,
+            'novos_clientes_realizados': self.novos_clientes_realizados,
+            'ticket_medio_realizado': self.ticket_medio_realizado,
+        }
+    
+    def gerar_relatorio_atingimento(self, realizado=None):
         """Gerar relatório completo de atingimento"""
-        realizado = self.calcular_realizado()
-        percentuais = self.calcular_percentual_atingimento()
-        percentual_geral = self.calcular_percentual_geral()
+        realizado = realizado or self.calcular_realizado()
+        percentuais = self.calcular_percentual_atingimento(realizado)
+        percentual_geral = self.calcular_percentual_geral(realizado)
         
         return {
             'meta': self,
             'realizado': realizado,
             'percentuais': percentuais,
             'percentual_geral': percentual_geral,
-            'meta_atingida': self.meta_atingida(),
-            'bonus_calculado': self.calcular_bonus(),
-            'comissao_extra': self.calcular_comissao_extra(),
+            'meta_atingida': self.meta_atingida(realizado),
+            'bonus_calculado': self.calcular_bonus(realizado),
+            'comissao_extra': self.calcular_comissao_extra(realizado),
             'dias_restantes': (self.data_fim - timezone.now().date()).days,
             'periodo_display': self.get_periodo_display(),
         }
@@ -1128,6 +1138,35 @@ def verificar_meta_vencida(sender, instance, **kwargs):
         instance.save(update_fields=['status'])    
 
 
+class ExecucaoComissao(models.Model):
+    """Registo de cada execução do motor de metas/comissões (marca d'água do modo incremental)"""
+    MODO_CHOICES = [
+        ('completo', 'Completo'),
+        ('incremental', 'Incremental'),
+    ]
+
+    empresa = models.ForeignKey('core.Empresa', on_delete=models.CASCADE, related_name='execucoes_comissao')
+    modo = models.CharField(max_length=20, choices=MODO_CHOICES, default='completo')
+    data_inicio = models.DateField(null=True, blank=True)
+    data_fim = models.DateField(null=True, blank=True)
+    iniciado_em = models.DateTimeField()
+    concluido_em = models.DateTimeField(null=True, blank=True)
+    vendas_processadas = models.PositiveIntegerField(default=0)
+    metas_recalculadas = models.PositiveIntegerField(default=0)
+    comissoes_geradas = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Execução de Comissões'
+        verbose_name_plural = 'Execuções de Comissões'
+        ordering = ['-iniciado_em']
+        indexes = [
+            models.Index(fields=['empresa', 'concluido_em']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_modo_display()} - {self.empresa} ({self.iniciado_em:%d/%m/%Y %H:%M})"
+
+
 class FaturaCredito(TimeStampedModel):
     """Fatura de Crédito (FT) - Documento de venda a crédito"""
     TIPO_FATURA_CHOICES = [
@@ -1,13 +1,17 @@
 #apps/vendas/services.py
 
 from apps.core.services import gerar_numero_documento
+from collections import defaultdict
 from django.db import transaction
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import TruncDate
 from django.utils import timezone
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
 from apps.core.services import gerar_numero_documento
 from apps.fiscal.utils import gerar_atcud, gerar_hash_anterior
-from apps.vendas.models import FormaPagamento, Venda, ItemVenda
+from apps.vendas.models import FormaPagamento, Venda, ItemVenda, MetaVenda, Comissao, ExecucaoComissao
 from apps.fiscal.services import DocumentoFiscalService
+from apps.produtos.services import AlocacaoLoteService
 
 
 
@@ -21,8 +25,10 @@ def criar_venda(empresa, cliente, vendedor, itens_data, forma_pagamento=None):
         raise ValueError("Nenhuma forma de pagamento configurada no sistema.")
 
     with transaction.atomic():
-        # 🔐 Gera número de documento com controle de concorrência
-        numero_documento = gerar_numero_documento(empresa, tipo_documento)
+        # 🔐 Gera número de documento (bloco da loja se a série estiver em modo blocos)
+        numero_documento = gerar_numero_documento(
+            empresa, tipo_documento, loja=getattr(vendedor, 'loja_principal', None)
+        )
 
         # 🧾 Inicializa objeto em memória (não salva ainda)
         venda = Venda(
@@ -64,8 +70,9 @@ def criar_venda(empresa, cliente, vendedor, itens_data, forma_pagamento=None):
         venda.save()
 
         # 🧱 Cria itens vinculados
+        itens_venda = []
         for item in itens_data:
-            ItemVenda.objects.create(
+            itens_venda.append(ItemVenda.objects.create(
                 venda=venda,
                 produto=item.get("produto"),
                 servico=item.get("servico"),
@@ -79,7 +86,10 @@ def criar_venda(empresa, cliente, vendedor, itens_data, forma_pagamento=None):
                 subtotal_sem_iva=item["preco_unitario"] * item["quantidade"],
                 total=(item["preco_unitario"] * item["quantidade"] - item.get("desconto_item", Decimal("0.00")))
                       * (1 + getattr(item.get("taxa_iva", None), "tax_percentage", 0) / Decimal("100.00")),
-            )
+            ))
+
+        # 📦 Baixa de estoque por lote (FEFO), de uma vez para todo o cesto
+        AlocacaoLoteService.alocar(itens_venda)
 
         # 🧾 Cria documento fiscal SAF-T AO
         service = DocumentoFiscalService()
@@ -115,6 +125,7 @@ def criar_venda(empresa, cliente, vendedor, itens_data, forma_pagamento=None):
         return venda
 
 
+@transaction.atomic
 def criar_fatura_credito(empresa, cliente, vendedor, itens_data, forma_pagamento=None, data_vencimento=None):
     """
     Cria uma fatura de crédito com itens e gera Documento Fiscal.
@@ -220,6 +231,7 @@ def criar_fatura_credito(empresa, cliente, vendedor, itens_data, forma_pagamento
 
 
 
+@transaction.atomic
 def criar_recibo(empresa, cliente, vendedor, itens_data, forma_pagamento=None):
     """
     Cria um recibo e gera Documento Fiscal.
@@ -318,3 +330,378 @@ def criar_recibo(empresa, cliente, vendedor, itens_data, forma_pagamento=None):
     return recibo
 
 
+
+class MetaVendaService:
+    """
+    Motor de metas e comissões baseado em conjuntos.
+
+    Em vez de uma consulta agregada por meta/vendedor, o realizado de todas as
+    metas do período é obtido com consultas agrupadas por vendedor, loja,
+    categoria de produto e dia. Cada meta é depois avaliada em memória sobre
+    esses agregados, e as comissões são gravadas com ``bulk_create``.
+    """
+
+    STATUS_METAS = ('ativa', 'finalizada')
+    CAMPOS_REALIZADO = [
+        'faturamento_realizado',
+        'quantidade_vendas_realizada',
+        'quantidade_produtos_realizada',
+        'novos_clientes_realizados',
+        'ticket_medio_realizado',
+        'percentual_atingido',
+        'realizado_atualizado_em',
+    ]
+
+    def __init__(self, empresa):
+        self.empresa = empresa
+
+    # ------------------------------------------------------------------
+    # Agregados
+    # ------------------------------------------------------------------
+    def _vendas_finalizadas(self, data_inicio, data_fim):
+        return Venda.objects.filter(
+            empresa=self.empresa,
+            status='finalizada',
+            data_venda__date__gte=data_inicio,
+            data_venda__date__lte=data_fim,
+        )
+
+    def agregar_vendas(self, data_inicio, data_fim):
+        """Faturamento e nº de vendas por (vendedor, loja, dia)"""
+        return list(
+            self._vendas_finalizadas(data_inicio, data_fim)
+            .annotate(dia=TruncDate('data_venda'))
+            .values('vendedor_id', 'loja_id', 'dia')
+            .annotate(faturamento=Sum('total'), quantidade=Count('id'))
+            .order_by()
+        )
+
+    def agregar_itens(self, data_inicio, data_fim):
+        """Quantidade e valor vendidos por (vendedor, loja, categoria, dia)"""
+        return list(
+            ItemVenda.objects.filter(
+                venda__empresa=self.empresa,
+                venda__status='finalizada',
+                venda__data_venda__date__gte=data_inicio,
+                venda__data_venda__date__lte=data_fim,
+            )
+            .annotate(dia=TruncDate('venda__data_venda'))
+            .values('venda__vendedor_id', 'venda__loja_id', 'produto__categoria_id', 'dia')
+            .annotate(quantidade=Sum('quantidade'), faturamento=Sum('total'))
+            .order_by()
+        )
+
+    def _clientes_novos(self, data_inicio, data_fim):
+        """
+        Devolve (vendedor, cliente, dia) das compras no período e a data da
+        primeira compra (em toda a empresa) de cada cliente envolvido.
+        """
+        vendas = self._vendas_finalizadas(data_inicio, data_fim).filter(cliente__isnull=False)
+        compras = list(
+            vendas.annotate(dia=TruncDate('data_venda'))
+            .values_list('vendedor_id', 'cliente_id', 'dia')
+            .distinct()
+            .order_by()
+        )
+        primeiras = dict(
+            Venda.objects.filter(
+                empresa=self.empresa,
+                status='finalizada',
+                cliente_id__in=vendas.values('cliente_id'),
+            )
+            .values('cliente_id')
+            .annotate(primeira=Min(TruncDate('data_venda')))
+            .order_by()
+            .values_list('cliente_id', 'primeira')
+        )
+        return compras, primeiras
+
+    # ------------------------------------------------------------------
+    # Realizado das metas
+    # ------------------------------------------------------------------
+    def calcular_realizado(self, metas):
+        """Realizado de cada meta ({meta.pk: dict}) a partir dos agregados do período"""
+        metas = list(metas)
+        if not metas:
+            return {}
+
+        data_inicio = min(m.data_inicio for m in metas)
+        data_fim = max(m.data_fim for m in metas)
+
+        vendas_por_vendedor = defaultdict(list)
+        for linha in self.agregar_vendas(data_inicio, data_fim):
+            vendas_por_vendedor[linha['vendedor_id']].append(linha)
+
+        itens_por_vendedor = defaultdict(list)
+        for linha in self.agregar_itens(data_inicio, data_fim):
+            itens_por_vendedor[linha['venda__vendedor_id']].append(linha)
+
+        compras, primeiras = self._clientes_novos(data_inicio, data_fim)
+        compras_por_vendedor = defaultdict(list)
+        for vendedor_id, cliente_id, dia in compras:
+            compras_por_vendedor[vendedor_id].append((cliente_id, dia))
+
+        def linhas(indice, meta):
+            if meta.vendedor_id:
+                return indice.get(meta.vendedor_id, [])
+            return [linha for grupo in indice.values() for linha in grupo]
+
+        resultado = {}
+        for meta in metas:
+            no_periodo = lambda dia: meta.data_inicio <= dia <= meta.data_fim
+
+            faturamento = Decimal('0.00')
+            quantidade_vendas = 0
+            for linha in linhas(vendas_por_vendedor, meta):
+                if no_periodo(linha['dia']):
+                    faturamento += linha['faturamento'] or 0
+                    quantidade_vendas += linha['quantidade']
+
+            quantidade_produtos = 0
+            for linha in linhas(itens_por_vendedor, meta):
+                if no_periodo(linha['dia']):
+                    quantidade_produtos += linha['quantidade'] or 0
+
+            clientes = {
+                cliente_id for cliente_id, dia in linhas(compras_por_vendedor, meta)
+                if no_periodo(dia)
+            }
+            novos_clientes = sum(
+                1 for cliente_id in clientes
+                if primeiras.get(cliente_id) and no_periodo(primeiras[cliente_id])
+            )
+
+            resultado[meta.pk] = {
+                'faturamento_realizado': faturamento,
+                'quantidade_vendas_realizada': quantidade_vendas,
+                # Devoluções podem deixar o saldo do período negativo; o
+                # campo é positivo, por isso o realizado não desce de zero.
+                'quantidade_produtos_realizada': max(quantidade_produtos, 0),
+                'ticket_medio_realizado': (
+                    faturamento / quantidade_vendas if quantidade_vendas else 0
+                ),
+                'novos_clientes_realizados': novos_clientes,
+            }
+        return resultado
+
+    def realizado_por_categoria(self, data_inicio, data_fim):
+        """Quantidade e valor vendidos por vendedor, loja e categoria no período"""
+        totais = defaultdict(lambda: {'quantidade': 0, 'faturamento': Decimal('0.00')})
+        for linha in self.agregar_itens(data_inicio, data_fim):
+            chave = (linha['venda__vendedor_id'], linha['venda__loja_id'], linha['produto__categoria_id'])
+            totais[chave]['quantidade'] += linha['quantidade'] or 0
+            totais[chave]['faturamento'] += linha['faturamento'] or 0
+        return dict(totais)
+
+    def metas_do_periodo(self, data_inicio, data_fim):
+        return MetaVenda.objects.filter(
+            empresa=self.empresa,
+            status__in=self.STATUS_METAS,
+            data_inicio__lte=data_fim,
+            data_fim__gte=data_inicio,
+        ).select_related('vendedor')
+
+    def atualizar_metas(self, metas):
+        """
+        Recalcula e grava o realizado das metas (bulk_update). Devolve o
+        realizado por meta e as metas cujo estado de atingimento mudou.
+        """
+        metas = list(metas)
+        realizados = self.calcular_realizado(metas)
+        agora = timezone.now()
+        alteradas = []
+
+        for meta in metas:
+            realizado = realizados[meta.pk]
+            atingida_antes = meta.percentual_atingido >= meta.meta_minima_percentual
+            percentual = Decimal(str(meta.calcular_percentual_geral(realizado))).quantize(
+                Decimal('0.01'), rounding=ROUND_HALF_UP
+            )
+
+            meta.faturamento_realizado = realizado['faturamento_realizado']
+            meta.quantidade_vendas_realizada = realizado['quantidade_vendas_realizada']
+            meta.quantidade_produtos_realizada = realizado['quantidade_produtos_realizada']
+            meta.novos_clientes_realizados = realizado['novos_clientes_realizados']
+            meta.ticket_medio_realizado = Decimal(realizado['ticket_medio_realizado']).quantize(
+                Decimal('0.01'), rounding=ROUND_HALF_UP
+            )
+            meta.percentual_atingido = percentual
+            meta.realizado_atualizado_em = agora
+
+            if (percentual >= meta.meta_minima_percentual) != atingida_antes:
+                alteradas.append(meta)
+
+        MetaVenda.objects.bulk_update(metas, self.CAMPOS_REALIZADO, batch_size=500)
+        return realizados, alteradas
+
+    # ------------------------------------------------------------------
+    # Comissões
+    # ------------------------------------------------------------------
+    def gerar_comissoes(self, vendas, metas):
+        """
+        Gera/atualiza as comissões das vendas finalizadas. O percentual é o
+        ``comissao_percentual`` do vendedor mais a comissão extra das metas
+        atingidas desse vendedor cujo período inclua a data da venda.
+        Comissões já pagas não são alteradas.
+        """
+        metas_atingidas = defaultdict(list)
+        for meta in metas:
+            if meta.vendedor_id and meta.percentual_atingido >= meta.meta_minima_percentual:
+                metas_atingidas[meta.vendedor_id].append(meta)
+
+        vendas = (
+            vendas.filter(status='finalizada', vendedor__usuario__isnull=False)
+            .select_related('vendedor')
+            .only('id', 'numero_documento', 'total', 'vendedor__id',
+                  'vendedor__usuario_id', 'vendedor__comissao_percentual')
+            .annotate(dia=TruncDate('data_venda'))
+        )
+        pagas = set(
+            Comissao.objects.filter(venda__in=vendas, status='paga').values_list('venda_id', 'vendedor_id')
+        )
+
+        comissoes = []
+        for venda in vendas.iterator(chunk_size=2000):
+            vendedor = venda.vendedor
+            if (venda.id, vendedor.usuario_id) in pagas:
+                continue
+
+            extras = [
+                meta for meta in metas_atingidas.get(vendedor.id, [])
+                if meta.data_inicio <= venda.dia <= meta.data_fim
+            ]
+            percentual = (vendedor.comissao_percentual or Decimal('0')) + sum(
+                (meta.comissao_extra_percentual for meta in extras), Decimal('0')
+            )
+            if percentual <= 0:
+                continue
+
+            observacoes = f"Venda {venda.numero_documento or venda.id}"
+            if extras:
+                observacoes += ' + extra ' + ', '.join(m.codigo_meta or str(m.pk) for m in extras)
+
+            comissoes.append(Comissao(
+                venda_id=venda.id,
+                vendedor_id=vendedor.usuario_id,
+                valor_base=venda.total,
+                percentual=percentual,
+                valor_comissao=(venda.total * percentual / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+                status='pendente',
+                observacoes=observacoes[:200],
+            ))
+
+        Comissao.objects.bulk_create(
+            comissoes,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['venda', 'vendedor'],
+            update_fields=['valor_base', 'percentual', 'valor_comissao', 'status', 'observacoes'],
+        )
+        return len(comissoes)
+
+    def cancelar_comissoes(self, vendas):
+        """Cancela as comissões pendentes de vendas que deixaram de estar finalizadas"""
+        return Comissao.objects.filter(
+            venda__in=vendas.exclude(status='finalizada'),
+            status='pendente',
+        ).update(status='cancelada')
+
+    # ------------------------------------------------------------------
+    # Execução
+    # ------------------------------------------------------------------
+    def ultima_execucao(self):
+        return ExecucaoComissao.objects.filter(
+            empresa=self.empresa,
+            concluido_em__isnull=False,
+        ).order_by('-iniciado_em').first()
+
+    @transaction.atomic
+    def executar(self, data_inicio=None, data_fim=None, vendedor=None):
+        """
+        Execução completa: recalcula todas as metas do período e (re)gera as
+        comissões das vendas finalizadas do período.
+        """
+        hoje = timezone.now().date()
+        data_inicio = data_inicio or hoje.replace(day=1)
+        data_fim = data_fim or hoje
+        execucao = ExecucaoComissao.objects.create(
+            empresa=self.empresa, modo='completo', iniciado_em=timezone.now(),
+            data_inicio=data_inicio, data_fim=data_fim,
+        )
+
+        metas = list(self.metas_do_periodo(data_inicio, data_fim))
+        self.atualizar_metas(metas)
+
+        vendas = self._vendas_finalizadas(data_inicio, data_fim)
+        if vendedor:
+            vendas = vendas.filter(vendedor=vendedor)
+
+        execucao.metas_recalculadas = len(metas)
+        execucao.vendas_processadas = vendas.count()
+        execucao.comissoes_geradas = self.gerar_comissoes(vendas, metas)
+        execucao.concluido_em = timezone.now()
+        execucao.save()
+        return execucao
+
+    @transaction.atomic
+    def executar_incremental(self):
+        """
+        Execução incremental: só considera vendas criadas/alteradas desde o
+        início da última execução concluída e só recalcula as metas que essas
+        vendas tocam. Sem execução anterior, faz uma execução completa.
+        """
+        ultima = self.ultima_execucao()
+        if not ultima:
+            return self.executar()
+
+        execucao = ExecucaoComissao.objects.create(
+            empresa=self.empresa, modo='incremental', iniciado_em=timezone.now(),
+        )
+        alteradas = Venda.objects.filter(empresa=self.empresa, updated_at__gte=ultima.iniciado_em)
+        tocadas = set(
+            alteradas.annotate(dia=TruncDate('data_venda'))
+            .values_list('vendedor_id', 'dia')
+            .distinct()
+            .order_by()
+        )
+
+        metas = []
+        if tocadas:
+            dias = [dia for _, dia in tocadas]
+            candidatas = self.metas_do_periodo(min(dias), max(dias))
+            metas = [
+                meta for meta in candidatas
+                if any(
+                    (meta.vendedor_id is None or meta.vendedor_id == vendedor_id)
+                    and meta.data_inicio <= dia <= meta.data_fim
+                    for vendedor_id, dia in tocadas
+                )
+            ]
+        _, metas_alteradas = self.atualizar_metas(metas)
+
+        # Se uma meta passou a estar (ou deixou de estar) atingida, o
+        # percentual extra muda para todas as vendas do seu período.
+        filtro = Q(pk__in=alteradas.values('pk'))
+        for meta in metas_alteradas:
+            if meta.vendedor_id:
+                filtro |= Q(
+                    vendedor_id=meta.vendedor_id,
+                    data_venda__date__gte=meta.data_inicio,
+                    data_venda__date__lte=meta.data_fim,
+                )
+        vendas = Venda.objects.filter(filtro, empresa=self.empresa)
+
+        self.cancelar_comissoes(alteradas)
+        comissoes_geradas = 0
+        if tocadas:
+            inicios = dias + [meta.data_inicio for meta in metas]
+            fins = dias + [meta.data_fim for meta in metas]
+            metas_comissao = list(self.metas_do_periodo(min(inicios), max(fins)))
+            comissoes_geradas = self.gerar_comissoes(vendas, metas_comissao)
+
+        execucao.metas_recalculadas = len(metas)
+        execucao.vendas_processadas = vendas.count()
+        execucao.comissoes_geradas = comissoes_geradas
+        execucao.concluido_em = timezone.now()
+        execucao.save()
+        return execucao
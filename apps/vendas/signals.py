@@ -1,13 +1,102 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from apps.vendas.models import Venda
-from apps.clientes.models import Ponto
+from django.utils import timezone
+from apps.vendas.models import CAMPOS_ESTATISTICA_CLIENTE, ItemDevolucao, ItemNotaCredito, Venda
+from apps.clientes.services import STATUS_COMPRA, EstatisticaClienteService, FidelidadeService
+from apps.core.services import CacheBIService
+from apps.produtos.services import AlocacaoLoteService
+
+# =====================================
+# PONTOS E ESTATÍSTICAS DO CLIENTE
+# =====================================
+
+def _afeta_estatisticas(update_fields):
+    if update_fields is None:
+        return True
+    return bool({'cliente', 'cliente_id', 'status', 'total', 'valor_pago'} & set(update_fields))
+
 
 @receiver(post_save, sender=Venda)
-def gerar_pontos(sender, instance, created, **kwargs):
-    if created and instance.cliente:  # 🔹 só cria ponto se houver cliente
-        # 1 ponto = 1 Kz gasto
-        Ponto.objects.create(
-            cliente=instance.cliente,
-            valor=instance.total,
+def gerar_pontos(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Acumulação única (idempotente) dos pontos da venda; estorno no cancelamento"""
+    if raw or not instance.cliente_id or not _afeta_estatisticas(update_fields):
+        return
+    anterior = None if created else getattr(instance, '_estado_estatistica', None)
+    if anterior == instance.estado_estatistica():
+        return
+    if instance.status in STATUS_COMPRA:
+        FidelidadeService.acumular_venda(instance)
+    elif instance.status == 'cancelada':
+        FidelidadeService.estornar_venda(instance)
+
+
+@receiver(pre_save, sender=Venda)
+def capturar_estado_estatistica(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Instâncias não carregadas da BD (ou com campos diferidos) leem o estado anterior"""
+    if raw or instance._state.adding or hasattr(instance, '_estado_estatistica'):
+        return
+    if not _afeta_estatisticas(update_fields):
+        return
+    anterior = Venda.objects.filter(pk=instance.pk).values_list(*sorted(CAMPOS_ESTATISTICA_CLIENTE)).first()
+    if anterior:
+        valores = dict(zip(sorted(CAMPOS_ESTATISTICA_CLIENTE), anterior))
+        instance._estado_estatistica = (
+            valores['cliente_id'], valores['status'], valores['total'], valores['valor_pago'],
         )
+
+
+@receiver(post_save, sender=Venda)
+def atualizar_estatisticas_venda(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or not _afeta_estatisticas(update_fields):
+        return
+    anterior = None if created else getattr(instance, '_estado_estatistica', None)
+    atual = instance.estado_estatistica()
+    data_compra = timezone.localdate(instance.data_venda) if instance.data_venda else None
+    EstatisticaClienteService.registrar_venda(anterior, atual, data_compra=data_compra)
+    instance._estado_estatistica = atual
+
+
+@receiver(post_delete, sender=Venda)
+def remover_estatisticas_venda(sender, instance, **kwargs):
+    anterior = getattr(instance, '_estado_estatistica', None) or instance.estado_estatistica()
+    EstatisticaClienteService.registrar_venda(anterior, None)
+
+
+# =====================================
+# CACHE DE B.I.
+# =====================================
+
+@receiver(post_save, sender=Venda)
+def invalidar_cache_bi_venda(sender, instance, raw=False, **kwargs):
+    """Só a geração da empresa da venda é incrementada (após o commit)"""
+    if raw or not instance.empresa_id:
+        return
+    CacheBIService.invalidar_vendas(instance.empresa_id)
+
+
+@receiver(post_delete, sender=Venda)
+def invalidar_cache_bi_venda_removida(sender, instance, **kwargs):
+    if instance.empresa_id:
+        CacheBIService.invalidar_vendas(instance.empresa_id)
+
+
+# =====================================
+# LOTES (FEFO)
+# =====================================
+
+@receiver(post_save, sender=ItemDevolucao)
+def repor_lotes_devolucao(sender, instance, created, raw=False, **kwargs):
+    """Os itens devolvidos voltam aos lotes de onde saíram"""
+    if raw or not created:
+        return
+    AlocacaoLoteService.reverter([(instance.item_venda_original_id, instance.quantidade_devolvida)])
+
+
+@receiver(post_save, sender=ItemNotaCredito)
+def repor_lotes_nota_credito(sender, instance, created, raw=False, **kwargs):
+    """Notas de crédito por devolução repõem os lotes do item da venda original"""
+    if raw or not created or not instance.item_venda_original_id:
+        return
+    if instance.nota_credito.tipo_nota != 'devolucao':
+        return
+    AlocacaoLoteService.reverter([(instance.item_venda_original_id, instance.quantidade_creditada)])
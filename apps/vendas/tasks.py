@@ -1,4 +1,5 @@
 # apps/vendas/tasks.py (NOVO ARQUIVO)
+import logging
 from celery import shared_task
 from django.db.models import F, Sum, DecimalField
 from datetime import timedelta
@@ -6,6 +7,8 @@ from django.utils import timezone
 from apps.produtos.models import Produto # Ajuste o caminho
 # from apps.users.utils import enviar_email_alerta # Importe sua função de e-mail
 
+logger = logging.getLogger(__name__)
+
 @shared_task
 def verificar_margem_critica():
     """
@@ -59,17 +62,18 @@ def verificar_stock_critico():
     Tarefa Celery para verificar o stock mínimo.
     """
     alertas = []
-    # Assumindo que o seu modelo Produto tem um campo 'stock_atual' e 'stock_minimo'
-    produtos_criticos = Produto.objects.filter(stock_atual__lte=F('stock_minimo'))
+    produtos_criticos = Produto.objects.filter(
+        ativo=True, estoque_minimo__gt=0, estoque_atual__lte=F('estoque_minimo')
+    ).values_list('nome_produto', 'estoque_atual')
     
-    for produto in produtos_criticos:
-        alertas.append(f"{produto.nome} (Stock: {produto.stock_atual})")
+    for nome, estoque in produtos_criticos:
+        alertas.append(f"{nome} (Stock: {estoque})")
         
     if alertas:
         assunto = "🛑 ALERTA DE STOCK: Baixo Stock Mínimo Atingido"
         corpo = "Os seguintes produtos atingiram ou ultrapassaram o stock mínimo:\n\n"
         corpo += "\n".join([f"- {a}" for a in alertas])
-        corpo += "\n**Ação Imediata Necessária: Gerar ordem de compra.**"
+        corpo += "\n**Os pedidos em rascunho são gerados pelo plano de reposição diário.**"
         
         # enviar_email_alerta(assunto, corpo, destinatarios=['logistica@empresa.com'])
         print(f"ALERTE ENVIADO: {assunto}") # Simulação de envio
@@ -77,3 +81,21 @@ def verificar_stock_critico():
         
     return "Verificação de stock concluída. Sem alertas."
 
+
+@shared_task
+def calcular_comissoes_incremental_task():
+    """
+    Recalcula metas e comissões de todas as empresas ativas em modo
+    incremental (só vendas alteradas desde a última execução).
+    """
+    from apps.core.models import Empresa
+    from apps.vendas.services import MetaVendaService
+
+    total = 0
+    for empresa in Empresa.objects.filter(ativa=True):
+        try:
+            total += MetaVendaService(empresa).executar_incremental().comissoes_geradas
+        except Exception:
+            logger.exception(f'Erro ao calcular comissões da empresa {empresa.id}')
+    logger.info(f'Comissões atualizadas: {total}')
+    return f"Comissões atualizadas: {total}."
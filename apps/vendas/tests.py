@@ -1,3 +1,115 @@
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+
+from apps.core.models import Empresa, Loja
+from apps.funcionarios.models import Cargo, Departamento, Funcionario
+from apps.vendas.models import Comissao, FormaPagamento, MetaVenda, Venda
+from apps.vendas.services import MetaVendaService
+
+
+class MetaVendaServiceTest(TestCase):
+    """Realizado das metas e comissões calculados em conjunto"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            nome='Farmácia Metas', nif='5000000070', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', provincia='Luanda', postal='0000', telefone='900000000', email='metas@exemplo.ao',
+        )
+        cls.loja = Loja.objects.create(
+            empresa=cls.empresa, nome='Loja', codigo='L1', endereco='Rua 1', bairro='Centro',
+            cidade='Luanda', postal='0000', provincia='Luanda',
+        )
+        cls.forma_pagamento = FormaPagamento.objects.create(empresa=cls.empresa, nome='Dinheiro')
+        cls.gestor = get_user_model().objects.create(username='gestor_metas', empresa=cls.empresa)
+        cargo = Cargo.objects.create(empresa=cls.empresa, nome='Vendedor', codigo='VEND70')
+        departamento = Departamento.objects.create(nome='Vendas', codigo='VND70', loja=cls.loja)
+        cls.vendedores = [
+            Funcionario.objects.create(
+                empresa=cls.empresa, nome_completo=f'Vendedor {indice}', bi=f'500000007{indice}',
+                data_nascimento=date(1990, 1, 1), sexo='M', endereco='Rua 1', numero='1', bairro='Centro',
+                cidade='Luanda', postal='0000', cargo=cargo, departamento=departamento,
+                loja_principal=cls.loja, data_admissao=date(2024, 1, 1), salario_atual=Decimal('1000'),
+                usuario=get_user_model().objects.create(username=f'vendedor_{indice}', empresa=cls.empresa),
+                comissao_percentual=Decimal('2'),
+            )
+            for indice in range(2)
+        ]
+
+        cls.hoje = timezone.localdate()
+        cls.inicio = cls.hoje.replace(day=1)
+
+    def setUp(self):
+        # Vendedor 0 atinge a meta (250 de 200); vendedor 1 fica nos 10%
+        self.metas = [
+            self._meta(vendedor, meta_faturamento)
+            for vendedor, meta_faturamento in zip(self.vendedores, ('200', '1000'))
+        ]
+        self.vendas = [
+            self._venda(numero, vendedor, total)
+            for numero, (vendedor, total) in enumerate(
+                [(self.vendedores[0], '150'), (self.vendedores[0], '100'), (self.vendedores[1], '100')], start=1
+            )
+        ]
+
+    def _meta(self, vendedor, meta_faturamento):
+        return MetaVenda.objects.create(
+            nome=f'Meta {vendedor.nome_completo}', empresa=self.empresa, vendedor=vendedor,
+            mes=self.hoje.month, ano=self.hoje.year, data_inicio=self.inicio, data_fim=self.hoje,
+            meta_faturamento=Decimal(meta_faturamento), comissao_extra_percentual=Decimal('1'),
+            criado_por=self.gestor,
+        )
+
+    def _venda(self, numero, vendedor, total):
+        return Venda.objects.create(
+            empresa=self.empresa, loja=self.loja, vendedor=vendedor, forma_pagamento=self.forma_pagamento,
+            numero_documento=f'FR METAS/{numero}', subtotal=Decimal(total), total=Decimal(total),
+        )
+
+    def _comissoes(self):
+        return {
+            comissao.venda_id: (comissao.percentual, comissao.valor_comissao, comissao.status)
+            for comissao in Comissao.objects.filter(venda__empresa=self.empresa)
+        }
+
+    def test_realizado_das_metas(self):
+        MetaVendaService(self.empresa).executar(self.inicio, self.hoje)
+
+        atingida, falhada = [MetaVenda.objects.get(pk=meta.pk) for meta in self.metas]
+        self.assertEqual(
+            (atingida.faturamento_realizado, atingida.quantidade_vendas_realizada, atingida.percentual_atingido),
+            (Decimal('250'), 2, Decimal('125.00')),
+        )
+        self.assertEqual(
+            (falhada.faturamento_realizado, falhada.quantidade_vendas_realizada, falhada.percentual_atingido),
+            (Decimal('100'), 1, Decimal('10.00')),
+        )
+        self.assertIsNotNone(atingida.realizado_atualizado_em)
+
+    def test_comissoes_com_extra_das_metas_atingidas(self):
+        execucao = MetaVendaService(self.empresa).executar(self.inicio, self.hoje)
+
+        self.assertEqual((execucao.metas_recalculadas, execucao.vendas_processadas), (2, 3))
+        self.assertEqual(execucao.comissoes_geradas, 3)
+        self.assertEqual(self._comissoes(), {
+            self.vendas[0].pk: (Decimal('3.00'), Decimal('4.50'), 'pendente'),
+            self.vendas[1].pk: (Decimal('3.00'), Decimal('3.00'), 'pendente'),
+            self.vendas[2].pk: (Decimal('2.00'), Decimal('2.00'), 'pendente'),
+        })
+
+    def test_nova_execucao_atualiza_sem_duplicar_nem_tocar_nas_pagas(self):
+        service = MetaVendaService(self.empresa)
+        service.executar(self.inicio, self.hoje)
+        Comissao.objects.filter(venda=self.vendas[0]).update(status='paga', percentual=Decimal('5'))
+        Venda.objects.filter(pk=self.vendas[2].pk).update(total=Decimal('300'))
+
+        service.executar(self.inicio, self.hoje)
 
-# Create your tests here.
+        comissoes = self._comissoes()
+        self.assertEqual(Comissao.objects.filter(venda__empresa=self.empresa).count(), 3)
+        self.assertEqual(comissoes[self.vendas[0].pk], (Decimal('5.00'), Decimal('4.50'), 'paga'))
+        self.assertEqual(comissoes[self.vendas[2].pk], (Decimal('2.00'), Decimal('6.00'), 'pendente'))
@@ -85,6 +85,7 @@ urlpatterns = [
     
     # API de B.I. (NOVA)
     path('v1/relatorios/rentabilidade/', views.RentabilidadeAPIView.as_view(), name='rentabilidade-api'),
+    path('v1/relatorios/cache-bi/metricas/', views.CacheBIMetricasAPIView.as_view(), name='cache-bi-metricas-api'),
     
     # =====================================
     # 8. GESTÃO DE DOCUMENTOS (LISTAS)
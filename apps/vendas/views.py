@@ -11,11 +11,9 @@ from django.views import View
 from django.views.generic import (
     ListView, DetailView, CreateView, UpdateView, DeleteView
 )
-from django.core.cache import caches
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
-from requests import Response, request
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.db import transaction
@@ -27,13 +25,15 @@ from apps.fiscal.services import DocumentoFiscalService
 from apps.funcionarios.models import Funcionario
 from apps.funcionarios.utils import funcionario_tem_turno_aberto
 from apps.produtos.models import Produto
+from apps.produtos.services import AlocacaoLoteService
 from apps.servicos.models import Servico
 from apps.vendas.api.serializers import ItemVendaSerializer, VendaSerializer
 from datetime import timedelta
 from .models import (
     Comissao, Convenio, Entrega, Orcamento, ItemOrcamento, Venda, ItemVenda, PagamentoVenda,
-    DevolucaoVenda, ItemDevolucao, FormaPagamento
+    DevolucaoVenda, ItemDevolucao, FormaPagamento, MetaVenda
 )
+from .services import MetaVendaService
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
@@ -81,7 +81,7 @@ import json
 
 from .models import *
 from .forms import *
-from apps.clientes.models import Cliente, EnderecoCliente, Ponto
+from apps.clientes.models import Cliente, EnderecoCliente
 from apps.produtos.models import Produto
 from apps.funcionarios.models import Funcionario
 from apps.servicos.models import Servico
@@ -154,7 +154,8 @@ from rest_framework import generics, status
 from rest_framework.response import Response
 from django.db import transaction
 from .tasks import verificar_margem_critica # Importe a tarefa Celery
-from django.core.cache import caches
+from django.db.models import DecimalField
+from apps.core.services import CacheBIService, PlaneadorKPIService
 from .models import (
     Venda, NotaCredito, ItemNotaCredito, NotaDebito,
     ItemNotaDebito, DocumentoTransporte, ItemDocumentoTransporte
@@ -686,25 +687,10 @@ class VendaDashboardView(BaseVendaView, TemplateView):
         hoje = timezone.now().date()
         mes_atual = hoje.replace(day=1)
         
-        # Vendas hoje
-        vendas_hoje = Venda.objects.filter(
-            empresa=empresa,
-            data_venda__date=hoje,
-            status='finalizada'
-        ).aggregate(
-            total=Sum('total'),
-            quantidade=Count('id')
-        )
-        
-        # Vendas do mês
-        vendas_mes = Venda.objects.filter(
-            empresa=empresa,
-            data_venda__gte=mes_atual,
-            status='finalizada'
-        ).aggregate(
-            total=Sum('total'),
-            quantidade=Count('id')
-        )
+        # Totais do dia e do mês numa única consulta (apps/vendas/kpis.py)
+        kpis = PlaneadorKPIService(empresa).executar('vendas', hoje=hoje)
+        vendas_hoje = {'total': kpis['vendas_hoje_total'], 'quantidade': kpis['vendas_hoje_quantidade']}
+        vendas_mes = {'total': kpis['vendas_mes_total'], 'quantidade': kpis['vendas_mes_quantidade']}
         
         # Top produtos
         top_produtos = ItemVenda.objects.filter(
@@ -961,15 +947,9 @@ class DevolucaoVendaView(BaseVendaView, CreateView):
         form.instance.usuario_criacao = self.request.user
         
         with transaction.atomic():
+            # O estoque dos itens devolvidos é reposto nos lotes de origem (signal do ItemDevolucao)
             response = super().form_valid(form)
             
-            # Processar devolução dos itens
-            devolucao = form.instance
-            for item_dev in devolucao.itens.all():
-                produto = item_dev.produto
-                produto.estoque_atual += item_dev.quantidade
-                produto.save()
-            
             messages.success(self.request, f'Devolução registrada com sucesso!')
             return response
 
@@ -1261,15 +1241,19 @@ class MetasVendaView(BaseVendaView, TemplateView):
         hoje = timezone.now().date()
         mes_atual = hoje.replace(day=1)
         
-        # Buscar metas do mês
-        try:
-            meta_mes = MetaVenda.objects.get(
+        # Metas do mês avaliadas em conjunto (consultas agrupadas, sem gravar)
+        service = MetaVendaService(empresa)
+        metas = list(
+            MetaVenda.objects.filter(
                 empresa=empresa,
                 mes=mes_atual.month,
                 ano=mes_atual.year
-            )
-        except MetaVenda.DoesNotExist:
-            meta_mes = None
+            ).exclude(status='cancelada').select_related('vendedor')
+        )
+        realizados = service.calcular_realizado(metas)
+        relatorios = [meta.gerar_relatorio_atingimento(realizados[meta.pk]) for meta in metas]
+        
+        meta_mes = next((meta for meta in metas if meta.vendedor_id is None), None)
         
         # Vendas realizadas no mês
         vendas_mes = Venda.objects.filter(
@@ -1286,15 +1270,14 @@ class MetasVendaView(BaseVendaView, TemplateView):
         percentual_quantidade = 0
         
         if meta_mes:
-            if meta_mes.meta_faturamento > 0:
-                percentual_faturamento = (vendas_mes['total_vendido'] or 0) / meta_mes.meta_faturamento * 100
-            
-            if meta_mes.meta_quantidade > 0:
-                percentual_quantidade = (vendas_mes['quantidade_vendas'] or 0) / meta_mes.meta_quantidade * 100
+            percentuais = meta_mes.calcular_percentual_atingimento(realizados[meta_mes.pk])
+            percentual_faturamento = percentuais.get('faturamento', 0)
+            percentual_quantidade = percentuais.get('quantidade_vendas', 0)
         
         context.update({
             'title': 'Metas de Vendas',
             'meta_mes': meta_mes,
+            'metas': relatorios,
             'vendas_mes': vendas_mes,
             'percentual_faturamento': percentual_faturamento,
             'percentual_quantidade': percentual_quantidade,
@@ -1326,22 +1309,22 @@ class CalcularComissaoView(BaseVendaView, TemplateView):
         ano = int(request.POST.get('ano'))
         vendedor_id = request.POST.get('vendedor_id')
         
-        # Filtros
-        vendas = Venda.objects.filter(
-            empresa=self.get_empresa(),
-            data_venda__month=mes,
-            data_venda__year=ano,
-            status='finalizada'
-        )
+        empresa = self.get_empresa()
+        data_inicio = date(ano, mes, 1)
+        data_fim = (data_inicio + timedelta(days=32)).replace(day=1) - timedelta(days=1)
         
+        vendedor = None
         if vendedor_id:
-            vendas = vendas.filter(vendedor_id=vendedor_id)
+            vendedor = get_object_or_404(Funcionario, pk=vendedor_id, empresa=empresa)
         
-        # Calcular comissões
-        for venda in vendas:
-            Comissao.calcular_comissao(venda)
+        # Recalcular metas e comissões do mês num único processamento
+        execucao = MetaVendaService(empresa).executar(data_inicio, data_fim, vendedor=vendedor)
         
-        messages.success(request, 'Comissões calculadas com sucesso!')
+        messages.success(
+            request,
+            f'Comissões calculadas com sucesso! {execucao.comissoes_geradas} comissões geradas '
+            f'em {execucao.vendas_processadas} vendas.'
+        )
         return redirect('vendas:comissao_lista')
     
     def get_context_data(self, **kwargs):
@@ -1663,19 +1646,19 @@ class PDVCreateAPIView(APIView):
                 venda = venda_serializer.save()
 
                 # 2. Serializar e validar os dados dos itens da venda
+                itens_venda = []
                 for item_data in itens_data:
                     item_data['venda'] = venda.id  # Vincula o item à venda recém-criada
                     item_serializer = ItemVendaSerializer(data=item_data)
 
                     if item_serializer.is_valid():
-                        item_serializer.save()
-                        # Lógica de atualização de estoque
-                        produto = item_serializer.validated_data['produto']
-                        produto.estoque_atual -= item_serializer.validated_data['quantidade']
-                        produto.save()
+                        itens_venda.append(item_serializer.save())
                     else:
                         raise ValueError(f"Dados do item inválidos: {item_serializer.errors}")
 
+                # 3. Baixa de estoque por lote (FEFO) para todo o cesto
+                AlocacaoLoteService.alocar(itens_venda)
+
                 return Response(VendaSerializer(venda).data, status=status.HTTP_201_CREATED)
             else:
                 return Response(venda_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -1917,18 +1900,12 @@ def finalizar_venda_api(request):
         venda.troco = valor_pago_decimal - venda.total if valor_pago_decimal >= venda.total else Decimal('0.00')
         venda.save(update_fields=['valor_pago', 'troco'])
 
-        # Registrar pagamento e pontos do cliente
+        # Registrar pagamento (os pontos do cliente são acumulados pelo signal da venda)
         PagamentoVenda.objects.create(
             venda=venda,
             forma_pagamento=forma_pagamento,
             valor_pago=valor_pago_decimal
         )
-        if cliente:
-            Ponto.objects.create(
-                cliente=cliente,
-                valor=venda.total,
-                data=timezone.now().date()
-            )
 
         return JsonResponse({
             'success': True,
@@ -3228,12 +3205,8 @@ def liquidar_fatura_api(request, fatura_id):
             )
             print("[TRANSAÇÃO] Movimentação Financeira criada com sucesso.")
 
-            # --- 7. Atualizar estoque dos produtos (se necessário) ---
-            for item in fatura.itens.filter(produto__isnull=False):
-                if item.produto:
-                    item.produto.estoque_atual = F('estoque_atual') - item.quantidade
-                    item.produto.save(update_fields=['estoque_atual'])
-                    print(f"[ESTOQUE] Produto {item.produto.nome_produto}: -{item.quantidade}")
+            # --- 7. Atualizar estoque dos produtos (lotes FEFO) ---
+            AlocacaoLoteService.alocar(list(fatura.itens.filter(produto__isnull=False).select_related('fatura')))
 
         # --- Resposta de Sucesso ---
         print(f"[SUCESSO] Transação Atómica CONCLUÍDA. Fatura {fatura.numero_documento} liquidada.")
@@ -3344,10 +3317,11 @@ def _converter_para_fatura_recibo(proforma, user):
     )
     
     # Converter itens da proforma seguindo estrutura da finalizar_venda_api
+    itens_produto = []
     for item_proforma in proforma.itens.all():
         if item_proforma.produto:
             # Item de produto
-            ItemVenda.objects.create(
+            itens_produto.append(ItemVenda.objects.create(
                 venda=venda,
                 produto=item_proforma.produto,
                 nome_produto=item_proforma.produto.nome_produto,
@@ -3358,11 +3332,7 @@ def _converter_para_fatura_recibo(proforma, user):
                 taxa_iva=item_proforma.produto.taxa_iva,
                 iva_valor=item_proforma.iva_valor,
                 total=item_proforma.total
-            )
-            
-            # Atualizar estoque 
-            item_proforma.produto.estoque_atual = F('estoque_atual') - item_proforma.quantidade
-            item_proforma.produto.save(update_fields=['estoque_atual'])
+            ))
             
         elif item_proforma.servico:
             # Item de serviço
@@ -3380,6 +3350,8 @@ def _converter_para_fatura_recibo(proforma, user):
                 iva_valor=item_proforma.iva_valor,
                 total=item_proforma.total
             )
+
+    AlocacaoLoteService.alocar(itens_produto)
     
     return venda
 
@@ -5329,10 +5301,11 @@ def estatisticas_rapidas_api(request):
 # apps/vendas/views.py
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
+from apps.core.mixins import APIOtimizadaMixin
 from apps.vendas.models import Venda
 
 
-class VendaViewSet(viewsets.ModelViewSet):
+class VendaViewSet(APIOtimizadaMixin, viewsets.ModelViewSet):
     """
     API Endpoints para gestão de Vendas/Documentos Fiscais.
     A criação de uma Venda dispara a lógica de HASH e ATCUD.
@@ -5340,6 +5313,9 @@ class VendaViewSet(viewsets.ModelViewSet):
     queryset = Venda.objects.all().order_by('-data_venda')
     serializer_class = VendaSerializer
     permission_classes = [permissions.IsAuthenticated] # Ajuste as permissões conforme a sua lógica
+    # Cursor sobre os índices (empresa, id) e (empresa, data_venda)
+    ordenacao_cursor = '-pk'
+    campos_cursor = ('data_venda',)
 
     def get_queryset(self):
         # Filtro de segurança: apenas vendas da empresa do utilizador
@@ -5364,7 +5340,6 @@ class VendaViewSet(viewsets.ModelViewSet):
 
 
 
-bi_cache = caches["B_I"]
 class VendaCreateAPIView(generics.CreateAPIView):
     """
     Endpoint para criar uma nova venda e gerar o documento fiscal (HASH, ATCUD).
@@ -5418,10 +5393,8 @@ class VendaCreateAPIView(generics.CreateAPIView):
                 # 2. Disparar Tarefas Assíncronas (Alertas)
                 verificar_margem_critica.delay() 
                 
-                # 🛑 3. INVALICAÇÃO INTELIGENTE DE CACHE (CRÍTICO PARA B.I.)
-                # Limpa TODA a cache de B.I., forçando o Dashboard a recalcular.
-                bi_cache.clear() 
-                print("CACHE DE B.I. INVALIDADA: Nova venda registrada. Forçando recálculo do Dashboard.")
+                # 3. A cache de B.I. desta empresa é invalidada pelo signal da
+                # Venda (geração por empresa, após o commit).
             
             headers = self.get_success_headers(serializer.data)
             return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
@@ -5440,59 +5413,60 @@ class VendaCreateAPIView(generics.CreateAPIView):
 
 class RentabilidadeAPIView(APIView):
     """
-    Endpoint de Rentabilidade com camada de Caching Redis.
+    Endpoint de Rentabilidade com cache de B.I. por empresa (CacheBIService).
     """
-    
-    # TTL (Time To Live): 1 hora = 3600 segundos. Suficiente para B.I.
-    CACHE_TTL = 60 * 60 
+
+    permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
+        empresa = getattr(request.user, 'empresa', None)
+        if empresa is None:
+            return Response({"detail": "Utilizador sem empresa associada."}, status=status.HTTP_403_FORBIDDEN)
+
         data_inicio = request.query_params.get('data_inicio', 'all')
         data_fim = request.query_params.get('data_fim', 'all')
-        
-        # 1. Geração da Chave Única de Cache
-        # A chave DEVE incluir os filtros de data para evitar cache de dados errados.
-        cache_key = f"bi_rentabilidade_{data_inicio}_{data_fim}"
-        
-        # 2. TENTATIVA DE RECUPERAR DADOS DO CACHE
-        dados_cache = bi_cache.get(cache_key)
-        
-        if dados_cache:
-            # Hit de Cache: Resposta RÁPIDA (Não toca no DB)
-            print(f"CACHE HIT: Servindo dados de Rentabilidade da chave {cache_key}")
-            return Response(dados_cache)
+        parametros = {'data_inicio': data_inicio, 'data_fim': data_fim}
+
+        def calcular():
+            filtros = {'venda__empresa': empresa, 'venda__status': 'finalizada', 'produto__isnull': False}
+            if data_inicio != 'all':
+                filtros['venda__data_venda__date__gte'] = data_inicio
+            if data_fim != 'all':
+                filtros['venda__data_venda__date__lte'] = data_fim
+
+            resultados = ItemVenda.objects.filter(**filtros).values('produto_id').annotate(
+                produto_nome=F('produto__nome_produto'),
+                quantidade_total=Sum('quantidade'),
+                total_vendido=Sum('subtotal_sem_iva'),
+                custo_total=Sum(F('quantidade') * F('produto__preco_custo'), output_field=DecimalField()),
+            ).annotate(
+                margem_bruta=F('total_vendido') - F('custo_total'),
+            ).order_by('-margem_bruta')
+
+            linhas = []
+            for linha in resultados:
+                total = linha['total_vendido'] or Decimal('0')
+                linha['percentual_margem_bruta'] = (
+                    (linha['margem_bruta'] * 100 / total).quantize(Decimal('0.01')) if total else Decimal('0')
+                )
+                linhas.append(linha)
+            return list(RentabilidadeItemSerializer(linhas, many=True).data)
 
-        # 3. Cache Miss: Executar CÁLCULOS PESADOS NO DB
-        print(f"CACHE MISS: A calcular dados de Rentabilidade e a gravar cache.")
-        
-        filtros = {}
-        if data_inicio != 'all':
-            filtros['venda__data_venda__gte'] = data_inicio
-        if data_fim != 'all':
-            filtros['venda__data_venda__lte'] = data_fim
+        dados = CacheBIService(empresa.pk, 'rentabilidade').obter(parametros, calcular)
+        return Response({
+            "relatorio_de_rentabilidade": dados,
+            "filtros_aplicados": parametros,
+        })
 
-        # Lógica de Agregação (A mesma lógica de cálculo pesado de Margem Bruta)
-        resultados = VendaItem.objects.filter(**filtros).select_related('produto').values(
-            'produto_id', 'produto__nome'
-        ).annotate(
-            total_vendido=Sum(F('quantidade') * F('preco_venda')),
-            custo_total=Sum(F('quantidade') * F('produto__preco_custo')),
-        ).annotate(
-            margem_bruta=F('total_vendido') - F('custo_total'),
-            percentual_margem_bruta=F('margem_bruta') * 100 / F('total_vendido', output_field=DecimalField())
-        ).order_by('-margem_bruta')
-
-        # 4. Serialização e Formato de Resposta
-        serializer = RentabilidadeItemSerializer(resultados, many=True)
-        response_data = {
-            "relatorio_de_rentabilidade": serializer.data,
-            "filtros_aplicados": request.query_params,
-            "origem_dados": "Base de Dados (Cache Miss)" # Tag de debug para provar o caching
-        }
-        
-        # 5. GRAVAR DADOS NO CACHE
-        # O método `set` envia os dados serializados para o Redis com o TTL
-        bi_cache.set(cache_key, response_data, timeout=self.CACHE_TTL)
-        
-        return Response(response_data)
+
+class CacheBIMetricasAPIView(APIView):
+    """Hits, misses e tempos de recálculo da cache de B.I. da empresa"""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        empresa = getattr(request.user, 'empresa', None)
+        if empresa is None:
+            return Response({"detail": "Utilizador sem empresa associada."}, status=status.HTTP_403_FORBIDDEN)
+        return Response({"empresa": empresa.pk, "datasets": CacheBIService.metricas(empresa.pk)})
 
@@ -3,6 +3,7 @@ from pathlib import Path
 import django
 from django.core.management.utils import get_random_secret_key
 from celery.schedules import crontab
+from kombu import Queue
 from datetime import timedelta
 import cloudinary
 import cloudinary.uploader
@@ -242,8 +243,63 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'apps.vendas.tasks.verificar_stock_critico',
         'schedule': timedelta(hours=1),
     },
+    'consolidar_ponto_diario': {
+        'task': 'apps.funcionarios.tasks.consolidar_ponto_task',
+        'schedule': crontab(hour=1, minute=0),
+    },
+    'auditar_lacunas_numeracao': {
+        'task': 'apps.core.tasks.auditar_lacunas_numeracao_task',
+        'schedule': crontab(minute=45),
+    },
+    'calcular_comissoes_incremental': {
+        'task': 'apps.vendas.tasks.calcular_comissoes_incremental_task',
+        'schedule': timedelta(minutes=30),
+    },
+    'fechar_mes_contabil': {
+        'task': 'apps.financeiro.tasks.fechar_mes_contabil_task',
+        'schedule': crontab(day_of_month=1, hour=2, minute=0),
+    },
+    'selar_fragmentos_saft': {
+        'task': 'apps.fiscal.tasks.selar_fragmentos_saft_task',
+        'schedule': crontab(day_of_month=1, hour=2, minute=30),
+    },
+    'reconciliar_estatisticas_clientes': {
+        'task': 'apps.clientes.tasks.reconciliar_estatisticas_clientes_task',
+        'schedule': crontab(hour=3, minute=30),
+    },
+    'expirar_pontos_fidelidade': {
+        'task': 'apps.clientes.tasks.expirar_pontos_fidelidade_task',
+        'schedule': crontab(hour=0, minute=30),
+    },
+    'recalcular_niveis_fidelidade': {
+        'task': 'apps.clientes.tasks.recalcular_niveis_fidelidade_task',
+        'schedule': crontab(day_of_week=0, hour=4, minute=0),
+    },
+    'reconstruir_scorecards_fornecedores': {
+        'task': 'apps.fornecedores.tasks.reconstruir_scorecards_fornecedores_task',
+        'schedule': crontab(hour=4, minute=30),
+    },
+    'atualizar_previsoes_demanda': {
+        'task': 'apps.relatorios.tasks.atualizar_previsoes_demanda_task',
+        'schedule': crontab(hour=1, minute=15),
+    },
+    'atualizar_segmentacao_clientes': {
+        'task': 'apps.relatorios.tasks.atualizar_segmentacao_clientes_task',
+        'schedule': crontab(hour=4, minute=15),
+    },
+    'calcular_risco_validade': {
+        'task': 'apps.produtos.tasks.calcular_risco_validade_task',
+        'schedule': crontab(hour=1, minute=30),
+    },
+    'gerar_planos_reposicao': {
+        'task': 'apps.fornecedores.tasks.gerar_planos_reposicao_task',
+        'schedule': crontab(hour=5, minute=0),
+    },
 }
 
+# Validade (dias) dos pontos de fidelidade acumulados; 0 = não expiram
+FIDELIDADE_VALIDADE_PONTOS_DIAS = 365
+
 
 # =========================================
 # Caches (Redis + BI)
@@ -274,12 +330,35 @@ CACHES = {
 
 
 
+# Feed em tempo real das comandas (SSE): Redis pub/sub por omissão.
+# Em testes/desenvolvimento sem Redis: 'apps.comandas.feed.MemoriaBroker'
+COMANDAS_FEED_BROKER = None
+
+
 # Celery
 CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_BROKER_USE_SSL = {"ssl_cert_reqs": None}
 CELERY_RESULT_BACKEND_USE_SSL = {"ssl_cert_reqs": None}
 
+# Filas: 'celery' por omissão e filas próprias para a geração de relatórios
+# (apps/relatorios/services.py). Workers sem -Q consomem todas; em produção
+# pode dedicar-se um worker a 'relatorios_pesados'.
+CELERY_TASK_DEFAULT_QUEUE = 'celery'
+CELERY_TASK_QUEUES = (
+    Queue('celery'),
+    Queue('relatorios'),
+    Queue('relatorios_pesados'),
+)
+# Prioridades 0-9 na Redis (0 = mais prioritária)
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'queue_order_strategy': 'priority',
+}
+
+# Resultados de relatórios concluídos reutilizados por pedidos idênticos (segundos)
+RELATORIOS_TTL_RESULTADO = 15 * 60
+
 
 # =========================================
 # Templates
@@ -382,6 +461,9 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+    # Paginação por cursor (keyset) em todas as listagens; ver apps/core/api/pagination.py
+    'DEFAULT_PAGINATION_CLASS': 'apps.core.api.pagination.CursorPaginacao',
+    'PAGE_SIZE': 50,
 }
 
 # Crispy Forms
@@ -395,6 +477,9 @@ PRODUCT_COMPANY_TAX_ID = "5001304461"  # NIF da empresa produtora do software
 SOFTWARE_VALIDATION_NUMBER = "123/AGT/2019"  # Número de validação AGT (ex: "123/AGT/2024")
 ERP_PRODUCT_ID = "SOTARQ SOFTWARE ERP"  # Ex: "MeuERP/MinhaEmpresa Lda"
 ERP_PRODUCT_VERSION = "1.0.0"
+# Processos que constroem as secções SAF-T em paralelo (1 = no próprio processo).
+# Fica em 1 até haver medições de: python manage.py benchmark_saft_paralelo --empresa <id>
+SAFT_EXPORT_PROCESSOS = 1
 
 # =========================================
 # Configuração padrão de PK